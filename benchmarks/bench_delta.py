@@ -0,0 +1,110 @@
+# Benchmark della copia a delta: byte scritti sul disco di backup con e senza delta per un file grande modificato
+# Uso: python benchmarks/bench_delta.py [--dir /mnt/btrfs/tmp] [--size-mb 512] [--changed-mb 4]
+#
+# Crea la copia "precedente" di un file, ne modifica --changed-mb in punti sparsi e ricostruisce la nuova
+# versione in tre modi: copia completa (NativeCopyEngine._copy_file), copia a delta (DeltaCopier.copy) e
+# mirror del motore nativo con delta abilitato, che usa il delta solo se la cartella supporta la clonazione.
+# Per ogni modo riporta i byte scritti dal processo (write_bytes di /proc/self/io, solo Linux) e lo spazio
+# libero consumato sul file system: con reflink i blocchi riusati dalla copia precedente non occupano spazio.
+# Senza reflink (ext4, NTFS, exFAT) la copia a delta scrive quanto una copia completa e in più rilegge la base.
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from pybck.CopyEngine import NativeCopyEngine, supports_clone
+from pybck.DeltaCopy import DeltaCopier, SignatureCache
+
+SEGMENT = 4 * 1024 * 1024
+
+
+def written_bytes() -> int:
+    # Byte inviati al disco dal processo (None dove /proc/self/io non esiste)
+    try:
+        with open("/proc/self/io") as file:
+            for line in file:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def free_bytes(path: str) -> int:
+    st = os.statvfs(path)
+    return st.f_bavail * st.f_frsize
+
+
+def make_versions(work: str, size: int, changed: int, rng: random.Random):
+    # Versione precedente e nuova dello stesso file, nella sorgente
+    block = os.urandom(SEGMENT)
+    old = os.path.join(work, "src", "posta.pst")
+    os.makedirs(os.path.dirname(old))
+    with open(old, "wb") as file:
+        for index in range(size // SEGMENT):
+            file.write(block[index % 7:] + block[:index % 7])
+    new = os.path.join(work, "nuovo.pst")
+    shutil.copyfile(old, new)
+    with open(new, "r+b") as file:
+        for _ in range(max(1, changed // (64 * 1024))):
+            file.seek(rng.randrange(size - 64 * 1024))
+            file.write(os.urandom(64 * 1024))
+    return old, new
+
+
+def measure(work: str, function) -> tuple:
+    os.sync()
+    before_written, before_free = written_bytes(), free_bytes(work)
+    start = time.perf_counter()
+    function()
+    os.sync()
+    elapsed = time.perf_counter() - start
+    after_written = written_bytes()
+    written = after_written - before_written if after_written is not None else None
+    return elapsed, written, before_free - free_bytes(work)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Byte scritti con e senza copia a delta")
+    parser.add_argument("--dir", default=None, help="Cartella di lavoro (default: temporanea nella cartella corrente)")
+    parser.add_argument("--size-mb", type=int, default=512, help="Dimensione del file")
+    parser.add_argument("--changed-mb", type=int, default=4, help="Byte modificati tra le due versioni")
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench_delta_", dir=args.dir or os.getcwd())
+    size = max(1, args.size_mb * 1024 * 1024 // SEGMENT) * SEGMENT
+    try:
+        old, new = make_versions(work, size, args.changed_mb * 1024 * 1024, random.Random(1))
+        base = os.path.join(work, "snap1", "posta.pst")
+        os.makedirs(os.path.dirname(base))
+        shutil.copyfile(old, base)
+        delta = DeltaCopier(min_size=0, cache=SignatureCache(os.path.join(work, "firme")))
+        delta.copy(old, base, os.path.join(work, "riscaldamento.pst"))  # Firma della base in cache
+        os.replace(new, old)
+        os.utime(old, ns=(os.stat(base).st_mtime_ns + 10**10,) * 2)
+        engine = NativeCopyEngine(threads=1, delta=delta)
+
+        def mirror():
+            stats = engine.mirror(os.path.join(work, "src"), os.path.join(work, "snap2"), link_dest=os.path.join(work, "snap1"))
+            runs["mirror"] = "delta" if stats.files_delta else "copia completa"
+
+        runs = {}
+        modes = [("completa", lambda: engine._copy_file(old, os.path.join(work, "completa.pst"), size)),
+                 ("delta", lambda: delta.copy(old, base, os.path.join(work, "delta.pst"))),
+                 ("mirror", mirror)]
+        print(f"Cartella {work}, file da {size / 1024**2:.0f} MB, {args.changed_mb} MB modificati, "
+              f"clonazione {'supportata' if supports_clone(work) else 'non supportata'}")
+        print(f"{'modo':<10} {'secondi':>8} {'scritti MB':>11} {'occupati MB':>12}")
+        for name, function in modes:
+            elapsed, written, used = measure(work, function)
+            shown = f"{written / 1024**2:>11.1f}" if written is not None else f"{'n/d':>11}"
+            print(f"{name:<10} {elapsed:>8.2f} {shown} {used / 1024**2:>12.1f}" + (f"  ({runs[name]})" if name in runs else ""))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# Benchmark della valutazione dei filtri include/exclude (PathFilter) su percorsi sintetici
+# Uso: python benchmarks/bench_filters.py [--paths 1000000] [--rules 20]
+#
+# Riporta i secondi per milione di percorsi del filtro compilato (trie + regex combinata) e,
+# come riferimento, di un ciclo fnmatch su ogni regola con la stessa semantica (verificata: i due
+# filtri devono accettare lo stesso numero di percorsi). I percorsi arrivano nell'ordine della
+# visita (cartelle prima del contenuto) e quelli sotto una cartella esclusa non vengono valutati,
+# come durante la scansione.
+
+import argparse
+import fnmatch
+import random
+import re
+import time
+
+from pybck.PathFilter import PathFilter
+
+NAMES = ["src", "docs", "Foto", "2024", "lib", "web", "dati", "Progetti", "cliente", "archivio"]
+EXCLUDE = ["node_modules/", "$RECYCLE.BIN/", "Temp/", "__pycache__/", ".git/", "*.tmp", "*.log", "~$*",
+           "**/build/", "**/dist/", "AppData/Local/Temp/", "AppData/Local/Microsoft/Windows/INetCache/",
+           "re:\\.(o|obj|pyc)$", "Thumbs.db", "desktop.ini"]
+
+
+def synthetic_paths(count: int, rng: random.Random):
+    # (percorso relativo, è una cartella) in ordine di visita, con un 5% di cartelle da escludere
+    paths = []
+    stack = [""]
+    while len(paths) < count:
+        parent = stack.pop() if stack and rng.random() < 0.3 else rng.choice(stack or [""])
+        for _ in range(rng.randint(1, 4)):
+            name = rng.choice(NAMES + ["node_modules", "build", "__pycache__"] if rng.random() < 0.05 else NAMES)
+            relative = f"{parent}/{name}{rng.randint(0, 99)}" if name in NAMES else f"{parent}/{name}"
+            relative = relative.lstrip("/")
+            paths.append((relative, True))
+            stack.append(relative)
+        for _ in range(rng.randint(2, 12)):
+            extension = rng.choice([".txt", ".docx", ".jpg", ".py", ".pyc", ".tmp", ".log", ".pdf"])
+            paths.append((f"{parent}/file{rng.randint(0, 9999)}{extension}".lstrip("/"), False))
+        if len(stack) > 5000:
+            stack = stack[-1000:]
+    return paths[:count]
+
+
+def evaluate(paths, enter, accept) -> (float, int):
+    # Le cartelle escluse potano i percorsi successivi che iniziano con il loro nome
+    pruned = set()
+    kept = 0
+    start = time.perf_counter()
+    for relative, is_dir in paths:
+        parent = relative.rpartition("/")[0]
+        if parent in pruned:
+            if is_dir:
+                pruned.add(relative)
+            continue
+        if is_dir:
+            if enter(relative):
+                kept += 1
+            else:
+                pruned.add(relative)
+        elif accept(relative):
+            kept += 1
+    return time.perf_counter() - start, kept
+
+
+def naive_filter(rules):
+    # Riferimento con la stessa semantica di PathFilter, ma una regola alla volta con fnmatch per componente
+    # (re: cercata nel percorso, "**/" iniziale come regola per nome, percorsi dalla radice componente per
+    # componente): il costo cresce con il numero di regole
+    parsed = []
+    for rule in rules:
+        if rule.startswith("re:"):
+            parsed.append(("re", re.compile(rule[3:], re.IGNORECASE), False))
+            continue
+        dir_only = rule.endswith("/")
+        body = rule.strip("/").lower()
+        if body.startswith("**/") and "/" not in body[3:]:
+            body = body[3:]
+        if rule.startswith("/") or "/" in body:
+            parsed.append(("path", body.split("/"), dir_only))
+        else:
+            parsed.append(("name", body, dir_only))
+
+    def match_parts(parts, patterns):
+        if not patterns:
+            return not parts
+        if patterns[0] == "**":
+            return any(match_parts(parts[skip:], patterns[1:]) for skip in range(len(parts) + 1))
+        return bool(parts) and fnmatch.fnmatchcase(parts[0], patterns[0]) and match_parts(parts[1:], patterns[1:])
+
+    def matches(relative, is_dir):
+        lowered = relative.lower()
+        for kind, pattern, dir_only in parsed:
+            if dir_only and not is_dir:
+                continue
+            if kind == "re":
+                if pattern.search(relative + "/" if is_dir else relative):
+                    return True
+            elif kind == "name":
+                if fnmatch.fnmatchcase(lowered.rpartition("/")[2], pattern):
+                    return True
+            elif match_parts(lowered.split("/"), pattern):
+                return True
+        return False
+    return (lambda relative: not matches(relative, True)), (lambda relative: not matches(relative, False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Costo dei filtri include/exclude per milione di percorsi")
+    parser.add_argument("--paths", type=int, default=1000000, help="Numero di percorsi sintetici")
+    parser.add_argument("--rules", type=int, default=len(EXCLUDE), help="Regole di esclusione (ripetute con suffissi)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rules = [EXCLUDE[i % len(EXCLUDE)] if i < len(EXCLUDE) else f"extra{i}_*.bak" for i in range(args.rules)]
+    paths = synthetic_paths(args.paths, rng)
+
+    start = time.perf_counter()
+    compiled = PathFilter(exclude=rules)
+    compile_ms = (time.perf_counter() - start) * 1000
+    included = PathFilter(include=["/Progetti3/", "*.docx"], exclude=rules)
+
+    scale = 1_000_000 / len(paths)
+    print(f"{len(paths)} percorsi, {len(rules)} regole (compilazione {compile_ms:.2f} ms)")
+    accepted = {}
+    for name, (enter, accept) in {
+        "PathFilter exclude": (compiled.enter, compiled.accept),
+        "PathFilter include+exclude": (included.enter, included.accept),
+        "fnmatch per regola": naive_filter(rules),
+    }.items():
+        elapsed, accepted[name] = evaluate(paths, enter, accept)
+        print(f"{name:<28} {elapsed * scale:>7.2f} s per milione  ({accepted[name]} percorsi accettati)")
+    # Il confronto dei tempi ha senso solo se il riferimento applica le stesse regole
+    assert accepted["PathFilter exclude"] == accepted["fnmatch per regola"], "Il riferimento non applica le stesse regole"
+
+
+if __name__ == "__main__":
+    main()
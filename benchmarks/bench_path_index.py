@@ -0,0 +1,83 @@
+# Benchmark dell'indice dei percorsi (PathIndex): aggiornamento alla finalizzazione e tempi delle ricerche
+# Uso: python benchmarks/bench_path_index.py [--snapshots 100] [--files 1000000] [--change-rate 0.01]
+#
+# Crea manifest sintetici (nessun file reale) per --snapshots snapshot di --files file ciascuno; a ogni snapshot
+# cambia una frazione --change-rate dei file. Riporta il tempo di add_snapshot, la dimensione dell'indice e
+# il tempo di versions(), di una ricerca per prefisso e di una per glob.
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from pybck.BackupManifest import BackupManifest, ManifestEntry, MANIFEST_NAME
+from pybck.PathIndex import PathIndex, INDEX_NAME
+
+
+def snapshot_name(index: int) -> str:
+    # Fino a 336 nomi in ordine cronologico
+    return f"2024-{1 + index // 28:02d}-{1 + index % 28:02d}_00-00-00"
+
+
+def file_path(index: int) -> str:
+    return f"Cartella_{index % 1000:03d}/Sotto_{index // 1000 % 100:02d}/file_{index}.docx"
+
+
+def write_manifest(root: str, name: str, mtimes: list):
+    os.makedirs(os.path.join(root, name), exist_ok=True)
+    entries = [ManifestEntry(f"Disco_D_Backup_{name}/{file_path(i)}", 1000 + i, mtime, 0o644) for i, mtime in enumerate(mtimes)]
+    BackupManifest.write(os.path.join(root, name, MANIFEST_NAME), entries)
+
+
+def timed(function, repeat: int = 1) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempi dell'indice dei percorsi tra gli snapshot")
+    parser.add_argument("--dir", default=None, help="Cartella di lavoro (default: temporanea nella cartella corrente)")
+    parser.add_argument("--snapshots", type=int, default=100, help="Numero di snapshot")
+    parser.add_argument("--files", type=int, default=1000000, help="File per snapshot")
+    parser.add_argument("--change-rate", type=float, default=0.01, help="Frazione di file modificati a ogni snapshot")
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench_index_", dir=args.dir or os.getcwd())
+    rng = random.Random(1)
+    mtimes = [10**18] * args.files
+    add_times = []
+    try:
+        with PathIndex(work) as index:
+            for s in range(args.snapshots):
+                name = snapshot_name(s)
+                if s:
+                    for i in rng.sample(range(args.files), int(args.files * args.change_rate)):
+                        mtimes[i] += 10**9
+                write_manifest(work, name, mtimes)
+                elapsed, _ = timed(lambda: index.add_snapshot(name))
+                add_times.append(elapsed)
+                shutil.rmtree(os.path.join(work, name))  # Il manifest serve solo per l'aggiunta
+
+            print(f"{args.snapshots} snapshot da {args.files} file, {args.change_rate:.1%} modificati a ogni snapshot")
+            print(f"add_snapshot: primo {add_times[0]:.2f} s, successivi in media {sum(add_times[1:]) / max(1, len(add_times) - 1):.2f} s")
+            print(f"Indice: {os.path.getsize(os.path.join(work, INDEX_NAME)) / 1024**2:.0f} MB")
+
+            paths = [f"D:/{file_path(rng.randrange(args.files))}" for _ in range(100)]
+            elapsed, _ = timed(lambda: [index.versions(path) for path in paths])
+            print(f"versions():          {elapsed / len(paths) * 1000:8.2f} ms per file")
+            elapsed, found = timed(lambda: index.search(prefix="D:/Cartella_042/Sotto_07/"), 5)
+            print(f"search(prefix):      {elapsed * 1000:8.2f} ms ({len(found)} versioni)")
+            elapsed, found = timed(lambda: index.search(pattern="D:/Cartella_042/*/file_*2.docx"), 5)
+            print(f"search(pattern):     {elapsed * 1000:8.2f} ms ({len(found)} versioni)")
+            elapsed, found = timed(lambda: index.search(pattern="*/file_12345?.docx"), 1)
+            print(f"search(senza prefisso): {elapsed * 1000:5.0f} ms ({len(found)} versioni, scansione completa)")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# Benchmark end-to-end della pipeline su alberi sintetici: validazione, backup completo,
+# secondo backup senza modifiche e pulizia, con le unità mappate su cartelle locali (drive_map)
+# Uso: python benchmarks/bench_pipeline.py [--profiles tiny,huge,deep,mixed] [--scale 0.1]
+#                                           [--incremental] [--check] [--update-baseline]
+#
+# Per ogni passo misura tempo, throughput, picco di RSS e chiamate di sistema read/write
+# (psutil.io_counters: su Linux read_count/write_count sono le syscall del processo).
+# --check confronta con benchmarks/baselines.json e termina con codice 1 in caso di regressione.
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import psutil
+
+from synthetic_tree import PROFILES, generate_tree
+from pybck import logger
+from pybck.BackupConfig import BackupConfig
+from pybck.BackupBuilder import BackupBuilder
+from pybck.BackupCleaner import BackupCleaner
+from pybck.BackupValidator import BackupValidator
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+# Metriche confrontate con la baseline: True se un valore più alto è meglio
+COMPARED = {"mb_s": True, "seconds": False, "peak_rss_mb": False, "syscalls": False}
+MIN_SECONDS = 0.05  # Sotto questa durata il tempo non è significativo
+
+
+class Sampler:
+    # Campiona l'RSS del processo per trovare il picco durante un passo
+    def __init__(self, interval=0.02):
+        self.process = psutil.Process()
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self.peak = self.process.memory_info().rss
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.process.memory_info().rss)
+
+
+def syscalls():
+    try:
+        counters = psutil.Process().io_counters()
+        return counters.read_count + counters.write_count
+    except (AttributeError, psutil.Error):
+        return 0  # Non disponibile su questa piattaforma
+
+
+def measure(func, bytes_processed=0, files=0) -> dict:
+    calls = syscalls()
+    with Sampler() as sampler:
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+    return {
+        "seconds": round(seconds, 3),
+        "mb_s": round(bytes_processed / 1024**2 / seconds, 1) if bytes_processed else 0.0,
+        "files_s": round(files / seconds, 1) if files else 0.0,
+        "peak_rss_mb": round(sampler.peak / 1024**2, 1),
+        "syscalls": syscalls() - calls,
+    }
+
+
+def run_profile(profile: str, scale: float, workdir: str, incremental: bool) -> dict:
+    base = os.path.join(workdir, profile)
+    source = os.path.join(base, "D")
+    target = os.path.join(base, "G")
+    user_profile = os.path.join(base, "Users", "bench")
+    os.makedirs(os.path.join(target, "BackupPC"))
+    os.makedirs(os.path.join(user_profile, "Documents"))
+    os.environ["USERPROFILE"] = user_profile
+
+    start = time.perf_counter()
+    files, total = generate_tree(source, profile, scale)
+    print(f"[{profile}] albero generato: {files} file, {total / 1024**2:.1f} MB in {time.perf_counter() - start:.1f}s")
+
+    config = BackupConfig(
+        backup_drive="G:",
+        backup_root="BackupPC",
+        source_drives=["D:"],
+        user_folders=["Documents"],
+        keep_last_n=0,
+        keep_daily=1,   # Due backup nello stesso giorno: la pulizia elimina il primo
+        copy_engine="native",
+        incremental=incremental,
+        drive_map={"D:": source, "G:": target},
+    )
+
+    def validate():
+        validator = BackupValidator(config)
+        if not validator.can_perform_backup():
+            raise RuntimeError(f"Validazione fallita: {validator.error}")
+
+    def backup():
+        builder = BackupBuilder(config)
+        builder.execute_backup()
+        if not builder.executed:
+            raise RuntimeError(f"Backup fallito: {builder.error}")
+
+    def clean():
+        cleaner = BackupCleaner(config)
+        cleaner.clean_old_backups()
+        if not cleaner.cleanedOld:
+            raise RuntimeError(f"Pulizia fallita: {cleaner.error}")
+
+    results = {"validate": measure(validate, total, files), "backup_full": measure(backup, total, files)}
+    time.sleep(1.1)  # Il timestamp degli snapshot ha la risoluzione del secondo
+    results["backup_unchanged"] = measure(backup, total, files)
+    results["clean"] = measure(clean, total, files)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for step, metrics in results.items():
+        reference = baseline.get(step, {})
+        for name, higher_is_better in COMPARED.items():
+            if name not in reference or not reference[name]:
+                continue
+            if name in ("seconds", "mb_s") and reference.get("seconds", 0) < MIN_SECONDS:
+                continue
+            value, expected = metrics[name], reference[name]
+            worse = value < expected * (1 - tolerance) if higher_is_better else value > expected * (1 + tolerance)
+            if worse:
+                regressions.append(f"{step}.{name}: {value} (baseline {expected})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end di validazione, backup e pulizia")
+    parser.add_argument("--profiles", default=",".join(PROFILES), help="Profili separati da virgola")
+    parser.add_argument("--scale", type=float, default=0.1, help="Fattore di scala degli alberi (tiny: 20000 file × scale)")
+    parser.add_argument("--incremental", action="store_true", help="Secondo backup con hard link")
+    parser.add_argument("--workdir", help="Cartella di lavoro (default: temporanea, eliminata alla fine)")
+    parser.add_argument("--check", action="store_true", help="Confronta con la baseline")
+    parser.add_argument("--update-baseline", action="store_true", help="Salva i risultati come baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Scostamento ammesso rispetto alla baseline")
+    args = parser.parse_args()
+
+    # Solo avvisi ed errori: il log di debug falserebbe le misure
+    logger.setLevel(logging.WARNING)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="pybck-bench-")
+    baselines = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, "r", encoding="utf-8") as file:
+            baselines = json.load(file)
+
+    cwd = os.getcwd()
+    os.chdir(workdir)  # La cache della scansione viene scritta nella cartella di lavoro
+    regressions = []
+    try:
+        for profile in args.profiles.split(","):
+            key = f"{profile}@{args.scale}" + ("+incremental" if args.incremental else "")
+            results = run_profile(profile, args.scale, workdir, args.incremental)
+            for step, metrics in results.items():
+                print(f"  {step:<17} {metrics['seconds']:>8.2f}s {metrics['mb_s']:>9.1f} MB/s {metrics['files_s']:>10.0f} file/s "
+                      f"RSS {metrics['peak_rss_mb']:>7.1f} MB  syscall {metrics['syscalls']:>8}")
+            if args.check and key in baselines:
+                found = compare(results, baselines[key], args.tolerance)
+                regressions.extend(f"[{key}] {item}" for item in found)
+            if args.update_baseline:
+                baselines[key] = results
+    finally:
+        os.chdir(cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.update_baseline:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+        print(f"Baseline aggiornata: {BASELINE_PATH}")
+
+    if regressions:
+        print("Regressioni rispetto alla baseline:")
+        for item in regressions:
+            print(f"  {item}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# Benchmark della valutazione delle regole di conservazione su nomi di snapshot sintetici
+# Uso: python benchmarks/bench_retention.py [--snapshots 10000] [--per-day 4]
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from pybck.RetentionPolicy import RetentionPolicy, plan_retention
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo di plan_retention su migliaia di snapshot")
+    parser.add_argument("--snapshots", type=int, default=10000, help="Numero di snapshot sintetici")
+    parser.add_argument("--per-day", type=int, default=4, help="Snapshot al giorno")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    start_date = datetime(2000, 1, 1)
+    step = timedelta(days=1) / args.per_day
+    names = [(start_date + step * i).strftime("%Y-%m-%d_%H-%M-%S") for i in range(args.snapshots)]
+    rng.shuffle(names)
+    sizes = {name: rng.randint(1, 50) * 1024**3 for name in names}
+
+    policies = {
+        "keep_last": RetentionPolicy(keep_last=7),
+        "gfs": RetentionPolicy(keep_daily=7, keep_weekly=4, keep_monthly=12, keep_yearly=5),
+        "gfs+budget": RetentionPolicy(keep_daily=7, keep_weekly=4, keep_monthly=12, keep_yearly=5,
+                                      max_total_bytes=500 * 1024**3),
+    }
+    for label, policy in policies.items():
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            keep, delete = plan_retention(names, policy, sizes)
+        elapsed = (time.perf_counter() - start) / args.repeat
+        print(f"{label:<11} snapshot: {len(names)}, conservati: {len(keep)}, eliminati: {len(delete)}, "
+              f"{elapsed * 1000:.2f} ms per valutazione")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# Benchmark del tempo di avvio della riga di comando: "pybck --help" e "pybck status"
+# Uso: python benchmarks/bench_startup.py [--repeat 15] [--budget-ms 75]
+#
+# Il tempo viene misurato come differenza dalla mediana di un interprete vuoto (python -c pass),
+# così il budget non dipende dalla velocità della macchina. Termina con codice 1 se un comando
+# supera il budget.
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from pybck.BackupConfig import BackupConfig
+
+
+def median_ms(command, repeat, env, cwd) -> float:
+    # La prima esecuzione (scartata) scrive i .pyc, come dopo un'installazione
+    samples = []
+    for _ in range(repeat + 1):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples[1:])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo di avvio di pybck --help e pybck status")
+    parser.add_argument("--repeat", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=75.0, help="Tempo massimo oltre l'avvio dell'interprete")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    with tempfile.TemporaryDirectory(prefix="pybck-startup-") as workdir:
+        # Configurazione con un catalogo vuoto: status legge davvero la cartella di backup
+        os.makedirs(os.path.join(workdir, "G", "BackupPC"))
+        config_path = os.path.join(workdir, "config.json")
+        BackupConfig(backup_drive="G:", backup_root="BackupPC", source_drives=["D:"], user_folders=["Documents"],
+                     keep_last_n=7, drive_map={"G:": os.path.join(workdir, "G")}).save(config_path)
+
+        python = [sys.executable, "-c"]
+        interpreter = median_ms(python + ["pass"], args.repeat, env, workdir)
+        commands = {
+            "--help": python + ["import sys; from pybck.main import main; sys.argv[0] = 'pybck'; main(['--help'])"],
+            "status": python + [f"import sys; from pybck.main import main; sys.exit(main(['--config', {config_path!r}, 'status']))"],
+        }
+
+        print(f"{'interprete':<10} {interpreter:>8.1f} ms")
+        over_budget = []
+        for name, command in commands.items():
+            # --help termina con SystemExit(0)
+            elapsed = median_ms(command, args.repeat, env, workdir)
+            overhead = elapsed - interpreter
+            print(f"{name:<10} {elapsed:>8.1f} ms  (+{overhead:.1f} ms, budget {args.budget_ms:.0f} ms)")
+            if overhead > args.budget_ms:
+                over_budget.append(name)
+
+    if over_budget:
+        print(f"Budget di avvio superato: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# Generatore di alberi di file sintetici e riproducibili per i benchmark
+# Stesso seed e stessi parametri producono sempre gli stessi nomi, dimensioni e contenuti
+
+import os
+import random
+
+# Profili: (descrizione, funzione che restituisce l'elenco (percorso relativo, dimensione))
+BLOCK_SIZE = 1024 * 1024
+
+
+def tiny_files(rng, scale):
+    # Molti file minuscoli in cartelle da 100 file (1M file con scale=50)
+    count = int(20000 * scale)
+    return [(f"t{i // 10000:03d}/d{i // 100 % 100:02d}/f{i:07d}.txt", rng.randint(0, 512)) for i in range(count)]
+
+
+def huge_files(rng, scale):
+    # Pochi file molto grandi
+    return [(f"iso/image{i}.bin", int(256 * 1024**2 * scale) + rng.randint(0, 4096)) for i in range(3)]
+
+
+def deep_nesting(rng, scale):
+    # Cartelle annidate fino a 40 livelli, pochi file per livello
+    files = []
+    for branch in range(max(1, int(20 * scale))):
+        path = f"b{branch:03d}"
+        for depth in range(40):
+            path += f"/l{depth:02d}"
+            files.append((f"{path}/x.dat", rng.randint(100, 8192)))
+    return files
+
+
+def mixed(rng, scale):
+    # Distribuzione log-normale delle dimensioni come in una cartella utente reale
+    # (mediana ~8 KB, qualche file da centinaia di MB)
+    files = []
+    for i in range(int(5000 * scale)):
+        size = min(int(rng.lognormvariate(9, 2.2)), 512 * 1024**2)
+        ext = rng.choice(("docx", "jpg", "pdf", "txt", "mp4", "zip", "py", "xlsx"))
+        files.append((f"{rng.choice(('Documenti', 'Foto', 'Progetti', 'Download'))}/s{i % 97:02d}/file{i:05d}.{ext}", size))
+    return files
+
+
+PROFILES = {
+    "tiny": tiny_files,
+    "huge": huge_files,
+    "deep": deep_nesting,
+    "mixed": mixed,
+}
+
+
+def plan_tree(profile: str, scale: float = 1.0, seed: int = 42):
+    return PROFILES[profile](random.Random(f"{profile}-{seed}"), scale)
+
+
+def generate_tree(root: str, profile: str, scale: float = 1.0, seed: int = 42) -> tuple:
+    # Restituisce (numero di file, byte totali); i contenuti derivano da un blocco casuale riproducibile
+    rng = random.Random(seed)
+    block = rng.getrandbits(BLOCK_SIZE * 8).to_bytes(BLOCK_SIZE, "little")
+    files = plan_tree(profile, scale, seed)
+
+    total = 0
+    created = set()
+    for index, (relative, size) in enumerate(files):
+        path = os.path.join(root, *relative.split("/"))
+        directory = os.path.dirname(path)
+        if directory not in created:
+            os.makedirs(directory, exist_ok=True)
+            created.add(directory)
+        with open(path, "wb") as file:
+            # Intestazione diversa per ogni file: i contenuti non sono tutti identici
+            header = f"{profile}:{index}:".encode()
+            remaining = size
+            offset = index * 4099 % BLOCK_SIZE
+            chunk = header[:remaining]
+            file.write(chunk)
+            remaining -= len(chunk)
+            while remaining > 0:
+                piece = block[offset:offset + remaining]
+                file.write(piece)
+                remaining -= len(piece)
+                offset = 0
+        total += size
+    return len(files), total
@@ -17,69 +17,288 @@ G:\Backup_PC\2024-01-22_10-30-45\
     
 _create_temp_backup_folder() → crea .tmp_backup_TIMESTAMP
 
+_resume_or_create_temp_backup_folder() → riprende un .tmp_backup_ interrotto se il suo journal
+                                         (.pybck_journal.jsonl) è valido, altrimenti ne crea uno nuovo;
+                                         le sorgenti e le cartelle utente completate non vengono ricopiate
+
 _copy_drive(drive_letter) → copia un intero drive
 
 _copy_user_folders() → copia cartelle utente da C:
 
-_finalize_backup() → rinomina .tmp_backup_* in definitiv
+_finalize_backup() → rinomina .tmp_backup_* in definitiv e registra lo snapshot nel catalogo
+                     (G:\Backup_PC\.pybck_catalog.jsonl: dimensione, numero di file, durata, stato)
+                     e nell'indice dei percorsi (.pybck_paths.sqlite, PathIndex) se config.path_index
+
+_mirror(source, destination) → robocopy /MIR (output letto in streaming da RobocopyRunner; il totale per
+                               l'ETA viene dalla stima di SpacePlanner, che riusa la cache della scansione)
+                               oppure il motore nativo (config.copy_engine)
+                               con le regole include/exclude di config.filters (PathFilter)
+
+storage_mode "dedup" → i file vengono divisi in chunk salvati una sola volta in G:\Backup_PC\.pybck_chunks\
+                        e ogni cartella del drive contiene solo la ricetta .pybck_recipe.jsonl
+
+storage_mode "compressed" → i file comprimibili vengono salvati come <nome>.pybckz da un pool di processi
+                            (CompressEngine); rapporto di compressione e CPU usata finiscono nelle metriche
+
+_write_manifest() → scrive .pybck_manifest (elenco ordinato dei file) nella cartella temporanea
+
+_verify_backup() → se verify_backup è attivo confronta lo snapshot con le sorgenti (BackupVerifier)
+
+metrics → tempi delle fasi (prepare, copy per sorgente, manifest, finalize, verify) e contatori
+          (byte, file, errori, tentativi ripetuti) in BackupMetrics; se il builder non riceve un
+          oggetto condiviso scrive da solo il record dell'esecuzione (config.metrics_dir)
+
+_find_previous_snapshot() → in modalità incrementale individua l'ultimo snapshot finalizzato,
+                            usato come link_dest: i file invariati diventano hard link
+
+_load_changes(source) → con change_journal attivo scrive il mark dello snapshot nel journal della
+                        sorgente e legge le cartelle cambiate dal precedente: il motore nativo rilegge
+                        solo quelle e collega il resto dal manifest precedente; senza un journal valido
+                        o con filtri diversi da quelli del mark precedente la sorgente viene percorsa per intero
+
+delta_copy → i file modificati più grandi di delta_min_size_mb vengono ricostruiti dalla copia nello
+             snapshot precedente, scrivendo solo i blocchi cambiati (DeltaCopier, firme in signature_dir).
+             Solo se il drive di backup supporta la clonazione (btrfs, XFS): altrimenti copia completa
     
 """
 
 
-import subprocess
+from functools import partial
 from datetime import datetime
 import os
+import threading
+import time
 from pathlib import Path
 
 from pybck.BackupConfig import BackupConfig
+from pybck.CopyEngine import CopyStats, create_copy_engine
+from pybck.DeltaCopy import DeltaCopier, SignatureCache
+from pybck.BackupScheduler import BackupScheduler, BackupJob, device_id
+from pybck.BackupCleaner import BackupCleaner
+from pybck.BackupCatalog import BackupCatalog
+from pybck.BackupJournal import BackupJournal, journal_header, resumable_backups
+from pybck.BackupManifest import BackupManifest, MANIFEST_NAME
+from pybck.BackupMetrics import BackupMetrics
+from pybck.ChunkStore import ChunkStore, DedupEngine, STORE_NAME
+from pybck.CompressedStore import CompressEngine
+from pybck.ChangeJournal import ChangeJournal
+from pybck.PathFilter import PathFilter, drive_filter
+from pybck.RobocopyRunner import RobocopyRunner
+from pybck.BackupProgress import ProgressTracker
+from pybck.BackupVerifier import BackupVerifier
 from pybck import logger
 LOG_CLASSE = "[BackupBuilder] - "
 
+CHANGE_ACK_TIMEOUT_S = 10.0   # Attesa massima della conferma del watcher dopo il mark
+
 
 class BackupBuilder:
     executed : bool
+    verified : bool
     error : str
     timestamp : str
     
-    def __init__(self, config: BackupConfig):
+    def __init__(self, config: BackupConfig, copy_engine=None, progress_callback=None, metrics: BackupMetrics = None):
         self.config = config
         self.executed = False
+        self.verified = False
         self.error = None
         self.timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        # Motore di copia: None usa robocopy, altrimenti un oggetto con il metodo mirror(source, destination, link_dest, progress)
+        self.delta = None
+        if copy_engine is None and config.storage_mode == "compressed":
+            copy_engine = CompressEngine(config.compression, config.compression_level, config.compression_processes)
+        elif copy_engine is None and config.storage_mode != "dedup":  # DedupEngine creato in _execute_backup
+            self.delta = self._create_delta_copier()
+            copy_engine = create_copy_engine(config.copy_engine, config.copy_threads, self.delta, config.reflink)
+        self.copy_engine = copy_engine
+        self.scheduler = BackupScheduler(config.max_parallel_jobs, config.max_jobs_per_source_device, config.max_jobs_per_target)
+        self.job_timings = {}
+        self.previous_snapshot = None
+        self.robocopy = RobocopyRunner()
+        # Riceve un ProgressEvent durante ogni copia (file/s, MB/s, ETA, errori)
+        self.progress_callback = progress_callback
+        # Catalogo degli snapshot nella radice del backup (aggiornato alla finalizzazione)
+        self.catalog = BackupCatalog(config.backup_path())
+        self._started = None
+        self.journal = None
+        self.resumed = False
+        # Metriche condivise con validazione e pulizia, oppure proprie di questo backup
+        self.metrics = metrics if metrics is not None else BackupMetrics(self.timestamp)
+        self._owns_metrics = metrics is None
+        # Manifest dello snapshot precedente, aperto solo se un journal delle modifiche è utilizzabile
+        self._previous_manifest = None
+        self._manifest_lock = threading.Lock()
+        # Byte di ogni sorgente stimati prima della copia con robocopy (ETA del ProgressTracker)
+        self._source_totals = {}
         
+    def _create_delta_copier(self):
+        if not self.config.delta_copy:
+            return None
+        return DeltaCopier(min_size=self.config.delta_min_size_mb * 1024**2, block_size=self.config.delta_block_kb * 1024,
+                           cache=SignatureCache(self.config.signature_dir))
+    
     def execute_backup(self):
         logger.debug(LOG_CLASSE + "execute_backup - Inizio execute_backup")  
         
-        temp_backup_folder = self._create_temp_backup_folder()
+        try:
+            with self.metrics.span("backup"):
+                self._execute_backup()
+        finally:
+            if isinstance(self.copy_engine, CompressEngine):
+                self.copy_engine.close()
+            if self._previous_manifest is not None:
+                self._previous_manifest.close()
+                self._previous_manifest = None
+            if self._owns_metrics:
+                self.metrics.success = self.executed and self.error is None
+                self.metrics.export(self.config)
+        logger.debug(LOG_CLASSE + "execute_backup - Fine execute_backup")
+    
+    def _execute_backup(self):
+        self._started = time.perf_counter()
+        with self.metrics.span("prepare"):
+            temp_backup_folder = self._resume_or_create_temp_backup_folder()
+            self.previous_snapshot = self._find_previous_snapshot()
+        if self.resumed:
+            self.metrics.count("resumed_backups")
+        if self.config.storage_mode == "dedup" and self.copy_engine is None:
+            self.copy_engine = DedupEngine(ChunkStore(self.config.backup_path(STORE_NAME)))
+        if self.copy_engine is None:
+            with self.metrics.span("estimate"):
+                self._source_totals = self._estimate_sources()
         
+        # Un job per sorgente: lo scheduler li esegue in parallelo rispettando i limiti per disco
+        target_device = device_id(self.config.drive_path(self.config.backup_drive), self.config.device_groups)
+        jobs = []
         for drive in self.config.source_drives:
-            logger.debug(LOG_CLASSE + f"execute_backup - Copia drive: {drive}")  
+            logger.debug(LOG_CLASSE + f"execute_backup - Preparazione copia drive: {drive}")  
             
             drive_folder = self._create_folder_drive(drive, temp_backup_folder)
+            if self.journal.is_done(drive):
+                logger.info(LOG_CLASSE + f"Drive {drive} già copiato prima dell'interruzione: salto la copia.")
+                continue
             
-            try:
-                if(drive != 'C'):
-                    self._copy_drive(drive, drive_folder)
-                    
-                else:
-                    self._copy_user_folders(drive_folder)
-
-            except Exception as e:
-                logger.error(LOG_CLASSE + f"Errore durante la copia del drive {drive}: {e}")
-                self.error = f"Errore durante la copia del drive {drive}: {e}"
+            if drive.replace(":", "") != "C":
+                source = self.config.drive_path(drive)
+                func = partial(self._copy_drive, drive, drive_folder)
+            else:
+                source = os.environ.get("USERPROFILE", "C:\\Users\\Default")
+                func = partial(self._copy_user_folders, drive_folder)
+            
+            jobs.append(BackupJob(drive, device_id(source, self.config.device_groups), target_device,
+                                  partial(self._run_journaled, drive, func)))
+        
+        self.scheduler.run(jobs)
+        self.job_timings = {job.name: job.wall_time for job in jobs}
+        
+        for job in jobs:
+            if job.error is not None:
+                logger.error(LOG_CLASSE + f"Errore durante la copia del drive {job.name}: {job.error}")
+                self.error = f"Errore durante la copia del drive {job.name}: {job.error}"
+                self.metrics.count("backup_errors")
                 self.executed = False
                 return  # Esce in caso di errore
     
-        
         self.executed = True
-        self._finalize_backup(temp_backup_folder)
+        self.journal.remove()
+        self._log_compression()
+        if self.delta is not None:
+            self.delta.cache.prune()
+        if isinstance(self.copy_engine, DedupEngine):
+            # Chunk salvati da tentativi interrotti o da file falliti a metà, mai entrati in una ricetta
+            self.copy_engine.store.prune_unreferenced()
+        with self.metrics.span("manifest"):
+            self._write_manifest(temp_backup_folder)
+        with self.metrics.span("finalize"):
+            self._finalize_backup(temp_backup_folder)
         logger.info(LOG_CLASSE + "Backup eseguito con successo.")
-        logger.debug(LOG_CLASSE + "execute_backup - Fine execute_backup")
+        
+        if self.config.verify_backup:
+            with self.metrics.span("verify"):
+                self._verify_backup()
+    
+    def _estimate_sources(self) -> dict:
+        # robocopy non conosce in anticipo i byte da copiare: senza totale l'ETA resta None.
+        # La stima riusa la cache della scansione appena aggiornata dalla validazione (una stat per cartella)
+        # Import locale: serve solo con robocopy
+        from pybck.SpacePlanner import SpacePlanner
+        planner = SpacePlanner(self.config, threads=self.config.copy_threads)
+        try:
+            return planner.estimate(planner.source_pairs()).source_bytes
+        except Exception as e:
+            logger.warning(LOG_CLASSE + f"Stima delle sorgenti non riuscita, avanzamento senza ETA: {e}")
+            return {}
+    
+    def _verify_backup(self):
+        if self.config.storage_mode != "mirror":
+            # Lo snapshot contiene ricette o file compressi: non ci sono copie da confrontare con le sorgenti
+            logger.warning(LOG_CLASSE + f"Verifica non disponibile in modalità {self.config.storage_mode}.")
+            return
+        
+        verifier = BackupVerifier(self.config, threads=self.config.copy_threads)
+        report = verifier.verify_snapshot(self.timestamp, self.config.verify_mode)
+        self.verified = verifier.verified
+        self.metrics.count("files_verified", report.files_checked)
+        self.metrics.count("verify_mismatches", report.mismatch_count)
+        if not verifier.verified:
+            self.error = verifier.error
+        
+        entry = self.catalog.get(self.timestamp)
+        if entry is not None:
+            entry.status = "verified" if verifier.verified else "corrupt"
+            self.catalog.add(entry)
+    
+    def _find_previous_snapshot(self):
+        # In modalità dedup la ricetta precedente evita di rileggere i file invariati
+        if not self.config.incremental and self.config.storage_mode != "dedup":
+            return None
+        
+        backups = BackupCleaner(self.config).get_finalized_backups()
+        if not backups:
+            logger.info(LOG_CLASSE + "Nessuno snapshot precedente: eseguo un backup completo.")
+            return None
+        
+        logger.debug(LOG_CLASSE + f"_find_previous_snapshot - Snapshot di riferimento: {backups[0]}")
+        return backups[0]
+    
+    def _previous_drive_folder(self, drive_letter):
+        # Cartella del drive nello snapshot precedente, es. G:\Backup_PC\<ts>\Disco_D_Backup_<ts>
+        if self.previous_snapshot is None:
+            return None
+        drive_name = drive_letter.replace(":", "")
+        return self.config.backup_path(self.previous_snapshot, f"Disco_{drive_name}_Backup_{self.previous_snapshot}")
+    
+    def _resume_or_create_temp_backup_folder(self):
+        # Riprende il backup interrotto più recente, se compatibile con la configurazione attuale
+        backup_base_path = self.config.backup_path()
+        resumable = resumable_backups(backup_base_path, self.config)
+        if resumable:
+            temp_backup_folder = self.config.join(backup_base_path, resumable[0])
+            self.journal = BackupJournal(temp_backup_folder)
+            self.journal.load()
+            # Lo snapshot mantiene il timestamp di avvio: i nomi delle cartelle dei drive lo contengono
+            self.timestamp = self.journal.header["timestamp"]
+            self.resumed = True
+            logger.info(LOG_CLASSE + f"Ripresa del backup interrotto {self.timestamp}: "
+                        f"{len(self.journal.done)} sorgenti o cartelle già completate.")
+            return temp_backup_folder
+        
+        temp_backup_folder = self._create_temp_backup_folder()
+        self.journal = BackupJournal(temp_backup_folder)
+        self.journal.start(journal_header(self.config, self.timestamp))
+        return temp_backup_folder
+    
+    def _run_journaled(self, key, func):
+        # Registra nel journal la sorgente solo a copia completata
+        with self.metrics.span("copy", source=key):
+            func()
+        self.journal.mark_done(key)
     
     def _create_temp_backup_folder(self):
 
         # Costruisco il percorso della cartella temporanea G:\Backup_PC\.tmp_backup_2024-01-22_10-30-45\
-        destination = f"{self.config.backup_drive}\\{self.config.backup_root}\\.tmp_backup_{self.timestamp}"
+        destination = self.config.backup_path(f".tmp_backup_{self.timestamp}")
         
         logger.debug(LOG_CLASSE + f"_create_temp_backup_folder - Creazione cartella temporanea: {destination}")  
         
@@ -93,7 +312,7 @@ class BackupBuilder:
         drive_name = drive_letter.replace(":", "")
         
         # Costruisco il percorso della cartella di destinazione per il drive
-        destination = f"{temp_backup_folder}\\Disco_{drive_name}_Backup_{self.timestamp}"
+        destination = self.config.join(temp_backup_folder, f"Disco_{drive_name}_Backup_{self.timestamp}")
         
         logger.debug(LOG_CLASSE + f"_create_folder_drive - Creazione cartella per drive: {destination}")  
         
@@ -102,48 +321,78 @@ class BackupBuilder:
         
         return destination
     
+    def _write_manifest(self, temp_backup_folder):
+        # Il manifest è solo un indice: se non si riesce a scriverlo lo snapshot resta valido
+        try:
+            BackupManifest.build(temp_backup_folder, self.config.manifest_hash)
+        except Exception as e:
+            logger.warning(LOG_CLASSE + f"Impossibile scrivere il manifest dello snapshot: {e}")
+    
     def _finalize_backup(self, temp_backup_folder):
         # Codice per rinominare la cartella temporanea in definitiva
         Path(temp_backup_folder).rename(temp_backup_folder.replace(".tmp_backup_", ""))
         
         logger.debug(LOG_CLASSE + f"_finalize_backup - Rinomina cartella temporanea in definitiva: {temp_backup_folder.replace('.tmp_backup_', '')}")
+        self._record_snapshot(temp_backup_folder.replace(".tmp_backup_", ""))
+    
+    def _record_snapshot(self, backup_folder):
+        # Come il manifest, il catalogo è un indice: un errore non invalida lo snapshot e la
+        # prossima pulizia (BackupCleaner.get_finalized_backups → reconcile) aggiunge la riga mancante
+        try:
+            entry = self.catalog.entry_from_manifest(backup_folder, self.timestamp)
+            entry.storage_mode = self.config.storage_mode
+            if self._started is not None:
+                entry.duration = round(time.perf_counter() - self._started, 3)
+            # Spazio occupato dai contatori della copia, senza percorrere lo snapshot sul disco di backup:
+            # in modalità mirror i file sono copie o hard link, tutti attribuiti allo snapshot più recente.
+            # Compresso, dedup o backup ripreso (contatori parziali): misurato alla prima pulizia che serve
+            linked = None
+            manifest_path = self.config.join(backup_folder, MANIFEST_NAME)
+            if self.config.storage_mode == "mirror" and not self.resumed and entry.size is not None:
+                # Il manifest è l'unico file dello snapshot che non compare tra quelli copiati
+                entry.unique_bytes = entry.size + os.path.getsize(manifest_path)
+                linked = self.metrics.counters.get("bytes_linked", 0)
+            self.catalog.add_newest(entry, linked)
+        except Exception as e:
+            logger.warning(LOG_CLASSE + f"Impossibile aggiornare il catalogo degli snapshot: {e}")
+        if self.config.path_index:
+            self._update_path_index()
+    
+    def _update_path_index(self):
+        # Anche l'indice dei percorsi è solo un indice: senza, "pybck find" lo ricostruisce dai manifest
+        from pybck.PathIndex import PathIndex
+        try:
+            with PathIndex(self.config.backup_path()) as index:
+                if not index.snapshots() and len(self.catalog.list()) > 1:
+                    # Primo indice su un backup esistente: includo gli snapshot precedenti
+                    index.rebuild(self.catalog.list())
+                else:
+                    index.add_snapshot(self.timestamp)
+        except Exception as e:
+            logger.warning(LOG_CLASSE + f"Impossibile aggiornare l'indice dei percorsi: {e}")
         
     def _copy_drive(self, drive_letter: str, dest_folder: Path):
         logger.debug(LOG_CLASSE + f"_copy_drive - Inizio copia drive {drive_letter} in {dest_folder}")  
         
-        robocopy = [
-            "robocopy",
-            drive_letter + "\\",  # sorgente
-            dest_folder,
-            "/MIR",                   # Mirror
-            "/R:3", "/W:5",           # Retry/Wait  
-            "/NP", "/NJH", "/NJS",    # Logging minimo (come in _copy_drive)
-            # "/P" progress potrebbe generare output eccessivo
-            #logger.LOG_FILE_PATH
-        ]
-        
-        result = subprocess.run(
-            robocopy,
-            capture_output=True,
-            text=True,
-            shell=False,
-            encoding='utf-8',
-            errors='ignore'  
-        )
-        
-        if result.returncode >= 8:
-            raise Exception(f"Robocopy failed with code {result.returncode}: {result.stderr}")
-        elif result.returncode > 1:
-            logger.warning(f"Robocopy warnings (code {result.returncode}): {result.stdout[:500]}")
+        drive_name = drive_letter.replace(":", "")
+        self._mirror(self.config.drive_path(drive_letter), dest_folder, self._previous_drive_folder(drive_letter),
+                     f"Disco_{drive_name}_Backup_{self.previous_snapshot}/", drive_filter(self.config, drive_letter))
             
         logger.debug(LOG_CLASSE + f"_copy_drive - Fine copia drive {drive_letter} in {dest_folder}")
 
     def _copy_user_folders(self, dest_folder: Path):
         logger.debug(LOG_CLASSE + f"_copy_user_folders - Inizio copia cartelle utente in {dest_folder}")
         path_source = os.environ.get("USERPROFILE", "C:\\Users\\Default")
+        previous_folder = self._previous_drive_folder("C:")
+        # Le regole di "C:" sono relative a ciascuna cartella utente
+        folder_filter = drive_filter(self.config, "C:")
 
         for drive in self.config.user_folders:  
             
+            if self.journal is not None and self.journal.is_done(f"C:/{drive}"):
+                logger.debug(f"{LOG_CLASSE}Cartella {drive} già copiata prima dell'interruzione")
+                continue
+            
             source = os.path.join(path_source, drive)
             destination = os.path.join(dest_folder, drive)
             
@@ -151,30 +400,105 @@ class BackupBuilder:
             
             logger.debug(f"{LOG_CLASSE}Copio {source} → {destination}")
             
-            robocopy = [
-                "robocopy",
-                source,  # sorgente
-                destination,
-                "/MIR",                   # Mirror
-                "/R:3", "/W:5",           # Retry/Wait  
-                "/NP", "/NJH", "/NJS",    # Logging minimo (come in _copy_drive)
-                # "/P" progress potrebbe generare output eccessivo
-                #logger.LOG_FILE_PATH
-            ]
-        
-            result = subprocess.run(
-                robocopy,
-                capture_output=True,
-                text=True,
-                shell=False,
-                encoding='utf-8',
-                errors='ignore'
-                #logger.LOG_FILE_PATH
-            )
+            link_dest = os.path.join(previous_folder, drive) if previous_folder else None
+            self._mirror(source, destination, link_dest, f"Disco_C_Backup_{self.previous_snapshot}/{drive}/", folder_filter)
+            if self.journal is not None:
+                self.journal.mark_done(f"C:/{drive}")
+            
+        logger.debug(LOG_CLASSE + f"_copy_user_folders - Fine copia cartelle utente in {dest_folder}")
+
+    def _mirror(self, source: str, destination: str, link_dest: str = None, manifest_prefix: str = None,
+                path_filter: PathFilter = None):
+        # Un tracker per ogni copia: throughput, ETA ed errori arrivano alla callback durante la copia
+        progress = ProgressTracker(source, self.progress_callback)
+        try:
+            if self.copy_engine is not None:
+                # Solo le opzioni usate: i motori senza journal o filtri mantengono la firma base
+                options = {}
+                changes = self._load_changes(source, link_dest, manifest_prefix, path_filter)
+                if changes is not None:
+                    options["changes"] = changes
+                if path_filter is not None:
+                    options["path_filter"] = path_filter
+                stats = self.copy_engine.mirror(source, destination, link_dest, progress, **options)
+                if isinstance(stats, CopyStats):
+                    self._count_copy_methods(stats)
+                return
             
-            if result.returncode >= 8:
-                raise Exception(f"Robocopy failed with code {result.returncode}: {result.stderr}")
-            elif result.returncode > 1:
-                logger.warning(f"Robocopy warnings (code {result.returncode}): {result.stdout[:500]}")
+            if self._source_totals.get(source):
+                progress.set_total(self._source_totals[source])
+            if path_filter is not None:
+                returncode, output = self.robocopy.run(source, destination, progress, path_filter)
+            else:
+                returncode, output = self.robocopy.run(source, destination, progress)
             
-        logger.debug(LOG_CLASSE + f"_copy_user_folders - Fine copia cartelle utente in {dest_folder}")
\ No newline at end of file
+            if returncode >= 8:
+                raise Exception(f"Robocopy failed with code {returncode}: {output[-500:]}")
+            elif returncode > 1:
+                logger.warning(f"Robocopy warnings (code {returncode}): {output[:500]}")
+        finally:
+            self.metrics.add_progress(progress.finish())
+
+    def _count_copy_methods(self, stats: CopyStats):
+        # Byte collegati allo snapshot precedente (catalogo) e file copiati senza trasferire tutti i dati:
+        # a delta, clonati (reflink) o sparsi
+        for name, value in (("bytes_linked", stats.bytes_linked),
+                            ("files_delta", stats.files_delta), ("bytes_delta_reused", stats.bytes_reused),
+                            ("files_cloned", stats.files_cloned), ("bytes_cloned", stats.bytes_cloned),
+                            ("files_sparse", stats.files_sparse), ("files_compressed", stats.files_compressed),
+                            ("files_incompressible", stats.files_incompressible)):
+            if value:
+                self.metrics.count(name, value)
+        if stats.bytes_stored:
+            # Byte originali e scritti dei file salvati dalla modalità compressa
+            self.metrics.count("compression_bytes_in", stats.bytes_copied)
+            self.metrics.count("compression_bytes_out", stats.bytes_stored)
+            self.metrics.count("compression_cpu_seconds", round(stats.cpu_seconds, 3))
+
+    def _log_compression(self):
+        bytes_out = self.metrics.counters.get("compression_bytes_out", 0)
+        if not bytes_out:
+            return
+        mb_in = self.metrics.counters.get("compression_bytes_in", 0) / 1024**2
+        cpu = self.metrics.counters.get("compression_cpu_seconds", 0)
+        logger.info(LOG_CLASSE + f"Compressione: {mb_in:.1f} MB → {bytes_out / 1024**2:.1f} MB "
+                                 f"(rapporto {mb_in * 1024**2 / bytes_out:.2f}), {cpu:.1f}s di CPU "
+                                 f"({cpu / mb_in if mb_in else 0:.3f}s per MB)")
+
+    def _load_changes(self, source: str, link_dest: str = None, manifest_prefix: str = None,
+                      path_filter: PathFilter = None):
+        if not self.config.change_journal:
+            return None
+        # Il mark viene scritto anche senza snapshot precedente: servirà al backup successivo.
+        # Contiene l'impronta dei filtri: se cambiano, il backup successivo rilegge tutta la sorgente
+        # Se il journal verrà usato, si attende che il watcher abbia scritto gli eventi precedenti al mark
+        journal = ChangeJournal(source, self.config.change_journal_dir)
+        filters = path_filter.fingerprint() if path_filter else ""
+        usable = link_dest is not None and self.previous_snapshot is not None
+        acknowledged = journal.mark(self.timestamp, filters, CHANGE_ACK_TIMEOUT_S if usable else 0.0)
+        if not journal.exists() or not usable:
+            return None
+        
+        changes = journal.changes_since(self.previous_snapshot, filters=filters) if acknowledged else None
+        manifest = self._open_previous_manifest() if changes is not None else None
+        if manifest is None:
+            logger.info(LOG_CLASSE + f"Journal delle modifiche non utilizzabile per {source}: scansione completa")
+            self.metrics.count("change_journal_fallbacks")
+            return None
+        
+        changes.manifest = manifest
+        changes.prefix = manifest_prefix
+        logger.info(LOG_CLASSE + f"{source}: {len(changes)} cartelle modificate dallo snapshot {self.previous_snapshot}")
+        self.metrics.count("change_journal_dirs", len(changes))
+        return changes
+    
+    def _open_previous_manifest(self):
+        # Condiviso dai job paralleli: il memory-map è in sola lettura
+        with self._manifest_lock:
+            if self._previous_manifest is None:
+                try:
+                    self._previous_manifest = BackupManifest(self.config.backup_path(self.previous_snapshot, MANIFEST_NAME))
+                except (OSError, ValueError) as e:
+                    logger.warning(LOG_CLASSE + f"Manifest dello snapshot {self.previous_snapshot} non leggibile: {e}")
+                    return None
+            return self._previous_manifest
@@ -0,0 +1,292 @@
+# Questa classe gestisce il catalogo degli snapshot: un file JSON lines nella cartella radice del backup
+# Elenco, conservazione e pianificazione dello spazio leggono un solo file invece di percorrere il disco
+
+"""
+G:\\Backup_PC\\.pybck_catalog.jsonl
+
+{"op": "add", "name": "2024-01-15_10-30-45", "status": "finalized", "size": 123, "files": 4, ...}
+{"op": "remove", "name": "2024-01-08_10-30-45"}
+
+Ogni modifica è una riga aggiunta in coda (scritta con una sola write e fsync): una riga troncata
+da un'interruzione viene ignorata. L'ultima riga per nome vince; quando le righe superate sono
+troppe, o il file è danneggiato, il catalogo viene riscritto in modo atomico (.tmp + os.replace).
+
+rebuild()   → ricostruisce il catalogo dalle cartelle presenti sul disco e dai loro manifest
+reconcile() → allinea il catalogo alle cartelle <timestamp> sul disco (BackupCleaner, a ogni pulizia):
+              aggiunge gli snapshot mancanti (es. catalogo non aggiornato alla finalizzazione) e
+              rimuove quelli cancellati a mano. Costa una sola scansione della cartella radice
+
+size         → byte logici dei file (dal manifest), mostrati da "pybck status"
+unique_bytes → byte sul disco attribuiti allo snapshot, usati dal budget di spazio e da SpacePlanner:
+                 un file (inode) o un chunk della modalità dedup conta nello snapshot più recente che
+                 lo contiene. Quindi, sommando dal più recente, la somma dei primi N snapshot è lo spazio
+                 occupato da quegli N, e la somma degli snapshot più vecchi di uno dato è lo spazio che
+                 la loro eliminazione libera.
+               Una modifica all'elenco cambia l'attribuzione degli snapshot più vecchi: remove() e
+               reconcile() li segnano come da misurare (None) e measure() li ricalcola dal più recente.
+               occupancy(names) misura l'attribuzione tra i soli snapshot indicati (es. quelli che le
+               regole di conservazione mantengono), senza salvarla
+"""
+
+import json
+import os
+from collections import Counter
+from dataclasses import dataclass, asdict, fields
+from re import match
+from typing import Dict, List, Optional
+
+from pybck import logger
+LOG_CLASSE = "[BackupCatalog] - "
+
+CATALOG_NAME = ".pybck_catalog.jsonl"
+SNAPSHOT_PATTERN = r"^\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}$"
+COMPACT_MIN_LINES = 100
+
+
+@dataclass
+class CatalogEntry:
+    name: str
+    status: str = "finalized"  # "finalized", "verified" oppure "corrupt"
+    size: int = 0
+    files: int = 0
+    duration: float = 0.0
+    storage_mode: str = "mirror"
+    unique_bytes: Optional[int] = None  # None: non ancora misurati (catalogo di una versione precedente)
+
+
+class BackupCatalog:
+    path : str
+
+    def __init__(self, backup_root: str):
+        self.backup_root = backup_root
+        self.path = os.path.join(backup_root, CATALOG_NAME)
+        self._entries = None
+        self._lines = 0
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.path)
+
+    def load(self) -> Dict[str, CatalogEntry]:
+        if self._entries is not None:
+            return self._entries
+
+        entries = {}
+        lines = 0
+        damaged = False
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                for line in file:
+                    if not line.strip():
+                        continue
+                    lines += 1
+                    try:
+                        record = json.loads(line)
+                        if record.pop("op") == "remove":
+                            entries.pop(record["name"], None)
+                        else:
+                            entries[record["name"]] = _entry(record)
+                    except (json.JSONDecodeError, KeyError, TypeError):
+                        damaged = True  # Riga troncata da un'interruzione
+        except FileNotFoundError:
+            pass
+
+        self._entries = entries
+        self._lines = lines
+        if damaged or lines > max(COMPACT_MIN_LINES, 2 * len(entries)):
+            self.compact()
+        return entries
+
+    def list(self) -> List[str]:
+        # Snapshot dal più recente al più vecchio
+        return sorted(self.load(), reverse=True)
+
+    def get(self, name: str) -> Optional[CatalogEntry]:
+        return self.load().get(name)
+
+    def add(self, entry: CatalogEntry):
+        # Aggiunge o sostituisce lo snapshot
+        self.load()[entry.name] = entry
+        self._append({"op": "add", **asdict(entry)})
+
+    def add_newest(self, entry: CatalogEntry, linked_bytes: Optional[int]):
+        # Snapshot appena finalizzato, senza percorrerlo: entry.unique_bytes sono tutti i suoi byte
+        # (è il più recente) e linked_bytes quelli collegati con hard link allo snapshot precedente,
+        # che da ora contano nel nuovo. None: attribuzione sconosciuta, gli snapshot precedenti vanno rimisurati
+        entries = self.load()
+        previous = max((name for name in entries if name < entry.name), default=None)
+        if previous is not None:
+            if entry.unique_bytes is None or linked_bytes is None:
+                if _invalidate(entries, previous):
+                    self._write_all(entries)
+            elif linked_bytes and entries[previous].unique_bytes is not None:
+                entries[previous].unique_bytes = max(0, entries[previous].unique_bytes - linked_bytes)
+                self._append({"op": "add", **asdict(entries[previous])})
+        self.add(entry)
+
+    def remove(self, name: str):
+        entries = self.load()
+        if entries.pop(name, None) is None:
+            return
+        # I file che condivideva con snapshot più vecchi ora contano in quelli: vanno rimisurati
+        if _invalidate(entries, name):
+            self._write_all(entries)
+        else:
+            self._append({"op": "remove", "name": name})
+
+    def compact(self):
+        logger.debug(LOG_CLASSE + f"compact - Riscrittura catalogo con {len(self._entries)} snapshot")
+        self._write_all(self._entries)
+
+    def rebuild(self) -> Dict[str, CatalogEntry]:
+        # Ricostruzione dal disco: dimensioni e numero di file dal manifest di ogni snapshot
+        logger.info(LOG_CLASSE + f"Ricostruzione del catalogo da {self.backup_root}")
+        names = sorted(self._disk_names(), reverse=True)
+        # Dal più recente: i file condivisi con hard link contano nell'ultimo snapshot che li contiene
+        seen = set()
+        entries = {name: self.entry_from_disk(os.path.join(self.backup_root, name), name, seen) for name in names}
+
+        self._entries = entries
+        self._write_all(entries)
+        return entries
+
+    def reconcile(self) -> Dict[str, CatalogEntry]:
+        entries = self.load()
+        names = set(self._disk_names())
+        missing = sorted(names.difference(entries))
+        removed = sorted(set(entries).difference(names))
+        if not missing and not removed:
+            return entries
+
+        logger.warning(LOG_CLASSE + f"Catalogo non allineato al disco: {len(missing)} snapshot aggiunti, {len(removed)} rimossi")
+        for name in missing:
+            entries[name] = self.entry_from_manifest(os.path.join(self.backup_root, name), name)
+        for name in removed:
+            del entries[name]
+        # Gli snapshot aggiunti e quelli più vecchi dell'ultima modifica vanno rimisurati (measure)
+        _invalidate(entries, max(missing + removed))
+        self._write_all(entries)
+        return entries
+
+    def measure(self, names: List[str]):
+        # Ricalcola unique_bytes degli snapshot indicati (tutti quelli presenti) e riscrive il catalogo
+        logger.info(LOG_CLASSE + f"Misura dello spazio occupato da {len(names)} snapshot")
+        entries = self.load()
+        for name, size in self.occupancy([name for name in names if name in entries]).items():
+            entries[name].unique_bytes = size
+        self._write_all(entries)
+
+    def occupancy(self, names: List[str]) -> Dict[str, Optional[int]]:
+        # Byte di ogni snapshot non contenuti in quelli più recenti tra i nomi indicati (percorre gli snapshot)
+        seen = set()
+        return {name: _measure(os.path.join(self.backup_root, name), name, seen) for name in sorted(names, reverse=True)}
+
+    def entry_from_disk(self, snapshot_path: str, name: str, seen: set = None) -> CatalogEntry:
+        # seen: inode e chunk degli snapshot più recenti già misurati (None: solo i file non condivisi)
+        entry = self.entry_from_manifest(snapshot_path, name)
+        entry.unique_bytes = _measure(snapshot_path, name, seen)
+        return entry
+
+    def entry_from_manifest(self, snapshot_path: str, name: str) -> CatalogEntry:
+        # Dimensione e numero di file dal manifest; unique_bytes resta da misurare
+        # Import locale: chi legge solo il catalogo (es. "pybck status") non carica il lettore dei manifest
+        from pybck.BackupManifest import BackupManifest, MANIFEST_NAME
+        entry = CatalogEntry(name)
+        try:
+            with BackupManifest(os.path.join(snapshot_path, MANIFEST_NAME)) as manifest:
+                entry.size = manifest.total_bytes
+                entry.files = len(manifest)
+        except (OSError, ValueError):
+            logger.warning(LOG_CLASSE + f"Manifest assente o non valido per {name}: dimensione sconosciuta")
+        return entry
+
+    def _disk_names(self) -> List[str]:
+        with os.scandir(self.backup_root) as items:
+            return [item.name for item in items if item.is_dir() and match(SNAPSHOT_PATTERN, item.name)]
+
+    def _append(self, record: dict):
+        # Il catalogo vive nella radice del backup: se non esiste non lo creo altrove
+        if not os.path.isdir(self.backup_root):
+            logger.warning(LOG_CLASSE + f"Cartella del backup non trovata, catalogo non aggiornato: {self.backup_root}")
+            return
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0), 0o644)
+        try:
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self._lines += 1
+
+    def _write_all(self, entries: Dict[str, CatalogEntry]):
+        if not os.path.isdir(self.backup_root):
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            for name in sorted(entries):
+                file.write(json.dumps({"op": "add", **asdict(entries[name])}, ensure_ascii=False) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+        self._lines = len(entries)
+
+
+def unique_bytes(snapshot_path: str, seen: set = None) -> int:
+    # Byte dei file con un solo link e dei chunk referenziati solo da questo snapshot.
+    # seen: inode e chunk già attribuiti a snapshot più recenti (occupancy, rebuild); quelli nuovi
+    # vengono contati qui e aggiunti a seen
+    from pybck.ChunkStore import ChunkStore, RECIPE_NAME, STORE_NAME, read_recipe
+    total = 0
+    chunks = Counter()
+    stack = [snapshot_path]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                if not st.st_nlink:
+                    st = os.stat(entry.path, follow_symlinks=False)  # Su Windows DirEntry non riporta i link
+                if st.st_nlink == 1:
+                    total += st.st_size
+                elif seen is not None and (st.st_dev, st.st_ino) not in seen:
+                    seen.add((st.st_dev, st.st_ino))
+                    total += st.st_size
+                if entry.name == RECIPE_NAME:
+                    for item in read_recipe(entry.path):
+                        chunks.update(item["chunks"])
+
+    store_path = os.path.join(os.path.dirname(snapshot_path), STORE_NAME)
+    if chunks and os.path.isdir(store_path):
+        store = ChunkStore(store_path)
+        try:
+            total += store.exclusive_bytes(chunks, seen)
+        finally:
+            store.close()
+    return total
+
+
+def _invalidate(entries: Dict[str, CatalogEntry], newest: str) -> bool:
+    # Segna da misurare gli snapshot non più recenti di newest; True se qualcuno era misurato
+    changed = False
+    for name, entry in entries.items():
+        if name <= newest and entry.unique_bytes is not None:
+            entry.unique_bytes = None
+            changed = True
+    return changed
+
+
+def _measure(snapshot_path: str, name: str, seen: set = None) -> Optional[int]:
+    try:
+        return unique_bytes(snapshot_path, seen)
+    except (OSError, ValueError) as e:
+        logger.warning(LOG_CLASSE + f"Spazio occupato da {name} non misurabile: {e}")
+        return None
+
+
+def _entry(record: dict) -> CatalogEntry:
+    # Ignoro i campi sconosciuti (catalogo scritto da una versione più recente)
+    known = {f.name for f in fields(CatalogEntry)}
+    return CatalogEntry(**{key: value for key, value in record.items() if key in known})
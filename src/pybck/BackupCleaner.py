@@ -1,15 +1,20 @@
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, replace
 # Questa classe gestisce la validazione delle condizioni per effettuare un backup
 # Verifica quindi: che il dispositivo sia colllegato, che la cartella di backup esista, che le cartelle utente esistano
 # e che ci sia spazio sufficiente sul drive di backup.
 
 from re import match
 import shutil
-from datetime import datetime
 from pathlib import Path
-from typing import List
+from typing import Callable, List
 
 from pybck.BackupConfig import BackupConfig
+from pybck.BackupCatalog import BackupCatalog
+from pybck.BackupJournal import resumable_backups
+from pybck.BackupMetrics import BackupMetrics
+from pybck.BackupProgress import ProgressEvent
+from pybck.BackupReclaimer import BackupReclaimer, TRASH_NAME
+from pybck.RetentionPolicy import RetentionPolicy, plan_retention
 from pybck import logger
 LOG_CLASSE = "[BackupCleaner] - "
 
@@ -19,73 +24,244 @@ class BackupCleaner:
     cleanedFailed : bool
     error : str
     
-    def __init__(self, config: BackupConfig):
+    def __init__(self, config: BackupConfig, progress_callback: Callable[[ProgressEvent], None] = None,
+                 metrics: BackupMetrics = None):
         self.config = config
+        self.metrics = metrics if metrics is not None else BackupMetrics()
         self.cleanedOld = False
         self.cleanedFailed = False
         self.error = None
+        self.progress_callback = progress_callback
+        self.reclaimer = None
+        self.catalog = None
     
     def clean_old_backups(self):
         logger.debug(LOG_CLASSE + "clean_old_backups - Inizio clean_old_backups")  
-        TIMESTAMP_FORMAT = "%Y-%m-%d_%H-%M-%S"
-        patternTimestamp = r"^\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}$"
+        with self.metrics.span("clean_old"):
+            self._clean_old_backups()
+        logger.debug(LOG_CLASSE + "clean_old_backups - Fine clean_old_backups")
+    
+    def _clean_old_backups(self):
+        # Calcolo la lista dei backup, già ordinata dal più recente al più vecchio
+        listFoldersBackups = self.get_finalized_backups()
         
-        # Calcolo la lista dei backup
-        listFoldersBackups = self._getListBackups(patternTimestamp)
-        sizeList = len(listFoldersBackups)
+        # Applico le regole di conservazione (ultimi N, GFS, budget di spazio)
+        policy = self.retention_policy()
+        sizes = None
+        if policy.max_total_bytes:
+            # Il budget conserva i candidati delle altre regole dal più recente: servono i byte che
+            # ognuno aggiunge ai candidati più recenti, non quelli condivisi con snapshot da eliminare
+            candidates = listFoldersBackups
+            if policy.has_count_rules:
+                candidates, _ = plan_retention(listFoldersBackups, replace(policy, max_total_bytes=0))
+            sizes = self.kept_sizes(candidates)
+        _, folders_to_delete = plan_retention(listFoldersBackups, policy, sizes)
         
-        if sizeList > self.config.keep_last_n :
-            # Ordino la lista dal più recente al più vecchio
-            listFoldersBackups.sort(key=lambda x: datetime.strptime(x, TIMESTAMP_FORMAT), reverse=True)
-            
-            # identifico la sottolista da eliminare
-            folders_to_delete = listFoldersBackups[self.config.keep_last_n:]
-            
+        if folders_to_delete :
             # Eseguo pulizia
+            removed = []
             try:
-                for folder_name in folders_to_delete:
-                    pathBackupTmp = Path(self.config.backup_drive) / self.config.backup_root / folder_name
-                    if pathBackupTmp.exists() and pathBackupTmp.is_dir() :
-                        shutil.rmtree(pathBackupTmp)
+                try:
+                    for folder_name in folders_to_delete:
+                        pathBackupTmp = self._backup_base_path() / folder_name
+                        if pathBackupTmp.exists() and pathBackupTmp.is_dir() :
+                            self._release_chunks(pathBackupTmp)
+                            self._discard(pathBackupTmp)
+                        self._get_catalog().remove(folder_name)
+                        removed.append(folder_name)
+                        self.metrics.count("snapshots_deleted")
+                finally:
+                    # Anche dopo un errore l'indice perde gli snapshot già eliminati
+                    self._remove_from_path_index(removed)
 
+                self._reclaim()
                 self.cleanedOld = True
                 logger.info(LOG_CLASSE + "Pulizia dei vecchi backup eseguita con successo.")
             except Exception as e:
                 logger.error(LOG_CLASSE + f"Errore durante la pulizia dei vecchi backup: {e}")
                 self.error = f"Errore durante la pulizia dei vecchi backup: {e}"
+                self.metrics.count("clean_errors")
                 self.cleanedOld = False
-        
-        logger.debug(LOG_CLASSE + "clean_old_backups - Fine clean_old_backups")
+    
+    def retention_policy(self) -> RetentionPolicy:
+        return RetentionPolicy(
+            keep_last=self.config.keep_last_n,
+            keep_daily=self.config.keep_daily,
+            keep_weekly=self.config.keep_weekly,
+            keep_monthly=self.config.keep_monthly,
+            keep_yearly=self.config.keep_yearly,
+            max_total_bytes=int(self.config.max_backup_size_gb * 1024**3),
+        )
         
     def clean_failed_backups(self):
         logger.debug(LOG_CLASSE + "clean_failed_backups - Inizio clean_failed_backups")  
+        with self.metrics.span("clean_failed"):
+            self._clean_failed_backups()
+        logger.debug(LOG_CLASSE + "clean_failed_backups - Fine clean_failed_backups")
+    
+    def _clean_failed_backups(self):
         TIMESTAMP_FORMAT = "%Y-%m-%d_%H-%M-%S"
         patternTmpFolder = r"^\.tmp_backup_\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}$"
         
-        # Calcolo la lista dei backup
+        # Calcolo la lista dei backup, escluso il backup interrotto più recente se può essere ripreso
         listFoldersBackups = self._getListBackups(patternTmpFolder)
+        resumable = resumable_backups(str(self._backup_base_path()), self.config)[:1]
+        if resumable:
+            logger.info(LOG_CLASSE + f"Backup interrotto {resumable[0]} conservato per la ripresa.")
+        listFoldersBackups = [folder for folder in listFoldersBackups if folder not in resumable]
         sizeList = len(listFoldersBackups)
         if sizeList > 0 :
             # Eseguo pulizia
             try:
                 for folder in listFoldersBackups :
-                    pathBackupTmp = (Path(self.config.backup_drive)/self.config.backup_root / folder)
+                    pathBackupTmp = (self._backup_base_path() / folder)
                     if pathBackupTmp.exists() and pathBackupTmp.is_dir() :
-                        shutil.rmtree(pathBackupTmp)
+                        self._release_chunks(pathBackupTmp)
+                        self._discard(pathBackupTmp)
+                        self.metrics.count("failed_backups_deleted")
 
+                self._reclaim()
                 self.cleanedFailed = True
                 logger.info(LOG_CLASSE + "Pulizia dei backup falliti eseguita con successo.")
             except Exception as e:
                 logger.error(LOG_CLASSE + f"Errore durante la pulizia dei backup falliti: {e}")
                 self.error = f"Errore durante la pulizia dei backup falliti: {e}"
+                self.metrics.count("clean_errors")
                 self.cleanedFailed = False
     
-        logger.debug(LOG_CLASSE + "clean_failed_backups - Fine clean_failed_backups")
+    def get_finalized_backups(self) -> List:
+        # Backup finalizzati ordinati dal più recente al più vecchio, letti dal catalogo
+        # (ricostruito dalle cartelle sul disco se manca, altrimenti allineato alle cartelle presenti)
+        backup_base_path = self._backup_base_path()
+        if not backup_base_path.is_dir():
+            return []
+        
+        catalog = self._get_catalog()
+        if not catalog.exists():
+            catalog.rebuild()
+        else:
+            catalog.reconcile()
+        return catalog.list()
+    
+    def _remove_from_path_index(self, folder_names: List[str]):
+        # La pulizia non crea l'indice, lo aggiorna solo se esiste; un errore non blocca la pulizia.
+        # Una sola apertura dell'indice e una sola transazione per tutti gli snapshot eliminati
+        # Import locali (anche ChunkStore e BackupManifest): chi elenca solo gli snapshot (SpacePlanner,
+        # "pybck status") non carica sqlite3 e il motore di copia
+        from pybck.PathIndex import PathIndex, INDEX_NAME
+        if not folder_names or not (self._backup_base_path() / INDEX_NAME).is_file():
+            return
+        try:
+            with PathIndex(str(self._backup_base_path())) as index:
+                index.remove_snapshots(folder_names)
+        except Exception as e:
+            logger.warning(LOG_CLASSE + f"Impossibile aggiornare l'indice dei percorsi per {', '.join(folder_names)}: {e}")
+    
+    def _get_catalog(self) -> BackupCatalog:
+        if self.catalog is None:
+            self.catalog = BackupCatalog(str(self._backup_base_path()))
+        return self.catalog
+    
+    def wait_reclaim(self, timeout: float = None) -> bool:
+        # Attende la fine della cancellazione in background (True se terminata)
+        if self.reclaimer is None:
+            return True
+        return self.reclaimer.wait(timeout)
+    
+    def _get_reclaimer(self) -> BackupReclaimer:
+        if self.reclaimer is None:
+            trash_root = self._backup_base_path() / TRASH_NAME
+            self.reclaimer = BackupReclaimer(str(trash_root), self.config.reclaim_threads,
+                                             self.config.reclaim_max_ops_per_s, self.progress_callback)
+        return self.reclaimer
+    
+    def _discard(self, pathBackup: Path):
+        # Rinomina nel cestino: il backup sparisce subito, lo spazio viene recuperato dopo
+        try:
+            self._get_reclaimer().move_to_trash(str(pathBackup))
+        except OSError as e:
+            # Es. file aperti su Windows: ripiego sulla cancellazione diretta
+            logger.warning(LOG_CLASSE + f"Impossibile spostare {pathBackup.name} nel cestino ({e}), cancellazione diretta")
+            shutil.rmtree(pathBackup)
+    
+    def _reclaim(self):
+        # Svuota il cestino, compresi i residui di esecuzioni interrotte
+        reclaimer = self._get_reclaimer()
+        if self.config.reclaim_in_background:
+            reclaimer.start_background()
+            return
+        with self.metrics.span("reclaim"):
+            report = reclaimer.reclaim()
+        self.metrics.count("files_deleted", report.files_deleted)
+        self.metrics.count("bytes_reclaimed", report.bytes_reclaimed)
+        self.metrics.count("reclaim_errors", len(report.errors))
+    
+    def kept_sizes(self, candidates: List) -> dict:
+        # Byte che ogni candidato aggiunge a quelli più recenti: sommati dal più recente danno lo spazio
+        # occupato dai candidati conservati. Se sono i più recenti del catalogo valgono le sue misure,
+        # altrimenti (regole GFS che saltano snapshot) l'attribuzione va misurata tra i soli candidati
+        ordered = sorted(candidates, reverse=True)
+        if ordered == self.get_finalized_backups()[:len(ordered)]:
+            return self.snapshot_sizes(ordered)
+        return {name: size for name, size in self._get_catalog().occupancy(ordered).items() if size is not None}
+
+    def snapshot_sizes(self, listFolders: List) -> dict:
+        # Byte sul disco attribuiti a ogni snapshot (unique_bytes del catalogo): un file o chunk condiviso
+        # conta nello snapshot più recente che lo contiene. La somma dei più recenti è lo spazio che occupano,
+        # quella dei più vecchi lo spazio che la loro eliminazione libera. Gli snapshot senza misura vengono
+        # misurati; se la misura non è possibile uso la dimensione logica dell'intestazione del manifest
+        sizes = {}
+        catalog = self._get_catalog()
+        if not catalog.exists() and self._backup_base_path().is_dir():
+            catalog.rebuild()
+        if any(catalog.get(name) is not None and catalog.get(name).unique_bytes is None for name in listFolders):
+            catalog.measure(catalog.list())
+        for folder_name in listFolders:
+            entry = catalog.get(folder_name)
+            if entry is not None and entry.unique_bytes is not None:
+                sizes[folder_name] = entry.unique_bytes
+                continue
+            from pybck.BackupManifest import BackupManifest, MANIFEST_NAME
+            manifest_path = self._backup_base_path() / folder_name / MANIFEST_NAME
+            try:
+                with BackupManifest(str(manifest_path)) as manifest:
+                    sizes[folder_name] = manifest.total_bytes
+            except (OSError, ValueError):
+                logger.warning(LOG_CLASSE + f"Dimensione non disponibile per {folder_name}: manifest assente o non valido")
+        return sizes
+    
+    def _release_chunks(self, pathBackup: Path):
+        # Snapshot deduplicato: prima di eliminarlo rilascio i chunk referenziati dalle sue ricette
+        from pybck.ChunkStore import ChunkStore, STORE_NAME, RECIPE_NAME
+        store_path = self._backup_base_path() / STORE_NAME
+        if not store_path.is_dir():
+            return
+        
+        # Le ricette stanno nelle cartelle dei drive o delle cartelle utente (anche parziali se il backup è fallito)
+        recipes = list(pathBackup.glob(f"*/{RECIPE_NAME}*")) + list(pathBackup.glob(f"*/*/{RECIPE_NAME}*"))
+        if not recipes:
+            return
+        
+        # Una ricetta .tmp ha riferimenti solo se era già registrata come "pending": lo decide discard_recipe
+        finals = sorted({str(recipe)[:-len(".tmp")] if recipe.name.endswith(".tmp") else str(recipe) for recipe in recipes})
+        store = ChunkStore(str(store_path))
+        try:
+            freed = sum(store.discard_recipe(recipe) for recipe in finals)
+            logger.debug(LOG_CLASSE + f"_release_chunks - Liberati {freed} byte di chunk da {pathBackup.name}")
+        finally:
+            store.close()
+    
+    def _backup_base_path(self) -> Path:
+        # Cartella radice del backup (l'unità può essere mappata su una cartella locale)
+        drive = self.config.drive_map.get(self.config.backup_drive, self.config.backup_drive)
+        return Path(drive) / self.config.backup_root
     
     def _getListBackups(self, pattern) -> List:
         # Crea lista di cartelle dei backup effettuati
         listFolders = []
-        backup_base_path = Path(self.config.backup_drive) / self.config.backup_root
+        backup_base_path = self._backup_base_path()
+        if not backup_base_path.is_dir():
+            return listFolders  # Primo backup: la cartella radice non esiste ancora
         
         for item in backup_base_path.iterdir():
             if item.is_dir():
@@ -1,10 +1,13 @@
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 import re
 import json
+import ntpath
 import os
 from pybck import logger
 LOG_CLASSE = "[BackupConfig] - "
 
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+
 @dataclass
 class BackupConfig:
     backup_drive: str # Porta del  drive di backup
@@ -12,6 +15,46 @@ class BackupConfig:
     source_drives: list # Elenco delle unità sorgente da includere nel backup
     user_folders: list # Elenco delle cartelle utente da includere nel backup
     keep_last_n: int # Numero di giorni per mantenere i backup            
+    keep_daily: int = 0 # Conserva l'ultimo backup di ciascuno degli ultimi N giorni
+    keep_weekly: int = 0 # Conserva l'ultimo backup di ciascuna delle ultime N settimane
+    keep_monthly: int = 0 # Conserva l'ultimo backup di ciascuno degli ultimi N mesi
+    keep_yearly: int = 0 # Conserva l'ultimo backup di ciascuno degli ultimi N anni
+    max_backup_size_gb: float = 0 # Conserva i backup più recenti che rientrano in questo spazio (0 = nessun limite)
+    copy_engine: str = "robocopy" # Motore di copia: "robocopy" oppure "native" (multi-thread, portabile)
+    copy_threads: int = 8 # Numero di thread usati dal motore nativo
+    reflink: bool = True # Il motore nativo clona i file (FICLONE) quando sorgente e backup sono sullo stesso file system btrfs/XFS
+    max_parallel_jobs: int = 4 # Numero massimo di sorgenti copiate contemporaneamente
+    max_jobs_per_source_device: int = 1 # Copie contemporanee dallo stesso disco fisico sorgente
+    max_jobs_per_target: int = 2 # Copie contemporanee verso lo stesso disco di backup
+    device_groups: dict = field(default_factory=dict) # Unità che condividono lo stesso disco fisico (es. {"D:": "disco1", "E:": "disco1"})
+    incremental: bool = False # Hard link verso lo snapshot precedente per i file invariati (richiede copy_engine "native")
+    manifest_hash: bool = False # Calcola lo sha256 di ogni file nel manifest dello snapshot
+    path_index: bool = True # Indice dei percorsi di tutti gli snapshot (.pybck_paths.sqlite) per "pybck find"
+    storage_mode: str = "mirror" # "mirror" (copia dei file), "dedup" (chunk deduplicati + ricette) oppure "compressed" (file compressi)
+    compression: str = "zlib" # Codec della modalità compressa: "zlib", "lzma" oppure "zstd" (pacchetto zstandard)
+    compression_level: int = 0 # Livello di compressione (0 = predefinito del codec)
+    compression_processes: int = 0 # Processi usati per comprimere (0 = numero di CPU)
+    verify_backup: bool = False # Verifica lo snapshot dopo la finalizzazione
+    verify_mode: str = "quick" # "quick" (dimensione e data) oppure "full" (contenuto sha256)
+    preflight_timeout_s: float = 10.0 # Tempo massimo di risposta di un disco nei controlli preliminari
+    preflight_space_timeout_s: float = 600.0 # Tempo massimo per la stima dello spazio necessario
+    resume_backups: bool = True # Riprende un backup interrotto invece di ricominciare da zero
+    resume_max_age_hours: int = 72 # Oltre questa età un backup interrotto viene eliminato
+    drive_map: dict = field(default_factory=dict) # Unità mappate su cartelle locali (es. {"G:": "/mnt/backup"}), per test e benchmark
+    reclaim_threads: int = 4 # Thread usati per cancellare i backup spostati nel cestino
+    reclaim_max_ops_per_s: int = 0 # Budget di I/O della cancellazione (operazioni al secondo, 0 = illimitato)
+    reclaim_in_background: bool = False # Svuota il cestino in background, in parallelo al backup successivo
+    metrics_dir: str = "metrics" # Cartella del record delle esecuzioni (pybck_runs.jsonl); "" disattiva le metriche
+    log_level: str = "INFO" # Livello del log configurato da setup_logging (DEBUG, INFO, WARNING, ERROR)
+    metrics_textfile: str = "" # File .prom per il textfile collector di node_exporter (default: <metrics_dir>/pybck.prom)
+    change_journal: bool = False # Percorre solo le cartelle registrate dal servizio "pybck watch" (richiede incremental e copy_engine "native")
+    change_journal_dir: str = "cache/changes" # Cartella dei journal delle modifiche, uno per sorgente
+    watch_backend: str = "inotify" # Backend di monitoraggio del servizio "pybck watch"
+    delta_copy: bool = False # Copia a delta dei file grandi modificati rispetto allo snapshot precedente (richiede incremental e copy_engine "native"; usata solo se il backup è su un file system con reflink)
+    delta_min_size_mb: int = 64 # Dimensione minima dei file copiati a delta
+    delta_block_kb: int = 0 # Dimensione dei blocchi della copia a delta (0 = circa la radice quadrata della dimensione del file)
+    signature_dir: str = "cache/signatures" # Cartella della cache delle firme dei blocchi
+    filters: dict = field(default_factory=dict) # Regole include/exclude per unità o "*" (vedi PathFilter), es. {"*": {"exclude": ["node_modules/"]}}
 
     def __post_init__(self):
         logger.debug(LOG_CLASSE + "__post_init__ - Verifica cartelle utente")
@@ -47,8 +90,86 @@ class BackupConfig:
         
         if self.keep_last_n > 0 and self.keep_last_n < 7:
             raise ValueError("Keep last n Deve essere maggiore di 0 e minore di 7.")
+        
+        if min(self.keep_daily, self.keep_weekly, self.keep_monthly, self.keep_yearly, self.max_backup_size_gb) < 0:
+            raise ValueError("Le regole di conservazione dei backup non possono essere negative.")
+        
+        if self.copy_engine not in ("robocopy", "native"):
+            raise ValueError(f"Motore di copia non valido: {self.copy_engine}. Valori ammessi: robocopy, native.")
+        
+        if self.copy_threads < 1:
+            raise ValueError("Il numero di thread di copia deve essere almeno 1.")
+        
+        if self.max_parallel_jobs < 1 or self.max_jobs_per_source_device < 1 or self.max_jobs_per_target < 1:
+            raise ValueError("I limiti di concorrenza dei job devono essere almeno 1.")
+        
+        if self.preflight_timeout_s <= 0 or self.preflight_space_timeout_s <= 0:
+            raise ValueError("I timeout dei controlli preliminari devono essere maggiori di 0.")
+        
+        if self.resume_max_age_hours < 1:
+            raise ValueError("L'età massima di un backup riprendibile deve essere di almeno 1 ora.")
+        
+        if self.reclaim_threads < 1 or self.reclaim_max_ops_per_s < 0:
+            raise ValueError("La cancellazione richiede almeno 1 thread e un budget di I/O non negativo.")
+        
+        if self.storage_mode not in ("mirror", "dedup", "compressed"):
+            raise ValueError(f"Modalità di archiviazione non valida: {self.storage_mode}. Valori ammessi: mirror, dedup, compressed.")
+        
+        if self.storage_mode == "compressed":
+            # Import locale: i codec e il pool di processi servono solo alla modalità compressa
+            from pybck.CompressedStore import validate_codec
+            validate_codec(self.compression, self.compression_level)
+            if self.compression_processes < 0:
+                raise ValueError("Il numero di processi di compressione non può essere negativo.")
+        
+        if self.verify_mode not in ("quick", "full"):
+            raise ValueError(f"Modalità di verifica non valida: {self.verify_mode}. Valori ammessi: quick, full.")
+        
+        if self.log_level not in LOG_LEVELS:
+            raise ValueError(f"Livello di log non valido: {self.log_level}. Valori ammessi: {', '.join(LOG_LEVELS)}.")
+        
+        for drive, folder in self.drive_map.items():
+            if not re.fullmatch(patternDrive, drive) or not isinstance(folder, str) or not folder.strip():
+                raise ValueError(f"Mappatura unità non valida: {drive} → {folder}.")
+        
+        if self.filters != {}:
+            # Import locale: senza filtri la configurazione (es. "pybck status") non carica PathFilter
+            from pybck.PathFilter import validate_filters
+            validate_filters(self.filters, self.copy_engine if self.storage_mode == "mirror" else "native")
+        
+        if self.incremental and self.storage_mode == "mirror" and self.copy_engine != "native":
+            raise ValueError("La modalità incrementale richiede copy_engine 'native'.")
+        
+        if self.change_journal and not (self.incremental and self.storage_mode == "mirror" and self.copy_engine == "native"):
+            raise ValueError("Il journal delle modifiche richiede incremental, storage_mode 'mirror' e copy_engine 'native'.")
+        
+        if self.delta_copy and not (self.incremental and self.storage_mode == "mirror" and self.copy_engine == "native"):
+            raise ValueError("La copia a delta richiede incremental, storage_mode 'mirror' e copy_engine 'native'.")
+        
+        if self.delta_min_size_mb < 1 or self.delta_block_kb < 0:
+            raise ValueError("La copia a delta richiede una dimensione minima di almeno 1 MB e blocchi non negativi.")
+        
+        if self.watch_backend not in ("inotify",):
+            raise ValueError(f"Backend di monitoraggio non valido: {self.watch_backend}. Valori ammessi: inotify.")
         logger.debug(LOG_CLASSE + "validate - Fine validate")   
     
+    def drive_path(self, drive: str, *parts) -> str:
+        # Percorso su un'unità: "D:\\parte" in stile Windows, oppure nella cartella indicata da drive_map
+        folder = self.drive_map.get(drive)
+        if folder is None:
+            return ntpath.join(drive + "\\", *parts)
+        return os.path.join(folder, *parts)
+    
+    def backup_path(self, *parts) -> str:
+        # Percorso nella cartella radice del backup, es. G:\\Backup_PC\\<parts>
+        return self.drive_path(self.backup_drive, self.backup_root, *parts)
+    
+    def join(self, base: str, *parts) -> str:
+        # Separatore Windows per i percorsi delle unità, quello locale quando le unità sono mappate
+        if self.drive_map:
+            return os.path.join(base, *parts)
+        return ntpath.join(base, *parts)
+    
     def save(self, filepath="config.json"):
         with open(filepath, "w") as file:
             json.dump(asdict(self), file, indent=2,ensure_ascii=False)  # Leggibile
@@ -0,0 +1,128 @@
+# Questa classe gestisce il journal di un backup in corso: le sorgenti e le cartelle già copiate
+# Un backup interrotto (mancanza di corrente, disco scollegato) riparte da dove si era fermato
+
+"""
+G:\\Backup_PC\\.tmp_backup_2024-01-22_10-30-45\\.pybck_journal.jsonl
+
+{"version": 1, "timestamp": "2024-01-22_10-30-45", "source_drives": [...], "user_folders": [...], ...}
+{"done": "D:"}
+{"done": "C:/Documents"}
+
+Il journal viene creato con la cartella temporanea e rimosso prima della finalizzazione.
+Una cartella temporanea è riprendibile se il journal è leggibile, è stato creato con la stessa
+configurazione ed è stato aggiornato da meno di resume_max_age_hours ore.
+All'interno di una sorgente non completata la ripresa si affida al mirror: i file già copiati
+(stessa dimensione e data) vengono saltati dal motore di copia o da robocopy.
+"""
+
+import json
+import os
+import threading
+import time
+from re import match
+from typing import List, Optional, Set
+
+from pybck.BackupConfig import BackupConfig
+from pybck import logger
+LOG_CLASSE = "[BackupJournal] - "
+
+JOURNAL_NAME = ".pybck_journal.jsonl"
+JOURNAL_VERSION = 1
+TEMP_PATTERN = r"^\.tmp_backup_\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}$"
+
+
+def journal_header(config: BackupConfig, timestamp: str) -> dict:
+    # Campi che determinano il contenuto dello snapshot: se cambiano la ripresa non è possibile
+    return {
+        "version": JOURNAL_VERSION,
+        "timestamp": timestamp,
+        "source_drives": list(config.source_drives),
+        "user_folders": list(config.user_folders),
+        "storage_mode": config.storage_mode,
+        "incremental": config.incremental,
+    }
+
+
+class BackupJournal:
+    path : str
+    done : Set[str]
+
+    def __init__(self, temp_backup_folder: str):
+        self.folder = temp_backup_folder
+        self.path = os.path.join(temp_backup_folder, JOURNAL_NAME)
+        self.header = None
+        self.done = set()
+        self._resumed = False
+        self._lock = threading.Lock()
+
+    def start(self, header: dict):
+        # Senza la cartella temporanea il journal non può esistere (disco scollegato)
+        self.header = header
+        self.done = set()
+        if not os.path.isdir(self.folder):
+            logger.warning(LOG_CLASSE + f"Cartella temporanea non trovata, journal disattivato: {self.folder}")
+            return
+        with open(self.path, "w", encoding="utf-8") as file:
+            file.write(json.dumps(header) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    def load(self) -> Optional[dict]:
+        # Restituisce l'intestazione, None se il journal manca o è danneggiato
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                header = json.loads(file.readline())
+                if not isinstance(header, dict) or header.get("version") != JOURNAL_VERSION:
+                    return None
+                done = set()
+                for line in file:
+                    try:
+                        done.add(json.loads(line)["done"])
+                    except (json.JSONDecodeError, KeyError, TypeError):
+                        continue  # Riga troncata da un'interruzione
+        except (OSError, json.JSONDecodeError):
+            return None
+
+        self.header = header
+        self.done = done
+        self._resumed = True
+        return header
+
+    def is_done(self, key: str) -> bool:
+        return key in self.done
+
+    def mark_done(self, key: str):
+        with self._lock:
+            self.done.add(key)
+            if not os.path.isfile(self.path):
+                return
+            # Alla ripresa il "\n" iniziale chiude un'eventuale riga troncata dall'interruzione
+            prefix = "\n" if self._resumed else ""
+            self._resumed = False
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(prefix + json.dumps({"done": key}) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+        logger.debug(LOG_CLASSE + f"mark_done - Completato: {key}")
+
+    def remove(self):
+        if os.path.isfile(self.path):
+            os.unlink(self.path)
+
+    def is_resumable(self, config: BackupConfig, max_age_s: float) -> bool:
+        header = self.load()
+        if header is None:
+            return False
+        if header != journal_header(config, header.get("timestamp")):
+            return False
+        return time.time() - os.path.getmtime(self.path) <= max_age_s
+
+
+def resumable_backups(backup_base_path: str, config: BackupConfig) -> List[str]:
+    # Cartelle temporanee riprendibili, dalla più recente alla più vecchia
+    if not config.resume_backups or not os.path.isdir(backup_base_path):
+        return []
+    max_age_s = config.resume_max_age_hours * 3600
+    names = sorted((entry.name for entry in os.scandir(backup_base_path) if entry.is_dir() and match(TEMP_PATTERN, entry.name)),
+                   reverse=True)
+    return [name for name in names if BackupJournal(os.path.join(backup_base_path, name)).is_resumable(config, max_age_s)]
@@ -0,0 +1,208 @@
+# Questa classe gestisce il manifest di uno snapshot: l'elenco compatto e ordinato dei file contenuti
+# Permette di sapere cosa c'è in un backup senza percorrere l'albero sul disco esterno
+
+"""
+Formato del file .pybck_manifest (little endian):
+
+HEADER  magic "PYBCKMF1" | versione | flag (bit 0: hash presenti) | numero record |
+        byte totali | offset record | offset stringhe
+RECORD  (64 byte, ordinati per percorso) offset percorso | lunghezza percorso | size |
+        mtime_ns | mode | hash sha256 (zeri se assente)
+STRINGHE percorsi UTF-8 relativi allo snapshot, separati da "/"
+
+build(root)          → percorre lo snapshot e scrive il manifest; i file .pybckz della modalità compressa
+                       compaiono con il nome, la dimensione e l'hash del file originale
+BackupManifest(path) → apre il manifest in memory-map; lookup() e iter_prefix() usano la ricerca binaria
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+
+from pybck import logger
+LOG_CLASSE = "[BackupManifest] - "
+
+MANIFEST_NAME = ".pybck_manifest"
+MAGIC = b"PYBCKMF1"
+VERSION = 1
+FLAG_HASH = 1
+
+HEADER = struct.Struct("<8sHHIQQQQ")
+RECORD = struct.Struct("<QIQqI32s")
+NO_HASH = b"\x00" * 32
+HASH_BUFFER_SIZE = 1024 * 1024
+
+
+@dataclass
+class ManifestEntry:
+    path: str
+    size: int
+    mtime_ns: int
+    mode: int
+    hash: Optional[bytes] = None
+
+
+class BackupManifest:
+    count : int
+    total_bytes : int
+    has_hash : bool
+
+    def __init__(self, manifest_path: str):
+        self.path = manifest_path
+        self._file = open(manifest_path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Un file vuoto non può essere mappato
+            self._file.close()
+            raise ValueError(f"Manifest non valido: {manifest_path}")
+
+        magic, version, flags, _, self.count, self.total_bytes, self._records, self._strings = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"Manifest non valido: {manifest_path}")
+        self.has_hash = bool(flags & FLAG_HASH)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self) -> Iterator[ManifestEntry]:
+        for index in range(self.count):
+            yield self._entry(index)
+
+    def close(self):
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def lookup(self, path: str) -> Optional[ManifestEntry]:
+        key = path.encode("utf-8")
+        index = self._bisect(key)
+        if index < self.count and self._path_bytes(index) == key:
+            return self._entry(index)
+        return None
+
+    def iter_prefix(self, prefix: str) -> Iterator[ManifestEntry]:
+        key = prefix.encode("utf-8")
+        index = self._bisect(key)
+        while index < self.count:
+            path = self._path_bytes(index)
+            if not path.startswith(key):
+                break
+            yield self._entry(index)
+            index += 1
+
+    def _bisect(self, key: bytes) -> int:
+        # Primo record con percorso >= key
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._path_bytes(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _path_bytes(self, index: int) -> bytes:
+        offset, length = struct.unpack_from("<QI", self._map, self._records + index * RECORD.size)
+        start = self._strings + offset
+        return self._map[start:start + length]
+
+    def _entry(self, index: int) -> ManifestEntry:
+        offset, length, size, mtime_ns, mode, digest = RECORD.unpack_from(self._map, self._records + index * RECORD.size)
+        start = self._strings + offset
+        path = self._map[start:start + length].decode("utf-8")
+        return ManifestEntry(path, size, mtime_ns, mode, digest if self.has_hash else None)
+
+    @staticmethod
+    def write(manifest_path: str, entries: List[ManifestEntry], with_hash: bool = False):
+        logger.debug(LOG_CLASSE + "write - Scrittura manifest con %d voci: %s", len(entries), manifest_path)
+        encoded = sorted((entry.path.encode("utf-8"), entry) for entry in entries)
+
+        records = bytearray()
+        strings = bytearray()
+        total_bytes = 0
+        for path, entry in encoded:
+            records += RECORD.pack(len(strings), len(path), entry.size, entry.mtime_ns, entry.mode, entry.hash or NO_HASH)
+            strings += path
+            total_bytes += entry.size
+
+        header = HEADER.pack(MAGIC, VERSION, FLAG_HASH if with_hash else 0, 0, len(encoded), total_bytes,
+                             HEADER.size, HEADER.size + len(records))
+
+        # Scrittura atomica: un manifest troncato non deve mai sostituire quello valido
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(header)
+            file.write(records)
+            file.write(strings)
+        os.replace(tmp_path, manifest_path)
+
+    @staticmethod
+    def build(root: str, with_hash: bool = False) -> str:
+        # Import locale: leggere un manifest (es. "pybck status") non carica sqlite e i motori di copia
+        from pybck.ChunkStore import RECIPE_NAME, read_recipe
+        from pybck.CompressedStore import SUFFIX, read_header, iter_original
+        logger.debug(LOG_CLASSE + "build - Inizio creazione manifest per %s", root)
+        entries = []
+        for path, full_path, st in _walk(root):
+            header = read_header(full_path) if path.endswith(SUFFIX) else None
+            if os.path.basename(path) == RECIPE_NAME:
+                # Snapshot deduplicato: i file sono descritti dalla ricetta, non presenti sul disco
+                prefix = path[:-len(RECIPE_NAME)]
+                entries.extend(ManifestEntry(prefix + item["path"], item["size"], item["mtime_ns"], item["mode"])
+                               for item in read_recipe(full_path))
+            elif header is not None:
+                digest = None
+                if with_hash:
+                    digest = hashlib.sha256()
+                    for data in iter_original(full_path):
+                        digest.update(data)
+                    digest = digest.digest()
+                entries.append(ManifestEntry(path[:-len(SUFFIX)], header[1], st.st_mtime_ns, st.st_mode, digest))
+            else:
+                entries.append(ManifestEntry(path, st.st_size, st.st_mtime_ns, st.st_mode,
+                                             _hash_file(full_path) if with_hash else None))
+
+        manifest_path = os.path.join(root, MANIFEST_NAME)
+        BackupManifest.write(manifest_path, entries, with_hash)
+        logger.debug(LOG_CLASSE + "build - Fine creazione manifest: %d file", len(entries))
+        return manifest_path
+
+
+def _walk(root: str) -> Iterator[Tuple[str, str, os.stat_result]]:
+    # Percorso relativo con "/", percorso completo e stat di ogni file sotto root
+    stack = [(root, "")]
+    while stack:
+        directory, relative = stack.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                rel_path = relative + entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, rel_path + "/"))
+                elif entry.is_file(follow_symlinks=False):
+                    if not relative and entry.name.startswith(MANIFEST_NAME):
+                        continue
+                    yield rel_path, entry.path, entry.stat(follow_symlinks=False)
+
+
+def _hash_file(path: str) -> bytes:
+    digest = hashlib.sha256()
+    buffer = memoryview(bytearray(HASH_BUFFER_SIZE))
+    with open(path, "rb") as file:
+        while True:
+            n = file.readinto(buffer)
+            if not n:
+                break
+            digest.update(buffer[:n])
+    return digest.digest()
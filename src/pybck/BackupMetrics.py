@@ -0,0 +1,190 @@
+# Questa classe raccoglie i tempi delle fasi e i contatori di un'esecuzione del backup
+# Alla fine dell'esecuzione li scrive in un record JSON-lines e in un file per il textfile collector di Prometheus
+
+"""
+metrics = BackupMetrics()
+with metrics.span("copy", source="D:"):   → durata della fase (anche se solleva un'eccezione)
+    ...
+metrics.add_span("check", 0.3, ok=False)  → fase già misurata altrove (es. controlli con timeout)
+metrics.count("bytes_copied", 1024)       → contatore (thread-safe)
+metrics.write("metrics")                  → aggiunge una riga a metrics/pybck_runs.jsonl
+                                            e riscrive metrics/pybck.prom
+metrics.export(config)                    → write() nelle cartelle della configurazione
+                                            (metrics_dir, metrics_textfile); metrics_dir "" disattiva
+
+pybck_runs.jsonl, una riga per esecuzione:
+    {"run_id": "2024-01-22_10-30-45", "started": 1705915845.1, "duration": 812.4, "success": true,
+     "spans": [{"name": "validate", "labels": {}, "start": 0.0, "duration": 2.1, "ok": true}, ...],
+     "counters": {"bytes_copied": 123456789, "files_copied": 4321, "copy_errors": 0, ...}}
+
+pybck.prom (sovrascritto a ogni esecuzione, valori dell'ultima esecuzione):
+    pybck_last_run_success 1
+    pybck_phase_duration_seconds{phase="copy",source="D:"} 640.2
+    pybck_bytes_copied 123456789
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict, field
+from typing import Dict, List, Optional
+
+from pybck.BackupConfig import BackupConfig
+from pybck.BackupProgress import ProgressEvent
+from pybck import logger
+LOG_CLASSE = "[BackupMetrics] - "
+
+METRICS_DIR = "metrics"
+RUNS_NAME = "pybck_runs.jsonl"
+PROM_NAME = "pybck.prom"
+PROM_PREFIX = "pybck_"
+
+
+@dataclass
+class Span:
+    name: str
+    labels: Dict[str, str] = field(default_factory=dict)
+    start: float = 0.0          # Secondi dall'inizio dell'esecuzione
+    duration: float = 0.0
+    ok: bool = True
+    error: Optional[str] = None
+
+
+class BackupMetrics:
+    spans : List[Span]
+    counters : Dict[str, float]
+
+    def __init__(self, run_id: str = None):
+        self.run_id = run_id or time.strftime("%Y-%m-%d_%H-%M-%S")
+        self.started = time.time()
+        self.spans = []
+        self.counters = {}
+        self.success = None
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        # Le fasi possono essere annidate e concorrenti (copie parallele): ognuna ha il suo record
+        span = Span(name, {key: str(value) for key, value in labels.items()}, time.perf_counter() - self._start)
+        try:
+            yield span
+        except BaseException as e:
+            span.ok = False
+            span.error = str(e)
+            raise
+        finally:
+            span.duration = time.perf_counter() - self._start - span.start
+            with self._lock:
+                self.spans.append(span)
+            logger.debug(LOG_CLASSE + "span - %s %s %.3fs", name, span.labels or "", span.duration)
+
+    def add_span(self, name: str, duration: float, ok: bool = True, error: str = None, **labels):
+        # La fase è appena terminata: l'inizio si ricava dalla durata
+        start = max(0.0, time.perf_counter() - self._start - duration)
+        with self._lock:
+            self.spans.append(Span(name, {key: str(value) for key, value in labels.items()}, start, duration, ok, error))
+
+    def count(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_progress(self, event: ProgressEvent):
+        # Riepilogo finale di una copia (ProgressTracker.finish)
+        self.count("bytes_copied", event.bytes_done)
+        self.count("files_copied", event.files_done)
+        self.count("copy_errors", event.errors)
+        self.count("copy_retries", event.retries)
+
+    def duration(self, name: str) -> float:
+        # Durata totale delle fasi con questo nome
+        with self._lock:
+            return sum(span.duration for span in self.spans if span.name == name)
+
+    def to_record(self) -> dict:
+        with self._lock:
+            spans = [asdict(span) for span in sorted(self.spans, key=lambda span: span.start)]
+            counters = dict(self.counters)
+        for span in spans:
+            span["start"] = round(span["start"], 3)
+            span["duration"] = round(span["duration"], 3)
+        return {
+            "run_id": self.run_id,
+            "started": round(self.started, 3),
+            "duration": round(time.perf_counter() - self._start, 3),
+            "success": self.success,
+            "spans": spans,
+            "counters": counters,
+        }
+
+    def to_prometheus(self, record: dict = None) -> str:
+        record = record or self.to_record()
+        lines = [
+            "# HELP pybck_last_run_timestamp_seconds Avvio dell'ultima esecuzione (epoch)",
+            "# TYPE pybck_last_run_timestamp_seconds gauge",
+            f"pybck_last_run_timestamp_seconds {record['started']}",
+            "# HELP pybck_last_run_duration_seconds Durata dell'ultima esecuzione",
+            "# TYPE pybck_last_run_duration_seconds gauge",
+            f"pybck_last_run_duration_seconds {record['duration']}",
+            "# HELP pybck_last_run_success 1 se l'ultima esecuzione è terminata senza errori",
+            "# TYPE pybck_last_run_success gauge",
+            f"pybck_last_run_success {1 if record['success'] else 0}",
+        ]
+
+        # Fasi con lo stesso nome ed etichette (es. tentativi ripetuti) vengono sommate
+        durations = {}
+        for span in record["spans"]:
+            labels = {"phase": span["name"], **span["labels"]}
+            key = tuple(sorted(labels.items()))
+            durations[key] = durations.get(key, 0.0) + span["duration"]
+        if durations:
+            lines.append("# HELP pybck_phase_duration_seconds Durata delle fasi dell'ultima esecuzione")
+            lines.append("# TYPE pybck_phase_duration_seconds gauge")
+            for key, value in durations.items():
+                lines.append(f"pybck_phase_duration_seconds{_prom_labels(dict(key))} {round(value, 3)}")
+
+        for name, value in sorted(record["counters"].items()):
+            metric = PROM_PREFIX + _prom_name(name)
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory: str = METRICS_DIR, prom_path: str = None) -> dict:
+        # Le metriche non devono mai far fallire un backup: gli errori vengono solo registrati
+        record = self.to_record()
+        prom_path = prom_path or os.path.join(directory, PROM_NAME)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, RUNS_NAME), "a", encoding="utf-8") as file:
+                file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+            # Il textfile collector può leggere in qualsiasi momento: scrittura atomica
+            prom_dir = os.path.dirname(prom_path)
+            if prom_dir:
+                os.makedirs(prom_dir, exist_ok=True)
+            tmp_path = prom_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                file.write(self.to_prometheus(record))
+            os.replace(tmp_path, prom_path)
+        except OSError as e:
+            logger.warning(LOG_CLASSE + f"Impossibile scrivere le metriche dell'esecuzione: {e}")
+        return record
+
+    def export(self, config: BackupConfig) -> Optional[dict]:
+        if not config.metrics_dir:
+            return None
+        return self.write(config.metrics_dir, config.metrics_textfile or None)
+
+
+def _prom_name(name: str) -> str:
+    return "".join(char if char.isalnum() or char == "_" else "_" for char in name)
+
+
+def _prom_labels(labels: dict) -> str:
+    escaped = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        escaped.append(f'{_prom_name(key)}="{value}"')
+    return "{" + ",".join(escaped) + "}"
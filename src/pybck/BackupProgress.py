@@ -0,0 +1,120 @@
+# Questa classe raccoglie l'avanzamento di una copia e lo pubblica tramite callback
+# Usata sia dal runner di robocopy sia dai motori di copia nativi
+
+"""
+ProgressTracker(source, callback)  → un tracker per ogni job di copia
+  file_done(path, size)            → un file copiato (thread-safe)
+  error(message)                   → un errore di copia
+  retry(message)                   → un tentativo fallito che verrà ripetuto
+  set_total(total_bytes)           → abilita il calcolo dell'ETA
+
+callback(ProgressEvent)            → chiamata al massimo ogni `interval` secondi e alla fine;
+                                     senza callback l'avanzamento viene scritto nel log
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from pybck import logger
+LOG_CLASSE = "[BackupProgress] - "
+
+
+@dataclass
+class ProgressEvent:
+    source: str
+    files_done: int
+    bytes_done: int
+    errors: int
+    elapsed: float
+    files_per_s: float
+    mb_per_s: float
+    eta_s: Optional[float]
+    last_file: str
+    finished: bool = False
+    retries: int = 0
+
+
+class ProgressTracker:
+    files_done : int
+    bytes_done : int
+    errors : int
+
+    def __init__(self, source: str, callback: Callable[[ProgressEvent], None] = None, total_bytes: int = None, interval: float = 1.0):
+        self.source = source
+        self.callback = callback
+        self.total_bytes = total_bytes
+        # Senza callback il log viene aggiornato più raramente per non riempirlo
+        self.interval = interval if callback is not None else max(interval, 30.0)
+        self.files_done = 0
+        self.bytes_done = 0
+        self.errors = 0
+        self.retries = 0
+        self.last_file = ""
+        self._start = time.perf_counter()
+        self._last_publish = self._start
+        self._lock = threading.Lock()
+
+    def set_total(self, total_bytes: int):
+        self.total_bytes = total_bytes
+
+    def file_done(self, path: str, size: int):
+        with self._lock:
+            self.files_done += 1
+            self.bytes_done += size
+            self.last_file = path
+        self._maybe_publish()
+
+    def error(self, message: str):
+        with self._lock:
+            self.errors += 1
+            self.last_file = message
+        self._maybe_publish()
+
+    def retry(self, message: str):
+        with self._lock:
+            self.retries += 1
+            self.last_file = message
+
+    def finish(self) -> ProgressEvent:
+        event = self.snapshot(finished=True)
+        self._publish(event)
+        return event
+
+    def snapshot(self, finished: bool = False) -> ProgressEvent:
+        with self._lock:
+            elapsed = time.perf_counter() - self._start
+            files_per_s = self.files_done / elapsed if elapsed > 0 else 0.0
+            bytes_per_s = self.bytes_done / elapsed if elapsed > 0 else 0.0
+            eta = None
+            if self.total_bytes and bytes_per_s > 0:
+                eta = max(0.0, (self.total_bytes - self.bytes_done) / bytes_per_s)
+            return ProgressEvent(self.source, self.files_done, self.bytes_done, self.errors, elapsed,
+                                 files_per_s, bytes_per_s / 1024**2, eta, self.last_file, finished, self.retries)
+
+    def _maybe_publish(self):
+        now = time.perf_counter()
+        if now - self._last_publish < self.interval:
+            return
+        with self._lock:
+            # Un solo thread pubblica per intervallo
+            if now - self._last_publish < self.interval:
+                return
+            self._last_publish = now
+        self._publish(self.snapshot())
+
+    def _publish(self, event: ProgressEvent):
+        if self.callback is not None:
+            try:
+                self.callback(event)
+            except Exception as e:
+                logger.warning(LOG_CLASSE + f"Errore nella callback di avanzamento: {e}")
+            return
+
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        eta = f", ETA {event.eta_s:.0f}s" if event.eta_s is not None else ""
+        logger.info(LOG_CLASSE + f"{event.source}: {event.files_done} file, {event.bytes_done / 1024**2:.1f} MB, "
+                    f"{event.files_per_s:.1f} file/s, {event.mb_per_s:.1f} MB/s, {event.errors} errori{eta}")
@@ -0,0 +1,207 @@
+# Questa classe elimina i backup in due tempi: prima li sposta nel cestino (rinomina atomica,
+# spariscono subito dall'elenco dei backup), poi li cancella con più thread, anche in background
+
+"""
+G:\\Backup_PC\\.pybck_trash\\
+└── 2024-01-15_10-30-45_1705311045000000000\\   # backup spostato, in attesa di cancellazione
+
+move_to_trash(path)   → rinomina la cartella nel cestino (stesso volume: operazione istantanea)
+reclaim()             → svuota il cestino: cancellazione in profondità con un pool di thread,
+                        limitata a max_ops_per_s operazioni al secondo se richiesto
+start_background()    → esegue reclaim() in un thread separato, sovrapposto al backup successivo
+"""
+
+import os
+import queue
+import stat
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List
+
+from pybck.BackupProgress import ProgressTracker, ProgressEvent
+from pybck import logger, RateLimitedLog
+LOG_CLASSE = "[BackupReclaimer] - "
+
+TRASH_NAME = ".pybck_trash"
+
+
+@dataclass
+class ReclaimReport:
+    files_deleted: int = 0
+    dirs_deleted: int = 0
+    bytes_reclaimed: int = 0
+    errors: List[str] = field(default_factory=list)
+    elapsed: float = 0.0
+
+
+class _DirNode:
+    # Una cartella viene rimossa quando la sua lettura e tutte le sottocartelle sono terminate
+    __slots__ = ("path", "parent", "pending")
+
+    def __init__(self, path: str, parent):
+        self.path = path
+        self.parent = parent
+        self.pending = 1
+
+
+class BackupReclaimer:
+    trash_root : str
+    threads : int
+
+    def __init__(self, trash_root: str, threads: int = 4, max_ops_per_s: int = 0,
+                 progress_callback: Callable[[ProgressEvent], None] = None):
+        self.trash_root = trash_root
+        self.threads = max(1, threads)
+        self.max_ops_per_s = max_ops_per_s
+        self.progress_callback = progress_callback
+        self.report = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._budget_lock = threading.Lock()
+        self._next_slot = 0.0
+        self._rerun = False
+        self._file_log = RateLimitedLog()
+
+    def move_to_trash(self, path: str) -> str:
+        os.makedirs(self.trash_root, exist_ok=True)
+        target = os.path.join(self.trash_root, f"{os.path.basename(path)}_{time.time_ns()}")
+        os.rename(path, target)
+        logger.debug(LOG_CLASSE + "move_to_trash - Spostato nel cestino: %s → %s", path, target)
+        return target
+
+    def start_background(self) -> threading.Thread:
+        # Thread daemon: se il processo termina il cestino resta e verrà svuotato al prossimo avvio
+        with self._lock:
+            self._rerun = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._background, name="pybck-reclaimer", daemon=True)
+                self._thread.start()
+        return self._thread
+
+    def _background(self):
+        # Ripete lo svuotamento se nel frattempo sono stati spostati altri backup nel cestino
+        while True:
+            with self._lock:
+                if not self._rerun:
+                    self._thread = None
+                    return
+                self._rerun = False
+            self.reclaim()
+
+    def wait(self, timeout: float = None) -> bool:
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    def reclaim(self) -> ReclaimReport:
+        logger.debug(LOG_CLASSE + "reclaim - Inizio svuotamento cestino %s", self.trash_root)
+        report = ReclaimReport()
+        start = time.perf_counter()
+        if os.path.isdir(self.trash_root):
+            self._delete_tree(self.trash_root, report, ProgressTracker(self.trash_root, self.progress_callback))
+
+        report.elapsed = time.perf_counter() - start
+        self.report = report
+        logger.info(LOG_CLASSE + f"Spazio recuperato: {report.bytes_reclaimed / 1024**3:.2f} GB, "
+                    f"{report.files_deleted} file e {report.dirs_deleted} cartelle in {report.elapsed:.1f}s"
+                    + (f", {len(report.errors)} errori" if report.errors else ""))
+        return report
+
+    def _delete_tree(self, root: str, report: ReclaimReport, progress: ProgressTracker):
+        # Coda LIFO: i thread scendono in profondità e liberano le cartelle appena possibile
+        tasks = queue.LifoQueue()
+        finished = threading.Event()
+        root_node = _DirNode(root, None)
+        tasks.put(root_node)
+
+        def worker():
+            while True:
+                node = tasks.get()
+                if node is None:
+                    return
+                self._process_dir(node, tasks, report, progress, finished)
+
+        workers = [threading.Thread(target=worker, daemon=True) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        finished.wait()
+        for _ in workers:
+            tasks.put(None)
+        for thread in workers:
+            thread.join()
+        progress.finish()
+
+    def _process_dir(self, node: _DirNode, tasks, report: ReclaimReport, progress: ProgressTracker, finished):
+        try:
+            with os.scandir(node.path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        with self._lock:
+                            node.pending += 1
+                        tasks.put(_DirNode(entry.path, node))
+                    else:
+                        self._unlink(entry, report, progress)
+        except Exception as e:
+            # Anche un errore inatteso va nel report: senza _complete il contatore della cartella
+            # non scende e finished.wait() in _delete_tree non ritorna più
+            self._error(report, f"{node.path}: {e}")
+        self._complete(node, report, finished)
+
+    def _complete(self, node: _DirNode, report: ReclaimReport, finished):
+        while node is not None:
+            with self._lock:
+                node.pending -= 1
+                if node.pending > 0:
+                    return
+            if node.parent is None:
+                # La radice è il cestino stesso: resta, vuoto
+                finished.set()
+                return
+            self._throttle()
+            try:
+                os.rmdir(node.path)
+                with self._lock:
+                    report.dirs_deleted += 1
+            except Exception as e:
+                self._error(report, f"{node.path}: {e}")
+            node = node.parent
+
+    def _unlink(self, entry, report: ReclaimReport, progress: ProgressTracker):
+        self._throttle()
+        try:
+            st = entry.stat(follow_symlinks=False)
+            try:
+                os.unlink(entry.path)
+            except PermissionError:
+                # File in sola lettura (Windows): tolgo l'attributo e riprovo
+                os.chmod(entry.path, stat.S_IWRITE)
+                os.unlink(entry.path)
+        except OSError as e:
+            self._error(report, f"{entry.path}: {e}")
+            return
+
+        # Un hard link condiviso con altri snapshot non libera spazio
+        size = st.st_size if st.st_nlink <= 1 else 0
+        with self._lock:
+            report.files_deleted += 1
+            report.bytes_reclaimed += size
+        progress.file_done(entry.path, size)
+
+    def _throttle(self):
+        # Budget di I/O: al massimo max_ops_per_s operazioni al secondo tra tutti i thread
+        if not self.max_ops_per_s:
+            return
+        with self._budget_lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + 1.0 / self.max_ops_per_s
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _error(self, report: ReclaimReport, message: str):
+        self._file_log.warning(LOG_CLASSE + "Impossibile eliminare %s", message)
+        with self._lock:
+            report.errors.append(message)
@@ -0,0 +1,273 @@
+# Questa classe ripristina i file da uno snapshot: l'intero snapshot, una sorgente o i file che corrispondono a un glob
+# L'elenco dei file viene dal manifest dello snapshot, senza percorrere l'albero sul disco di backup
+
+"""
+Percorsi: i file si indicano come nella sorgente originale, "D:/Progetti/relazione.docx" oppure
+"C:/Documents/nota.txt" per le cartelle utente ("/" oppure "\\"). Nello snapshot corrispondono a
+Disco_D_Backup_<snapshot>/Progetti/relazione.docx e Disco_C_Backup_<snapshot>/Documents/nota.txt.
+
+restore(name, destination)                      → tutto lo snapshot in destination/D/..., destination/C/...
+restore(name, destination, source="D:")         → una sola sorgente ("D:" oppure "C:/Documents"),
+                                                  direttamente in destination/...
+restore(name, destination, pattern="D:/Pro*/*.docx") → i file che corrispondono al glob, in destination/D/...
+                                                  ("*" comprende anche "/"; le maiuscole contano)
+restore_file(name, path, destination)           → un solo file: ricerca binaria nel manifest, nessuna scansione.
+                                                  destination è una cartella esistente o il percorso del file
+versions(path)                                  → snapshot (dal più recente) che contengono il file, dall'indice
+                                                  dei percorsi (PathIndex) oppure dai manifest se l'indice manca
+
+Copia: i file normali passano per NativeCopyEngine.run_jobs (thread, clonazione, file sparsi, tentativi);
+i .pybckz della modalità compressa vengono decompressi e i file della modalità dedup ricostruiti dai chunk
+sullo stesso numero di thread. Data di modifica e permessi vengono ripristinati; le cartelle vuote no
+(il manifest elenca solo i file).
+
+I file già presenti con la stessa dimensione e data vengono saltati (files_skipped); quelli diversi vengono
+sovrascritti solo con overwrite=True, altrimenti finiscono in stats.errors.
+"""
+
+import fnmatch
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from pybck.BackupCatalog import BackupCatalog
+from pybck.BackupConfig import BackupConfig
+from pybck.BackupManifest import BackupManifest, ManifestEntry, MANIFEST_NAME
+from pybck.CopyEngine import CopyStats, NativeCopyEngine, MTIME_TOLERANCE_NS
+from pybck.PathIndex import PathIndex, IndexEntry, INDEX_NAME
+from pybck import logger, RateLimitedLog
+LOG_CLASSE = "[BackupRestorer] - "
+
+WILDCARDS = re.compile(r"[*?\[]")
+
+
+class BackupRestorer:
+    config : BackupConfig
+    threads : int
+    overwrite : bool
+
+    def __init__(self, config: BackupConfig, threads: int = 0, overwrite: bool = False):
+        self.config = config
+        self.threads = threads or config.copy_threads
+        self.overwrite = overwrite
+        self.catalog = BackupCatalog(config.backup_path())
+        self.engine = NativeCopyEngine(self.threads, reflink=config.reflink)
+        self._store = None
+        self._recipes = {}
+        self._lock = threading.Lock()
+        self._file_log = RateLimitedLog()
+
+    def restore(self, name: str, destination: str, source: str = None, pattern: str = None) -> CopyStats:
+        if source is not None and pattern is not None:
+            raise ValueError("Indicare una sorgente oppure un glob, non entrambi")
+        logger.info(LOG_CLASSE + f"Ripristino dello snapshot {name} in {destination}"
+                    + (f" (sorgente {source})" if source else "") + (f" (glob {pattern})" if pattern else ""))
+        start = time.perf_counter()
+        snapshot = self._snapshot_folder(name)
+
+        with self._open_manifest(snapshot) as manifest:
+            if source is not None:
+                # La sorgente finisce direttamente in destination, senza la cartella dell'unità
+                prefix = manifest_path(name, source) + "/"
+                selected = [(entry, entry.path[len(prefix):]) for entry in manifest.iter_prefix(prefix)]
+            else:
+                match = None
+                prefix = ""
+                if pattern is not None:
+                    match = re.compile(fnmatch.translate(pattern.replace("\\", "/"))).match
+                    # Il tratto senza caratteri jolly restringe la ricerca binaria nel manifest
+                    literal = WILDCARDS.split(pattern.replace("\\", "/"), 1)[0]
+                    if ":" in literal and len(literal.partition(":")[0]) == 1:
+                        prefix = manifest_path(name, literal.rpartition("/")[0] or literal.partition(":")[0] + ":")
+                        prefix = prefix + "/"
+                selected = []
+                for entry in manifest.iter_prefix(prefix):
+                    original = source_path(entry.path)
+                    if match is None or match(original):
+                        selected.append((entry, original.replace(":", "", 1)))
+
+        stats = CopyStats()
+        plan = self._plan(name, snapshot, [(entry, os.path.join(destination, *target.split("/")))
+                                           for entry, target in selected], stats)
+        self._run(plan, stats)
+        stats.elapsed = time.perf_counter() - start
+        self._file_log.flush()
+        logger.info(LOG_CLASSE + f"Ripristino di {name} completato: {stats.files_copied} file, "
+                    f"{stats.bytes_copied / 1024**2:.1f} MB, {stats.files_skipped} già presenti, "
+                    f"{len(stats.errors)} errori in {stats.elapsed:.1f}s")
+        return stats
+
+    def restore_file(self, name: str, path: str, destination: str) -> str:
+        # Restituisce il percorso del file ripristinato
+        snapshot = self._snapshot_folder(name)
+        with self._open_manifest(snapshot) as manifest:
+            entry = manifest.lookup(manifest_path(name, path))
+        if entry is None:
+            raise FileNotFoundError(f"{path} non è nello snapshot {name}")
+
+        target = destination
+        if os.path.isdir(destination):
+            target = os.path.join(destination, entry.path.rpartition("/")[2])
+        stats = CopyStats()
+        self._run(self._plan(name, snapshot, [(entry, target)], stats), stats)
+        if stats.errors:
+            raise OSError(stats.errors[0])
+        logger.info(LOG_CLASSE + f"Ripristinato {path} dallo snapshot {name} in {target}")
+        return target
+
+    def versions(self, path: str) -> List[IndexEntry]:
+        # Versioni del file dal più recente: dall'indice dei percorsi se esiste, altrimenti dai manifest
+        if os.path.isfile(self.config.backup_path(INDEX_NAME)):
+            with PathIndex(self.config.backup_path()) as index:
+                return index.versions(path)
+
+        found = []
+        for name in self.catalog.list():
+            try:
+                with BackupManifest(self.config.backup_path(name, MANIFEST_NAME)) as manifest:
+                    entry = manifest.lookup(manifest_path(name, path))
+            except (OSError, ValueError) as e:
+                logger.warning(LOG_CLASSE + f"Manifest di {name} non leggibile, snapshot ignorato: {e}")
+                continue
+            if entry is not None:
+                found.append(IndexEntry(name, source_path(entry.path), entry.size, entry.mtime_ns, entry.hash))
+        return found
+
+    def close(self):
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def _snapshot_folder(self, name: str) -> str:
+        snapshot = self.config.backup_path(name)
+        if not os.path.isdir(snapshot):
+            raise FileNotFoundError(f"Snapshot {name} non trovato in {self.config.backup_path()}")
+        return snapshot
+
+    def _open_manifest(self, snapshot: str) -> BackupManifest:
+        path = self.config.join(snapshot, MANIFEST_NAME)
+        if not os.path.isfile(path):
+            # Snapshot precedente ai manifest: lo creo una volta, i ripristini successivi lo riusano
+            logger.warning(LOG_CLASSE + f"Manifest assente in {snapshot}: lo ricostruisco percorrendo lo snapshot")
+            BackupManifest.build(snapshot)
+        return BackupManifest(path)
+
+    def _plan(self, name: str, snapshot: str, selected: list, stats: CopyStats) -> list:
+        # (tipo, dati salvati, destinazione, voce): tipo "file", "compressed" (.pybckz) oppure "chunks" (dedup)
+        from pybck.CompressedStore import SUFFIX
+        entry_of = self.catalog.get(name)
+        mirror = entry_of is not None and entry_of.storage_mode == "mirror"
+
+        plan = []
+        folders = set()
+        for entry, target in selected:
+            if not self._needs_restore(entry, target, stats):
+                continue
+            stored = self.config.join(snapshot, *entry.path.split("/"))
+            if mirror:
+                plan.append(("file", stored, target, entry))
+            else:
+                item = self._recipe_item(snapshot, entry.path)
+                if item is not None:
+                    plan.append(("chunks", item["chunks"], target, entry))
+                elif not os.path.isfile(stored) and os.path.isfile(stored + SUFFIX):
+                    plan.append(("compressed", stored + SUFFIX, target, entry))
+                else:
+                    plan.append(("file", stored, target, entry))
+            folders.add(os.path.dirname(target))
+
+        for folder in sorted(folders):
+            os.makedirs(folder, exist_ok=True)
+        return plan
+
+    def _needs_restore(self, entry: ManifestEntry, target: str, stats: CopyStats) -> bool:
+        try:
+            st = os.stat(target)
+        except FileNotFoundError:
+            return True
+        if st.st_size == entry.size and abs(st.st_mtime_ns - entry.mtime_ns) <= MTIME_TOLERANCE_NS:
+            stats.files_skipped += 1
+            return False
+        if self.overwrite:
+            return True
+        self._file_log.warning(LOG_CLASSE + "Esiste già un file diverso, non sovrascritto: %s", target)
+        stats.errors.append(f"{target}: esiste già un file diverso (usare overwrite)")
+        return False
+
+    def _run(self, plan: list, stats: CopyStats):
+        # I file normali con il pool del motore nativo, gli altri (decompressione, chunk) con un pool uguale
+        jobs = [(stored, target, entry.size, None, None) for kind, stored, target, entry in plan if kind == "file"]
+        if jobs:
+            self.engine.run_jobs(jobs, stats)
+        others = sorted((item for item in plan if item[0] != "file"), key=lambda item: item[3].size, reverse=True)
+        if others:
+            with ThreadPoolExecutor(max_workers=self.threads) as executor:
+                futures = [(target, executor.submit(self._restore_stored, kind, stored, target, entry, stats))
+                           for kind, stored, target, entry in others]
+            # Come in run_jobs: gli errori inattesi (es. zlib, sqlite) finiscono negli errori del ripristino
+            for target, future in futures:
+                if future.exception() is not None:
+                    stats.errors.append(f"{target}: {future.exception()}")
+
+    def _restore_stored(self, kind: str, stored, target: str, entry: ManifestEntry, stats: CopyStats):
+        from pybck.CompressedStore import decompress_file
+        try:
+            # Come nel motore nativo: mai scrivere dentro un file esistente (potrebbe avere altri hard link)
+            if os.path.lexists(target):
+                os.unlink(target)
+            if kind == "compressed":
+                decompress_file(stored, target)
+            else:
+                self._chunk_store().restore_file(stored, target)
+                os.chmod(target, entry.mode & 0o7777)
+                os.utime(target, ns=(entry.mtime_ns, entry.mtime_ns))
+        except (OSError, ValueError) as e:
+            self._file_log.error(LOG_CLASSE + "_restore_stored - Ripristino fallito %s: %s", target, e)
+            with self._lock:
+                stats.errors.append(f"{target}: {e}")
+            return
+        with self._lock:
+            stats.files_copied += 1
+            stats.bytes_copied += entry.size
+
+    def _recipe_item(self, snapshot: str, path: str) -> Optional[dict]:
+        # La ricetta della modalità dedup sta nella cartella copiata (unità o cartella utente): la cerco
+        # negli antenati del file, leggendo ciascuna ricetta una sola volta
+        from pybck.ChunkStore import RECIPE_NAME, read_recipe
+        parts = path.split("/")
+        for depth in range(1, len(parts)):
+            folder = "/".join(parts[:depth])
+            if folder not in self._recipes:
+                recipe = self.config.join(snapshot, *parts[:depth], RECIPE_NAME)
+                self._recipes[folder] = ({item["path"]: item for item in read_recipe(recipe)}
+                                         if os.path.isfile(recipe) else None)
+            items = self._recipes[folder]
+            if items is not None:
+                return items.get("/".join(parts[depth:]))
+        return None
+
+    def _chunk_store(self):
+        with self._lock:
+            if self._store is None:
+                from pybck.ChunkStore import ChunkStore, STORE_NAME
+                self._store = ChunkStore(self.config.backup_path(STORE_NAME))
+            return self._store
+
+
+def manifest_path(name: str, path: str) -> str:
+    # "D:/Progetti/file" → "Disco_D_Backup_<name>/Progetti/file"
+    drive, colon, rest = path.replace("\\", "/").partition(":")
+    if not colon or len(drive) != 1 or not drive.isalpha():
+        raise ValueError(f"Percorso non valido: {path}. Usare la forma D:/cartella/file")
+    folder = f"Disco_{drive.upper()}_Backup_{name}"
+    rest = rest.strip("/")
+    return f"{folder}/{rest}" if rest else folder
+
+
+def source_path(path: str) -> str:
+    # "Disco_D_Backup_<name>/Progetti/file" → "D:/Progetti/file"
+    folder, _, rest = path.partition("/")
+    return f"{folder[len('Disco_')]}:/{rest}"
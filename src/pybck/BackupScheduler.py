@@ -0,0 +1,126 @@
+# Questa classe esegue in parallelo i job di copia di BackupBuilder
+# limitando la concorrenza per dispositivo fisico sorgente e per dispositivo di destinazione
+
+"""
+BackupJob        → un'unità di lavoro (es. copia del drive D:) con i dispositivi coinvolti
+
+device_id(path)  → identifica il dispositivo fisico che contiene il percorso
+
+run(jobs)        → avvia i job in parallelo; un job parte solo quando il suo disco sorgente
+                   e il disco di destinazione hanno uno slot libero
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from pybck import logger
+LOG_CLASSE = "[BackupScheduler] - "
+
+
+@dataclass
+class BackupJob:
+    name: str
+    source_device: str
+    target_device: str
+    func: Callable
+    wall_time: float = 0.0
+    started_at: float = 0.0
+    error: Optional[Exception] = None
+    skipped: bool = False
+
+
+def device_id(path: str, device_groups: Optional[Dict[str, str]] = None) -> str:
+    # I gruppi espliciti in configurazione hanno la precedenza (es. D: ed E: sullo stesso disco)
+    drive = path[:2].upper() if path[1:2] == ":" else os.path.splitdrive(path)[0].upper()
+    if device_groups:
+        if drive in device_groups:
+            return device_groups[drive]
+        if path in device_groups:
+            return device_groups[path]
+
+    try:
+        st_dev = os.stat(path).st_dev
+    except OSError:
+        # Percorso non raggiungibile: uso la lettera di unità come identificativo
+        return drive or path
+
+    disk = _linux_physical_disk(st_dev)
+    return disk if disk is not None else f"dev-{st_dev}"
+
+
+def _linux_physical_disk(st_dev: int) -> Optional[str]:
+    # Su Linux risalgo dalla partizione (sda1) al disco fisico (sda) tramite sysfs
+    sys_path = f"/sys/dev/block/{os.major(st_dev)}:{os.minor(st_dev)}" if hasattr(os, "major") else None
+    if sys_path is None or not os.path.exists(sys_path):
+        return None
+    real_path = os.path.realpath(sys_path)
+    if os.path.exists(os.path.join(real_path, "partition")):
+        real_path = os.path.dirname(real_path)
+    return os.path.basename(real_path)
+
+
+class BackupScheduler:
+    max_workers : int
+    max_per_source : int
+    max_per_target : int
+
+    def __init__(self, max_workers: int = 4, max_per_source: int = 1, max_per_target: int = 2):
+        self.max_workers = max(1, max_workers)
+        self.max_per_source = max(1, max_per_source)
+        self.max_per_target = max(1, max_per_target)
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def run(self, jobs: List[BackupJob]) -> List[BackupJob]:
+        logger.debug(LOG_CLASSE + f"run - Inizio esecuzione di {len(jobs)} job")
+        start = time.perf_counter()
+        failed = threading.Event()
+        workers = threading.BoundedSemaphore(self.max_workers)
+
+        threads = []
+        for job in jobs:
+            thread = threading.Thread(target=self._run_job, args=(job, workers, failed, start), name=f"pybck-{job.name}")
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        total = time.perf_counter() - start
+        busy = sum(job.wall_time for job in jobs)
+        overlap = busy / total if total > 0 else 0.0
+        for job in jobs:
+            logger.info(LOG_CLASSE + f"Job {job.name}: avvio dopo {job.started_at:.2f}s, durata {job.wall_time:.2f}s"
+                        + (" (annullato)" if job.skipped else ""))
+        logger.info(LOG_CLASSE + f"Tempo totale {total:.2f}s, somma dei job {busy:.2f}s, sovrapposizione x{overlap:.2f}")
+        return jobs
+
+    def _run_job(self, job: BackupJob, workers, failed, start: float):
+        # Ordine di acquisizione fisso (sorgente → destinazione → worker): nessun deadlock,
+        # e un job in attesa del proprio disco non occupa un worker che altri potrebbero usare
+        source_slot = self._semaphore("source:" + job.source_device, self.max_per_source)
+        target_slot = self._semaphore("target:" + job.target_device, self.max_per_target)
+
+        with source_slot, target_slot, workers:
+            if failed.is_set():
+                # Un altro job è fallito: il backup non verrà finalizzato, inutile proseguire
+                job.skipped = True
+                return
+
+            job.started_at = time.perf_counter() - start
+            try:
+                job.func()
+            except Exception as e:
+                job.error = e
+                failed.set()
+            finally:
+                job.wall_time = time.perf_counter() - start - job.started_at
+
+    def _semaphore(self, key: str, limit: int):
+        with self._lock:
+            if key not in self._semaphores:
+                self._semaphores[key] = threading.BoundedSemaphore(limit)
+            return self._semaphores[key]
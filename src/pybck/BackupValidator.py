@@ -1,26 +1,107 @@
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 # Questa classe gestisce la validazione delle condizioni per effettuare un backup
 # Verifica quindi: che il dispositivo sia colllegato, che la cartella di backup esista, che le cartelle utente esistano
 # e che ci sia spazio sufficiente sul drive di backup.
 
 import psutil
 import os
+import threading
+import time
 from pathlib import Path
-from typing import List
+from typing import Callable, List, Optional
 
 from pybck.BackupConfig import BackupConfig
+from pybck.BackupMetrics import BackupMetrics
+from pybck.SpacePlanner import SpacePlanner
 from pybck import logger
 LOG_CLASSE = "[BackupValidator] - "
 
 
+@dataclass
+class CheckResult:
+    name: str
+    ok: bool
+    latency: float
+    timed_out: bool = False
+    error: Optional[str] = None
+    skipped: bool = False       # Non eseguito perché un controllo precedente è fallito
+
+
+@dataclass
+class PreflightReport:
+    checks: List[CheckResult] = field(default_factory=list)   # Controlli principali, nell'ordine logico
+    probes: List[CheckResult] = field(default_factory=list)   # Sonde sui singoli percorsi
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return all(check.ok for check in self.checks)
+
+    @property
+    def failed(self) -> List[CheckResult]:
+        return [check for check in self.checks if not check.ok and not check.skipped]
+
+
+def run_with_timeout(name: str, func: Callable, args: list = (), timeout: float = None) -> CheckResult:
+    # Thread daemon: un disco bloccato non impedisce la chiusura del processo
+    outcome = {}
+
+    def target():
+        try:
+            outcome["ok"] = bool(func(*args))
+        except Exception as e:
+            outcome["ok"] = False
+            outcome["error"] = str(e)
+
+    start = time.perf_counter()
+    thread = threading.Thread(target=target, name=f"pybck-preflight-{name}", daemon=True)
+    thread.start()
+    thread.join(timeout)
+    latency = time.perf_counter() - start
+    if thread.is_alive():
+        return CheckResult(name, False, latency, timed_out=True, error=f"nessuna risposta entro {timeout:.0f}s")
+    return CheckResult(name, outcome["ok"], latency, error=outcome.get("error"))
+
+
+def run_parallel(checks: list, default_timeout: float = None) -> List[CheckResult]:
+    # checks: (nome, funzione, argomenti[, timeout]); tutti partono insieme, ognuno con il suo timeout
+    results = [None] * len(checks)
+
+    def run(index, name, func, args, timeout):
+        results[index] = run_with_timeout(name, func, args, timeout)
+
+    threads = []
+    for index, check in enumerate(checks):
+        name, func, args = check[:3]
+        timeout = check[3] if len(check) > 3 else default_timeout
+        thread = threading.Thread(target=run, args=(index, name, func, args, timeout), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return results
+
+
 class BackupValidator:
     validate : bool
     error : str
     
-    def __init__(self, config: BackupConfig):
+    def __init__(self, config: BackupConfig, metrics: BackupMetrics = None):
         self.config = config
+        self.metrics = metrics if metrics is not None else BackupMetrics()
         self.validate = False
         self.error = None
+        self.space_plan = None
+        self.report = None
+        self._partitions = None
+        self._probes = []
+        self._probes_lock = threading.Lock()
+    
+    def disk_partitions(self):
+        # La tabella delle partizioni viene letta una sola volta per validazione
+        if self._partitions is None:
+            self._partitions = psutil.disk_partitions()
+        return self._partitions
     
     def is_drive_connected(self, drive_letter: str) -> bool:
         logger.debug(LOG_CLASSE + "is_drive_connected - Inizio is_drive_connected")  
@@ -28,7 +109,11 @@ class BackupValidator:
         if not drive_letter.endswith(":"):
             drive_letter = drive_letter + ":"
         
-        partitions = psutil.disk_partitions()
+        if drive_letter in self.config.drive_map:
+            # Unità mappata su una cartella locale (test e benchmark)
+            return os.path.isdir(self.config.drive_map[drive_letter])
+        
+        partitions = self.disk_partitions()
         for partition in partitions:
             if partition.device.startswith(drive_letter):
                 logger.debug(LOG_CLASSE + "is_drive_connected - Drive è connesso")
@@ -38,10 +123,11 @@ class BackupValidator:
     
     def validate_sources_exist(self) -> bool:
         logger.debug(LOG_CLASSE + "validate_sources_exist - Inizio validate_sources_exist")  
-        for drive in self.config.source_drives:
-            drive_path = Path(drive + "\\")
-            if not drive_path.exists():
-                logger.debug(LOG_CLASSE + f"validate_sources_exist - Unità sorgente non esiste: {drive}")
+        # Tutte le unità vengono interrogate insieme: un disco che non risponde non blocca le altre
+        results = self._probe_paths([(f"source:{drive}", Path(self.config.drive_path(drive))) for drive in self.config.source_drives])
+        for result in results:
+            if not result.ok:
+                logger.debug(LOG_CLASSE + f"validate_sources_exist - Unità sorgente non esiste: {result.name}")
                 return False
         logger.debug(LOG_CLASSE + "validate_sources_exist - Tutte le unità sorgente esistono")
         return True
@@ -49,74 +135,107 @@ class BackupValidator:
     def validate_user_folders_exist(self) -> bool:
         logger.debug(LOG_CLASSE + "validate_user_folders_exist - Inizio validate_user_folders_exist")  
         
-        for folder in self.config.user_folders:
-            # Costruisci il percorso CORRETTO: C:\Users\<tuonome>\Downloads
-            user_profile = os.environ.get("USERPROFILE", "C:\\Users\\Default")
-            folder_path = Path(user_profile) / folder
-            
-            logger.debug(LOG_CLASSE + f"Controllo: {folder_path}")
-            
-            if not folder_path.exists():
-                logger.debug(LOG_CLASSE + f"Cartella utente non esiste: {folder}")
+        # Costruisci il percorso CORRETTO: C:\Users\<tuonome>\Downloads
+        user_profile = os.environ.get("USERPROFILE", "C:\\Users\\Default")
+        results = self._probe_paths([(f"user_folder:{folder}", Path(user_profile) / folder) for folder in self.config.user_folders])
+        
+        for result in results:
+            if not result.ok:
+                logger.debug(LOG_CLASSE + f"Cartella utente non esiste: {result.name}")
                 return False  # Appena una manca, ritorna False
         
         logger.debug(LOG_CLASSE + "Tutte le cartelle utente esistono")
         return True  # Solo se TUTTE esistono
     
-    def has_sufficient_space(self, approx_os_space) -> bool:
+    def has_sufficient_space(self, approx_os_space=None) -> bool:
+        # approx_os_space non è più usato: il planner misura le cartelle utente invece dell'intero drive C
         logger.debug(LOG_CLASSE + "has_sufficient_space - Inizio has_sufficient_space")  
-        #per ogni disco diverso da C calcolo lo spazio totale da backuppare
-        used_space = 0
-        free_space = 0 
-        MARGIN = 1.15  # <<< AGGIUNGI: il tuo margine di sicurezza originale
-        for drive in self.config.source_drives:
-            drive_path = Path(drive + "\\") 
-            if drive_path.exists() :
-                    
-                    if drive_path.drive == "C:":
-                        used_space += (psutil.disk_usage(drive_path)).used / 1024**3 - approx_os_space  # Spazio in GB
-                    else:
-                        used_space += (psutil.disk_usage(drive_path)).used / 1024**3
-                    
-                    logger.debug(LOG_CLASSE + f"Spazio da backuppare sul drive {drive} (GB): {used_space}")  
-            else :
-                logger.debug(LOG_CLASSE + f"Unità sorgente non esiste durante il calcolo spazio: {drive}")  
-                return False
-                
-                
-        logger.debug(LOG_CLASSE + f"Spazio totale da backuppare (GB): {used_space}")    
-        # Controlla lo spazio disponibile sul drive di backup
-        backup_drive_path = Path(self.config.backup_drive + "\\")    
-
-        if backup_drive_path.exists():
-            free_space = (psutil.disk_usage(backup_drive_path)).free / 1024**3  # Spazio libero in GB
-        else :
+        
+        backup_drive_path = Path(self.config.drive_path(self.config.backup_drive))
+        if not self._probe_paths([(f"target:{self.config.backup_drive}", backup_drive_path)])[0].ok:
             logger.debug(LOG_CLASSE + f"Drive di backup non esiste durante il calcolo spazio: {self.config.backup_drive}")  
             return False
-
-        if free_space >= (used_space * MARGIN):
-            logger.debug(LOG_CLASSE + f"has_sufficient_space - Spazio sufficiente disponibile Spazio da copiare / spazio libero {used_space} / {free_space}")
+        
+        # Byte effettivamente da scrivere: sorgenti scandite e confrontate con lo snapshot precedente
+        self.space_plan = SpacePlanner(self.config, threads=self.config.copy_threads).plan()
+        if self.space_plan.missing_sources:
+            logger.debug(LOG_CLASSE + f"Unità sorgente non esiste durante il calcolo spazio: {', '.join(self.space_plan.missing_sources)}")  
+            return False
+        
+        if self.space_plan.fits:
+            logger.debug(LOG_CLASSE + f"has_sufficient_space - Spazio sufficiente: {self.space_plan.describe()}")
             return True 
         else:
-            logger.debug(LOG_CLASSE + f"has_sufficient_space - Spazio insufficiente disponibile Spazio da copiare / spazio libero {used_space} / {free_space}")
+            logger.debug(LOG_CLASSE + f"has_sufficient_space - Spazio insufficiente: {self.space_plan.describe()}")
             return False    
         
-    def can_perform_backup(self, approx_os_space):
+    def preflight(self, approx_os_space=None) -> PreflightReport:
+        logger.debug(LOG_CLASSE + "preflight - Inizio preflight") 
+        start = time.perf_counter()
+        self._probes = []
+        
+        # Controlli di esistenza eseguiti in parallelo, ognuno con il proprio timeout: i controlli che interrogano
+        # più percorsi hanno margine sul timeout delle singole sonde. La stima dello spazio (lenta, percorre le
+        # sorgenti) parte solo se tutti sono riusciti: un disco assente o bloccato fa fallire subito la validazione
+        timeout = self.config.preflight_timeout_s
+        checks = [
+            ("backup_drive_connected", self.is_drive_connected, [self.config.backup_drive], timeout),
+            ("sources_exist", self.validate_sources_exist, [], 2 * timeout),
+            ("user_folders_exist", self.validate_user_folders_exist, [], 2 * timeout),
+        ]
+        results = run_parallel(checks)
+        if all(result.ok for result in results):
+            results.append(run_with_timeout("sufficient_space", self.has_sufficient_space, [approx_os_space],
+                                            self.config.preflight_space_timeout_s))
+        else:
+            results.append(CheckResult("sufficient_space", False, 0.0, error="non eseguito", skipped=True))
+        report = PreflightReport(results)
+        report.probes = list(self._probes)
+        report.elapsed = time.perf_counter() - start
+        self.report = report
+        
+        self.metrics.add_span("validate", report.elapsed, report.ok)
+        for check in report.checks:
+            if not check.skipped:
+                self.metrics.add_span("preflight", check.latency, check.ok, check.error, check=check.name)
+        self.metrics.count("preflight_timeouts", sum(check.timed_out for check in report.checks + report.probes))
+        
+        latencies = ", ".join(f"{check.name} " + ("non eseguito" if check.skipped else f"{check.latency * 1000:.0f}ms")
+                              + (" (timeout)" if check.timed_out else "") for check in report.checks)
+        logger.info(LOG_CLASSE + f"Preflight completato in {report.elapsed:.2f}s: {latencies}")
+        return report
+    
+    def _probe_paths(self, paths: list) -> List[CheckResult]:
+        # Verifica l'esistenza dei percorsi in parallelo; un percorso che non risponde conta come assente
+        results = run_parallel([(name, path.exists, []) for name, path in paths], self.config.preflight_timeout_s)
+        with self._probes_lock:
+            self._probes.extend(results)
+        for result in results:
+            if result.timed_out:
+                logger.warning(LOG_CLASSE + f"{result.name}: {result.error}")
+        return results
+        
+    def can_perform_backup(self, approx_os_space=None):
         logger.debug(LOG_CLASSE + "can_perform_backup - Inizio can_perform_backup") 
     
-        # Lista di controlli in sequenza logica
-        checks = [
-            (self.is_drive_connected, [self.config.backup_drive], "Drive di backup non connesso"),
-            (self.validate_sources_exist, [], "Una o più sorgenti non esistono"),
-            (self.validate_user_folders_exist, [], "Una o più cartelle utente non esistono"),
-            (self.has_sufficient_space, [approx_os_space], "Spazio insufficiente sul drive di backup")
-        ]   
-        
-        for check_func, check_args, error_msg in checks:
-            if not check_func(*check_args):
-                logger.error(f"{LOG_CLASSE} {error_msg}")
-                self.error = error_msg  # Memorizza l'errore per eventuale consultazione
-                return False
+        # Messaggi di errore nell'ordine logico dei controlli
+        error_messages = {
+            "backup_drive_connected": "Drive di backup non connesso",
+            "sources_exist": "Una o più sorgenti non esistono",
+            "user_folders_exist": "Una o più cartelle utente non esistono",
+            "sufficient_space": "Spazio insufficiente sul drive di backup",
+        }
+        
+        report = self.preflight(approx_os_space)
+        for check in report.failed:
+            error_msg = error_messages[check.name]
+            if check.timed_out or check.error:
+                error_msg = f"{error_msg} ({check.error})"
+            elif check.name == "sufficient_space" and self.space_plan is not None:
+                error_msg = f"{error_msg}: {self.space_plan.describe()}"
+            logger.error(f"{LOG_CLASSE} {error_msg}")
+            self.error = error_msg  # Memorizza l'errore per eventuale consultazione
+            return False
         
         logger.info(f"{LOG_CLASSE} Tutti i controlli superati")
-        return True
\ No newline at end of file
+        return True
@@ -0,0 +1,262 @@
+# Questa classe verifica che uno snapshot corrisponda alle sorgenti da cui è stato copiato
+# Due livelli: "quick" confronta dimensione e data di modifica, "full" confronta il contenuto (sha256)
+
+"""
+verify(pairs, mode)      → confronta ogni coppia (sorgente, cartella nello snapshot)
+verify_snapshot(name)    → ricostruisce le coppie dalla configurazione e verifica lo snapshot indicato
+
+Checkpoint (cache/verify/<timestamp>.jsonl, fuori dallo snapshot finalizzato):
+    prima riga {"mode": "full"}, poi una riga per ogni file verificato correttamente.
+    Una verifica interrotta riparte saltando i file già presenti nel checkpoint;
+    a verifica completata, anche con file non corrispondenti, il checkpoint viene eliminato:
+    l'esito è nel report restituito al chiamante.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import List, Tuple
+
+from pybck.BackupConfig import BackupConfig
+from pybck.CopyEngine import MTIME_TOLERANCE_NS
+from pybck.PathFilter import PathFilter, source_filters
+from pybck import logger, RateLimitedLog
+LOG_CLASSE = "[BackupVerifier] - "
+
+CHECKPOINT_DIR = "cache/verify"
+LEGACY_CHECKPOINT_NAME = ".pybck_verify_checkpoint.jsonl"  # Versioni precedenti: dentro lo snapshot
+BUFFER_SIZE = 4 * 1024 * 1024
+CHECKPOINT_FLUSH_EVERY = 1000
+MAX_REPORTED_MISMATCHES = 100
+MODES = ("quick", "full")
+
+
+@dataclass
+class VerifyReport:
+    mode: str
+    files_checked: int = 0
+    files_resumed: int = 0
+    bytes_checked: int = 0
+    mismatches: List[str] = field(default_factory=list)
+    mismatch_count: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.mismatch_count == 0
+
+    @property
+    def throughput_mb_s(self) -> float:
+        if self.elapsed <= 0:
+            return 0.0
+        return self.bytes_checked / 1024**2 / self.elapsed
+
+
+class BackupVerifier:
+    verified : bool
+    error : str
+
+    def __init__(self, config: BackupConfig, threads: int = 4, buffer_size: int = BUFFER_SIZE,
+                 checkpoint_dir: str = CHECKPOINT_DIR):
+        self.config = config
+        self.threads = max(1, threads)
+        self.buffer_size = buffer_size
+        self.checkpoint_dir = checkpoint_dir
+        self.verified = False
+        self.error = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._file_log = RateLimitedLog()
+
+    def verify_snapshot(self, snapshot: str, mode: str = "quick") -> VerifyReport:
+        report = self.verify(self.snapshot_pairs(snapshot), mode, self.checkpoint_path(snapshot))
+        # Checkpoint lasciato nello snapshot da una versione precedente
+        legacy = self.config.join(self.config.backup_path(snapshot), LEGACY_CHECKPOINT_NAME)
+        if os.path.exists(legacy):
+            os.unlink(legacy)
+        return report
+
+    def checkpoint_path(self, snapshot: str) -> str:
+        return os.path.join(self.checkpoint_dir, f"{snapshot}.jsonl")
+
+    def snapshot_pairs(self, snapshot: str) -> List[Tuple[str, str]]:
+        # Stessa struttura creata da BackupBuilder: una cartella per drive, le cartelle utente sotto C
+        snapshot_folder = self.config.backup_path(snapshot)
+        pairs = []
+        for drive in self.config.source_drives:
+            drive_name = drive.replace(":", "")
+            drive_folder = self.config.join(snapshot_folder, f"Disco_{drive_name}_Backup_{snapshot}")
+            if drive_name != "C":
+                pairs.append((self.config.drive_path(drive), drive_folder))
+            else:
+                user_profile = os.environ.get("USERPROFILE", "C:\\Users\\Default")
+                pairs.extend((os.path.join(user_profile, folder), os.path.join(drive_folder, folder)) for folder in self.config.user_folders)
+        return pairs
+
+    def verify(self, pairs: List[Tuple[str, str]], mode: str = "quick", checkpoint_path: str = None) -> VerifyReport:
+        logger.debug(LOG_CLASSE + "verify - Inizio verifica %s di %d sorgenti", mode, len(pairs))
+        if mode not in MODES:
+            raise ValueError(f"Modalità di verifica non valida: {mode}. Valori ammessi: {', '.join(MODES)}.")
+
+        report = VerifyReport(mode)
+        start = time.perf_counter()
+        # I file esclusi da config.filters non sono nello snapshot: non vanno cercati
+        filters = source_filters(self.config)
+        done = self._load_checkpoint(checkpoint_path, mode)
+        checkpoint = self._open_checkpoint(checkpoint_path, mode, resume=bool(done))
+
+        # Limito i file in coda: la verifica di milioni di file non deve riempire la memoria
+        in_flight = threading.BoundedSemaphore(self.threads * 4)
+        try:
+            with ThreadPoolExecutor(max_workers=self.threads) as executor:
+                for index, (source, destination) in enumerate(pairs):
+                    for rel_path, src_path, size in self._walk(source, report, filters.get(source)):
+                        key = f"{index}:{rel_path}"
+                        if key in done:
+                            report.files_resumed += 1
+                            continue
+                        dst_path = os.path.join(destination, *rel_path.split("/"))
+                        in_flight.acquire()
+                        future = executor.submit(self._check_file, src_path, dst_path, size, mode, report, checkpoint, key)
+                        future.add_done_callback(partial(self._job_done, report, in_flight, dst_path))
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+
+        report.elapsed = time.perf_counter() - start
+        self._file_log.flush()
+        self.verified = report.ok
+        # Verifica arrivata in fondo: l'esito è nel report, un nuovo tentativo ricontrolla tutto
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            os.unlink(checkpoint_path)
+        if report.ok:
+            self.error = None
+            logger.info(LOG_CLASSE + f"Verifica {mode} completata: {report.files_checked} file, "
+                        f"{report.throughput_mb_s:.1f} MB/s ({report.files_resumed} già verificati)")
+        else:
+            self.error = f"Verifica {mode} fallita: {report.mismatch_count} file non corrispondenti"
+            logger.error(LOG_CLASSE + self.error)
+        return report
+
+    def _walk(self, root: str, report: VerifyReport, path_filter: PathFilter = None):
+        stack = [(root, "")]
+        while stack:
+            directory, relative = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if path_filter is None or path_filter.enter(relative + entry.name):
+                                stack.append((entry.path, relative + entry.name + "/"))
+                        elif entry.is_file():
+                            if path_filter is not None and not path_filter.accept(relative + entry.name):
+                                continue
+                            yield relative + entry.name, entry.path, entry.stat().st_size
+            except OSError as e:
+                self._mismatch(report, f"{directory}: sorgente non leggibile ({e})")
+
+    def _check_file(self, src_path: str, dst_path: str, size: int, mode: str, report: VerifyReport, checkpoint, key: str):
+        try:
+            src_stat = os.stat(src_path)
+            dst_stat = os.stat(dst_path)
+        except FileNotFoundError:
+            self._mismatch(report, f"{dst_path}: mancante nello snapshot")
+            return
+        except OSError as e:
+            self._mismatch(report, f"{dst_path}: {e}")
+            return
+
+        if src_stat.st_size != dst_stat.st_size:
+            self._mismatch(report, f"{dst_path}: dimensione diversa ({src_stat.st_size} / {dst_stat.st_size})")
+            return
+
+        if mode == "quick":
+            if abs(src_stat.st_mtime_ns - dst_stat.st_mtime_ns) > MTIME_TOLERANCE_NS:
+                self._mismatch(report, f"{dst_path}: data di modifica diversa")
+                return
+        else:
+            try:
+                if self._hash_file(src_path) != self._hash_file(dst_path):
+                    self._mismatch(report, f"{dst_path}: contenuto diverso")
+                    return
+            except OSError as e:
+                self._mismatch(report, f"{dst_path}: {e}")
+                return
+
+        with self._lock:
+            report.files_checked += 1
+            report.bytes_checked += size
+            if checkpoint is not None:
+                checkpoint.write(json.dumps(key) + "\n")
+                if report.files_checked % CHECKPOINT_FLUSH_EVERY == 0:
+                    checkpoint.flush()
+
+    def _hash_file(self, path: str) -> bytes:
+        # Buffer grande e riutilizzato per thread: hashlib rilascia il GIL durante update()
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = memoryview(bytearray(self.buffer_size))
+            self._local.buffer = buffer
+
+        digest = hashlib.sha256()
+        with open(path, "rb", buffering=0) as file:
+            while True:
+                n = file.readinto(buffer)
+                if not n:
+                    break
+                digest.update(buffer[:n])
+        return digest.digest()
+
+    def _job_done(self, report: VerifyReport, in_flight: threading.BoundedSemaphore, dst_path: str, future):
+        # Le future non vengono conservate (milioni di file): un errore inatteso conta come file non verificato
+        in_flight.release()
+        if future.exception() is not None:
+            self._mismatch(report, f"{dst_path}: {future.exception()}")
+
+    def _mismatch(self, report: VerifyReport, message: str):
+        self._file_log.warning(LOG_CLASSE + "%s", message)
+        with self._lock:
+            report.mismatch_count += 1
+            if len(report.mismatches) < MAX_REPORTED_MISMATCHES:
+                report.mismatches.append(message)
+
+    def _load_checkpoint(self, checkpoint_path: str, mode: str) -> set:
+        if not checkpoint_path or not os.path.exists(checkpoint_path):
+            return set()
+        done = set()
+        with open(checkpoint_path, "r", encoding="utf-8") as file:
+            try:
+                header = json.loads(file.readline())
+            except json.JSONDecodeError:
+                return set()
+            if not isinstance(header, dict) or header.get("mode") != mode:
+                return set()
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    done.add(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # Riga troncata da un'interruzione
+        logger.info(LOG_CLASSE + f"Ripresa della verifica: {len(done)} file già verificati")
+        return done
+
+    def _open_checkpoint(self, checkpoint_path: str, mode: str, resume: bool):
+        if not checkpoint_path:
+            return None
+        if resume:
+            file = open(checkpoint_path, "a", encoding="utf-8")
+            # Chiude un'eventuale riga troncata dall'interruzione precedente
+            file.write("\n")
+            return file
+        directory = os.path.dirname(checkpoint_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        file = open(checkpoint_path, "w", encoding="utf-8")
+        file.write(json.dumps({"mode": mode}) + "\n")
+        return file
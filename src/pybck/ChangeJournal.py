@@ -0,0 +1,238 @@
+# Questa classe gestisce il journal delle cartelle modificate di una sorgente tra un backup e il successivo
+# Lo scrive il servizio di monitoraggio (ChangeWatcher); BackupBuilder lo legge per percorrere solo le cartelle cambiate
+
+"""
+cache/changes/<sha1 della sorgente>.jsonl, una riga per evento:
+
+{"start": "a1b2c3", "time": 1705915000.0, "heartbeat": 30}   → il watcher ha iniziato a osservare l'intero albero
+{"beat": 1705915030.0}                                       → il watcher è ancora attivo
+{"mark": "2024-01-22_10-30-45", "time": 1705915845.1, "filters": "9f2c...", "flush": "d4e5f6"}
+                                                             → BackupBuilder inizia a copiare la sorgente
+                                                               (filters: impronta dei filtri della sorgente)
+{"ack": "d4e5f6"}                                            → il watcher ha scritto tutti gli eventi
+                                                               precedenti al mark con quel "flush"
+{"dirty": "Foto/2024"}                                       → è cambiato il contenuto diretto della cartella
+{"dirty": "Progetti/nuovo", "tree": true}                    → cartella creata o spostata: va riletta tutta
+{"overflow": 1705916000.0}                                   → eventi persi (coda piena, limite di watch)
+{"stop": 1705917000.0}                                       → il watcher è stato fermato
+
+changes_since(P) restituisce le cartelle da rileggere rispetto allo snapshot P, oppure None
+(scansione completa) se il journal manca, se non contiene il mark di P, se dopo il mark il watcher
+si è fermato, è ripartito o ha perso eventi, se l'ultimo heartbeat è troppo vecchio oppure se i filtri
+sono cambiati da P: un file escluso allora e incluso ora, in una cartella invariata, non sarebbe mai copiato.
+Nel dubbio si torna sempre alla scansione completa: un journal incompleto non deve far perdere file.
+
+mark(P, ack_timeout=10) attende la conferma del watcher invece di un'attesa fissa: False se il watcher
+non risponde entro ack_timeout (gli eventi ancora in memoria potrebbero mancare).
+unacknowledged(offset) → usata dal watcher: "flush" dei mark scritti dopo offset ancora senza conferma
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from typing import List, Optional, Set, Tuple
+
+from pybck.BackupConfig import BackupConfig
+from pybck import logger
+LOG_CLASSE = "[ChangeJournal] - "
+
+CHANGES_DIR = "cache/changes"
+HEARTBEAT_S = 30
+ACK_POLL_S = 0.05
+
+
+class ChangeSet:
+    # Cartelle (percorsi relativi con "/", "" è la radice) da rileggere nella sorgente
+    dirty : Set[str]
+    trees : Set[str]
+
+    def __init__(self, dirty: Set[str] = None, trees: Set[str] = None):
+        self.dirty = set(dirty or ())
+        self.trees = set(trees or ())
+        # Antenati delle cartelle cambiate: vanno percorsi per raggiungerle
+        self._ancestors = set()
+        for path in self.dirty | self.trees:
+            while path:
+                path = path.rpartition("/")[0]
+                if path in self._ancestors:
+                    break
+                self._ancestors.add(path)
+        # Impostati da BackupBuilder: manifest dello snapshot precedente e prefisso della sorgente
+        self.manifest = None
+        self.prefix = ""
+
+    def needs_scan(self, relative: str) -> bool:
+        return relative in self.dirty or relative in self.trees or relative in self._ancestors
+
+    def is_tree(self, relative: str) -> bool:
+        return relative in self.trees
+
+    def __len__(self):
+        return len(self.dirty | self.trees)
+
+
+class ChangeJournal:
+    path : str
+
+    def __init__(self, source: str, directory: str = CHANGES_DIR):
+        self.source = source
+        self.directory = directory
+        name = hashlib.sha1(os.path.normcase(os.path.abspath(source)).encode("utf-8")).hexdigest()
+        self.path = os.path.join(directory, f"{name}.jsonl")
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.path)
+
+    def append(self, records: List[dict]):
+        # Righe intere in una sola write in append: watcher e builder possono scrivere insieme
+        if not records:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def mark(self, timestamp: str, filters: str = "", ack_timeout: float = 0.0) -> bool:
+        # Senza watcher il journal non esiste e non va creato: il prossimo backup farà la scansione completa
+        if not self.exists():
+            return False
+        token = uuid.uuid4().hex[:12]
+        offset = os.path.getsize(self.path)
+        self.append([{"mark": timestamp, "time": time.time(), "filters": filters, "flush": token}])
+        if ack_timeout <= 0:
+            return True
+
+        # Il watcher scrive gli eventi ancora in memoria e poi la conferma
+        deadline = time.monotonic() + ack_timeout
+        while time.monotonic() < deadline:
+            records, offset = self._read_from(offset)
+            if any(record.get("ack") == token for record in records):
+                return True
+            time.sleep(ACK_POLL_S)
+        logger.warning(LOG_CLASSE + f"Nessuna conferma dal watcher per {self.source} entro {ack_timeout:.0f}s")
+        return False
+
+    def unacknowledged(self, offset: int) -> Tuple[List[str], int]:
+        # ("flush" dei mark dopo offset senza "ack", nuovo offset); il journal compattato si rilegge dall'inizio
+        records, offset = self._read_from(offset)
+        acked = {record["ack"] for record in records if "ack" in record}
+        return [record["flush"] for record in records if "flush" in record and record["flush"] not in acked], offset
+
+    def _read_from(self, offset: int) -> Tuple[List[dict], int]:
+        # Righe complete scritte dopo offset: una riga ancora in scrittura verrà letta la volta successiva
+        try:
+            with open(self.path, "rb") as file:
+                if os.fstat(file.fileno()).st_size < offset:
+                    offset = 0
+                file.seek(offset)
+                data = file.read()
+        except OSError:
+            return [], offset
+        end = data.rfind(b"\n") + 1
+        records = []
+        for line in data[:end].splitlines():
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+        return records, offset + end
+
+    def changes_since(self, snapshot: str, now: float = None, filters: str = None) -> Optional[ChangeSet]:
+        # filters: impronta dei filtri attuali (PathFilter.fingerprint(), "" senza filtri), None per non confrontarla
+        now = time.time() if now is None else now
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                lines = file.readlines()
+        except OSError:
+            return None
+
+        active = False          # Sessione del watcher in corso, senza eventi persi
+        heartbeat = HEARTBEAT_S
+        last_beat = 0.0
+        found = False
+        mark_filters = ""
+        dirty, trees = set(), set()
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Riga troncata o scritture concorrenti: la riga successiva è valida
+            if "dirty" in record:
+                if found:
+                    (trees if record.get("tree") else dirty).add(record["dirty"])
+            elif "beat" in record:
+                last_beat = max(last_beat, record["beat"])
+            elif "mark" in record:
+                if active and record["mark"] == snapshot:
+                    found = True
+                    mark_filters = record.get("filters", "")
+                    dirty, trees = set(), set()
+            elif "start" in record:
+                active = True
+                found = False
+                heartbeat = record.get("heartbeat", HEARTBEAT_S)
+                last_beat = max(last_beat, record.get("time", 0.0))
+            elif "overflow" in record or "stop" in record:
+                active = False
+                found = False
+
+        if not found:
+            logger.debug(LOG_CLASSE + "changes_since - Nessun intervallo valido per %s in %s", snapshot, self.path)
+            return None
+        if filters is not None and mark_filters != filters:
+            logger.info(LOG_CLASSE + f"Filtri di {self.source} cambiati dallo snapshot {snapshot}: scansione completa")
+            return None
+        if now - last_beat > 2 * heartbeat:
+            logger.warning(LOG_CLASSE + f"Watcher non attivo per {self.source} (ultimo segnale {now - last_beat:.0f}s fa)")
+            return None
+        return ChangeSet(dirty, trees)
+
+    def compact(self):
+        # Tiene l'ultima sessione dall'ultimo mark in poi; un mark scritto durante la riscrittura
+        # può andare perso e in quel caso il backup successivo rilegge tutto
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                lines = file.readlines()
+        except OSError:
+            return
+        start_line, last_mark = None, None
+        for index, line in enumerate(lines):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "start" in record:
+                start_line, last_mark = line, None
+            elif "mark" in record:
+                last_mark = index
+            elif "overflow" in record or "stop" in record:
+                start_line, last_mark = None, None  # Sessione chiusa: nessun mark è più utilizzabile
+        if start_line is None:
+            kept = []
+        elif last_mark is None:
+            kept = [start_line]
+        else:
+            kept = [start_line] + lines[last_mark:]
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.writelines(kept)
+        os.replace(tmp_path, self.path)
+        logger.debug(LOG_CLASSE + "compact - %s: %d righe su %d", self.path, len(kept), len(lines))
+
+
+def watched_sources(config: BackupConfig) -> List[str]:
+    # Stesse sorgenti copiate da BackupBuilder: i drive e, per C:, le cartelle utente
+    sources = []
+    for drive in config.source_drives:
+        if drive.replace(":", "") != "C":
+            sources.append(config.drive_path(drive))
+        else:
+            user_profile = os.environ.get("USERPROFILE", "C:\\Users\\Default")
+            sources.extend(os.path.join(user_profile, folder) for folder in config.user_folders)
+    return sources
@@ -0,0 +1,303 @@
+# Questa classe osserva le sorgenti del backup tra un'esecuzione e l'altra e registra nel journal
+# (ChangeJournal) le cartelle il cui contenuto è cambiato. Va eseguita come servizio: "pybck watch"
+
+"""
+ChangeWatcher(config).run(stop_event)  → installa i watch su tutte le sorgenti e scrive il journal
+                                         finché stop_event non viene impostato
+
+Backend intercambiabili (config.watch_backend), registrati in BACKENDS:
+    add_tree(path) → osserva path e tutte le sue sottocartelle; WatchLimitReached se il limite di watch
+                     è raggiunto
+    read(timeout)  → [(cartella, albero)]: cartelle con contenuto cambiato, albero=True per le cartelle
+                     create o spostate (vanno rilette per intero); WatchOverflow se il kernel ha perso eventi,
+                     WatchLimitReached se una cartella nuova non può essere osservata
+    close()
+
+A ogni giro il watcher cerca nei journal i mark di BackupBuilder ancora senza conferma: legge gli eventi
+già in coda nel backend, li scrive e aggiunge {"ack": ...}; il builder riparte senza un'attesa fissa.
+
+"inotify" (Linux) usa direttamente le chiamate di sistema tramite ctypes, senza dipendenze.
+Con molte cartelle può servire alzare fs.inotify.max_user_watches (un watch per cartella).
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, List, Tuple
+
+from pybck.BackupConfig import BackupConfig
+from pybck.ChangeJournal import ChangeJournal, watched_sources, HEARTBEAT_S
+from pybck import logger
+LOG_CLASSE = "[ChangeWatcher] - "
+
+FLUSH_INTERVAL_S = 1.0      # Gli eventi vengono scritti nel journal al massimo ogni secondo
+COMPACT_LINES = 10000       # Righe scritte da un journal prima di compattarlo
+
+# Costanti di <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+EVENT = struct.Struct("iIII")
+READ_SIZE = 256 * 1024
+
+
+class WatchOverflow(Exception):
+    pass
+
+
+class WatchLimitReached(WatchOverflow):
+    # Non tutte le cartelle sono osservate: una nuova sessione non sarebbe affidabile
+    pass
+
+
+class InotifyBackend:
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("Il backend inotify è disponibile solo su Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, f"inotify_init1: {os.strerror(code)}")
+        self._paths: Dict[int, str] = {}
+        self._wds: Dict[str, int] = {}
+
+    def add_tree(self, root: str):
+        stack = [root]
+        while stack:
+            path = stack.pop()
+            if not self._add_watch(path):
+                raise WatchLimitReached(f"limite di watch inotify raggiunto su {path}")
+            try:
+                with os.scandir(path) as entries:
+                    stack.extend(entry.path for entry in entries if entry.is_dir(follow_symlinks=False))
+            except OSError:
+                continue  # Cartella rimossa nel frattempo: il genitore ha già ricevuto l'evento
+
+    def read(self, timeout: float) -> List[Tuple[str, bool]]:
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return []
+        data = os.read(self._fd, READ_SIZE)
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b"\0")
+            offset += EVENT.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                raise WatchOverflow("coda degli eventi inotify piena")
+            if mask & IN_IGNORED:
+                self._forget(wd)
+                continue
+            directory = self._paths.get(wd)
+            if directory is None or mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                continue  # Il genitore riceve l'evento di rimozione o spostamento
+
+            events.append((directory, False))
+            if mask & IN_ISDIR and name:
+                child = os.path.join(directory, os.fsdecode(name))
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    events.append((child, True))
+                    self.add_tree(child)
+                elif mask & IN_MOVED_FROM:
+                    # I watch spostati altrove riporterebbero il vecchio percorso
+                    self._remove_tree(child)
+        return events
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _add_watch(self, path: str) -> bool:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            code = ctypes.get_errno()
+            if code in (errno.ENOENT, errno.ENOTDIR):
+                return True  # Rimossa o sostituita da un file prima del watch
+            logger.error(LOG_CLASSE + f"Impossibile osservare {path}: {os.strerror(code)}")
+            return False
+        self._paths[wd] = path
+        self._wds[path] = wd
+        return True
+
+    def _remove_tree(self, root: str):
+        prefix = root + os.sep
+        for path, wd in list(self._wds.items()):
+            if path == root or path.startswith(prefix):
+                self._libc.inotify_rm_watch(self._fd, wd)
+                self._forget(wd)
+
+    def _forget(self, wd: int):
+        path = self._paths.pop(wd, None)
+        if path is not None and self._wds.get(path) == wd:
+            del self._wds[path]
+
+
+BACKENDS = {
+    "inotify": InotifyBackend,
+}
+
+
+def create_backend(name: str):
+    if name not in BACKENDS:
+        raise ValueError(f"Backend di monitoraggio non valido: {name}. Valori ammessi: {', '.join(BACKENDS)}.")
+    return BACKENDS[name]()
+
+
+class ChangeWatcher:
+    journals : Dict[str, ChangeJournal]
+
+    def __init__(self, config: BackupConfig, backend=None, heartbeat_s: float = HEARTBEAT_S,
+                 flush_interval: float = FLUSH_INTERVAL_S, compact_lines: int = COMPACT_LINES):
+        self.config = config
+        self.backend = backend
+        self.heartbeat_s = heartbeat_s
+        self.flush_interval = flush_interval
+        self.compact_lines = compact_lines
+        self.journals = {}
+        self._written = {}
+        self._pending: Dict[str, Dict[str, bool]] = {}
+        self._offsets: Dict[str, int] = {}
+
+    def start(self):
+        if self.backend is None:
+            self.backend = create_backend(self.config.watch_backend)
+        for source in watched_sources(self.config):
+            if not os.path.isdir(source):
+                logger.warning(LOG_CLASSE + f"Sorgente non trovata, non osservata: {source}")
+                continue
+            journal = ChangeJournal(source, self.config.change_journal_dir)
+            self.journals[source] = journal
+            self._pending[source] = {}
+            self._written[source] = 0
+            start = time.perf_counter()
+            self._offsets[source] = 0
+            try:
+                self.backend.add_tree(source)
+            except WatchLimitReached as e:
+                journal.append([{"overflow": time.time()}])
+                logger.error(LOG_CLASSE + f"{source} non osservabile per intero ({e}): i backup useranno la scansione completa")
+                continue
+            # La sessione inizia solo quando tutto l'albero è osservato
+            self._start_session(source)
+            logger.info(LOG_CLASSE + f"Osservo {source} ({time.perf_counter() - start:.1f}s per installare i watch)")
+
+    def run(self, stop: threading.Event):
+        self.start()
+        last_flush = last_beat = time.monotonic()
+        try:
+            while not stop.is_set():
+                self._read_events(self.flush_interval)
+                self._acknowledge()
+
+                now = time.monotonic()
+                if now - last_flush >= self.flush_interval:
+                    self.flush()
+                    last_flush = now
+                if now - last_beat >= self.heartbeat_s:
+                    self._heartbeat()
+                    last_beat = now
+        finally:
+            self.flush()
+            for journal in self.journals.values():
+                journal.append([{"stop": time.time()}])
+            self.backend.close()
+            logger.info(LOG_CLASSE + "Monitoraggio delle sorgenti terminato")
+
+    def flush(self):
+        for source, pending in self._pending.items():
+            if not pending:
+                continue
+            records = [{"dirty": relative, "tree": True} if tree else {"dirty": relative}
+                       for relative, tree in pending.items()]
+            self.journals[source].append(records)
+            self._written[source] += len(records)
+            pending.clear()
+
+    def _read_events(self, timeout: float) -> bool:
+        # False se non è arrivato nessun evento
+        try:
+            events = self.backend.read(timeout)
+        except WatchLimitReached as e:
+            self._overflow(str(e), restart=False)
+            return True
+        except WatchOverflow as e:
+            self._overflow(str(e))
+            return True
+        for directory, tree in events:
+            self._record(directory, tree)
+        return bool(events)
+
+    def _acknowledge(self):
+        # Mark nuovi: prima gli eventi già in coda (accaduti prima del mark), poi la conferma
+        for source, journal in self.journals.items():
+            tokens, self._offsets[source] = journal.unacknowledged(self._offsets[source])
+            if not tokens:
+                continue
+            while self._read_events(0):
+                pass
+            self.flush()
+            journal.append([{"ack": token} for token in tokens])
+            self._written[source] += len(tokens)
+
+    def _record(self, directory: str, tree: bool):
+        source = self._source_of(directory)
+        if source is None:
+            return
+        relative = os.path.relpath(directory, source).replace(os.sep, "/")
+        relative = "" if relative == "." else relative
+        pending = self._pending[source]
+        pending[relative] = pending.get(relative, False) or tree
+
+    def _source_of(self, directory: str):
+        # La sorgente più specifica che contiene la cartella
+        for source in sorted(self.journals, key=len, reverse=True):
+            if directory == source or directory.startswith(source.rstrip(os.sep) + os.sep):
+                return source
+        return None
+
+    def _overflow(self, reason: str, restart: bool = True):
+        # Eventi persi: la sessione si chiude e ne inizia un'altra, il prossimo backup rilegge tutto.
+        # Con il limite di watch raggiunto (restart=False) nessuna nuova sessione: non tutto è osservato
+        logger.warning(LOG_CLASSE + f"Eventi persi ({reason}): il prossimo backup eseguirà la scansione completa")
+        self.flush()
+        for source, journal in self.journals.items():
+            journal.append([{"overflow": time.time()}])
+            if restart:
+                self._start_session(source)
+
+    def _start_session(self, source: str):
+        self.journals[source].append([{"start": uuid.uuid4().hex[:12], "time": time.time(), "heartbeat": self.heartbeat_s}])
+
+    def _heartbeat(self):
+        for source, journal in self.journals.items():
+            journal.append([{"beat": time.time()}])
+            self._written[source] += 1
+            if self._written[source] >= self.compact_lines:
+                journal.compact()
+                self._written[source] = 0
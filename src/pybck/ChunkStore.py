@@ -0,0 +1,482 @@
+# Questo modulo implementa l'archivio deduplicato: i file vengono divisi in chunk a dimensione variabile
+# (content-defined chunking stile FastCDC) salvati una sola volta per contenuto sotto backup_root
+
+"""
+G:\\Backup_PC\\.pybck_chunks\\
+├── index.sqlite            # indice dei chunk: hash → dimensione, riferimenti
+└── 3f\\a2\\3fa2...           # chunk salvati per hash sha256
+
+G:\\Backup_PC\\<timestamp>\\Disco_D_Backup_<timestamp>\\.pybck_recipe.jsonl
+                           # ricetta: per ogni file l'elenco ordinato dei chunk
+
+chunk_stream(file)      → divide uno stream in chunk con un gear hash (confini dipendenti dal contenuto).
+                          Con numpy (opzionale) l'hash è calcolato su tutto il buffer con operazioni vettoriali
+                          e dà gli stessi confini di cut_point(), il riferimento in Python puro; senza numpy i
+                          chunk hanno dimensione fissa (avg_size): la deduplica resta corretta, ma un inserimento
+                          sposta i confini di tutto il resto del file (benchmarks/bench_chunking.py)
+ChunkStore.put(data)    → salva un chunk se non esiste già e ne incrementa i riferimenti
+DedupEngine.mirror(...) → stessa interfaccia dei motori di copia, ma scrive una ricetta invece dei file
+ChunkStore.exclusive_bytes(counts) → byte dei chunk usati solo da un insieme di ricette (spazio di uno snapshot)
+
+Riferimenti e ricette: durante la deduplica i chunk vengono salvati senza riferimenti (put(data, ref=False)).
+commit_recipe() prende i riferimenti di tutta la ricetta in un'unica transazione, insieme a una riga "pending",
+poi rinomina .pybck_recipe.jsonl.tmp nella ricetta definitiva e cancella la riga. Così una ricetta parziale
+(backup interrotto, file fallito a metà) non ha mai riferimenti, e discard_recipe() sa sempre quali rilasciare
+quando una sorgente viene rifatta o un backup fallito eliminato. I chunk rimasti senza riferimenti vengono
+eliminati da prune_unreferenced() alla fine di un backup riuscito.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+
+from pybck.CopyEngine import CopyStats, MTIME_TOLERANCE_NS
+from pybck.BackupProgress import ProgressTracker
+from pybck import logger
+LOG_CLASSE = "[ChunkStore] - "
+
+STORE_NAME = ".pybck_chunks"
+RECIPE_NAME = ".pybck_recipe.jsonl"
+
+MIN_SIZE = 16 * 1024
+AVG_SIZE = 64 * 1024
+MAX_SIZE = 256 * 1024
+READ_SIZE = 4 * 1024 * 1024
+MASK64 = (1 << 64) - 1
+CHUNKERS = ("cdc", "fixed")
+HASH_BLOCK = 64 * 1024
+
+
+def _gear_table() -> List[int]:
+    # Tabella deterministica: i confini dei chunk devono restare stabili tra versioni e macchine
+    return [int.from_bytes(hashlib.sha256(i.to_bytes(2, "little")).digest()[:8], "little") for i in range(256)]
+
+
+GEAR = _gear_table()
+
+
+def _masks(avg_size: int):
+    # Normalized chunking: maschera più severa prima della dimensione media, più permissiva dopo
+    bits = avg_size.bit_length() - 1
+    mask_s = (1 << (bits + 2)) - 1
+    mask_l = (1 << (bits - 2)) - 1
+    # I bit della maschera vengono presi dalla parte alta dell'hash, la più mescolata
+    return mask_s << (64 - bits - 2), mask_l << (64 - bits + 2)
+
+
+def cut_point(data, start: int, end: int, min_size: int = MIN_SIZE, avg_size: int = AVG_SIZE, max_size: int = MAX_SIZE,
+              masks=None) -> int:
+    # Restituisce la lunghezza del chunk che inizia in data[start:]
+    length = end - start
+    if length <= min_size:
+        return length
+    if length > max_size:
+        length = max_size
+    normal = avg_size if avg_size < length else length
+    mask_s, mask_l = masks or _masks(avg_size)
+
+    gear = GEAR
+    h = 0
+    pos = start + min_size
+    for mask, stop in ((mask_s, start + normal), (mask_l, start + length)):
+        while pos < stop:
+            # I bit alti usati dalla maschera non dipendono da quelli oltre il 64esimo:
+            # riduco l'hash a 64 bit solo ogni 64 byte invece che a ogni byte
+            block_end = min(pos + 64, stop)
+            for byte in data[pos:block_end]:
+                h = (h << 1) + gear[byte]
+                pos += 1
+                if not h & mask:
+                    return pos - start
+            h &= MASK64
+    return length
+
+
+class _GearCutter:
+    # Stessi confini di cut_point() su un buffer intero: l'hash di ogni posizione dipende solo dagli ultimi
+    # 64 byte (quelli più vecchi escono dai 64 bit), quindi si calcola una volta per tutto il buffer con
+    # sei somme vettoriali (finestre di 2, 4, ..., 64 byte) invece che byte per byte
+    def __init__(self, np, data, min_size: int, avg_size: int, max_size: int, masks):
+        self.data = data
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        self.masks = masks
+        self._np = np
+        self._hits = self._gear_hits(np, data, masks)
+
+    @staticmethod
+    def _gear_hits(np, data, masks):
+        # Blocchi da HASH_BLOCK byte (più 63 di sovrapposizione per la finestra) restano in cache:
+        # sull'intero buffer da 4 MB gli array uint64 da 32 MB rendono il calcolo circa due volte più lento
+        gear = np.array(GEAR, dtype=np.uint64)
+        values = np.frombuffer(data, dtype=np.uint8)
+        scratch = np.empty(HASH_BLOCK + 63, dtype=np.uint64)
+        hits = [[] for _ in masks]
+        for block in range(0, len(values), HASH_BLOCK):
+            low = max(block - 63, 0)
+            h = gear[values[low:block + HASH_BLOCK]]
+            for shift in (1, 2, 4, 8, 16, 32):
+                np.left_shift(h[:-shift], np.uint64(shift), out=scratch[shift:len(h)])
+                h[shift:] += scratch[shift:len(h)]
+            h = h[block - low:]
+            for found, mask in zip(hits, masks):
+                found.append(np.flatnonzero((h & np.uint64(mask)) == 0) + block)
+        return [np.concatenate(found) if found else np.empty(0, dtype=np.intp) for found in hits]
+
+    def cut_point(self, start: int, end: int) -> int:
+        length = end - start
+        if length <= self.min_size:
+            return length
+        if length > self.max_size:
+            length = self.max_size
+        normal = self.avg_size if self.avg_size < length else length
+        # cut_point() riparte da h = 0 dopo min_size: nei primi 63 byte la finestra è più corta di quella
+        # del buffer, quindi li controllo in Python (al massimo 63 passi per chunk)
+        pos = start + self.min_size
+        exact = min(pos + 63, start + length)
+        h = 0
+        for byte in self.data[pos:exact]:
+            h = ((h << 1) + GEAR[byte]) & MASK64
+            pos += 1
+            if not h & self.masks[0 if pos <= start + normal else 1]:
+                return pos - start
+        for hits, stop in zip(self._hits, (start + normal, start + length)):
+            if pos >= stop:
+                continue
+            index = self._np.searchsorted(hits, pos)
+            if index < len(hits) and hits[index] < stop:
+                return int(hits[index]) + 1 - start
+            pos = stop
+        return length
+
+
+_fixed_fallback_logged = False
+
+
+def default_chunker() -> str:
+    global _fixed_fallback_logged
+    # Import locale: numpy serve solo alla deduplica, non all'avvio degli altri comandi
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        if not _fixed_fallback_logged:
+            _fixed_fallback_logged = True
+            logger.warning(LOG_CLASSE + "numpy non disponibile: chunk a dimensione fissa al posto del content-defined chunking")
+        return "fixed"
+    return "cdc"
+
+
+def chunk_stream(stream: BinaryIO, min_size: int = MIN_SIZE, avg_size: int = AVG_SIZE, max_size: int = MAX_SIZE,
+                 chunker: str = None) -> Iterator[bytes]:
+    # chunker: "cdc" (confini dal contenuto, vettoriale con numpy, altrimenti cut_point) o "fixed";
+    # None sceglie "cdc" solo se numpy è disponibile
+    chunker = chunker or default_chunker()
+    if chunker not in CHUNKERS:
+        raise ValueError(f"Chunker non valido: {chunker}. Valori ammessi: {', '.join(CHUNKERS)}.")
+    if chunker == "fixed":
+        yield from _fixed_chunks(stream, avg_size)
+        return
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    masks = _masks(avg_size)
+    buffer = b""
+    eof = False
+    while True:
+        if not eof and len(buffer) < max_size:
+            block = stream.read(READ_SIZE)
+            if block:
+                buffer += block
+                continue
+            eof = True
+        if not buffer:
+            return
+
+        start = 0
+        end = len(buffer)
+        cutter = _GearCutter(numpy, buffer, min_size, avg_size, max_size, masks) if numpy is not None else None
+        # Taglio solo finché c'è abbastanza dato per un chunk massimo, il resto attende la lettura successiva
+        while end - start >= max_size or (eof and start < end):
+            if cutter is not None:
+                size = cutter.cut_point(start, end)
+            else:
+                size = cut_point(buffer, start, end, min_size, avg_size, max_size, masks)
+            yield buffer[start:start + size]
+            start += size
+        buffer = buffer[start:]
+
+
+def _fixed_chunks(stream: BinaryIO, size: int) -> Iterator[bytes]:
+    buffer = b""
+    while True:
+        block = stream.read(READ_SIZE)
+        if not block:
+            break
+        buffer += block
+        whole = len(buffer) - len(buffer) % size
+        for start in range(0, whole, size):
+            yield buffer[start:start + size]
+        buffer = buffer[whole:]
+    if buffer:
+        yield buffer
+
+
+class ChunkStore:
+    root : str
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        # L'indice resta su disco: la memoria usata non cresce con il numero di chunk
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA cache_size=-65536")  # 64 MiB al massimo
+        self._db.execute("CREATE TABLE IF NOT EXISTS chunks (hash BLOB PRIMARY KEY, size INTEGER, refs INTEGER) WITHOUT ROWID")
+        # Ricette i cui riferimenti sono già presi ma che potrebbero essere ancora .tmp
+        self._db.execute("CREATE TABLE IF NOT EXISTS pending (recipe TEXT PRIMARY KEY)")
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+    def chunk_path(self, digest_hex: str) -> str:
+        return os.path.join(self.root, digest_hex[:2], digest_hex[2:4], digest_hex)
+
+    def put(self, data: bytes, ref: bool = True) -> Tuple[str, bool]:
+        # Restituisce l'hash del chunk e se è stato scritto (False se era già presente).
+        # ref=False: il riferimento verrà preso da commit_recipe()
+        digest = hashlib.sha256(data).digest()
+        refs = 1 if ref else 0
+        with self._lock:
+            row = self._db.execute("SELECT refs FROM chunks WHERE hash = ?", (digest,)).fetchone()
+            if row is not None:
+                if ref:
+                    self._db.execute("UPDATE chunks SET refs = refs + 1 WHERE hash = ?", (digest,))
+                return digest.hex(), False
+
+        path = self.chunk_path(digest.hex())
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._db.execute("INSERT INTO chunks (hash, size, refs) VALUES (?, ?, ?) "
+                             "ON CONFLICT(hash) DO UPDATE SET refs = refs + ?", (digest, len(data), refs, refs))
+        return digest.hex(), True
+
+    def add_refs(self, chunks: List[str]):
+        # Un file invariato riusa i chunk della ricetta precedente senza rileggerli
+        with self._lock:
+            self._db.executemany("UPDATE chunks SET refs = refs + 1 WHERE hash = ?", [(bytes.fromhex(c),) for c in chunks])
+
+    def exclusive_bytes(self, counts: Dict[str, int], seen: set = None) -> int:
+        # Byte dei chunk con tanti riferimenti quante le occorrenze in counts (usati solo da quelle ricette);
+        # con seen conta anche i chunk condivisi non ancora attribuiti, e li aggiunge a seen
+        total = 0
+        with self._lock:
+            for chunk, count in counts.items():
+                row = self._db.execute("SELECT size, refs FROM chunks WHERE hash = ?", (bytes.fromhex(chunk),)).fetchone()
+                if row is None:
+                    continue
+                if row[1] <= count or (seen is not None and chunk not in seen):
+                    total += row[0]
+                if seen is not None:
+                    seen.add(chunk)
+        return total
+
+    def release(self, chunks: List[str]) -> int:
+        # Decrementa i riferimenti ed elimina i chunk non più usati; restituisce i byte liberati
+        freed = 0
+        with self._lock:
+            for chunk in chunks:
+                digest = bytes.fromhex(chunk)
+                self._db.execute("UPDATE chunks SET refs = refs - 1 WHERE hash = ?", (digest,))
+                row = self._db.execute("SELECT size, refs FROM chunks WHERE hash = ?", (digest,)).fetchone()
+                if row is not None and row[1] <= 0:
+                    self._db.execute("DELETE FROM chunks WHERE hash = ?", (digest,))
+                    try:
+                        os.unlink(self.chunk_path(chunk))
+                        freed += row[0]
+                    except FileNotFoundError:
+                        pass
+            self._db.commit()
+        return freed
+
+    def release_recipe(self, recipe_path: str) -> int:
+        freed = 0
+        for entry in read_recipe(recipe_path):
+            freed += self.release(entry["chunks"])
+        return freed
+
+    def commit_recipe(self, tmp_path: str, recipe_path: str):
+        # Riferimenti di tutta la ricetta e riga "pending" nella stessa transazione, poi la rinomina
+        with self._lock:
+            self._db.executemany("UPDATE chunks SET refs = refs + 1 WHERE hash = ?",
+                                 ((bytes.fromhex(chunk),) for entry in read_recipe(tmp_path) for chunk in entry["chunks"]))
+            self._db.execute("INSERT OR REPLACE INTO pending (recipe) VALUES (?)", (os.path.abspath(recipe_path),))
+            self._db.commit()
+        os.replace(tmp_path, recipe_path)
+        with self._lock:
+            self._db.execute("DELETE FROM pending WHERE recipe = ?", (os.path.abspath(recipe_path),))
+            self._db.commit()
+
+    def discard_recipe(self, recipe_path: str) -> int:
+        # Elimina la ricetta (definitiva o .tmp) di una sorgente da rifare o di un backup eliminato,
+        # rilasciando solo i riferimenti presi da commit_recipe(); restituisce i byte liberati
+        key = os.path.abspath(recipe_path)
+        tmp_path = recipe_path + ".tmp"
+        with self._lock:
+            pending = self._db.execute("SELECT 1 FROM pending WHERE recipe = ?", (key,)).fetchone() is not None
+        freed = 0
+        if os.path.exists(recipe_path):
+            freed = self.release_recipe(recipe_path)
+            os.unlink(recipe_path)
+        elif pending and os.path.exists(tmp_path):
+            # Interrotto tra la transazione e la rinomina: i riferimenti della .tmp sono presi
+            freed = self.release_recipe(tmp_path)
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        if pending:
+            with self._lock:
+                self._db.execute("DELETE FROM pending WHERE recipe = ?", (key,))
+                self._db.commit()
+        return freed
+
+    def prune_unreferenced(self) -> int:
+        # Chunk salvati da deduplicazioni mai completate (ricette .tmp scartate); restituisce i byte liberati
+        freed = 0
+        with self._lock:
+            rows = self._db.execute("SELECT hash, size FROM chunks WHERE refs <= 0").fetchall()
+            for digest, size in rows:
+                self._db.execute("DELETE FROM chunks WHERE hash = ?", (digest,))
+                try:
+                    os.unlink(self.chunk_path(digest.hex()))
+                    freed += size
+                except FileNotFoundError:
+                    pass
+            self._db.commit()
+        return freed
+
+    def read_chunk(self, chunk: str) -> bytes:
+        with open(self.chunk_path(chunk), "rb") as file:
+            return file.read()
+
+    def restore_file(self, chunks: List[str], destination: str):
+        with open(destination, "wb") as file:
+            for chunk in chunks:
+                file.write(self.read_chunk(chunk))
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
+
+
+def read_recipe(recipe_path: str) -> Iterator[dict]:
+    with open(recipe_path, "r", encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # Ultima riga troncata di una ricetta parziale (backup interrotto)
+                logger.warning(LOG_CLASSE + f"Riga non valida nella ricetta {recipe_path}, lettura interrotta")
+                return
+
+
+class DedupEngine:
+    # Motore di "copia" per storage_mode "dedup": stessa interfaccia di NativeCopyEngine
+
+    def __init__(self, store: ChunkStore):
+        self.store = store
+
+    def mirror(self, source: str, destination: str, link_dest: str = None, progress: ProgressTracker = None,
+               path_filter=None) -> CopyStats:
+        logger.debug(LOG_CLASSE + "mirror - Inizio deduplica %s → %s", source, destination)
+        stats = CopyStats()
+        start = time.perf_counter()
+        previous = self._load_previous(link_dest)
+
+        os.makedirs(destination, exist_ok=True)
+        recipe_path = os.path.join(destination, RECIPE_NAME)
+        # Sorgente ripresa o rifatta: la ricetta precedente (anche parziale) restituisce i suoi riferimenti
+        self.store.discard_recipe(recipe_path)
+        with open(recipe_path + ".tmp", "w", encoding="utf-8") as recipe:
+            for rel_path, full_path, st in _walk_source(source, stats, path_filter):
+                old = previous.get(rel_path)
+                try:
+                    if old is not None and old["size"] == st.st_size and abs(old["mtime_ns"] - st.st_mtime_ns) <= MTIME_TOLERANCE_NS:
+                        chunks = old["chunks"]
+                        stats.files_skipped += 1
+                    else:
+                        chunks = self._store_file(full_path, stats)
+                        stats.files_copied += 1
+                except OSError as e:
+                    stats.errors.append(f"{full_path}: {e}")
+                    if progress is not None:
+                        progress.error(f"{full_path}: {e}")
+                    continue
+                if progress is not None:
+                    progress.file_done(full_path, st.st_size)
+                recipe.write(json.dumps({"path": rel_path, "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                                         "mode": st.st_mode, "chunks": chunks}) + "\n")
+        self.store.commit_recipe(recipe_path + ".tmp", recipe_path)
+
+        stats.elapsed = time.perf_counter() - start
+        logger.debug(LOG_CLASSE + "mirror - Fine deduplica %s: %d file letti, %d invariati, %.1f MB di chunk nuovi",
+                     source, stats.files_copied, stats.files_skipped, stats.bytes_copied / 1024**2)
+        if stats.errors:
+            raise Exception(f"Deduplica fallita con {len(stats.errors)} errori: {stats.errors[0]}")
+        return stats
+
+    def _store_file(self, path: str, stats: CopyStats) -> List[str]:
+        chunks = []
+        with open(path, "rb") as file:
+            for data in chunk_stream(file):
+                digest, written = self.store.put(data, ref=False)
+                chunks.append(digest)
+                if written:
+                    stats.bytes_copied += len(data)
+                else:
+                    stats.bytes_linked += len(data)
+        return chunks
+
+    def _load_previous(self, link_dest: str) -> dict:
+        if link_dest is None:
+            return {}
+        recipe_path = os.path.join(link_dest, RECIPE_NAME)
+        if not os.path.exists(recipe_path):
+            return {}
+        return {entry["path"]: entry for entry in read_recipe(recipe_path)}
+
+
+def _walk_source(root: str, stats: CopyStats, path_filter=None):
+    stack = [(root, "")]
+    while stack:
+        directory, relative = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if path_filter is None or path_filter.enter(relative + entry.name):
+                            stack.append((entry.path, relative + entry.name + "/"))
+                        else:
+                            stats.entries_filtered += 1
+                    elif entry.is_file():
+                        if path_filter is None or path_filter.accept(relative + entry.name):
+                            yield relative + entry.name, entry.path, entry.stat()
+                        else:
+                            stats.entries_filtered += 1
+        except OSError as e:
+            stats.errors.append(f"{directory}: {e}")
@@ -0,0 +1,306 @@
+# Questo modulo implementa la modalità di archiviazione compressa: lo snapshot mantiene l'albero delle
+# cartelle della sorgente, ma i file comprimibili vengono salvati compressi con l'estensione .pybckz
+
+"""
+G:\\Backup_PC\\<timestamp>\\Disco_D_Backup_<timestamp>\\
+├── Documenti\\relazione.doc.pybckz    # compresso: intestazione (codec, dimensione originale) + dati
+├── Documenti\\foto.jpg                # già compresso: copiato così com'è
+└── log\\server.log.pybckz
+
+compress_file(src, dst, codec, level) → comprime un file (eseguita nei processi del pool); se un campione
+                                        iniziale non si comprime almeno di MIN_SAVING o il risultato non
+                                        è più piccolo dell'originale il file viene copiato così com'è
+read_header(path)                     → (codec, dimensione originale) di un file .pybckz, None per gli altri
+iter_original(path) / decompress_file → contenuto originale di un file .pybckz
+
+CompressEngine.mirror(...)            → stessa interfaccia dei motori di copia: i file invariati rispetto allo
+                                        snapshot precedente diventano hard link, gli altri vengono compressi
+                                        in un pool di processi (la compressione usa la CPU, non l'I/O)
+
+Codec: "zlib" e "lzma" dalla libreria standard, "zstd" se il pacchetto zstandard è installato.
+I file con estensioni già compresse (immagini, video, archivi, documenti Office) e quelli più piccoli
+di un cluster non vengono compressi. mtime e permessi del file salvato sono quelli dell'originale.
+"""
+
+import lzma
+import os
+import shutil
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator, Optional, Tuple
+
+from pybck.ChunkStore import _walk_source
+from pybck.CopyEngine import CopyStats, MTIME_TOLERANCE_NS
+from pybck.BackupProgress import ProgressTracker
+from pybck import logger, RateLimitedLog
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+LOG_CLASSE = "[CompressedStore] - "
+
+SUFFIX = ".pybckz"
+MAGIC = b"PYBCKZ01"
+HEADER = struct.Struct("<8sBQ")     # magic | codec | dimensione originale
+CODECS = {"zlib": 1, "lzma": 2, "zstd": 3}
+DEFAULT_LEVELS = {"zlib": 6, "lzma": 1, "zstd": 3}
+READ_SIZE = 1024 * 1024
+SAMPLE_SIZE = 64 * 1024
+MIN_SAVING = 0.10                   # Il campione deve ridursi almeno del 10%
+MIN_SIZE = 4096                     # Sotto un cluster lo spazio occupato non cambia
+INCOMPRESSIBLE = {
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".avif",
+    ".mp3", ".aac", ".m4a", ".ogg", ".opus", ".flac",
+    ".mp4", ".m4v", ".mkv", ".avi", ".mov", ".wmv", ".webm",
+    ".zip", ".7z", ".rar", ".gz", ".tgz", ".bz2", ".xz", ".zst", ".lz4", ".cab", ".jar",
+    ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".odp", ".epub",   # Contenitori zip
+    ".pdf", ".msi", ".iso",
+}
+
+
+def available_codecs() -> Tuple[str, ...]:
+    return tuple(name for name in CODECS if name != "zstd" or zstandard is not None)
+
+
+def validate_codec(codec: str, level: int = 0):
+    if codec not in CODECS:
+        raise ValueError(f"Codec di compressione non valido: {codec}. Valori ammessi: {', '.join(CODECS)}.")
+    if codec not in available_codecs():
+        raise ValueError(f"Il codec {codec} richiede il pacchetto zstandard (pip install zstandard).")
+    if level < 0:
+        raise ValueError("Il livello di compressione non può essere negativo.")
+
+
+def _compressor(codec: str, level: int):
+    level = level or DEFAULT_LEVELS[codec]
+    if codec == "zlib":
+        return zlib.compressobj(level)
+    if codec == "lzma":
+        return lzma.LZMACompressor(preset=level)
+    return zstandard.ZstdCompressor(level=level).compressobj()
+
+
+def _decompressor(codec_id: int):
+    if codec_id == CODECS["zlib"]:
+        return zlib.decompressobj()
+    if codec_id == CODECS["lzma"]:
+        return lzma.LZMADecompressor()
+    if codec_id == CODECS["zstd"] and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError(f"Codec {codec_id} non supportato")
+
+
+def is_compressible(name: str, size: int) -> bool:
+    # Scelta senza leggere il file; il campione in compress_file scarta il resto
+    if name.endswith(SUFFIX):
+        return True  # Un file .pybckz salvato così com'è verrebbe scambiato per un file compresso
+    return size >= MIN_SIZE and os.path.splitext(name)[1].lower() not in INCOMPRESSIBLE
+
+
+def compress_file(src: str, dst: str, codec: str, level: int = 0) -> Tuple[bool, int, int, float]:
+    # Restituisce (compresso, byte letti, byte scritti, secondi di CPU del processo)
+    cpu = time.process_time()
+    with open(src, "rb") as fsrc:
+        size = os.fstat(fsrc.fileno()).st_size
+        sample = fsrc.read(SAMPLE_SIZE)
+        if not src.endswith(SUFFIX) and len(zlib.compress(sample, 1)) > len(sample) * (1 - MIN_SAVING):
+            fsrc.close()
+            shutil.copy2(src, dst)
+            return False, size, size, time.process_time() - cpu
+
+        compressor = _compressor(codec, level)
+        written = HEADER.size
+        with open(dst + SUFFIX, "wb") as fdst:
+            fdst.write(HEADER.pack(MAGIC, CODECS[codec], size))
+            data = sample
+            while data:
+                out = compressor.compress(data)
+                fdst.write(out)
+                written += len(out)
+                data = fsrc.read(READ_SIZE)
+            out = compressor.flush()
+            fdst.write(out)
+            written += len(out)
+
+    if written >= size and not src.endswith(SUFFIX):
+        # Il campione ingannava: meglio la copia originale
+        os.unlink(dst + SUFFIX)
+        shutil.copy2(src, dst)
+        return False, size, size, time.process_time() - cpu
+    shutil.copystat(src, dst + SUFFIX)
+    return True, size, written, time.process_time() - cpu
+
+
+def read_header(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        with open(path, "rb") as file:
+            magic, codec_id, size = HEADER.unpack(file.read(HEADER.size))
+    except (OSError, struct.error):
+        return None
+    if magic != MAGIC:
+        return None
+    return codec_id, size
+
+
+def iter_original(path: str) -> Iterator[bytes]:
+    # Contenuto originale di un file .pybckz, a blocchi
+    with open(path, "rb") as file:
+        magic, codec_id, size = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} non è un file compresso da pybck")
+        decompressor = _decompressor(codec_id)
+        produced = 0
+        while True:
+            data = file.read(READ_SIZE)
+            if not data:
+                break
+            out = decompressor.decompress(data)
+            produced += len(out)
+            yield out
+    if produced != size:
+        raise ValueError(f"{path}: {produced} byte decompressi invece di {size}")
+
+
+def decompress_file(path: str, destination: str):
+    with open(destination, "wb") as file:
+        for data in iter_original(path):
+            file.write(data)
+    shutil.copystat(path, destination)
+
+
+class CompressEngine:
+    # Motore di "copia" per storage_mode "compressed": stessa interfaccia di NativeCopyEngine
+    codec : str
+    processes : int
+
+    def __init__(self, codec: str = "zlib", level: int = 0, processes: int = 0):
+        validate_codec(codec, level)
+        self.codec = codec
+        self.level = level
+        self.processes = processes or os.cpu_count() or 1
+        self._pool = None
+        self._lock = threading.Lock()
+        self._file_log = RateLimitedLog()
+
+    def mirror(self, source: str, destination: str, link_dest: str = None, progress: ProgressTracker = None,
+               path_filter=None) -> CopyStats:
+        logger.debug(LOG_CLASSE + "mirror - Inizio compressione %s → %s (%s)", source, destination, self.codec)
+        stats = CopyStats()
+        start = time.perf_counter()
+        # I nomi salvati non coincidono con quelli della sorgente: una copia interrotta si rifà da capo
+        if os.path.isdir(destination):
+            shutil.rmtree(destination)
+        os.makedirs(destination, exist_ok=True)
+
+        files = list(_walk_source(source, stats, path_filter))
+        if progress is not None:
+            progress.set_total(sum(st.st_size for _, _, st in files))
+
+        compress_jobs, copy_jobs = [], []
+        created = {destination}
+        for rel_path, full_path, st in files:
+            parts = rel_path.split("/")
+            dst_path = os.path.join(destination, *parts)
+            parent = os.path.dirname(dst_path)
+            if parent not in created:
+                os.makedirs(parent, exist_ok=True)
+                stats.dirs_created += 1
+                created.add(parent)
+            if link_dest is not None and self._link_previous(os.path.join(link_dest, *parts), dst_path, st):
+                stats.files_linked += 1
+                stats.bytes_linked += st.st_size
+                if progress is not None:
+                    progress.file_done(full_path, st.st_size)
+            elif is_compressible(parts[-1], st.st_size):
+                compress_jobs.append((full_path, dst_path, st.st_size))
+            else:
+                copy_jobs.append((full_path, dst_path, st.st_size))
+
+        # I file grandi partono per primi; le copie dirette avanzano in questo thread mentre il pool comprime
+        compress_jobs.sort(key=lambda job: job[2], reverse=True)
+        pool = self._get_pool() if compress_jobs else None
+        futures = {pool.submit(compress_file, src, dst, self.codec, self.level): (src, size)
+                   for src, dst, size in compress_jobs}
+        for src, dst, size in copy_jobs:
+            try:
+                shutil.copy2(src, dst)
+                self._done(stats, progress, src, size, False, size, size, 0.0)
+                stats.files_incompressible += 1
+            except OSError as e:
+                self._failed(stats, progress, src, e)
+        for future in as_completed(futures):
+            src, size = futures[future]
+            try:
+                compressed, read, written, cpu = future.result()
+            except Exception as e:  # Errore nel processo: file illeggibile, codec, pool interrotto
+                self._failed(stats, progress, src, e)
+                continue
+            self._done(stats, progress, src, size, compressed, read, written, cpu)
+            if not compressed:
+                stats.files_incompressible += 1
+
+        stats.elapsed = time.perf_counter() - start
+        self._file_log.flush()
+        ratio = stats.bytes_copied / stats.bytes_stored if stats.bytes_stored else 1.0
+        logger.info(LOG_CLASSE + f"{source}: {stats.files_compressed} file compressi, {stats.files_incompressible} "
+                                 f"copiati senza compressione, rapporto {ratio:.2f}, {stats.cpu_seconds:.1f}s di CPU")
+        if stats.errors:
+            raise Exception(f"Compressione fallita con {len(stats.errors)} errori: {stats.errors[0]}")
+        return stats
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # Un solo pool per tutte le sorgenti copiate in parallelo
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.processes)
+            return self._pool
+
+    def _link_previous(self, previous: str, dst_path: str, st: os.stat_result) -> bool:
+        # File invariato rispetto allo snapshot precedente, salvato compresso oppure così com'è
+        for old_path, new_path in ((previous + SUFFIX, dst_path + SUFFIX), (previous, dst_path)):
+            try:
+                old = os.lstat(old_path)
+            except OSError:
+                continue
+            if abs(old.st_mtime_ns - st.st_mtime_ns) > MTIME_TOLERANCE_NS:
+                return False
+            if new_path.endswith(SUFFIX):
+                header = read_header(old_path)
+                if header is None or header[1] != st.st_size:
+                    return False
+            elif old.st_size != st.st_size:
+                return False
+            try:
+                os.link(old_path, new_path)
+                return True
+            except OSError as e:
+                # File system senza hard link: il file viene compresso di nuovo
+                logger.debug(LOG_CLASSE + "_link_previous - Hard link non riuscito per %s: %s", new_path, e)
+                return False
+        return False
+
+    def _done(self, stats: CopyStats, progress: ProgressTracker, src: str, size: int, compressed: bool,
+              read: int, written: int, cpu: float):
+        stats.files_copied += 1
+        stats.bytes_copied += read
+        stats.bytes_stored += written
+        stats.cpu_seconds += cpu
+        if compressed:
+            stats.files_compressed += 1
+        if progress is not None:
+            progress.file_done(src, size)
+
+    def _failed(self, stats: CopyStats, progress: ProgressTracker, src: str, error: Exception):
+        self._file_log.error(LOG_CLASSE + "_failed - Compressione fallita %s: %s", src, error)
+        stats.errors.append(f"{src}: {error}")
+        if progress is not None:
+            progress.error(f"{src}: {error}")
@@ -0,0 +1,566 @@
+# Questo modulo contiene il motore di copia nativo usato da BackupBuilder in alternativa a robocopy
+
+"""
+Il motore nativo replica il comportamento di robocopy /MIR in puro Python:
+
+_scan_tree(source, destination) → percorre la sorgente con os.scandir, crea le cartelle
+                                   e rimuove dalla destinazione ciò che non esiste più
+
+mirror(source, destination)     → copia i file nuovi o modificati con un pool di thread,
+                                   partendo dai file più grandi per tenere occupati i thread
+
+mirror(..., link_dest=snapshot) → modalità incrementale: i file invariati rispetto allo snapshot
+                                   precedente diventano hard link, solo i modificati vengono copiati
+
+mirror(..., path_filter=filtro) → le cartelle escluse da config.filters (PathFilter) non vengono aperte,
+                                   i file esclusi non vengono copiati e spariscono dalla destinazione
+
+run_jobs(jobs, stats)           → copia (o collega) un elenco di file con il pool di thread; usato anche
+                                   da BackupRestorer
+
+mirror(..., changes=ChangeSet)  → con il journal delle modifiche (_scan_changes) vengono lette solo le
+                                   cartelle cambiate e i loro antenati; i sottoalberi invariati vengono
+                                   collegati dal manifest dello snapshot precedente senza percorrerli.
+                                   Le cartelle vuote dei sottoalberi invariati non sono nel manifest
+                                   e non vengono ricreate
+
+delta (DeltaCopier)             → i file modificati più grandi di delta.min_size con una copia nello snapshot
+                                   precedente vengono ricostruiti da quella copia: dalla sorgente si
+                                   scrivono solo i blocchi cambiati (DeltaCopy).
+                                   Solo se la destinazione supporta la clonazione (supports_clone, una sonda
+                                   per dispositivo): i blocchi invariati vengono condivisi con la copia
+                                   precedente. Senza reflink (NTFS, exFAT, ext4) andrebbero riletti e riscritti
+                                   per intero, più I/O di una copia completa, che quindi viene usata al suo posto
+
+_copy_file(src, dst)            → clona il file (ioctl FICLONE) se sorgente e destinazione sono sullo
+                                   stesso file system con reflink (btrfs, XFS): nessun dato viene copiato.
+                                   Altrimenti i file sparsi vengono copiati solo nelle zone con dati
+                                   (SEEK_DATA / SEEK_HOLE) e restano sparsi; gli altri con copy_file_range
+                                   (che sugli stessi file system condivide a sua volta i blocchi) o sendfile
+                                   quando disponibili, altrimenti con readinto su un buffer riutilizzato per thread.
+                                   Una coppia di dispositivi che non supporta la clonazione non viene più ritentata
+"""
+
+import errno
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List
+
+from pybck.BackupProgress import ProgressTracker
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+from pybck import logger, RateLimitedLog
+LOG_CLASSE = "[CopyEngine] - "
+
+BUFFER_SIZE = 1024 * 1024        # 1 MiB per thread
+MTIME_TOLERANCE_NS = 2 * 10**9   # Tolleranza di 2 secondi come robocopy /FFT (FAT/exFAT)
+ENGINES = ("robocopy", "native")
+
+_HAS_COPY_FILE_RANGE = hasattr(os, "copy_file_range")
+_HAS_SENDFILE = hasattr(os, "sendfile") and os.name == "posix"
+_HAS_FICLONE = fcntl is not None and sys.platform.startswith("linux")
+_HAS_SEEK_DATA = hasattr(os, "SEEK_DATA")
+FICLONE = 0x40049409             # _IOW(0x94, 9, int) di <linux/fs.h>
+# Errori con cui il file system rifiuta la clonazione: si passa alla copia
+CLONE_UNSUPPORTED = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS, errno.EPERM}
+
+
+@dataclass
+class CopyStats:
+    files_copied: int = 0
+    files_skipped: int = 0
+    files_linked: int = 0
+    bytes_copied: int = 0
+    bytes_linked: int = 0
+    dirs_created: int = 0
+    entries_removed: int = 0
+    dirs_unscanned: int = 0
+    entries_filtered: int = 0
+    files_delta: int = 0
+    bytes_reused: int = 0
+    files_cloned: int = 0
+    bytes_cloned: int = 0       # Compresi in bytes_copied, ma senza dati letti o scritti
+    files_sparse: int = 0
+    files_compressed: int = 0
+    files_incompressible: int = 0
+    bytes_stored: int = 0       # Byte scritti dalla modalità compressa per i file in bytes_copied
+    cpu_seconds: float = 0.0    # CPU usata dai processi di compressione
+    errors: List[str] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def throughput_mb_s(self) -> float:
+        if self.elapsed <= 0:
+            return 0.0
+        return self.bytes_copied / 1024**2 / self.elapsed
+
+
+class NativeCopyEngine:
+    threads : int
+    buffer_size : int
+
+    def __init__(self, threads: int = 8, buffer_size: int = BUFFER_SIZE, retries: int = 3, retry_wait: float = 5,
+                 delta=None, reflink: bool = True):
+        self.threads = max(1, threads)
+        self.buffer_size = buffer_size
+        self.retries = retries
+        self.retry_wait = retry_wait
+        # DeltaCopier per i file grandi modificati (None: sempre copia completa)
+        self.delta = delta
+        self.reflink = reflink
+        # Coppie (dispositivo sorgente, dispositivo destinazione) su cui FICLONE non è supportato
+        self._no_clone = set()
+        # Dispositivo di destinazione → clonazione supportata (copia a delta abilitata)
+        self._delta_devices = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Messaggi per singolo file: pochi per intervallo, il resto viene solo contato
+        self._file_log = RateLimitedLog()
+
+    def mirror(self, source: str, destination: str, link_dest: str = None, progress: ProgressTracker = None,
+               changes=None, path_filter=None) -> CopyStats:
+        logger.debug(LOG_CLASSE + "mirror - Inizio mirror %s → %s (link_dest: %s)", source, destination, link_dest)
+        stats = CopyStats()
+        start = time.perf_counter()
+
+        # Il journal descrive le differenze dallo snapshot precedente: vale solo per una destinazione nuova
+        if changes is not None and link_dest is not None and not self._has_entries(destination):
+            jobs = self._scan_changes(source, destination, stats, link_dest, changes, path_filter)
+            logger.debug(LOG_CLASSE + "mirror - %s: %d sottoalberi invariati non percorsi", source, stats.dirs_unscanned)
+        else:
+            jobs = self._scan_tree(source, destination, stats, link_dest, path_filter)
+
+        self.run_jobs(jobs, stats, progress)
+
+        stats.elapsed = time.perf_counter() - start
+        self._file_log.flush()
+        logger.debug(LOG_CLASSE + "mirror - Fine mirror %s: %d file copiati (%d a delta), %d collegati, %d invariati, %d esclusi, %.1f MB/s",
+                     source, stats.files_copied, stats.files_delta, stats.files_linked, stats.files_skipped,
+                     stats.entries_filtered, stats.throughput_mb_s)
+
+        if stats.errors:
+            raise Exception(f"Copia nativa fallita con {len(stats.errors)} errori: {stats.errors[0]}")
+        return stats
+
+    def run_jobs(self, jobs: list, stats: CopyStats, progress: ProgressTracker = None):
+        # jobs: (sorgente, destinazione, dimensione, hard link da, base per la copia a delta)
+        # I file più grandi partono per primi: i piccoli riempiono i thread liberi verso la fine,
+        # gli hard link (nessun dato da copiare) chiudono la coda
+        jobs.sort(key=lambda job: (job[3] is None, job[2]), reverse=True)
+        if progress is not None:
+            progress.set_total(sum(job[2] for job in jobs))
+
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            futures = [(src, executor.submit(self._copy_job, src, dst, size, stats, link_src, progress, base))
+                       for src, dst, size, link_src, base in jobs]
+        # _copy_job gestisce gli OSError: qui arrivano solo gli errori inattesi, che non vanno persi
+        for src, future in futures:
+            if future.exception() is not None:
+                stats.errors.append(f"{src}: {future.exception()}")
+
+    def _scan_tree(self, source: str, destination: str, stats: CopyStats, link_dest: str = None, path_filter=None) -> list:
+        # Percorre la sorgente senza ricorsione e restituisce la lista dei file da copiare o collegare
+        jobs = []
+        stack = [(source, destination, link_dest, "")]
+
+        while stack:
+            src_dir, dst_dir, link_dir, relative = stack.pop()
+            previous = self._list_previous(link_dir)
+
+            if not os.path.isdir(dst_dir):
+                os.makedirs(dst_dir, exist_ok=True)
+                stats.dirs_created += 1
+                existing = {}
+            else:
+                existing = self._list_destination(dst_dir)
+
+            try:
+                with os.scandir(src_dir) as entries:
+                    for entry in entries:
+                        # Un elemento escluso resta in existing: se era già in destinazione viene rimosso
+                        if path_filter is not None and not self._allowed(path_filter, relative + entry.name, entry, stats):
+                            continue
+                        dst_path = os.path.join(dst_dir, entry.name)
+                        current = existing.pop(entry.name, None)
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if current is not None and not current.is_dir(follow_symlinks=False):
+                                    self._remove(current.path, stats)
+                                stack.append((entry.path, dst_path, os.path.join(link_dir, entry.name) if link_dir else None,
+                                              relative + entry.name + "/"))
+                            elif entry.is_file():
+                                st = entry.stat()
+                                if current is not None and current.is_dir(follow_symlinks=False):
+                                    self._remove(current.path, stats)
+                                    current = None
+                                if current is not None and self._is_unchanged(st, current):
+                                    stats.files_skipped += 1
+                                else:
+                                    jobs.append(self._job(entry, st, dst_path, previous))
+                            elif current is not None:
+                                # Link a cartelle/junction non vengono seguiti: la copia precedente va rimossa
+                                self._remove(current.path, stats)
+                        except OSError as e:
+                            stats.errors.append(f"{entry.path}: {e}")
+            except OSError as e:
+                stats.errors.append(f"{src_dir}: {e}")
+                continue
+
+            # Tutto ciò che resta in destinazione non esiste più in sorgente (/MIR)
+            for extra in existing.values():
+                self._remove(extra.path, stats)
+
+        return jobs
+
+    def _scan_changes(self, source: str, destination: str, stats: CopyStats, link_dest: str, changes, path_filter=None) -> list:
+        # Come _scan_tree, ma entra solo nelle cartelle indicate dal journal (changes.needs_scan)
+        jobs = []
+        stack = [("", False)]
+
+        while stack:
+            relative, tree = stack.pop()
+            parts = relative.split("/") if relative else []
+            src_dir = os.path.join(source, *parts)
+            dst_dir = os.path.join(destination, *parts)
+            link_dir = os.path.join(link_dest, *parts)
+
+            if not tree and not changes.needs_scan(relative):
+                if os.path.isdir(link_dir):
+                    self._link_unchanged(relative, source, destination, link_dest, changes, stats, jobs, path_filter)
+                    continue
+                tree = True  # Assente nello snapshot precedente: va letta per intero
+
+            previous = self._list_previous(link_dir)
+            os.makedirs(dst_dir, exist_ok=True)
+            stats.dirs_created += 1
+            try:
+                with os.scandir(src_dir) as entries:
+                    for entry in entries:
+                        child = f"{relative}/{entry.name}" if relative else entry.name
+                        if path_filter is not None and not self._allowed(path_filter, child, entry, stats):
+                            continue
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append((child, tree or changes.is_tree(child)))
+                            elif entry.is_file():
+                                st = entry.stat()
+                                jobs.append(self._job(entry, st, os.path.join(dst_dir, entry.name), previous))
+                        except OSError as e:
+                            stats.errors.append(f"{entry.path}: {e}")
+            except OSError as e:
+                stats.errors.append(f"{src_dir}: {e}")
+
+        return jobs
+
+    def _link_unchanged(self, relative: str, source: str, destination: str, link_dest: str, changes,
+                        stats: CopyStats, jobs: list, path_filter=None):
+        # Sottoalbero invariato: i file sono quelli del manifest precedente, collegati senza leggere la sorgente
+        os.makedirs(os.path.join(destination, *relative.split("/")), exist_ok=True)
+        stats.dirs_unscanned += 1
+        prefix = changes.prefix + (relative + "/" if relative else "")
+        created = set()
+        for entry in changes.manifest.iter_prefix(prefix):
+            rest = entry.path[len(changes.prefix):]
+            # Le regole possono essere cambiate dallo snapshot precedente
+            if path_filter is not None and not path_filter.match(rest):
+                stats.entries_filtered += 1
+                continue
+            parts = rest.split("/")
+            dst_path = os.path.join(destination, *parts)
+            parent = os.path.dirname(dst_path)
+            if parent not in created:
+                if not os.path.isdir(parent):
+                    os.makedirs(parent, exist_ok=True)
+                    stats.dirs_created += 1
+                created.add(parent)
+            jobs.append((os.path.join(source, *parts), dst_path, entry.size, os.path.join(link_dest, *parts), None))
+
+    def _job(self, entry, st, dst_path: str, previous: dict) -> tuple:
+        # (sorgente, destinazione, dimensione, hard link da, base per la copia a delta)
+        old = previous.get(entry.name)
+        if old is not None and self._is_unchanged(st, old):
+            return (entry.path, dst_path, st.st_size, old.path, None)
+        if old is not None and self.delta is not None and st.st_size >= self.delta.min_size and self._delta_allowed(dst_path):
+            return (entry.path, dst_path, st.st_size, None, old.path)
+        return (entry.path, dst_path, st.st_size, None, None)
+
+    def _delta_allowed(self, dst_path: str) -> bool:
+        # La cartella di destinazione esiste già: _scan_tree e _scan_changes la creano prima dei file
+        directory = os.path.dirname(dst_path)
+        try:
+            device = os.stat(directory).st_dev
+        except OSError:
+            return False
+        allowed = self._delta_devices.get(device)
+        if allowed is None:
+            allowed = self._delta_devices[device] = supports_clone(directory)
+            if not allowed:
+                logger.info(LOG_CLASSE + f"Clonazione non supportata in {directory}: copia a delta disattivata, copia completa")
+        return allowed
+
+    def _allowed(self, path_filter, relative: str, entry, stats: CopyStats) -> bool:
+        try:
+            allowed = path_filter.enter(relative) if entry.is_dir(follow_symlinks=False) else path_filter.accept(relative)
+        except OSError:
+            return True  # L'errore verrà registrato dalla scansione
+        if not allowed:
+            stats.entries_filtered += 1
+        return allowed
+
+    def _has_entries(self, directory: str) -> bool:
+        try:
+            with os.scandir(directory) as entries:
+                return next(entries, None) is not None
+        except OSError:
+            return False
+
+    def _list_destination(self, dst_dir: str) -> dict:
+        with os.scandir(dst_dir) as entries:
+            return {entry.name: entry for entry in entries}
+
+    def _list_previous(self, link_dir: str) -> dict:
+        # Contenuto della stessa cartella nello snapshot precedente (vuoto se non esiste)
+        if link_dir is None:
+            return {}
+        try:
+            with os.scandir(link_dir) as entries:
+                return {entry.name: entry for entry in entries if entry.is_file(follow_symlinks=False)}
+        except OSError:
+            return {}
+
+    def _is_unchanged(self, src_stat, dst_entry) -> bool:
+        dst_stat = dst_entry.stat(follow_symlinks=False)
+        if src_stat.st_size != dst_stat.st_size:
+            return False
+        return abs(src_stat.st_mtime_ns - dst_stat.st_mtime_ns) <= MTIME_TOLERANCE_NS
+
+    def _remove(self, path: str, stats: CopyStats):
+        self._file_log.debug(LOG_CLASSE + "_remove - Rimozione elemento non più presente in sorgente: %s", path)
+        try:
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.unlink(path)
+            stats.entries_removed += 1
+        except OSError as e:
+            stats.errors.append(f"{path}: {e}")
+
+    def _copy_job(self, src: str, dst: str, size: int, stats: CopyStats, link_src: str = None, progress: ProgressTracker = None,
+                  base: str = None):
+        if link_src is not None:
+            try:
+                self._unlink_if_exists(dst)
+                os.link(link_src, dst)
+                with self._lock:
+                    stats.files_linked += 1
+                    stats.bytes_linked += size
+                if progress is not None:
+                    progress.file_done(dst, size)
+                return
+            except OSError as e:
+                # Filesystem senza hard link (exFAT/FAT32) o limite di link raggiunto: copia normale
+                self._file_log.debug(LOG_CLASSE + "_copy_job - Hard link non riuscito per %s, copio: %s", dst, e)
+
+        if base is not None:
+            try:
+                result = self.delta.copy(src, base, dst)
+                with self._lock:
+                    stats.files_copied += 1
+                    stats.files_delta += 1
+                    stats.bytes_copied += result.literal_bytes
+                    stats.bytes_reused += result.reused_bytes
+                if progress is not None:
+                    progress.file_done(dst, size)
+                return
+            except OSError as e:
+                # Copia precedente illeggibile o file cambiato durante la lettura: copia completa
+                self._file_log.warning(LOG_CLASSE + "_copy_job - Copia a delta non riuscita per %s, copio: %s", src, e)
+
+        for attempt in range(self.retries + 1):
+            try:
+                method = self._copy_file(src, dst, size)
+                with self._lock:
+                    stats.files_copied += 1
+                    stats.bytes_copied += size
+                    if method == "clone":
+                        stats.files_cloned += 1
+                        stats.bytes_cloned += size
+                    elif method == "sparse":
+                        stats.files_sparse += 1
+                if progress is not None:
+                    progress.file_done(dst, size)
+                return
+            except OSError as e:
+                if attempt == self.retries:
+                    self._file_log.error(LOG_CLASSE + "_copy_job - Copia fallita %s: %s", src, e)
+                    with self._lock:
+                        stats.errors.append(f"{src}: {e}")
+                    if progress is not None:
+                        progress.error(f"{src}: {e}")
+                    return
+                if progress is not None:
+                    progress.retry(f"{src}: {e}")
+                time.sleep(self.retry_wait)
+
+    def _unlink_if_exists(self, path: str):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def _copy_file(self, src: str, dst: str, size: int) -> str:
+        # Restituisce il metodo usato: "clone", "sparse" oppure "copy"
+        # Mai scrivere dentro un file esistente: potrebbe essere un hard link verso uno snapshot precedente
+        self._unlink_if_exists(dst)
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            st = os.fstat(fsrc.fileno())
+            if self._clone(fsrc.fileno(), fdst.fileno(), st):
+                method = "clone"
+            elif _HAS_SEEK_DATA and _is_sparse(st):
+                self._copy_sparse(fsrc.fileno(), fdst.fileno(), st.st_size)
+                method = "sparse"
+            else:
+                method = "copy"
+                copied = self._copy_in_kernel(fsrc.fileno(), fdst.fileno(), size)
+                if copied < size:
+                    # Copia nel kernel non disponibile o parziale: il fallback riparte dallo stesso offset
+                    fsrc.seek(copied)
+                    fdst.seek(copied)
+                    self._copy_buffered(fsrc, fdst)
+        shutil.copystat(src, dst)
+        return method
+
+    def _clone(self, fd_in: int, fd_out: int, st: os.stat_result) -> bool:
+        # Reflink: la destinazione condivide i blocchi della sorgente (copy-on-write)
+        if not self.reflink or not _HAS_FICLONE or st.st_size == 0:
+            return False
+        devices = (st.st_dev, os.fstat(fd_out).st_dev)
+        if devices in self._no_clone:
+            return False
+        try:
+            fcntl.ioctl(fd_out, FICLONE, fd_in)
+            return True
+        except OSError as e:
+            if e.errno in CLONE_UNSUPPORTED:
+                with self._lock:
+                    if devices not in self._no_clone:
+                        self._no_clone.add(devices)
+                        logger.debug(LOG_CLASSE + "_clone - Clonazione non supportata tra i dispositivi %s: %s", devices, e)
+            else:
+                self._file_log.debug(LOG_CLASSE + "_clone - Clonazione non riuscita, copio: %s", e)
+            return False
+
+    def _copy_sparse(self, fd_in: int, fd_out: int, size: int):
+        # Copia solo le zone con dati; i buchi restano buchi grazie a ftruncate alla dimensione finale
+        offset = 0
+        while offset < size:
+            try:
+                data = os.lseek(fd_in, offset, os.SEEK_DATA)
+            except OSError as e:
+                if e.errno == errno.ENXIO:
+                    break  # Solo buchi fino alla fine del file
+                raise
+            hole = min(os.lseek(fd_in, data, os.SEEK_HOLE), size)
+            self._copy_range(fd_in, fd_out, data, hole - data)
+            offset = hole
+        os.ftruncate(fd_out, size)
+
+    def _copy_range(self, fd_in: int, fd_out: int, offset: int, length: int):
+        # Stesso offset in sorgente e destinazione, senza spostare la posizione dei file
+        end = offset + length
+        if _HAS_COPY_FILE_RANGE:
+            try:
+                while offset < end:
+                    n = os.copy_file_range(fd_in, fd_out, min(self.buffer_size * 8, end - offset), offset, offset)
+                    if n == 0:
+                        break
+                    offset += n
+            except OSError:
+                pass
+        while offset < end:
+            data = os.pread(fd_in, min(self.buffer_size, end - offset), offset)
+            if not data:
+                break
+            offset += os.pwrite(fd_out, data, offset)
+
+    def _copy_in_kernel(self, fd_in: int, fd_out: int, size: int) -> int:
+        # Restituisce il numero di byte copiati senza passare dallo spazio utente
+        chunk = self.buffer_size * 8
+        offset = 0
+        if _HAS_COPY_FILE_RANGE:
+            try:
+                while offset < size:
+                    n = os.copy_file_range(fd_in, fd_out, min(chunk, size - offset))
+                    if n == 0:
+                        break
+                    offset += n
+            except OSError:
+                pass
+
+        if _HAS_SENDFILE and offset < size:
+            try:
+                while offset < size:
+                    n = os.sendfile(fd_out, fd_in, offset, min(chunk, size - offset))
+                    if n == 0:
+                        break
+                    offset += n
+            except OSError:
+                pass
+
+        return offset
+
+    def _copy_buffered(self, fsrc, fdst):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or len(buffer) != self.buffer_size:
+            buffer = memoryview(bytearray(self.buffer_size))
+            self._local.buffer = buffer
+
+        while True:
+            n = fsrc.readinto(buffer)
+            if not n:
+                break
+            fdst.write(buffer[:n])
+
+
+def supports_clone(directory: str) -> bool:
+    # Sonda: clona (FICLONE) un piccolo file temporaneo nella cartella. copy_file_range non basta come
+    # prova: su ext4 riesce ma copia i dati invece di condividerli
+    if not _HAS_FICLONE:
+        return False
+    probe = os.path.join(directory, f".pybck_clone_probe_{os.getpid()}_{threading.get_ident()}")
+    try:
+        with open(probe, "wb") as fsrc:
+            fsrc.write(b"\0" * 4096)
+        with open(probe, "rb") as fsrc, open(probe + ".clone", "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        return False
+    finally:
+        for path in (probe, probe + ".clone"):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+def _is_sparse(st: os.stat_result) -> bool:
+    # Meno blocchi allocati della dimensione: il file contiene buchi (st_blocks non esiste su Windows)
+    blocks = getattr(st, "st_blocks", None)
+    return blocks is not None and blocks * 512 < st.st_size
+
+
+def create_copy_engine(name: str, threads: int = 8, delta=None, reflink: bool = True):
+    # robocopy resta gestito direttamente da BackupBuilder
+    if name == "robocopy":
+        return None
+    if name == "native":
+        return NativeCopyEngine(threads=threads, delta=delta, reflink=reflink)
+    raise ValueError(f"Motore di copia non valido: {name}. Valori ammessi: {', '.join(ENGINES)}.")
@@ -0,0 +1,373 @@
+# Questo modulo implementa la copia a delta stile rsync per i file grandi modificati (PST, immagini
+# di macchine virtuali, database): il nuovo file dello snapshot viene ricostruito riusando i blocchi
+# invariati della copia nello snapshot precedente, dalla sorgente si scrivono solo i blocchi cambiati
+
+"""
+signature(path, block_size)   → firme dei blocchi di un file: Adler-32 (debole, scorrevole come in rsync)
+                                e blake2b a 128 bit (forte)
+SignatureCache(directory)     → firme salvate in cache/signatures per (device, inode, dimensione, mtime)
+                                della copia nello snapshot: le copie collegate con hard link negli snapshot
+                                successivi condividono l'inode e quindi la firma, che non va ricalcolata
+DeltaCopier.copy(src, base, dst) → legge la sorgente, cerca ogni blocco tra le firme di base e scrive dst:
+                                i blocchi trovati vengono copiati da base (copy_file_range: sui file system
+                                con reflink i blocchi vengono condivisi), gli altri dalla sorgente.
+                                Alla fine salva la firma di dst per il backup successivo.
+                                dst è sempre un file nuovo: i blocchi riusati vengono condivisi solo con
+                                reflink. NativeCopyEngine usa la copia a delta solo se la destinazione
+                                supporta la clonazione (CopyEngine.supports_clone)
+
+Ricerca dei blocchi: a ogni posizione allineata si calcola l'Adler-32 del blocco (zlib, in C) e lo si cerca
+nella tabella delle firme. Nei primi ROLL_BLOCKS blocchi non trovati dopo un blocco trovato (inserimento
+o rimozione di byte) la finestra scorre anche byte per byte, aggiornando il checksum debole in O(1);
+nelle zone completamente cambiate si procede a blocchi interi senza scorrimento.
+"""
+
+import hashlib
+import math
+import os
+import shutil
+import struct
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from pybck import logger
+LOG_CLASSE = "[DeltaCopy] - "
+
+SIGNATURE_DIR = "cache/signatures"
+SIGNATURE_MAX_AGE_S = 30 * 86400     # Firme non usate da 30 giorni vengono eliminate
+MIN_BLOCK = 16 * 1024
+MAX_BLOCK = 1024 * 1024
+READ_SIZE = 8 * 1024 * 1024
+LITERAL_FLUSH = 1024 * 1024
+ADLER_MOD = 65521
+STRONG_SIZE = 16
+ROLL_BLOCKS = 2     # Blocchi dopo l'ultimo trovato in cui la finestra scorre byte per byte
+
+MAGIC = b"PYBCKSG1"
+HEADER = struct.Struct("<8sIQQ")     # magic | dimensione blocco | dimensione file | numero blocchi
+RECORD = struct.Struct("<I16s")      # Adler-32 | blake2b
+
+_HAS_COPY_FILE_RANGE = hasattr(os, "copy_file_range")
+
+
+@dataclass
+class Signature:
+    block_size: int
+    file_size: int
+    weak: List[int]
+    strong: List[bytes]
+
+    def table(self) -> Dict[int, List[int]]:
+        # Solo i blocchi completi: l'ultimo blocco parziale viene confrontato a parte
+        full = self.file_size // self.block_size
+        table = {}
+        for index in range(full):
+            table.setdefault(self.weak[index], []).append(index)
+        return table
+
+
+@dataclass
+class DeltaResult:
+    literal_bytes: int = 0      # Byte letti dalla sorgente e scritti
+    reused_bytes: int = 0       # Byte copiati dalla copia precedente
+    cached: bool = False        # Firma della copia precedente letta dalla cache
+
+
+def block_size_for(size: int, configured: int = 0) -> int:
+    # Come rsync: blocchi di circa sqrt(dimensione), arrotondati a una potenza di 2
+    if configured:
+        return configured
+    block = MIN_BLOCK
+    target = math.isqrt(size)
+    while block < target and block < MAX_BLOCK:
+        block *= 2
+    return block
+
+
+def strong_hash(data) -> bytes:
+    return hashlib.blake2b(data, digest_size=STRONG_SIZE).digest()
+
+
+def signature(path: str, block_size: int) -> Signature:
+    weak, strong = [], []
+    size = 0
+    read_size = max(block_size, READ_SIZE - READ_SIZE % block_size)
+    with open(path, "rb") as file:
+        while True:
+            data = file.read(read_size)
+            if not data:
+                break
+            size += len(data)
+            view = memoryview(data)
+            for start in range(0, len(data), block_size):
+                block = view[start:start + block_size]
+                weak.append(zlib.adler32(block))
+                strong.append(strong_hash(block))
+    return Signature(block_size, size, weak, strong)
+
+
+def roll(weak: int, out_byte: int, in_byte: int, block_size: int) -> int:
+    # Adler-32 della finestra spostata di un byte (stessa definizione di zlib.adler32)
+    a = ((weak & 0xFFFF) - out_byte + in_byte) % ADLER_MOD
+    b = ((weak >> 16) - block_size * out_byte + a - 1) % ADLER_MOD
+    return (b << 16) | a
+
+
+class SignatureCache:
+    directory : str
+
+    def __init__(self, directory: str = SIGNATURE_DIR):
+        self.directory = directory
+
+    def load(self, st: os.stat_result, block_size: int) -> Optional[Signature]:
+        path = self._path(st)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+            magic, cached_block, file_size, count = HEADER.unpack_from(data, 0)
+            if magic != MAGIC or cached_block != block_size or file_size != st.st_size \
+                    or len(data) != HEADER.size + count * RECORD.size:
+                return None
+        except (OSError, struct.error):
+            return None
+        weak, strong = [], []
+        for value, digest in RECORD.iter_unpack(memoryview(data)[HEADER.size:]):
+            weak.append(value)
+            strong.append(digest)
+        # La data di accesso decide quali firme sono ancora in uso (prune)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return Signature(block_size, file_size, weak, strong)
+
+    def save(self, st: os.stat_result, sig: Signature):
+        path = self._path(st)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as file:
+                file.write(HEADER.pack(MAGIC, sig.block_size, sig.file_size, len(sig.weak)))
+                file.write(b"".join(RECORD.pack(value, digest) for value, digest in zip(sig.weak, sig.strong)))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(LOG_CLASSE + f"Impossibile salvare la firma dei blocchi in {self.directory}: {e}")
+
+    def prune(self, max_age_s: float = SIGNATURE_MAX_AGE_S) -> int:
+        # Le firme di copie eliminate con gli snapshot non vengono più usate e invecchiano
+        removed = 0
+        limit = time.time() - max_age_s
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".sig") and entry.stat().st_mtime < limit:
+                        os.unlink(entry.path)
+                        removed += 1
+        except OSError:
+            pass
+        if removed:
+            logger.debug(LOG_CLASSE + "prune - %d firme non usate eliminate", removed)
+        return removed
+
+    def _path(self, st: os.stat_result) -> str:
+        # Il ctime non fa parte della chiave: cambia a ogni nuovo hard link alla copia
+        key = f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + ".sig")
+
+
+class DeltaCopier:
+    min_size : int
+    block_size : int
+
+    def __init__(self, min_size: int = 64 * 1024**2, block_size: int = 0, cache: SignatureCache = None,
+                 read_size: int = READ_SIZE):
+        self.min_size = min_size
+        self.block_size = block_size
+        self.cache = cache if cache is not None else SignatureCache()
+        self.read_size = read_size
+
+    def copy(self, src: str, base: str, dst: str) -> DeltaResult:
+        logger.debug(LOG_CLASSE + "copy - Copia a delta %s (base %s)", src, base)
+        result = DeltaResult()
+        base_stat = os.stat(base)
+        block = block_size_for(os.stat(src).st_size, self.block_size)
+
+        old = self.cache.load(base_stat, block)
+        result.cached = old is not None
+        if old is None:
+            old = signature(base, block)
+            self.cache.save(base_stat, old)
+        table = old.table()
+        tail_size = old.file_size - (old.file_size // block) * block
+
+        new_weak, new_strong = [], []
+        # Mai scrivere dentro un file esistente: potrebbe essere un hard link verso uno snapshot precedente
+        if os.path.lexists(dst):
+            os.unlink(dst)
+        with open(src, "rb") as fsrc, open(base, "rb", buffering=0) as fbase, open(dst, "wb", buffering=0) as fdst:
+            writer = _DeltaWriter(fbase, fdst, result)
+            data = b""
+            data_start = 0      # Offset nel file sorgente di data[0]
+            pos = 0             # Prossimo byte da elaborare in data
+            sig_next = 0        # Offset del prossimo blocco di cui calcolare la firma del nuovo file
+            expected = 0        # Blocco di base atteso dopo l'ultimo trovato
+            misses = 0          # Blocchi non trovati dall'ultimo trovato
+            eof = False
+            read_size = max(self.read_size, 2 * block)
+
+            while True:
+                if not eof and len(data) - pos < 2 * block:
+                    chunk = fsrc.read(read_size)
+                    if chunk:
+                        keep = min(pos, sig_next - data_start)
+                        data = data[keep:] + chunk
+                        data_start += keep
+                        pos -= keep
+                        continue
+                    eof = True
+
+                # Firma del nuovo file: blocchi allineati, indipendenti dagli scorrimenti della ricerca
+                end = data_start + len(data)
+                while sig_next + block <= end or (eof and sig_next < end):
+                    piece = data[sig_next - data_start:sig_next - data_start + block]
+                    new_weak.append(zlib.adler32(piece))
+                    new_strong.append(strong_hash(piece))
+                    sig_next += len(piece)
+
+                remaining = len(data) - pos
+                if remaining <= 0:
+                    break
+                if remaining < block:
+                    # Solo a fine file: l'ultimo blocco parziale può coincidere con quello di base
+                    piece = data[pos:]
+                    if remaining == tail_size and strong_hash(piece) == old.strong[-1]:
+                        writer.reuse((len(old.strong) - 1) * block, remaining)
+                    else:
+                        writer.write(piece)
+                    pos = len(data)
+                    continue
+
+                window = data[pos:pos + block]
+                weak = zlib.adler32(window)
+                index = _find(table, old, weak, window, expected)
+                if index is None and misses < ROLL_BLOCKS:
+                    found = _roll_search(data, pos, block, weak, table, old, expected)
+                    if found is not None:
+                        shift, index = found
+                        writer.write(data[pos:pos + shift])
+                        pos += shift
+                if index is not None:
+                    writer.reuse(index * block, block)
+                    expected = index + 1
+                    misses = 0
+                else:
+                    writer.write(window)
+                    misses += 1
+                pos += block
+            writer.close()
+
+        shutil.copystat(src, dst)
+        self.cache.save(os.stat(dst), Signature(block, sig_next, new_weak, new_strong))
+        logger.debug(LOG_CLASSE + "copy - %s: %d byte riusati, %d scritti dalla sorgente (firma %s)",
+                     dst, result.reused_bytes, result.literal_bytes, "dalla cache" if result.cached else "calcolata")
+        return result
+
+
+class _DeltaWriter:
+    # Accumula i byte nuovi e unisce i blocchi di base consecutivi in un'unica copia
+
+    def __init__(self, fbase, fdst, result: DeltaResult):
+        self.fbase = fbase
+        self.fdst = fdst
+        self.result = result
+        self.literal = bytearray()
+        self.range_start = None
+        self.range_length = 0
+
+    def write(self, data: bytes):
+        if not data:
+            return
+        self._flush_range()
+        self.literal += data
+        self.result.literal_bytes += len(data)
+        if len(self.literal) >= LITERAL_FLUSH:
+            self._flush_literal()
+
+    def reuse(self, offset: int, length: int):
+        self._flush_literal()
+        if self.range_start is not None and self.range_start + self.range_length == offset:
+            self.range_length += length
+        else:
+            self._flush_range()
+            self.range_start, self.range_length = offset, length
+        self.result.reused_bytes += length
+
+    def close(self):
+        self._flush_literal()
+        self._flush_range()
+
+    def _flush_literal(self):
+        if self.literal:
+            _write_all(self.fdst, self.literal)
+            self.literal = bytearray()
+
+    def _flush_range(self):
+        if self.range_start is not None:
+            _copy_range(self.fbase, self.fdst, self.range_start, self.range_length)
+            self.range_start, self.range_length = None, 0
+
+
+def _find(table: dict, old: Signature, weak: int, window: bytes, expected: int) -> Optional[int]:
+    candidates = table.get(weak)
+    if not candidates:
+        return None
+    strong = strong_hash(window)
+    # Il blocco successivo all'ultimo trovato allunga la copia in corso
+    if expected < len(old.strong) and old.weak[expected] == weak and old.strong[expected] == strong:
+        return expected
+    for index in candidates:
+        if old.strong[index] == strong:
+            return index
+    return None
+
+
+def _roll_search(data: bytes, pos: int, block: int, weak: int, table: dict, old: Signature, expected: int):
+    # (spostamento, blocco) del primo blocco di base trovato entro un blocco da pos, altrimenti None
+    limit = min(pos + block, len(data) - block)
+    for start in range(pos, limit):
+        weak = roll(weak, data[start], data[start + block], block)
+        if weak in table:
+            index = _find(table, old, weak, data[start + 1:start + 1 + block], expected)
+            if index is not None:
+                return start + 1 - pos, index
+    return None
+
+
+def _copy_range(fbase, fdst, offset: int, length: int):
+    # Nel kernel quando possibile: senza passare i dati dallo spazio utente, con reflink se supportato
+    if _HAS_COPY_FILE_RANGE:
+        try:
+            while length > 0:
+                n = os.copy_file_range(fbase.fileno(), fdst.fileno(), min(length, READ_SIZE), offset)
+                if n == 0:
+                    break
+                offset += n
+                length -= n
+        except OSError:
+            pass
+    fbase.seek(offset)
+    while length > 0:
+        data = fbase.read(min(length, READ_SIZE))
+        if not data:
+            raise OSError(f"Copia precedente troncata: {fbase.name}")
+        _write_all(fdst, data)
+        length -= len(data)
+
+
+def _write_all(fdst, data):
+    # Scrittura senza buffer: write() può scrivere solo una parte dei dati
+    view = memoryview(data)
+    while view:
+        view = view[fdst.write(view):]
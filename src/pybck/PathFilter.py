@@ -0,0 +1,315 @@
+# Questa classe decide quali cartelle e file di una sorgente entrano nel backup (config.filters)
+# Le regole vengono validate e compilate una sola volta; durante la scansione le cartelle escluse
+# non vengono nemmeno aperte, quindi il loro sottoalbero non costa nulla
+
+"""
+config.filters = {
+    "*":  {"exclude": ["node_modules/", "$RECYCLE.BIN/", "Temp/", "*.tmp"]},     # tutte le sorgenti
+    "D:": {"include": ["/Progetti/", "/Foto/"], "exclude": ["**/build/", "re:\\.(o|obj|pyc)$"]},
+    "C:": {"exclude": ["AppData/Local/Temp/"]},    # relative a ciascuna cartella utente
+}
+
+Regole (percorsi relativi alla sorgente con "/", maiuscole e minuscole equivalenti come su Windows):
+    "nome"           → file o cartella con questo nome a qualsiasi profondità
+    "nome/"          → solo cartelle
+    "a/b/c"          → percorso dalla radice della sorgente (anche "/nome")
+    * ? [abc] **     → caratteri jolly; * e ? non attraversano "/", ** sì
+    "re:<regex>"     → espressione regolare cercata nel percorso relativo (le cartelle finiscono con "/")
+Con regole include solo i file inclusi vengono copiati; exclude vince sempre su include.
+
+Compilazione:
+    percorsi senza jolly      → trie dei componenti: esclusioni e inclusioni in una visita per cartella
+    nomi senza jolly          → insieme di nomi
+    jolly ed espressioni      → una regex combinata per le cartelle e una per i file
+Solo le inclusioni di percorsi dalla radice ("/Progetti/") potano la scansione; le altre valgono per i file.
+
+enter(cartella) → False se la cartella va saltata con tutto il sottoalbero
+accept(file)    → True se il file va copiato
+fingerprint()   → impronta delle regole, confrontata con quella del mark nel journal delle modifiche
+Entrambe valutano le regole per nome solo sull'ultimo elemento: le cartelle superiori sono già
+state accettate da enter() durante la visita. match(percorso) controlla anche gli antenati.
+
+drive_filter(config, "D:") → filtro di una sorgente (regole "*" più quelle dell'unità), None se non ce ne sono
+source_filters(config)     → {cartella sorgente: filtro} con le stesse sorgenti di BackupBuilder
+"""
+
+import json
+import ntpath
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from pybck import logger
+LOG_CLASSE = "[PathFilter] - "
+
+ALL_SOURCES = "*"
+REGEX_PREFIX = "re:"
+_WILDCARDS = re.compile(r"[*?\[]")
+_END = "\0"     # Chiave dei nodi terminali del trie (non può essere un nome di file)
+
+
+class PathFilter:
+    include : List[str]
+    exclude : List[str]
+
+    def __init__(self, include: List[str] = (), exclude: List[str] = ()):
+        self.include = list(include)
+        self.exclude = list(exclude)
+        # Regole che robocopy non sa applicare (/XD e /XF accettano solo nomi, percorsi e * ?)
+        self.robocopy_unsupported = []
+
+        self._dir_names = set()
+        self._file_names = set()
+        self._exclude_trie = {}
+        self._include_trie = {}
+        # Jolly sul solo nome (fullmatch, stringa corta) e sul percorso completo (search)
+        dir_names, file_names, dir_paths, file_paths = [], [], [], []
+        include_names, include_paths = [], []
+
+        for rule in self.exclude:
+            regex, anchored, dir_only, body = _parse(rule)
+            if regex is not None:
+                dir_paths.append(regex)
+                file_paths.append(regex)
+                self.robocopy_unsupported.append(rule)
+            elif not _WILDCARDS.search(body):
+                if anchored:
+                    _trie_insert(self._exclude_trie, body, "dir" if dir_only else "any")
+                else:
+                    self._dir_names.add(body.casefold())
+                    if not dir_only:
+                        self._file_names.add(body.casefold())
+            else:
+                if anchored or "**" in body or "[" in body:
+                    self.robocopy_unsupported.append(rule)
+                if anchored:
+                    pattern = "^" + _glob_to_regex(body)
+                    dir_paths.append(pattern + r"/\Z")
+                    if not dir_only:
+                        file_paths.append(pattern + r"\Z")
+                else:
+                    dir_names.append(_glob_to_regex(body))
+                    if not dir_only:
+                        file_names.append(_glob_to_regex(body))
+
+        for rule in self.include:
+            regex, anchored, dir_only, body = _parse(rule)
+            if regex is not None:
+                include_paths.append(regex)
+                self.robocopy_unsupported.append(rule)
+            elif anchored and not _WILDCARDS.search(body):
+                _trie_insert(self._include_trie, body, "any")
+                self.robocopy_unsupported.append(rule)
+            elif anchored or dir_only:
+                # Una cartella inclusa include tutti i file sotto di essa
+                pattern = ("^" if anchored else "(?:^|/)") + _glob_to_regex(body)
+                include_paths.append(pattern + ("/" if dir_only else r"\Z"))
+                self.robocopy_unsupported.append(rule)
+            else:
+                include_names.append(_glob_to_regex(body))
+                if "[" in body:
+                    self.robocopy_unsupported.append(rule)
+
+        self._dir_name_re = _combine(dir_names)
+        self._file_name_re = _combine(file_names)
+        self._dir_re = _combine(dir_paths)
+        self._file_re = _combine(file_paths)
+        self._include_name_re = _combine(include_names)
+        self._include_re = _combine(include_paths)
+        # Senza inclusioni (o con inclusioni per nome) ogni cartella non esclusa va percorsa
+        self._open = not self.include or self._include_re is not None or self._include_name_re is not None
+        logger.debug(LOG_CLASSE + "__init__ - %d regole include, %d exclude compilate", len(self.include), len(self.exclude))
+
+    def __bool__(self):
+        return bool(self.include or self.exclude)
+
+    def fingerprint(self) -> str:
+        # Impronta delle regole effettive: salvata nel mark del journal delle modifiche, se cambia
+        # la sorgente va riletta per intero (file prima esclusi in cartelle invariate)
+        import hashlib  # Import locale: la validazione della configurazione (avvio della CLI) non lo carica
+        rules = json.dumps([self.include, self.exclude], ensure_ascii=False)
+        return hashlib.sha1(rules.encode("utf-8")).hexdigest()
+
+    def enter(self, relative: str) -> bool:
+        name = relative.rpartition("/")[2]
+        if self._dir_names and name.casefold() in self._dir_names:
+            return False
+        if self._dir_name_re is not None and self._dir_name_re.fullmatch(name):
+            return False
+        if self._exclude_trie and _trie_get(self._exclude_trie, relative.casefold().split("/")) is not None:
+            return False
+        if self._dir_re is not None and self._dir_re.search(relative + "/"):
+            return False
+        if self._open:
+            return True
+        # Cartella inclusa, dentro una cartella inclusa o sul percorso verso una di esse
+        return _trie_walk(self._include_trie, relative.casefold().split("/")) is not None
+
+    def accept(self, relative: str) -> bool:
+        name = relative.rpartition("/")[2]
+        if self._file_names and name.casefold() in self._file_names:
+            return False
+        if self._file_name_re is not None and self._file_name_re.fullmatch(name):
+            return False
+        if self._exclude_trie and _trie_get(self._exclude_trie, relative.casefold().split("/")) == "any":
+            return False
+        if self._file_re is not None and self._file_re.search(relative):
+            return False
+        if not self.include:
+            return True
+        if self._include_trie and _trie_walk(self._include_trie, relative.casefold().split("/")):
+            return True
+        if self._include_name_re is not None and self._include_name_re.fullmatch(name):
+            return True
+        return self._include_re is not None and self._include_re.search(relative) is not None
+
+    def match(self, relative: str) -> bool:
+        # Come la visita: ogni cartella superiore deve essere accettata da enter()
+        parts = relative.split("/")
+        for depth in range(1, len(parts)):
+            if not self.enter("/".join(parts[:depth])):
+                return False
+        return self.accept(relative)
+
+    def robocopy_args(self, source: str) -> Tuple[List[str], List[str]]:
+        # (filtri di file posizionali, opzioni /XD /XF); le regole non traducibili sono rifiutate in validazione
+        files = [rule for rule in self.include if rule not in self.robocopy_unsupported]
+        excluded_dirs, excluded_files = [], []
+        for rule in self.exclude:
+            if rule in self.robocopy_unsupported:
+                continue
+            regex, anchored, dir_only, body = _parse(rule)
+            target = ntpath.join(source, *body.split("/")) if anchored else body
+            excluded_dirs.append(target)
+            if not dir_only:
+                excluded_files.append(target)
+        options = []
+        if excluded_dirs:
+            options += ["/XD"] + excluded_dirs
+        if excluded_files:
+            options += ["/XF"] + excluded_files
+        return files, options
+
+
+def drive_filter(config, drive: str) -> Optional[PathFilter]:
+    # Regole comuni ("*") e della singola unità; None se la sorgente non ha filtri
+    common = config.filters.get(ALL_SOURCES, {})
+    rules = config.filters.get(drive, {})
+    include = list(common.get("include", [])) + list(rules.get("include", []))
+    exclude = list(common.get("exclude", [])) + list(rules.get("exclude", []))
+    if not include and not exclude:
+        return None
+    return PathFilter(include, exclude)
+
+
+def source_filters(config) -> Dict[str, PathFilter]:
+    # Filtro di ogni cartella sorgente, con le stesse sorgenti di BackupBuilder
+    filters = {}
+    for drive in config.source_drives:
+        current = drive_filter(config, drive)
+        if current is None:
+            continue
+        if drive.replace(":", "") != "C":
+            filters[config.drive_path(drive)] = current
+        else:
+            user_profile = os.environ.get("USERPROFILE", "C:\\Users\\Default")
+            filters.update((os.path.join(user_profile, folder), current) for folder in config.user_folders)
+    return filters
+
+
+def validate_filters(filters: dict, copy_engine: str):
+    # Chiamata da BackupConfig.validate: ogni errore diventa un ValueError con la regola che lo causa
+    if not isinstance(filters, dict):
+        raise ValueError("filters deve essere un oggetto {unità: {include: [...], exclude: [...]}}.")
+    for key, rules in filters.items():
+        if key != ALL_SOURCES and not re.fullmatch(r"[A-Z]:", key):
+            raise ValueError(f"Filtro per un'unità non valida: {key}. Usa una lettera di unità (es. 'D:') oppure '*'.")
+        if not isinstance(rules, dict) or set(rules) - {"include", "exclude"}:
+            raise ValueError(f"Filtri di {key} non validi: sono ammesse solo le chiavi include ed exclude.")
+        for kind, values in rules.items():
+            if not isinstance(values, list) or not all(isinstance(value, str) and value.strip("/ ") for value in values):
+                raise ValueError(f"Filtri {kind} di {key} non validi: serve un elenco di regole non vuote.")
+        try:
+            compiled = PathFilter(rules.get("include", []), rules.get("exclude", []))
+        except re.error as e:
+            raise ValueError(f"Espressione regolare non valida nei filtri di {key}: {e}")
+        if copy_engine == "robocopy" and compiled.robocopy_unsupported:
+            raise ValueError(f"Filtri di {key} non applicabili da robocopy ({', '.join(compiled.robocopy_unsupported)}): "
+                             "usa copy_engine 'native'.")
+
+
+def _parse(rule: str):
+    # (regex | None, ancorata alla radice, solo cartelle, corpo con "/")
+    if rule.startswith(REGEX_PREFIX):
+        return rule[len(REGEX_PREFIX):], False, False, ""
+    body = rule.replace("\\", "/")
+    dir_only = body.endswith("/")
+    body = body.strip("/")
+    if body.startswith("**/") and "/" not in body[3:]:
+        return None, False, dir_only, body[3:]  # "**/build/" equivale alla regola per nome "build/"
+    anchored = rule.startswith(("/", "\\")) or "/" in body
+    return None, anchored, dir_only, body
+
+
+def _glob_to_regex(body: str) -> str:
+    # * e ? restano dentro un componente del percorso, ** attraversa le cartelle
+    out = []
+    segments = body.split("/")
+    for index, segment in enumerate(segments):
+        last = index == len(segments) - 1
+        if segment == "**":
+            out.append(".*" if last else "(?:[^/]*/)*")
+            continue
+        position = 0
+        while position < len(segment):
+            char = segment[position]
+            close = segment.find("]", position + 2) if char == "[" else -1
+            if char == "*":
+                out.append("[^/]*")
+            elif char == "?":
+                out.append("[^/]")
+            elif close != -1:
+                inner = segment[position + 1:close]
+                out.append("[" + ("^" + inner[1:] if inner.startswith("!") else inner).replace("\\", "\\\\") + "]")
+                position = close
+            else:
+                out.append(re.escape(char))
+            position += 1
+        if not last:
+            out.append("/")
+    return "".join(out)
+
+
+def _combine(patterns: List[str]):
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.IGNORECASE)
+
+
+def _trie_insert(trie: dict, body: str, kind: str):
+    node = trie
+    for part in body.casefold().split("/"):
+        node = node.setdefault(part, {})
+    node[_END] = kind
+
+
+def _trie_get(trie: dict, parts: List[str]):
+    # Tipo della regola sul percorso esatto (None se assente)
+    node = trie
+    for part in parts:
+        node = node.get(part)
+        if node is None:
+            return None
+    return node.get(_END)
+
+
+def _trie_walk(trie: dict, parts: List[str]):
+    # True se il percorso è dentro un nodo terminale, False se è un antenato di una regola, None altrimenti
+    node = trie
+    for part in parts:
+        if _END in node:
+            return True
+        node = node.get(part)
+        if node is None:
+            return None
+    return _END in node
@@ -0,0 +1,252 @@
+# Questa classe mantiene l'indice dei percorsi di tutti gli snapshot in backup_root (SQLite)
+# Risponde a "quali versioni di questo file esistono" senza aprire le cartelle <timestamp> sul disco esterno
+
+"""
+G:\\Backup_PC\\.pybck_paths.sqlite
+
+snapshots(id, name)                          → snapshot indicizzati, id crescente con il nome (timestamp)
+versions(path, first, last, size, mtime_ns, hash)
+                                             → una riga per versione di un file: stesso contenuto in ogni
+                                               snapshot indicizzato con id tra first e last
+                                               (last NULL = presente anche nell'ultimo snapshot)
+
+I percorsi sono nella forma della sorgente: "D:/Progetti/relazione.docx", "C:/Documents/nota.txt".
+Un file invariato per 100 snapshot occupa una sola riga.
+
+add_snapshot(name)   → alla finalizzazione (BackupBuilder): confronto ordinato tra il manifest e le versioni
+                       aperte, si scrivono solo i file nuovi, modificati o scomparsi. Uno snapshot più vecchio
+                       dell'ultimo indicizzato ricostruisce l'indice
+remove_snapshot(name)→ first/last passano agli snapshot vicini
+remove_snapshots(names) → alla cancellazione (BackupCleaner): tutti gli snapshot eliminati in una transazione
+rebuild(names)       → ricostruisce l'indice dai manifest degli snapshot indicati
+
+versions(path)       → (snapshot, size, mtime_ns, hash) per ogni snapshot che contiene il file, dal più recente
+search(prefix=...)   → versioni distinte dei file sotto un prefisso, oppure
+search(pattern=...)    che corrispondono a un glob (GLOB di SQLite: "*" comprende anche "/", maiuscole distinte).
+                       Il tratto iniziale senza caratteri jolly limita la ricerca con l'indice su path
+"""
+
+import os
+import re
+import sqlite3
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
+
+from pybck.BackupManifest import BackupManifest, ManifestEntry, MANIFEST_NAME
+from pybck import logger
+LOG_CLASSE = "[PathIndex] - "
+
+INDEX_NAME = ".pybck_paths.sqlite"
+BATCH_SIZE = 10000
+WILDCARDS = re.compile(r"[*?\[]")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS versions (path TEXT NOT NULL, first INTEGER NOT NULL, last INTEGER,
+                                     size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, hash BLOB);
+CREATE INDEX IF NOT EXISTS versions_path ON versions (path);
+CREATE INDEX IF NOT EXISTS versions_last ON versions (last, path);
+CREATE INDEX IF NOT EXISTS versions_first ON versions (first);
+"""
+
+
+@dataclass
+class IndexEntry:
+    snapshot: str
+    path: str
+    size: int
+    mtime_ns: int
+    hash: Optional[bytes] = None
+
+
+@dataclass
+class IndexVersion:
+    path: str
+    first: str          # Snapshot più vecchio con questa versione
+    last: str           # Snapshot più recente con questa versione
+    size: int
+    mtime_ns: int
+    hash: Optional[bytes] = None
+
+
+class PathIndex:
+    path : str
+
+    def __init__(self, backup_root: str):
+        self.backup_root = backup_root
+        self.path = os.path.join(backup_root, INDEX_NAME)
+        self._db = sqlite3.connect(self.path, timeout=30)
+        # WAL: add_snapshot legge le versioni aperte da una seconda connessione mentre scrive
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA cache_size=-65536")  # 64 MiB al massimo
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def snapshots(self) -> List[str]:
+        # Dal più recente al più vecchio, come BackupCatalog.list()
+        return [row[0] for row in self._db.execute("SELECT name FROM snapshots ORDER BY id DESC")]
+
+    def add_snapshot(self, name: str) -> int:
+        # Restituisce il numero di versioni scritte (file nuovi o modificati)
+        if self._db.execute("SELECT 1 FROM snapshots WHERE name = ?", (name,)).fetchone() is not None:
+            self.remove_snapshot(name)
+        newest = self._db.execute("SELECT id, name FROM snapshots ORDER BY id DESC LIMIT 1").fetchone()
+        if newest is not None and name < newest[1]:
+            # Gli intervalli first..last presuppongono snapshot aggiunti in ordine
+            logger.warning(LOG_CLASSE + f"Snapshot {name} più vecchio dell'ultimo indicizzato: ricostruisco l'indice")
+            return self.rebuild(self.snapshots() + [name])
+
+        with BackupManifest(os.path.join(self.backup_root, name, MANIFEST_NAME)) as manifest:
+            written = self._add(name, _source_entries(manifest), newest[0] if newest else None)
+        logger.debug(LOG_CLASSE + "add_snapshot - %s indicizzato: %d versioni nuove", name, written)
+        return written
+
+    def remove_snapshot(self, name: str):
+        self.remove_snapshots([name])
+
+    def remove_snapshots(self, names: List[str]):
+        # Una sola transazione (un solo commit e fsync) per tutti gli snapshot eliminati da una pulizia
+        with self._db:
+            for name in names:
+                self._remove(name)
+
+    def _remove(self, name: str):
+        row = self._db.execute("SELECT id FROM snapshots WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return
+        sid = row[0]
+        before = self._db.execute("SELECT MAX(id) FROM snapshots WHERE id < ?", (sid,)).fetchone()[0]
+        after = self._db.execute("SELECT MIN(id) FROM snapshots WHERE id > ?", (sid,)).fetchone()[0]
+        # Versioni presenti solo in questo snapshot
+        self._db.execute("DELETE FROM versions WHERE first = ? AND (last = ? OR (last IS NULL AND ? IS NULL))",
+                         (sid, sid, after))
+        self._db.execute("UPDATE versions SET first = ? WHERE first = ?", (after, sid))
+        self._db.execute("UPDATE versions SET last = ? WHERE last = ?", (before, sid))
+        if after is None and before is not None:
+            # Era l'ultimo: le versioni chiuse dalle sue modifiche tornano attuali
+            self._db.execute("UPDATE versions SET last = NULL WHERE last = ?", (before,))
+        self._db.execute("DELETE FROM snapshots WHERE id = ?", (sid,))
+        logger.debug(LOG_CLASSE + "remove_snapshot - %s rimosso dall'indice", name)
+
+    def rebuild(self, names: List[str]) -> int:
+        logger.info(LOG_CLASSE + f"Ricostruzione dell'indice dei percorsi da {len(names)} snapshot")
+        with self._db:
+            self._db.execute("DELETE FROM versions")
+            self._db.execute("DELETE FROM snapshots")
+        written = 0
+        previous = None
+        for name in sorted(set(names)):
+            try:
+                with BackupManifest(os.path.join(self.backup_root, name, MANIFEST_NAME)) as manifest:
+                    written += self._add(name, _source_entries(manifest), previous)
+            except (OSError, ValueError) as e:
+                logger.warning(LOG_CLASSE + f"Manifest di {name} non leggibile, snapshot non indicizzato: {e}")
+                continue
+            previous = self._db.execute("SELECT id FROM snapshots WHERE name = ?", (name,)).fetchone()[0]
+        return written
+
+    def versions(self, path: str) -> List[IndexEntry]:
+        rows = self._db.execute(
+            "SELECT s.name, v.path, v.size, v.mtime_ns, v.hash FROM versions v "
+            "JOIN snapshots s ON s.id >= v.first AND s.id <= COALESCE(v.last, s.id) "
+            "WHERE v.path = ? ORDER BY s.id DESC", (_normalize(path),))
+        return [IndexEntry(*row) for row in rows]
+
+    def search(self, prefix: str = None, pattern: str = None, limit: int = 1000) -> List[IndexVersion]:
+        # Versioni distinte ordinate per percorso, dalla più recente
+        where = []
+        params = []
+        literal = _normalize(prefix) if prefix is not None else ""
+        if pattern is not None:
+            pattern = _normalize(pattern)
+            literal = max(literal, WILDCARDS.split(pattern, 1)[0], key=len)
+            where.append("v.path GLOB ?")
+            params.append(pattern)
+        if literal:
+            where.append("v.path >= ? AND v.path < ?")
+            params += [literal, literal[:-1] + chr(ord(literal[-1]) + 1)]
+        newest = self._db.execute("SELECT name FROM snapshots ORDER BY id DESC LIMIT 1").fetchone()
+        rows = self._db.execute(
+            "SELECT v.path, f.name, l.name, v.size, v.mtime_ns, v.hash FROM versions v "
+            "JOIN snapshots f ON f.id = v.first LEFT JOIN snapshots l ON l.id = v.last "
+            + ("WHERE " + " AND ".join(where) if where else "")
+            + " ORDER BY v.path, v.first DESC LIMIT ?", params + [limit])
+        return [IndexVersion(path, first, last if last is not None else newest[0], size, mtime_ns, digest)
+                for path, first, last, size, mtime_ns, digest in rows]
+
+    def _add(self, name: str, entries: Iterator[ManifestEntry], previous: Optional[int]) -> int:
+        # Confronto ordinato (merge) tra il manifest e le versioni aperte dello snapshot precedente.
+        # Le versioni aperte si leggono da una seconda connessione: le scritture non in commit non la toccano
+        reader = sqlite3.connect(self.path, timeout=30)
+        try:
+            with self._db:
+                sid = self._db.execute("INSERT INTO snapshots (name) VALUES (?)", (name,)).lastrowid
+                opened = reader.execute("SELECT rowid, path, size, mtime_ns, hash FROM versions "
+                                        "WHERE last IS NULL ORDER BY path") if previous is not None else iter(())
+                closes = []
+                inserts = []
+                written = 0
+                old = next(opened, None)
+                for entry in entries:
+                    while old is not None and old[1] < entry.path:
+                        closes.append((previous, old[0]))  # File scomparso
+                        old = next(opened, None)
+                    if old is not None and old[1] == entry.path:
+                        if _same(old, entry):
+                            old = next(opened, None)
+                            continue
+                        closes.append((previous, old[0]))  # File modificato
+                        old = next(opened, None)
+                    inserts.append((entry.path, sid, entry.size, entry.mtime_ns, entry.hash))
+                    written += 1
+                    if len(inserts) + len(closes) >= BATCH_SIZE:
+                        self._flush(closes, inserts)
+                while old is not None:
+                    closes.append((previous, old[0]))
+                    old = next(opened, None)
+                self._flush(closes, inserts)
+        finally:
+            reader.close()
+        return written
+
+    def _flush(self, closes: list, inserts: list):
+        self._db.executemany("UPDATE versions SET last = ? WHERE rowid = ?", closes)
+        self._db.executemany("INSERT INTO versions (path, first, size, mtime_ns, hash) VALUES (?, ?, ?, ?, ?)", inserts)
+        closes.clear()
+        inserts.clear()
+
+
+def _source_entries(manifest: BackupManifest) -> Iterator[ManifestEntry]:
+    # Voci del manifest con il percorso della sorgente: "Disco_D_Backup_<ts>/a/b" → "D:/a/b".
+    # Il prefisso è uguale per tutti i file di un'unità, quindi l'ordine del manifest resta valido
+    for entry in manifest:
+        folder, slash, rest = entry.path.partition("/")
+        if not slash or not folder.startswith("Disco_"):
+            continue  # File interni nella radice dello snapshot
+        entry.path = f"{folder[len('Disco_')]}:/{rest}"
+        yield entry
+
+
+def _same(row: tuple, entry: ManifestEntry) -> bool:
+    # Stessa versione: stessa dimensione e data; l'hash conta solo se presente in entrambi
+    _, _, size, mtime_ns, digest = row
+    if size != entry.size or mtime_ns != entry.mtime_ns:
+        return False
+    return digest is None or entry.hash is None or digest == entry.hash
+
+
+def _normalize(path: str) -> str:
+    path = path.replace("\\", "/")
+    drive, colon, rest = path.partition(":")
+    if colon and len(drive) == 1:
+        return f"{drive.upper()}:{rest}"
+    return path
@@ -0,0 +1,101 @@
+# Questo modulo decide quali backup conservare: funzioni pure sui nomi degli snapshot,
+# senza accesso al disco, così da poterle testare e misurare su migliaia di nomi sintetici
+
+"""
+Regole (si sommano: un backup è conservato se almeno una regola lo seleziona):
+
+keep_last      → gli ultimi N backup
+keep_daily     → l'ultimo backup di ciascuno degli ultimi N giorni con backup
+keep_weekly    → l'ultimo backup di ciascuna delle ultime N settimane ISO
+keep_monthly   → l'ultimo backup di ciascuno degli ultimi N mesi
+keep_yearly    → l'ultimo backup di ciascuno degli ultimi N anni
+max_total_bytes→ tra i backup selezionati conserva i più recenti finché la somma delle dimensioni
+                 rientra nel budget (il più recente è sempre conservato)
+
+I nomi "YYYY-MM-DD_HH-MM-SS" sono ordinabili come stringhe: nessun parsing delle date,
+tranne il calcolo della settimana ISO (una sola volta per giorno distinto).
+"""
+
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, List, Tuple
+
+
+@dataclass
+class RetentionPolicy:
+    keep_last: int = 0
+    keep_daily: int = 0
+    keep_weekly: int = 0
+    keep_monthly: int = 0
+    keep_yearly: int = 0
+    max_total_bytes: int = 0
+
+    @property
+    def has_count_rules(self) -> bool:
+        return any((self.keep_last, self.keep_daily, self.keep_weekly, self.keep_monthly, self.keep_yearly))
+
+
+def plan_retention(names: List[str], policy: RetentionPolicy, sizes: Dict[str, int] = None) -> Tuple[List[str], List[str]]:
+    # Restituisce (da conservare, da eliminare), entrambe dal più recente al più vecchio
+    ordered = sorted(names, reverse=True)
+    if not ordered:
+        return [], []
+
+    if policy.has_count_rules:
+        keep = _apply_count_rules(ordered, policy)
+    elif policy.max_total_bytes:
+        keep = set(ordered)  # Solo budget: tutti candidati
+    else:
+        keep = set()
+
+    if policy.max_total_bytes:
+        keep = _apply_size_budget(ordered, keep, policy.max_total_bytes, sizes or {})
+
+    return [name for name in ordered if name in keep], [name for name in ordered if name not in keep]
+
+
+def _apply_count_rules(ordered: List[str], policy: RetentionPolicy) -> set:
+    keep = set(ordered[:policy.keep_last])
+    week_cache = {}
+    buckets = (
+        (policy.keep_daily, lambda name: name[:10]),
+        (policy.keep_weekly, lambda name: _iso_week(name, week_cache)),
+        (policy.keep_monthly, lambda name: name[:7]),
+        (policy.keep_yearly, lambda name: name[:4]),
+    )
+    for count, period in buckets:
+        last_period = None
+        for name in ordered:
+            if count <= 0:
+                break
+            current = period(name)
+            if current != last_period:
+                # Primo (quindi più recente) backup del periodo
+                keep.add(name)
+                last_period = current
+                count -= 1
+    return keep
+
+
+def _apply_size_budget(ordered: List[str], keep: set, max_total_bytes: int, sizes: Dict[str, int]) -> set:
+    kept = set()
+    total = 0
+    for name in ordered:
+        if name not in keep:
+            continue
+        size = sizes.get(name, 0)
+        if kept and total + size > max_total_bytes:
+            # Conservo i backup in ordine dal più recente: i successivi sono tutti più vecchi
+            break
+        kept.add(name)
+        total += size
+    return kept
+
+
+def _iso_week(name: str, cache: dict) -> Tuple[int, int]:
+    day = name[:10]
+    week = cache.get(day)
+    if week is None:
+        year, week_number, _ = date(int(day[:4]), int(day[5:7]), int(day[8:10])).isocalendar()
+        week = cache[day] = (year, week_number)
+    return week
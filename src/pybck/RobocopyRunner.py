@@ -0,0 +1,85 @@
+# Questa classe esegue robocopy leggendo l'output riga per riga invece di accumularlo in memoria
+# Ogni riga viene interpretata come evento (file copiato, errore) e inoltrata al ProgressTracker
+
+"""
+run(source, destination) → avvia robocopy /MIR con Popen e restituisce (returncode, ultime righe)
+
+Righe riconosciute (con /BYTES le dimensioni sono in byte):
+    \t    New File  \t\t    1234\tfile.txt
+    \t    Newer     \t\t    5678\tfile.txt
+    2024/01/22 10:30:45 ERROR 5 (0x00000005) Copying File D:\\file.txt
+"""
+
+import re
+import subprocess
+from collections import deque
+from typing import List, Tuple
+
+from pybck.BackupProgress import ProgressTracker
+from pybck import logger
+LOG_CLASSE = "[RobocopyRunner] - "
+
+FILE_PATTERN = re.compile(r"^\s*(New File|Newer|Older|Changed|Modified|Tweaked)\s+(\d+)\s+(.*?)\s*$")
+ERROR_PATTERN = re.compile(r"\bERROR\s+(\d+)\s+\((0x[0-9A-Fa-f]+)\)\s+(.*?)\s*$")
+MAX_BUFFER_LINES = 200
+
+
+class RobocopyRunner:
+    max_buffer_lines : int
+
+    def __init__(self, max_buffer_lines: int = MAX_BUFFER_LINES):
+        self.max_buffer_lines = max_buffer_lines
+
+    def build_command(self, source: str, destination: str, path_filter=None) -> List[str]:
+        # config.filters: include di file come filtri posizionali, esclusioni con /XD e /XF
+        files, options = path_filter.robocopy_args(source) if path_filter is not None else ([], [])
+        return [
+            "robocopy",
+            source,  # sorgente
+            destination,
+            *files,
+            "/MIR",                   # Mirror
+            "/R:3", "/W:5",           # Retry/Wait
+            "/NP", "/NJH", "/NJS",    # Logging minimo: niente percentuali, intestazioni e riepilogo
+            "/BYTES",                 # Dimensioni in byte, per calcolare il throughput
+            *options,
+        ]
+
+    def run(self, source: str, destination: str, progress: ProgressTracker = None, path_filter=None) -> Tuple[int, str]:
+        logger.debug(LOG_CLASSE + "run - Avvio robocopy %s → %s", source, destination)
+        # Buffer limitato: conservo solo le ultime righe per i messaggi di errore
+        tail = deque(maxlen=self.max_buffer_lines)
+
+        process = subprocess.Popen(
+            self.build_command(source, destination, path_filter),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            shell=False,
+            encoding='utf-8',
+            errors='ignore',
+            bufsize=1
+        )
+
+        with process.stdout:
+            for line in process.stdout:
+                line = line.rstrip("\r\n")
+                if not line.strip():
+                    continue
+                tail.append(line)
+                if progress is not None:
+                    self._parse_line(line, progress)
+
+        returncode = process.wait()
+        logger.debug(LOG_CLASSE + "run - Fine robocopy %s con codice %d", source, returncode)
+        return returncode, "\n".join(tail)
+
+    def _parse_line(self, line: str, progress: ProgressTracker):
+        file_match = FILE_PATTERN.match(line)
+        if file_match:
+            progress.file_done(file_match.group(3), int(file_match.group(2)))
+            return
+
+        error_match = ERROR_PATTERN.search(line)
+        if error_match:
+            progress.error(error_match.group(3))
@@ -0,0 +1,352 @@
+# Questa classe esporta uno snapshot finalizzato come archivio tar.gz, per portarlo fuori sede
+# Il tar viene prodotto in streaming (file o stdout) e compresso a blocchi in parallelo, come pigz
+
+"""
+SnapshotExporter(config).export(name, output)  → scrive <name>/... in un tar.gz; output è un percorso
+                                                 oppure un file binario già aperto (es. sys.stdout.buffer).
+                                                 Su percorso scrive <output>.tmp e lo rinomina solo alla fine
+
+Contenuto: i file originali dello snapshot. I file .pybckz della modalità compressa vengono
+decompressi e le ricette della modalità dedup ricostruite dai chunk; il manifest e gli altri file
+interni (.pybck_*) nella radice dello snapshot non vengono esportati.
+
+Compressione: il tar viene diviso in blocchi da BLOCK_SIZE compressi da un pool di thread (zlib rilascia
+il GIL) e scritti nell'ordine originale. Ogni blocco termina con Z_FULL_FLUSH e non dipende dai precedenti:
+la decompressione può iniziare da qualsiasi inizio di blocco. Il risultato è un unico membro gzip,
+leggibile da tar/gzip/7-Zip.
+
+Indice per l'accesso diretto, in coda:
+    <name>/.pybck_export_index.json → ultimo membro del tar, in un blocco a sé:
+        {"version": 1, "snapshot": name, "block_size": ...,
+         "blocks": [[offset nel tar, offset nel file compresso], ...],
+         "members": [{"name", "size", "offset" (dati nel tar), "mtime", "mode"}, ...]}
+    footer → secondo membro gzip vuoto (FOOTER_SIZE byte) con l'offset compresso del blocco dell'indice
+             nel campo extra: gzip -d lo ignora, read_index() lo legge dalla fine del file
+
+read_index(path) / read_member(path, name) → elenco dei membri e lettura di un singolo file senza
+                                             decomprimere l'intero archivio
+"""
+
+import bisect
+import io
+import json
+import os
+import struct
+import tarfile
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator, Union
+
+from pybck.BackupConfig import BackupConfig
+from pybck import logger
+LOG_CLASSE = "[SnapshotExporter] - "
+
+BLOCK_SIZE = 1024 * 1024
+READ_SIZE = 1024 * 1024
+INDEX_NAME = ".pybck_export_index.json"
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"   # deflate, nessun flag, mtime 0, OS sconosciuto
+FOOTER = struct.Struct("<2sBBIBBH2sHQ")                      # membro gzip con FEXTRA "PB": offset dell'indice
+EMPTY_DEFLATE = b"\x03\x00"
+FOOTER_SIZE = FOOTER.size + len(EMPTY_DEFLATE) + 8
+
+
+@dataclass
+class ExportStats:
+    members: int = 0
+    bytes_in: int = 0           # Byte del tar non compresso
+    bytes_out: int = 0          # Byte scritti
+    elapsed: float = 0.0
+
+    @property
+    def throughput_mb_s(self) -> float:
+        return self.bytes_in / 1024**2 / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class _ParallelGzip:
+    # Flusso gzip compresso a blocchi indipendenti su più thread, scritti in ordine
+
+    def __init__(self, output: BinaryIO, threads: int, level: int, block_size: int = BLOCK_SIZE):
+        self.output = output
+        self.level = level
+        self.block_size = block_size
+        self.blocks = []            # [offset non compresso, offset compresso] di ogni blocco
+        self.offset = 0             # Byte non compressi ricevuti
+        self._buffer_start = 0      # Offset non compresso di _buffer[0]
+        self.written = 0            # Byte scritti in output
+        self._buffer = bytearray()
+        self._crc = 0
+        self._pending = deque()
+        self._max_pending = threads * 2
+        self._executor = ThreadPoolExecutor(max_workers=threads)
+        self._write(GZIP_HEADER)
+
+    def write(self, data):
+        self._buffer += data
+        self.offset += len(data)
+        while len(self._buffer) >= self.block_size:
+            self._submit(bytes(self._buffer[:self.block_size]))
+            del self._buffer[:self.block_size]
+
+    def boundary(self):
+        # Il prossimo byte scritto inizia un nuovo blocco; i blocchi precedenti vengono scritti
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        while self._pending:
+            self._drain()
+
+    def abort(self):
+        for future, _, _ in self._pending:
+            future.cancel()
+        self._executor.shutdown(wait=False)
+
+    def close(self) -> int:
+        # Chiude il membro gzip; restituisce i byte scritti
+        self.boundary()
+        self._executor.shutdown()
+        self._write(zlib.compressobj(self.level, zlib.DEFLATED, -15).flush(zlib.Z_FINISH))
+        self._write(struct.pack("<II", self._crc, self.offset & 0xFFFFFFFF))
+        return self.written
+
+    def _submit(self, block: bytes):
+        self.blocks.append([self._buffer_start, None])
+        self._buffer_start += len(block)
+        self._pending.append((self._executor.submit(_deflate_block, block, self.level), block, len(self.blocks) - 1))
+        while len(self._pending) > self._max_pending:
+            self._drain()
+
+    def _drain(self):
+        future, block, index = self._pending.popleft()
+        self._crc = zlib.crc32(block, self._crc)
+        self.blocks[index][1] = self.written
+        self._write(future.result())
+
+    def _write(self, data: bytes):
+        self.output.write(data)
+        self.written += len(data)
+
+
+def _deflate_block(block: bytes, level: int) -> bytes:
+    # Deflate grezzo chiuso con Z_FULL_FLUSH: il blocco si decomprime senza i precedenti
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(block) + compressor.flush(zlib.Z_FULL_FLUSH)
+
+
+class SnapshotExporter:
+    config : BackupConfig
+
+    def __init__(self, config: BackupConfig, threads: int = 0, level: int = 6):
+        self.config = config
+        self.threads = threads or os.cpu_count() or 1
+        self.level = level
+        self._store = None
+
+    def export(self, name: str, output: Union[str, BinaryIO]) -> ExportStats:
+        snapshot = self.config.backup_path(name)
+        if name.startswith(".") or not os.path.isdir(snapshot):
+            raise FileNotFoundError(f"Snapshot non trovato: {snapshot}")
+        logger.info(LOG_CLASSE + f"Esportazione dello snapshot {name} ({self.threads} thread, livello {self.level})")
+
+        if isinstance(output, str):
+            # Un archivio interrotto non deve sembrare completo: rinomino solo a esportazione riuscita
+            tmp_path = output + ".tmp"
+            try:
+                with open(tmp_path, "wb") as file:
+                    stats = self._export(name, snapshot, file)
+                os.replace(tmp_path, output)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except FileNotFoundError:
+                    pass
+                raise
+            return stats
+        return self._export(name, snapshot, output)
+
+    def _export(self, name: str, snapshot: str, output: BinaryIO) -> ExportStats:
+        stats = ExportStats()
+        start = time.perf_counter()
+        stream = _ParallelGzip(output, self.threads, self.level)
+        members = []
+        try:
+            for info, chunks in self._members(name, snapshot):
+                stream.write(info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape"))
+                if info.isfile():
+                    members.append({"name": info.name, "size": info.size, "offset": stream.offset,
+                                    "mtime": info.mtime, "mode": info.mode})
+                    written = 0
+                    for data in chunks:
+                        stream.write(data)
+                        written += len(data)
+                    if written != info.size:
+                        raise OSError(f"{info.name}: letti {written} byte invece di {info.size}")
+                    stream.write(b"\0" * (-info.size % tarfile.BLOCKSIZE))
+                stats.members += 1
+
+            # L'indice inizia un blocco: il footer indica dove decomprimere per leggerlo
+            stream.boundary()
+            index_block = len(stream.blocks)
+            index = json.dumps({"version": 1, "snapshot": name, "block_size": stream.block_size,
+                                "blocks": stream.blocks, "members": members}).encode("utf-8")
+            info = tarfile.TarInfo(f"{name}/{INDEX_NAME}")
+            info.size = len(index)
+            info.mtime = int(time.time())
+            stream.write(info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape"))
+            stream.write(index)
+            stream.write(b"\0" * (-len(index) % tarfile.BLOCKSIZE))
+            stream.write(b"\0" * (2 * tarfile.BLOCKSIZE))   # Fine dell'archivio tar
+            stats.bytes_in = stream.offset
+            stats.bytes_out = stream.close()
+        except BaseException:
+            stream.abort()
+            raise
+        finally:
+            if self._store is not None:
+                self._store.close()
+                self._store = None
+
+        index_offset = stream.blocks[index_block][1]
+        footer = FOOTER.pack(b"\x1f\x8b", 8, 4, 0, 0, 0xFF, 12, b"PB", 8, index_offset)
+        output.write(footer + EMPTY_DEFLATE + b"\0" * 8)
+        output.flush()
+        stats.bytes_out += FOOTER_SIZE
+        stats.elapsed = time.perf_counter() - start
+        logger.info(LOG_CLASSE + f"Snapshot {name} esportato: {stats.members} elementi, {stats.bytes_in / 1024**2:.1f} MB "
+                                 f"→ {stats.bytes_out / 1024**2:.1f} MB, {stats.throughput_mb_s:.1f} MB/s")
+        return stats
+
+    def _members(self, name: str, snapshot: str) -> Iterator:
+        # (TarInfo, iteratore dei dati o None) in ordine di percorso
+        from pybck.ChunkStore import RECIPE_NAME, read_recipe
+        from pybck.CompressedStore import SUFFIX, read_header, iter_original
+
+        yield _info(name, os.stat(snapshot), tarfile.DIRTYPE), None
+        for member, entry in _walk(snapshot, name):
+            st = entry.stat(follow_symlinks=False)
+            if entry.is_dir(follow_symlinks=False):
+                yield _info(member, st, tarfile.DIRTYPE), None
+            elif not entry.is_file(follow_symlinks=False):
+                continue  # Link simbolici e file speciali non vengono copiati dai motori
+            elif entry.name == RECIPE_NAME:
+                # Snapshot deduplicato: i file si ricostruiscono dai chunk
+                directory = member.rpartition("/")[0]
+                for item in read_recipe(entry.path):
+                    info = tarfile.TarInfo(f"{directory}/{item['path']}")
+                    info.size = item["size"]
+                    info.mtime = item["mtime_ns"] / 10**9
+                    info.mode = item["mode"] & 0o7777
+                    yield info, self._chunks(item["chunks"])
+            else:
+                header = read_header(entry.path) if entry.name.endswith(SUFFIX) else None
+                if header is not None:
+                    info = _info(member[:-len(SUFFIX)], st, tarfile.REGTYPE)
+                    info.size = header[1]
+                    yield info, iter_original(entry.path)
+                else:
+                    info = _info(member, st, tarfile.REGTYPE)
+                    info.size = st.st_size
+                    yield info, _read_file(entry.path)
+
+    def _chunks(self, chunks) -> Iterator[bytes]:
+        if self._store is None:
+            from pybck.ChunkStore import ChunkStore, STORE_NAME
+            self._store = ChunkStore(self.config.backup_path(STORE_NAME))
+        for chunk in chunks:
+            yield self._store.read_chunk(chunk)
+
+
+def read_index(path: str) -> dict:
+    # Legge il footer e decomprime solo dal blocco dell'indice
+    with open(path, "rb") as file:
+        file.seek(-FOOTER_SIZE, os.SEEK_END)
+        magic, _, _, _, _, _, _, subfield, _, offset = FOOTER.unpack(file.read(FOOTER.size))
+        if magic != b"\x1f\x8b" or subfield != b"PB":
+            raise ValueError(f"{path} non contiene l'indice di pybck")
+        data = b"".join(_inflate_from(file, offset))
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        member = tar.next()
+        if member is None or not member.name.endswith("/" + INDEX_NAME):
+            raise ValueError(f"{path}: indice non trovato all'offset {offset}")
+        return json.loads(tar.extractfile(member).read())
+
+
+def read_member(path: str, name: str, index: dict = None) -> Iterator[bytes]:
+    # Contenuto di un file dell'archivio, decomprimendo dal blocco che lo contiene
+    index = index if index is not None else read_index(path)
+    member = next((item for item in index["members"] if item["name"] == name), None)
+    if member is None:
+        raise KeyError(f"{name} non è nell'archivio {path}")
+    blocks = index["blocks"]
+    block = bisect.bisect_right([start for start, _ in blocks], member["offset"]) - 1
+    skip = member["offset"] - blocks[block][0]
+    remaining = member["size"]
+    if not remaining:
+        return
+    with open(path, "rb") as file:
+        for data in _inflate_from(file, blocks[block][1]):
+            if skip:
+                cut = min(skip, len(data))
+                data = data[cut:]
+                skip -= cut
+            data = data[:remaining]
+            if data:
+                remaining -= len(data)
+                yield data
+            if not remaining:
+                return
+    raise ValueError(f"{name}: archivio troncato")
+
+
+def _inflate_from(file: BinaryIO, offset: int) -> Iterator[bytes]:
+    # Deflate grezzo da un inizio di blocco fino alla fine del membro gzip
+    file.seek(offset)
+    decompressor = zlib.decompressobj(-15)
+    while not decompressor.eof:
+        data = file.read(READ_SIZE)
+        if not data:
+            raise ValueError("Flusso compresso troncato")
+        yield decompressor.decompress(data)
+
+
+def _walk(snapshot: str, name: str) -> Iterator:
+    # (percorso nel tar, DirEntry): ogni cartella precede il suo contenuto, fratelli in ordine alfabetico
+    stack = [iter(_sorted_entries(snapshot))]
+    prefixes = [name]
+    while stack:
+        entry = next(stack[-1], None)
+        if entry is None:
+            stack.pop()
+            prefixes.pop()
+            continue
+        if len(stack) == 1 and entry.name.startswith(".pybck_"):
+            continue  # Manifest e file interni dello snapshot
+        member = f"{prefixes[-1]}/{entry.name}"
+        yield member, entry
+        if entry.is_dir(follow_symlinks=False):
+            stack.append(iter(_sorted_entries(entry.path)))
+            prefixes.append(member)
+
+
+def _sorted_entries(directory: str) -> list:
+    with os.scandir(directory) as entries:
+        return sorted(entries, key=lambda entry: entry.name)
+
+
+def _info(name: str, st: os.stat_result, kind: bytes) -> tarfile.TarInfo:
+    info = tarfile.TarInfo(name)
+    info.type = kind
+    info.mtime = st.st_mtime
+    info.mode = st.st_mode & 0o7777
+    return info
+
+
+def _read_file(path: str) -> Iterator[bytes]:
+    with open(path, "rb") as file:
+        while True:
+            data = file.read(READ_SIZE)
+            if not data:
+                return
+            yield data
@@ -0,0 +1,259 @@
+# Questa classe stima quanti byte scriverà il prossimo backup e se c'è spazio sul drive di backup
+# Se lo spazio non basta indica quali snapshot dovrebbe eliminare BackupCleaner per fare posto
+
+"""
+estimate(sources)   → scansione parallela delle sorgenti (os.scandir con un pool di thread);
+                      in modalità incrementale o dedup confronta ogni file con il manifest dello
+                      snapshot precedente e conta solo i file nuovi o modificati
+plan()              → SpacePlan: byte da scrivere, spazio libero, snapshot da eliminare.
+                      Lo spazio recuperabile usa i byte occupati sul disco da ogni snapshot
+                      (BackupCleaner.snapshot_sizes, unique_bytes del catalogo), non la dimensione
+                      logica. Ogni file condiviso conta nello snapshot più recente che lo contiene,
+                      quindi la somma sugli snapshot più vecchi (gli unici proposti) è esattamente lo
+                      spazio liberato eliminandoli: un file ancora presente in uno snapshot conservato non conta
+
+Cache della scansione (cache/pybck_scan_cache.json), una voce per cartella:
+    {"C:\\Users\\me\\Documents": [mtime_ns, [[nome, size, mtime_ns], ...], [sottocartelle]]}
+La cache è indicizzata dalla data di modifica della cartella (mtime_ns): se non è cambiata il
+contenuto viene letto dalla cache con un solo stat invece di scandir + stat di ogni file.
+Limite: la data di una cartella cambia quando si aggiungono, rimuovono o rinominano elementi, non
+quando un file viene riscritto sul posto. Un file riscritto senza cambiare la cartella conserva
+dimensione e data dell'ultima scansione, quindi la stima resta quella vecchia (e, in modalità
+incrementale, il file può risultare invariato rispetto al manifest e non essere contato).
+La stima si corregge alla prima modifica della cartella o cancellando la cache.
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import psutil
+
+from pybck.BackupConfig import BackupConfig
+from pybck.BackupCleaner import BackupCleaner
+from pybck.BackupManifest import BackupManifest, MANIFEST_NAME
+from pybck.CopyEngine import MTIME_TOLERANCE_NS
+from pybck.PathFilter import PathFilter, source_filters
+from pybck import logger, RateLimitedLog
+LOG_CLASSE = "[SpacePlanner] - "
+
+SCAN_CACHE_PATH = "cache/pybck_scan_cache.json"
+SCAN_CACHE_VERSION = 1
+CLUSTER_SIZE = 4096      # Ogni file occupa almeno un cluster sul drive di backup
+SAFETY_MARGIN = 1.05     # Manifest, ricette, cartelle e metadati del file system
+
+
+@dataclass
+class SpacePlan:
+    total_bytes: int = 0            # Dimensione delle sorgenti
+    bytes_to_write: int = 0         # Byte che il backup scriverà davvero
+    required_bytes: int = 0         # bytes_to_write con il margine di sicurezza
+    free_bytes: int = 0
+    files: int = 0
+    dirs_scanned: int = 0
+    dirs_cached: int = 0
+    previous_snapshot: Optional[str] = None
+    missing_sources: List[str] = field(default_factory=list)
+    source_bytes: Dict[str, int] = field(default_factory=dict)   # Dimensione di ogni cartella sorgente
+    snapshots_to_delete: List[str] = field(default_factory=list)
+    reclaimable_bytes: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def fits(self) -> bool:
+        return not self.missing_sources and self.free_bytes >= self.required_bytes
+
+    def describe(self) -> str:
+        text = (f"da scrivere {self.required_bytes / 1024**3:.2f} GB, "
+                f"liberi {self.free_bytes / 1024**3:.2f} GB")
+        if self.snapshots_to_delete:
+            enough = self.free_bytes + self.reclaimable_bytes >= self.required_bytes
+            text += (f"; per fare spazio eliminare {', '.join(self.snapshots_to_delete)}"
+                     f" ({self.reclaimable_bytes / 1024**3:.2f} GB)"
+                     + ("" if enough else ", comunque non sufficiente"))
+        return text
+
+
+class SpacePlanner:
+    threads : int
+
+    def __init__(self, config: BackupConfig, threads: int = 8, cache_path: str = SCAN_CACHE_PATH):
+        self.config = config
+        self.threads = max(1, threads)
+        self.cache_path = cache_path
+        self._cache = None
+        self._new_cache = {}
+        self._dir_log = RateLimitedLog()
+
+    def source_pairs(self) -> List[Tuple[str, str]]:
+        # (cartella sorgente, prefisso nel manifest senza timestamp) come in BackupBuilder
+        pairs = []
+        for drive in self.config.source_drives:
+            drive_name = drive.replace(":", "")
+            if drive_name != "C":
+                pairs.append((self.config.drive_path(drive), f"Disco_{drive_name}_Backup_"))
+            else:
+                user_profile = os.environ.get("USERPROFILE", "C:\\Users\\Default")
+                pairs.extend((os.path.join(user_profile, folder), f"Disco_C_Backup_/{folder}")
+                             for folder in self.config.user_folders)
+        return pairs
+
+    def plan(self) -> SpacePlan:
+        logger.debug(LOG_CLASSE + "plan - Inizio stima dello spazio")
+        start = time.perf_counter()
+        cleaner = BackupCleaner(self.config)
+        snapshots = cleaner.get_finalized_backups()
+        previous = snapshots[0] if snapshots else None
+
+        # Con hard link o chunk deduplicati si scrive solo ciò che è cambiato dallo snapshot precedente
+        manifest = None
+        if previous and (self.config.incremental or self.config.storage_mode == "dedup"):
+            manifest_path = self.config.backup_path(previous, MANIFEST_NAME)
+            try:
+                manifest = BackupManifest(manifest_path)
+            except (OSError, ValueError):
+                logger.warning(LOG_CLASSE + f"Manifest di {previous} non disponibile: stimo un backup completo")
+
+        sources = [(path, self._manifest_prefix(prefix, previous)) for path, prefix in self.source_pairs()]
+        try:
+            plan = self.estimate(sources, manifest)
+        finally:
+            if manifest is not None:
+                manifest.close()
+
+        plan.previous_snapshot = previous if manifest is not None else None
+        plan.free_bytes = psutil.disk_usage(self.config.drive_path(self.config.backup_drive)).free
+        if plan.free_bytes < plan.required_bytes:
+            # Lo snapshot più recente non viene mai proposto: è il riferimento per il prossimo backup
+            candidates = list(reversed(snapshots[1:]))
+            # Byte liberati davvero: i file collegati con hard link agli snapshot conservati non contano
+            plan.snapshots_to_delete, plan.reclaimable_bytes = self.deletions_needed(
+                plan.required_bytes - plan.free_bytes, candidates, cleaner.snapshot_sizes(candidates))
+
+        plan.elapsed = time.perf_counter() - start
+        logger.info(LOG_CLASSE + f"Stima spazio: {plan.describe()} ({plan.files} file, "
+                    f"{plan.dirs_cached}/{plan.dirs_scanned} cartelle dalla cache, {plan.elapsed:.1f}s)")
+        return plan
+
+    def estimate(self, sources: List[Tuple[str, str]], manifest: BackupManifest = None) -> SpacePlan:
+        # sources: (cartella sorgente, prefisso dei suoi file nel manifest dello snapshot precedente)
+        plan = SpacePlan()
+        filters = source_filters(self.config)
+        self._load_cache()
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            for root, prefix in sources:
+                if not os.path.isdir(root):
+                    logger.warning(LOG_CLASSE + f"Sorgente non trovata: {root}")
+                    plan.missing_sources.append(root)
+                    continue
+                self._scan_source(executor, root, prefix, manifest, plan, filters.get(root))
+        self._save_cache()
+
+        plan.required_bytes = int(plan.bytes_to_write * SAFETY_MARGIN)
+        return plan
+
+    @staticmethod
+    def deletions_needed(missing_bytes: int, candidates: List[str], sizes: Dict[str, int]) -> Tuple[List[str], int]:
+        # Snapshot da eliminare nell'ordine dato (dal più vecchio) finché lo spazio recuperato basta;
+        # sizes: byte occupati sul disco da ogni snapshot (snapshot_sizes), non la dimensione logica.
+        # Eliminando dal più vecchio la somma è esatta: ogni byte è attribuito a un solo snapshot
+        selected = []
+        reclaimed = 0
+        for name in candidates:
+            if reclaimed >= missing_bytes:
+                break
+            selected.append(name)
+            reclaimed += sizes.get(name, 0)
+        return selected, reclaimed
+
+    def _manifest_prefix(self, prefix: str, previous: Optional[str]) -> str:
+        # "Disco_C_Backup_/Documents" → "Disco_C_Backup_<ts>/Documents/"
+        if previous is None:
+            return ""
+        head, _, tail = prefix.partition("/")
+        return f"{head}{previous}/" + (tail + "/" if tail else "")
+
+    def _scan_source(self, executor, root: str, prefix: str, manifest: Optional[BackupManifest], plan: SpacePlan,
+                     path_filter: PathFilter = None):
+        # Ogni cartella è un task: le sottocartelle vengono accodate man mano che arrivano i risultati
+        pending = {executor.submit(self._scan_dir, root): ""}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                relative = pending.pop(future)
+                try:
+                    path, files, subdirs, cached = future.result()
+                except OSError as e:
+                    self._dir_log.warning(LOG_CLASSE + "Cartella non leggibile durante la stima: %s", e)
+                    continue
+
+                plan.dirs_scanned += 1
+                plan.dirs_cached += cached
+                # La cache contiene le cartelle complete: i filtri si applicano dopo la lettura
+                for name, size, mtime_ns in files:
+                    if path_filter is not None and not path_filter.accept(relative + name):
+                        continue
+                    plan.files += 1
+                    plan.total_bytes += size
+                    plan.source_bytes[root] = plan.source_bytes.get(root, 0) + size
+                    if manifest is not None and _unchanged(manifest, prefix + relative + name, size, mtime_ns):
+                        continue
+                    plan.bytes_to_write += -(-size // CLUSTER_SIZE) * CLUSTER_SIZE
+                for name in subdirs:
+                    if path_filter is not None and not path_filter.enter(relative + name):
+                        continue
+                    pending[executor.submit(self._scan_dir, os.path.join(path, name))] = relative + name + "/"
+
+    def _scan_dir(self, path: str):
+        mtime_ns = os.stat(path).st_mtime_ns
+        cached = self._cache.get(path)
+        if cached is not None and cached[0] == mtime_ns:
+            self._new_cache[path] = cached
+            return path, cached[1], cached[2], True
+
+        files = []
+        subdirs = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    files.append([entry.name, st.st_size, st.st_mtime_ns])
+        self._new_cache[path] = [mtime_ns, files, subdirs]
+        return path, files, subdirs, False
+
+    def _load_cache(self):
+        self._new_cache = {}
+        if self._cache is not None:
+            return
+        self._cache = {}
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            if data.get("version") == SCAN_CACHE_VERSION:
+                self._cache = data["dirs"]
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass  # Cache assente o danneggiata: scansione completa
+
+    def _save_cache(self):
+        # Solo le cartelle viste in questa scansione: quelle rimosse escono dalla cache
+        self._cache = self._new_cache
+        try:
+            directory = os.path.dirname(self.cache_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump({"version": SCAN_CACHE_VERSION, "dirs": self._cache}, file, separators=(",", ":"))
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(LOG_CLASSE + f"Impossibile salvare la cache della scansione: {e}")
+
+
+def _unchanged(manifest: BackupManifest, path: str, size: int, mtime_ns: int) -> bool:
+    entry = manifest.lookup(path)
+    return entry is not None and entry.size == size and abs(entry.mtime_ns - mtime_ns) <= MTIME_TOLERANCE_NS
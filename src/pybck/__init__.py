@@ -1,32 +1,129 @@
 """PyBck - Professional Backup Tool"""
 __version__ = "0.1.0"
 
+# Logging: l'import del pacchetto non crea cartelle né apre file.
+# setup_logging() va chiamato una volta all'avvio (CLI, script): i messaggi passano da una coda
+# a un thread dedicato (QueueListener) che li scrive su console e file, così i thread di copia
+# non attendono mai la scrittura su disco.
+# I messaggi di debug usano la formattazione differita di logging (logger.debug("... %s", valore)):
+# se il livello non è abilitato il testo non viene costruito.
+# RateLimitedLog limita i messaggi per file (errori di copia, discrepanze) a pochi per intervallo.
+
+import atexit
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import threading
+import time
 
 LOG_FILE_PATH = "logs/backup.log"
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
 
-# Creo la cartella dei log se non esiste
-os.makedirs("logs", exist_ok=True)
-
-# Creo il logger principale
+# Logger principale: senza setup_logging() i messaggi arrivano solo agli handler del root logger
 logger = logging.getLogger("PyBck")
-logger.setLevel(logging.DEBUG)  # livello debug globale
+logger.addHandler(logging.NullHandler())
+
+_listener = None
+_queue_handler = None
+
+
+def setup_logging(level=logging.INFO, log_file: str = LOG_FILE_PATH, console: bool = True) -> logging.Logger:
+    # Può essere richiamata per cambiare configurazione: la pipeline precedente viene chiusa
+    global _listener, _queue_handler
+    # Import locale: logging.handlers (socket, pickle, queue) non rallenta l'avvio dei comandi rapidi
+    import queue
+    from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+    shutdown_logging()
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = []
+    if log_file:
+        directory = os.path.dirname(log_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Handler per il file con rotazione
+        file_handler = RotatingFileHandler(log_file, maxBytes=5*1024*1024, backupCount=1, encoding="utf-8")
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+        handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    _queue_handler = QueueHandler(log_queue)
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    logger.addHandler(_queue_handler)
+    logger.setLevel(level)
+    # Gli handler sono già qui: evito la doppia scrittura tramite il root logger
+    logger.propagate = False
+    return logger
+
+
+def shutdown_logging():
+    # Svuota la coda e chiude i file (chiamata anche all'uscita del processo)
+    global _listener, _queue_handler
+    if _queue_handler is not None:
+        logger.removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+        logger.propagate = True
+
+
+atexit.register(shutdown_logging)
+
+
+class RateLimitedLog:
+    # Al massimo `limit` messaggi ogni `interval` secondi; quelli scartati vengono contati
+    # e riportati nel primo messaggio dell'intervallo successivo
+
+    def __init__(self, log: logging.Logger = logger, limit: int = 20, interval: float = 10.0):
+        self.log = log
+        self.limit = limit
+        self.interval = interval
+        self.suppressed = 0
+        self._window_start = time.monotonic()
+        self._emitted = 0
+        self._lock = threading.Lock()
+
+    def log_message(self, level: int, msg: str, *args):
+        if not self.log.isEnabledFor(level):
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= self.interval:
+                self._window_start = now
+                self._emitted = 0
+            if self._emitted >= self.limit:
+                self.suppressed += 1
+                return
+            self._emitted += 1
+            suppressed, self.suppressed = self.suppressed, 0
+        if suppressed:
+            msg = msg + " (%d messaggi simili soppressi)"
+            args = args + (suppressed,)
+        self.log.log(level, msg, *args)
+
+    def flush(self, level: int = logging.WARNING):
+        # Riepilogo dei messaggi scartati dall'ultimo messaggio scritto (a fine operazione)
+        with self._lock:
+            suppressed, self.suppressed = self.suppressed, 0
+        if suppressed:
+            self.log.log(level, "%d messaggi soppressi per limite di frequenza", suppressed)
 
-# Formattazione dei log
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    def debug(self, msg: str, *args):
+        self.log_message(logging.DEBUG, msg, *args)
 
-# Handler per il file con rotazione
-file_handler = RotatingFileHandler(
-    LOG_FILE_PATH, maxBytes=5*1024*1024, backupCount=1
-)
-file_handler.setFormatter(formatter)
+    def info(self, msg: str, *args):
+        self.log_message(logging.INFO, msg, *args)
 
-# Handler per la console
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(formatter)
+    def warning(self, msg: str, *args):
+        self.log_message(logging.WARNING, msg, *args)
 
-# Aggiungo gli handler al logger
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+    def error(self, msg: str, *args):
+        self.log_message(logging.ERROR, msg, *args)
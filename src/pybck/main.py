@@ -0,0 +1,360 @@
+# Punto di ingresso della riga di comando (pybck = "pybck.main:main")
+# I moduli pesanti (psutil, motori di copia, scheduler) vengono importati solo dai comandi che li usano:
+# "pybck --help" e "pybck status" partono in poche decine di millisecondi
+
+"""
+pybck [--config config.json] [--log-level INFO] [--quiet] <comando>
+
+run       → validazione, pulizia dei backup falliti, backup, pulizia dei backup vecchi
+            (--skip-validate, --no-clean); scrive le metriche dell'esecuzione
+clean     → pulizia dei backup falliti e di quelli vecchi (--failed-only, --old-only)
+validate  → controlli preliminari con la latenza di ciascuno
+status    → snapshot nel catalogo, backup interrotti riprendibili, ultima esecuzione
+watch     → servizio che registra le cartelle modificate nel journal (change_journal) fino a SIGINT/SIGTERM
+export    → esporta uno snapshot (default: l'ultimo) in un tar.gz compresso in parallelo, su file o su
+            stdout con "-o -" (--threads, --level)
+restore   → ripristina uno snapshot in una cartella: tutto, una sorgente (--source D:), un glob
+            (--glob "D:/Progetti/*.docx") oppure un solo file (--file D:/cartella/file); --overwrite, --threads
+verify    → verifica uno snapshot (default: l'ultimo) contro le sorgenti, --mode quick (dimensione e data) o full
+            (contenuto); una verifica interrotta riprende dal checkpoint in cache/verify/<snapshot>.jsonl
+find      → versioni di un file in tutti gli snapshot, oppure dei file sotto un prefisso ("D:/Progetti/")
+            o che corrispondono a un glob ("D:/Progetti/*.docx"), dall'indice dei percorsi (--rebuild, --limit)
+
+Codici di uscita: 0 successo, 1 operazione fallita, 2 configurazione non valida
+"""
+
+import argparse
+import os
+import sys
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_CONFIG = 2
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="pybck", description="PyBck - backup di unità disco e cartelle utente")
+    parser.add_argument("--config", default="config.json", help="File di configurazione JSON (default: config.json)")
+    parser.add_argument("--log-level", choices=("DEBUG", "INFO", "WARNING", "ERROR"),
+                        help="Livello del log (default: log_level della configurazione)")
+    parser.add_argument("--quiet", action="store_true", help="Log solo su file, non sulla console")
+    commands = parser.add_subparsers(dest="command", metavar="<comando>")
+    commands.required = True
+
+    run = commands.add_parser("run", help="Esegue un backup completo del ciclo")
+    run.add_argument("--skip-validate", action="store_true", help="Salta i controlli preliminari")
+    run.add_argument("--no-clean", action="store_true", help="Non elimina i backup vecchi dopo il backup")
+    run.set_defaults(func=cmd_run)
+
+    clean = commands.add_parser("clean", help="Elimina i backup falliti e quelli oltre la conservazione")
+    only = clean.add_mutually_exclusive_group()
+    only.add_argument("--failed-only", action="store_true", help="Solo i backup interrotti")
+    only.add_argument("--old-only", action="store_true", help="Solo i backup oltre la conservazione")
+    clean.set_defaults(func=cmd_clean)
+
+    validate = commands.add_parser("validate", help="Esegue i controlli preliminari")
+    validate.set_defaults(func=cmd_validate)
+
+    status = commands.add_parser("status", help="Mostra gli snapshot e l'ultima esecuzione")
+    status.set_defaults(func=cmd_status)
+
+    watch = commands.add_parser("watch", help="Registra le cartelle modificate per il prossimo backup")
+    watch.set_defaults(func=cmd_watch)
+
+    export = commands.add_parser("export", help="Esporta uno snapshot in un archivio tar.gz")
+    export.add_argument("snapshot", nargs="?", help="Snapshot da esportare (default: il più recente)")
+    export.add_argument("-o", "--output", help="File di destinazione, \"-\" per stdout (default: <snapshot>.tar.gz)")
+    export.add_argument("--threads", type=int, default=0, help="Thread di compressione (default: numero di CPU)")
+    export.add_argument("--level", type=int, default=6, choices=range(0, 10), metavar="0-9",
+                        help="Livello di compressione gzip (default: 6)")
+    export.set_defaults(func=cmd_export)
+
+    restore = commands.add_parser("restore", help="Ripristina file da uno snapshot")
+    restore.add_argument("snapshot", help="Snapshot da cui ripristinare")
+    restore.add_argument("destination", help="Cartella di destinazione (per --file anche il percorso del file)")
+    selection = restore.add_mutually_exclusive_group()
+    selection.add_argument("--source", help="Solo questa sorgente, es. D: oppure C:/Documents")
+    selection.add_argument("--glob", help="Solo i file che corrispondono, es. \"D:/Progetti/*.docx\"")
+    selection.add_argument("--file", help="Un solo file, es. D:/Progetti/relazione.docx")
+    restore.add_argument("--overwrite", action="store_true", help="Sovrascrive i file diversi già presenti")
+    restore.add_argument("--threads", type=int, default=0, help="Thread di copia (default: copy_threads)")
+    restore.set_defaults(func=cmd_restore)
+
+    verify = commands.add_parser("verify", help="Verifica uno snapshot contro le sorgenti")
+    verify.add_argument("snapshot", nargs="?", help="Snapshot da verificare (default: il più recente)")
+    verify.add_argument("--mode", choices=("quick", "full"), default="quick",
+                        help="quick: dimensione e data, full: contenuto (default: quick)")
+    verify.add_argument("--threads", type=int, default=4, help="Thread di verifica (default: 4)")
+    verify.set_defaults(func=cmd_verify)
+
+    find = commands.add_parser("find", help="Cerca le versioni di un file negli snapshot")
+    find.add_argument("path", help="File (D:/Progetti/a.docx), prefisso con \"/\" finale oppure glob (D:/Progetti/*.docx)")
+    find.add_argument("--limit", type=int, default=100, help="Numero massimo di versioni (default: 100)")
+    find.add_argument("--rebuild", action="store_true", help="Ricostruisce l'indice dai manifest degli snapshot")
+    find.set_defaults(func=cmd_find)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+
+    from pybck.BackupConfig import BackupConfig
+    try:
+        config = BackupConfig.load(args.config)
+    except (OSError, ValueError, TypeError) as e:
+        print(f"Configurazione non valida ({args.config}): {e}", file=sys.stderr)
+        return EXIT_CONFIG
+
+    # status legge solo file locali: il log su file non serve
+    if args.command != "status":
+        from pybck import setup_logging
+        setup_logging(args.log_level or config.log_level, console=not args.quiet)
+    return args.func(config, args)
+
+
+def cmd_run(config, args) -> int:
+    from pybck.BackupMetrics import BackupMetrics
+    from pybck.BackupBuilder import BackupBuilder
+    from pybck.BackupCleaner import BackupCleaner
+
+    # Un solo record di metriche per validazione, backup e pulizia
+    metrics = BackupMetrics()
+    try:
+        if not args.skip_validate:
+            from pybck.BackupValidator import BackupValidator
+            validator = BackupValidator(config, metrics)
+            if not validator.can_perform_backup():
+                print(f"Backup non eseguito: {validator.error}", file=sys.stderr)
+                return EXIT_FAILED
+
+        cleaner = BackupCleaner(config, metrics=metrics)
+        cleaner.clean_failed_backups()
+
+        builder = BackupBuilder(config, metrics=metrics)
+        metrics.run_id = builder.timestamp
+        builder.execute_backup()
+        if not builder.executed or builder.error:
+            print(f"Backup fallito: {builder.error}", file=sys.stderr)
+            return EXIT_FAILED
+
+        if not args.no_clean:
+            cleaner.clean_old_backups()
+        cleaner.wait_reclaim()
+        if cleaner.error:
+            print(f"Backup {builder.timestamp} eseguito, pulizia fallita: {cleaner.error}", file=sys.stderr)
+            return EXIT_FAILED
+
+        metrics.success = True
+        print(f"Backup {builder.timestamp} eseguito con successo.")
+        return EXIT_OK
+    finally:
+        metrics.export(config)
+
+
+def cmd_clean(config, args) -> int:
+    from pybck.BackupCleaner import BackupCleaner
+
+    cleaner = BackupCleaner(config)
+    if not args.old_only:
+        cleaner.clean_failed_backups()
+    if not args.failed_only and cleaner.error is None:
+        cleaner.clean_old_backups()
+    cleaner.wait_reclaim()
+    if cleaner.error:
+        print(cleaner.error, file=sys.stderr)
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+def cmd_validate(config, args) -> int:
+    from pybck.BackupValidator import BackupValidator
+
+    validator = BackupValidator(config)
+    ok = validator.can_perform_backup()
+    for check in validator.report.checks:
+        outcome = "ok" if check.ok else ("timeout" if check.timed_out else ("saltato" if check.skipped else "fallito"))
+        print(f"{check.name:<24} {outcome:<8} {check.latency * 1000:>8.0f} ms" + (f"  {check.error}" if check.error else ""))
+    if validator.space_plan is not None:
+        print(f"Spazio: {validator.space_plan.describe()}")
+    if not ok:
+        print(f"Backup non possibile: {validator.error}", file=sys.stderr)
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+def cmd_status(config, args) -> int:
+    from pybck.BackupCatalog import BackupCatalog
+    from pybck.BackupJournal import resumable_backups
+
+    backup_base_path = config.backup_path()
+    if not os.path.isdir(backup_base_path):
+        print(f"Cartella di backup non raggiungibile: {backup_base_path}")
+    else:
+        # Il catalogo non viene ricostruito: se manca lo farà il prossimo backup o la pulizia
+        catalog = BackupCatalog(backup_base_path)
+        if not catalog.exists():
+            print("Catalogo degli snapshot assente: verrà ricostruito al prossimo backup o pulizia.")
+        else:
+            names = catalog.list()
+            print(f"Snapshot: {len(names)}")
+            for name in names:
+                entry = catalog.get(name)
+                on_disk = f"  {entry.unique_bytes / 1024**3:.2f} GB sul disco" if entry.unique_bytes is not None else ""
+                print(f"  {name}  {entry.status:<9} {entry.size / 1024**3:>9.2f} GB {entry.files:>10} file{on_disk}")
+        for name in resumable_backups(backup_base_path, config):
+            print(f"Backup interrotto riprendibile: {name}")
+
+    record = last_run_record(config)
+    if record is not None:
+        outcome = "riuscita" if record.get("success") else "fallita"
+        print(f"Ultima esecuzione: {record.get('run_id')} {outcome}, durata {record.get('duration', 0):.1f}s")
+    return EXIT_OK
+
+
+def cmd_watch(config, args) -> int:
+    import signal
+    import threading
+    from pybck.ChangeWatcher import ChangeWatcher
+
+    if not config.change_journal:
+        print("change_journal non è attivo: i backup non useranno il journal delle modifiche.", file=sys.stderr)
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+    try:
+        ChangeWatcher(config).run(stop)
+    except (OSError, ValueError) as e:
+        print(f"Monitoraggio non disponibile: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+def cmd_export(config, args) -> int:
+    from pybck.BackupCatalog import BackupCatalog
+    from pybck.SnapshotExporter import SnapshotExporter
+
+    name = args.snapshot
+    if name is None:
+        names = BackupCatalog(config.backup_path()).list()
+        if not names:
+            print("Nessuno snapshot da esportare.", file=sys.stderr)
+            return EXIT_FAILED
+        name = names[0]
+    exporter = SnapshotExporter(config, threads=args.threads, level=args.level)
+    output = args.output or f"{name}.tar.gz"
+    try:
+        if output == "-":
+            stats = exporter.export(name, sys.stdout.buffer)
+        else:
+            stats = exporter.export(name, output)
+    except (OSError, ValueError) as e:
+        print(f"Esportazione fallita: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    # Su stdout c'è l'archivio: il riepilogo va su stderr
+    print(f"Snapshot {name} esportato: {stats.members} elementi, {stats.bytes_out / 1024**2:.1f} MB, "
+          f"{stats.throughput_mb_s:.1f} MB/s", file=sys.stderr if output == "-" else sys.stdout)
+    return EXIT_OK
+
+
+def cmd_restore(config, args) -> int:
+    from pybck.BackupRestorer import BackupRestorer
+
+    restorer = BackupRestorer(config, threads=args.threads, overwrite=args.overwrite)
+    try:
+        if args.file is not None:
+            target = restorer.restore_file(args.snapshot, args.file, args.destination)
+            print(f"Ripristinato {args.file} in {target}")
+            return EXIT_OK
+        stats = restorer.restore(args.snapshot, args.destination, source=args.source, pattern=args.glob)
+    except (OSError, ValueError) as e:
+        print(f"Ripristino fallito: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    finally:
+        restorer.close()
+    print(f"Snapshot {args.snapshot} ripristinato: {stats.files_copied} file, {stats.bytes_copied / 1024**2:.1f} MB, "
+          f"{stats.files_skipped} già presenti, {len(stats.errors)} errori")
+    for error in stats.errors[:10]:
+        print(f"  {error}", file=sys.stderr)
+    return EXIT_FAILED if stats.errors else EXIT_OK
+
+
+def cmd_verify(config, args) -> int:
+    from pybck.BackupCatalog import BackupCatalog
+    from pybck.BackupVerifier import BackupVerifier
+
+    catalog = BackupCatalog(config.backup_path())
+    name = args.snapshot
+    if name is None:
+        names = catalog.list()
+        if not names:
+            print("Nessuno snapshot da verificare.", file=sys.stderr)
+            return EXIT_FAILED
+        name = names[0]
+    if not os.path.isdir(config.backup_path(name)):
+        print(f"Snapshot non trovato: {name}", file=sys.stderr)
+        return EXIT_FAILED
+    entry = catalog.get(name)
+    if entry is not None and entry.storage_mode != "mirror":
+        print(f"Verifica non disponibile in modalità {entry.storage_mode}.", file=sys.stderr)
+        return EXIT_FAILED
+
+    report = BackupVerifier(config, threads=args.threads).verify_snapshot(name, args.mode)
+    print(f"Verifica {report.mode} di {name}: {report.files_checked} file, {report.bytes_checked / 1024**2:.1f} MB, "
+          f"{report.files_resumed} già verificati, {report.mismatch_count} non corrispondenti, "
+          f"{report.throughput_mb_s:.1f} MB/s")
+    for mismatch in report.mismatches[:10]:
+        print(f"  {mismatch}", file=sys.stderr)
+    return EXIT_OK if report.ok else EXIT_FAILED
+
+
+def cmd_find(config, args) -> int:
+    from datetime import datetime
+    from pybck.BackupCatalog import BackupCatalog
+    from pybck.PathIndex import PathIndex, INDEX_NAME, WILDCARDS
+
+    if not os.path.isdir(config.backup_path()):
+        print(f"Cartella di backup non trovata: {config.backup_path()}", file=sys.stderr)
+        return EXIT_FAILED
+    rebuild = args.rebuild or not os.path.isfile(config.backup_path(INDEX_NAME))
+    with PathIndex(config.backup_path()) as index:
+        if rebuild:
+            index.rebuild(BackupCatalog(config.backup_path()).list())
+        path = args.path.replace("\\", "/")
+        if WILDCARDS.search(path) or path.endswith("/"):
+            if WILDCARDS.search(path):
+                found = index.search(pattern=path, limit=args.limit)
+            else:
+                found = index.search(prefix=path, limit=args.limit)
+            for version in found:
+                snapshots = version.first if version.first == version.last else f"{version.first} → {version.last}"
+                print(f"{version.path}  {snapshots}  {version.size} byte  "
+                      f"{datetime.fromtimestamp(version.mtime_ns / 10**9):%Y-%m-%d %H:%M:%S}")
+        else:
+            found = index.versions(path)
+            for entry in found[:args.limit]:
+                print(f"{entry.snapshot}  {entry.size} byte  {datetime.fromtimestamp(entry.mtime_ns / 10**9):%Y-%m-%d %H:%M:%S}")
+    if not found:
+        print(f"Nessuna versione di {args.path} negli snapshot.", file=sys.stderr)
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+def last_run_record(config):
+    # Ultima riga di pybck_runs.jsonl senza leggere l'intero file
+    if not config.metrics_dir:
+        return None
+    import json
+    from pybck.BackupMetrics import RUNS_NAME
+    path = os.path.join(config.metrics_dir, RUNS_NAME)
+    try:
+        with open(path, "rb") as file:
+            file.seek(0, os.SEEK_END)
+            file.seek(max(0, file.tell() - 64 * 1024))
+            lines = file.read().splitlines()
+        return json.loads(lines[-1]) if lines else None
+    except (OSError, ValueError):
+        return None
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,6 +5,12 @@ import logging
 logger = logging.getLogger("PyBck")
 logger.setLevel(logging.DEBUG) 
 
+import io
+import os
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 from unittest.mock import Mock, patch 
 from datetime import datetime
@@ -14,6 +20,58 @@ from pybck.BackupConfig import BackupConfig
 from pybck.BackupBuilder import BackupBuilder
 
 
+def _robocopy_process(returncode, output=""):
+    # Processo finto: robocopy scrive l'output su stdout, letto riga per riga
+    process = Mock()
+    process.stdout = io.StringIO(output)
+    process.wait.return_value = returncode
+    return process
+
+class QueueBackend:
+    # Backend di monitoraggio finto: gli eventi li aggiunge il test in queue
+    def __init__(self):
+        self.queue = []
+
+    def add_tree(self, root):
+        return True
+
+    def read(self, timeout):
+        if self.queue:
+            return [self.queue.pop(0)]
+        time.sleep(timeout)
+        return []
+
+    def close(self):
+        pass
+
+
+@contextmanager
+def _watching(config, backend):
+    # ChangeWatcher reale in un thread: scrive la sessione e conferma i mark del builder
+    from pybck.ChangeWatcher import ChangeWatcher
+    stop = threading.Event()
+    watcher = ChangeWatcher(config, backend=backend, flush_interval=0.05)
+    thread = threading.Thread(target=watcher.run, args=(stop,))
+    thread.start()
+    try:
+        while not any(journal.exists() for journal in watcher.journals.values()):
+            time.sleep(0.01)
+        yield watcher
+    finally:
+        stop.set()
+        thread.join()
+
+POPEN_KWARGS = dict(
+    stdout=subprocess.PIPE,
+    stderr=subprocess.STDOUT,
+    text=True,
+    shell=False,
+    encoding='utf-8',
+    errors='ignore',
+    bufsize=1
+)
+
+
 def test_create_temp_backup_folder():
     config = BackupConfig(
         backup_drive="G:",
@@ -104,22 +162,14 @@ def test_copy_drive_success():
     source_drive = "D:"
     dest_folder = f"...{backup_builder.timestamp}..."
 
-    with patch("pybck.BackupBuilder.subprocess.run") as mock_run:
-        mock_result = Mock()
-        mock_result.returncode = 1
-        mock_result.stdout = "Successo"
-        mock_result.stderr = ""
-        mock_run.return_value = mock_result
+    with patch("pybck.RobocopyRunner.subprocess.Popen") as mock_popen:
+        mock_popen.return_value = _robocopy_process(1, "Successo\n")
         
         backup_builder._copy_drive(source_drive, dest_folder)
         
-        mock_run.assert_called_once_with(
-            ["robocopy", f"{source_drive}\\", dest_folder, "/MIR", "/R:3", "/W:5", "/NP", "/NJH", "/NJS"],
-            capture_output=True,
-            text=True,
-            shell=False,
-            encoding='utf-8',
-            errors='ignore'
+        mock_popen.assert_called_once_with(
+            ["robocopy", f"{source_drive}\\", dest_folder, "/MIR", "/R:3", "/W:5", "/NP", "/NJH", "/NJS", "/BYTES"],
+            **POPEN_KWARGS
         )  
         
 def test_copy_drive_warning(caplog):
@@ -138,25 +188,20 @@ def test_copy_drive_warning(caplog):
     source_drive = "D:"
     dest_folder = f"{config.backup_drive}\\{config.backup_root}\\.tmp_backup_{backup_builder.timestamp}\\Disco_D_Backup_{backup_builder.timestamp}"
 
-    with patch("pybck.BackupBuilder.subprocess") as mock_subprocess:
-        mock_subprocess.run.return_value.returncode = 2
-        mock_subprocess.run.return_value.stdout = "Warning"
-        mock_subprocess.run.return_value.stderr = "Warning details"
+    with patch("pybck.RobocopyRunner.subprocess.Popen") as mock_popen:
+        mock_popen.return_value = _robocopy_process(2, "Warning\nWarning details\n")
         
         with caplog.at_level(logging.WARNING):
             backup_builder._copy_drive(source_drive, dest_folder)
 
-        # verifica subprocess.run chiamato correttamente
-        mock_subprocess.run.assert_called_once_with(
+        # verifica Popen chiamato correttamente
+        mock_popen.assert_called_once_with(
             ["robocopy", f"{source_drive}\\", dest_folder,
             "/MIR",                   # Mirror
             "/R:3", "/W:5",           # Retry/Wait  
-            "/NP", "/NJH", "/NJS"],
-            capture_output=True,
-            text=True,
-            shell=False,
-            encoding='utf-8',
-            errors='ignore'  
+            "/NP", "/NJH", "/NJS",
+            "/BYTES"],
+            **POPEN_KWARGS
         )  
         
         assert "Robocopy warnings" in caplog.text  
@@ -177,26 +222,21 @@ def test_copy_drive_error(caplog):
     source_drive = "D:"
     dest_folder = f"{config.backup_drive}\\{config.backup_root}\\.tmp_backup_{backup_builder.timestamp}\\Disco_D_Backup_{backup_builder.timestamp}"
 
-    with patch("pybck.BackupBuilder.subprocess") as mock_subprocess:
-        mock_subprocess.run.return_value.returncode = 8
-        mock_subprocess.run.return_value.stdout = "Error"
-        mock_subprocess.run.return_value.stderr = "Error details"
+    with patch("pybck.RobocopyRunner.subprocess.Popen") as mock_popen:
+        mock_popen.return_value = _robocopy_process(8, "Error\nError details\n")
         
         # Verifica che venga alzata un’eccezione
         with pytest.raises(Exception, match="Robocopy failed"):
             backup_builder._copy_drive(source_drive, dest_folder)
 
-        # verifica subprocess.run chiamato correttamente
-        mock_subprocess.run.assert_called_once_with(
+        # verifica Popen chiamato correttamente
+        mock_popen.assert_called_once_with(
             ["robocopy", f"{source_drive}\\", dest_folder,
             "/MIR",                   # Mirror
             "/R:3", "/W:5",           # Retry/Wait  
-            "/NP", "/NJH", "/NJS"],
-            capture_output=True,
-            text=True,
-            shell=False,
-            encoding='utf-8',
-            errors='ignore'  
+            "/NP", "/NJH", "/NJS",
+            "/BYTES"],
+            **POPEN_KWARGS
         )   
         
 def test_execute_backup_success():
@@ -215,7 +255,7 @@ def test_execute_backup_success():
     fixed_time = datetime(2024, 1, 1, 10, 0, 0)
     
     with patch("pybck.BackupBuilder.datetime") as mock_datetime, \
-        patch("pybck.BackupBuilder.subprocess.run") as mock_run, \
+        patch("pybck.RobocopyRunner.subprocess.Popen") as mock_run, \
         patch.object(Path, 'mkdir') as mock_mkdir, \
         patch.object(Path, 'rename') as mock_rename:
         
@@ -225,12 +265,8 @@ def test_execute_backup_success():
         # Crea builder con timestamp fisso
         builder = BackupBuilder(config)
         
-        # Mock per subprocess.run (robocopy successo)
-        mock_result = Mock()
-        mock_result.returncode = 1  # Robocopy successo
-        mock_result.stdout = ""
-        mock_result.stderr = ""
-        mock_run.return_value = mock_result
+        # Mock per subprocess.Popen (robocopy successo), un processo nuovo per ogni chiamata
+        mock_run.side_effect = lambda *args, **kwargs: _robocopy_process(1)  # Robocopy successo
         
         # Esegui il backup
         builder.execute_backup()
@@ -275,7 +311,7 @@ def test_execute_backup_failure():
     fixed_time = datetime(2024, 1, 1, 10, 0, 0)
     
     with patch("pybck.BackupBuilder.datetime") as mock_datetime, \
-        patch("pybck.BackupBuilder.subprocess.run") as mock_run, \
+        patch("pybck.RobocopyRunner.subprocess.Popen") as mock_run, \
         patch.object(Path, 'mkdir') as mock_mkdir, \
         patch.object(Path, 'rename') as mock_rename:
         
@@ -283,11 +319,7 @@ def test_execute_backup_failure():
         builder = BackupBuilder(config)
         
         # Mock robocopy che FALLISCE (errore grave)
-        mock_result = Mock()
-        mock_result.returncode = 8  # Errore grave robocopy
-        mock_result.stdout = ""
-        mock_result.stderr = "Accesso negato"
-        mock_run.return_value = mock_result
+        mock_run.return_value = _robocopy_process(8, "Accesso negato\n")  # Errore grave robocopy
         
         # Esegui - dovrebbe fallire
         builder.execute_backup()
@@ -307,4 +339,293 @@ def test_execute_backup_failure():
         assert mock_mkdir.call_count >= 1, "mkdir dovrebbe essere chiamato per creare .tmp_backup_"
         
         # IMPORTANTE: .tmp_backup_* NON eliminato - rimane per il Cleaner!
-        # Questo è testato verificando che rename() non sia chiamato
\ No newline at end of file
+        # Questo è testato verificando che rename() non sia chiamato
+
+def test_execute_backup_resumes_interrupted(tmp_path, monkeypatch):
+    """Un backup interrotto viene ripreso: le sorgenti già completate non vengono ricopiate"""
+    monkeypatch.chdir(tmp_path)  # Cache della stima delle sorgenti per robocopy
+    config = BackupConfig(
+        backup_drive="G:",
+        backup_root="BackupPC",
+        source_drives=["D:", "E:"],
+        user_folders=["Documents"],
+        keep_last_n=7
+    )
+    
+    def fake_load(journal):
+        journal.header = {"timestamp": "2024-01-01_09-00-00"}
+        journal.done = {"D:"}
+        return journal.header
+    
+    with patch("pybck.BackupBuilder.resumable_backups", return_value=[".tmp_backup_2024-01-01_09-00-00"]), \
+        patch("pybck.BackupBuilder.BackupJournal.load", autospec=True, side_effect=fake_load), \
+        patch("pybck.RobocopyRunner.subprocess.Popen") as mock_run, \
+        patch.object(Path, 'mkdir'), \
+        patch.object(Path, 'rename') as mock_rename:
+        
+        mock_run.side_effect = lambda *args, **kwargs: _robocopy_process(1)
+        builder = BackupBuilder(config)
+        builder.execute_backup()
+        
+        assert builder.executed == True
+        assert builder.resumed == True
+        assert builder.timestamp == "2024-01-01_09-00-00"
+        # Solo E: viene copiato, D: era già completo
+        mock_run.assert_called_once()
+        assert mock_run.call_args[0][0][1] == "E:\\"
+        assert mock_rename.call_args[0][0] == "G:\\BackupPC\\2024-01-01_09-00-00"
+
+def test_execute_backup_writes_metrics(tmp_path):
+    """Il record dell'esecuzione contiene i tempi delle fasi e i contatori della copia"""
+    source = tmp_path / "D"
+    (source / "sub").mkdir(parents=True)
+    (source / "a.txt").write_bytes(b"a" * 100)
+    (source / "sub" / "b.txt").write_bytes(b"b" * 50)
+    (tmp_path / "G").mkdir()
+    
+    config = BackupConfig(
+        backup_drive="G:",
+        backup_root="BackupPC",
+        source_drives=["D:"],
+        user_folders=["Documents"],
+        keep_last_n=7,
+        copy_engine="native",
+        drive_map={"D:": str(source), "G:": str(tmp_path / "G")},
+        metrics_dir=str(tmp_path / "metrics")
+    )
+    
+    builder = BackupBuilder(config)
+    builder.execute_backup()
+    assert builder.executed == True
+    
+    import json
+    with open(tmp_path / "metrics" / "pybck_runs.jsonl", encoding="utf-8") as file:
+        record = json.loads(file.readline())
+    assert record["success"] == True
+    assert record["counters"]["bytes_copied"] == 150
+    assert record["counters"]["files_copied"] == 2
+    phases = {span["name"] for span in record["spans"]}
+    assert {"backup", "prepare", "copy", "manifest", "finalize"} <= phases
+    assert 'pybck_phase_duration_seconds{phase="copy",source="D:"}' in (tmp_path / "metrics" / "pybck.prom").read_text(encoding="utf-8")
+
+def test_execute_backup_uses_change_journal(tmp_path):
+    """Con un journal valido il secondo backup rilegge solo le cartelle modificate"""
+    import json
+    from pybck.ChangeJournal import ChangeJournal
+    source = tmp_path / "D"
+    (source / "clean").mkdir(parents=True)
+    (source / "dirty").mkdir()
+    (source / "clean" / "a.txt").write_bytes(b"a" * 100)
+    (source / "dirty" / "b.txt").write_bytes(b"b" * 50)
+    (tmp_path / "G").mkdir()
+    
+    config = BackupConfig(
+        backup_drive="G:",
+        backup_root="BackupPC",
+        source_drives=["D:"],
+        user_folders=["Documents"],
+        keep_last_n=7,
+        copy_engine="native",
+        incremental=True,
+        change_journal=True,
+        change_journal_dir=str(tmp_path / "changes"),
+        drive_map={"D:": str(source), "G:": str(tmp_path / "G")},
+        metrics_dir=""
+    )
+    journal = ChangeJournal(str(source), config.change_journal_dir)
+    backend = QueueBackend()
+    with _watching(config, backend):
+        first = BackupBuilder(config)
+        first.timestamp = "2024-01-01_09-00-00"
+        first.execute_backup()
+        assert first.executed == True
+        
+        # L'evento è ancora nella coda del backend: il builder attende che il watcher lo scriva
+        (source / "dirty" / "b.txt").write_bytes(b"nuovo")
+        backend.queue.append((str(source / "dirty"), False))
+        second = BackupBuilder(config)
+        second.timestamp = "2024-01-01_10-00-00"
+        second.execute_backup()
+    
+    assert second.executed == True
+    assert second.metrics.counters["change_journal_dirs"] == 1
+    snapshot = tmp_path / "G" / "BackupPC" / "2024-01-01_10-00-00" / "Disco_D_Backup_2024-01-01_10-00-00"
+    previous = tmp_path / "G" / "BackupPC" / "2024-01-01_09-00-00" / "Disco_D_Backup_2024-01-01_09-00-00"
+    assert (snapshot / "dirty" / "b.txt").read_bytes() == b"nuovo"
+    assert os.stat(snapshot / "clean" / "a.txt").st_ino == os.stat(previous / "clean" / "a.txt").st_ino
+    with open(journal.path, encoding="utf-8") as file:
+        marks = [json.loads(line).get("mark") for line in file]
+    assert marks.count("2024-01-01_10-00-00") == 1
+
+def test_change_journal_full_scan_when_filters_change(tmp_path):
+    """Un filtro allentato fa rileggere tutta la sorgente: i file prima esclusi entrano nel backup"""
+    source = tmp_path / "D"
+    (source / "clean").mkdir(parents=True)
+    (source / "clean" / "a.txt").write_bytes(b"a")
+    (source / "clean" / "b.log").write_bytes(b"b")
+    (tmp_path / "G").mkdir()
+    
+    def make_config(filters):
+        return BackupConfig(
+            backup_drive="G:",
+            backup_root="BackupPC",
+            source_drives=["D:"],
+            user_folders=["Documents"],
+            keep_last_n=7,
+            copy_engine="native",
+            incremental=True,
+            change_journal=True,
+            change_journal_dir=str(tmp_path / "changes"),
+            filters=filters,
+            drive_map={"D:": str(source), "G:": str(tmp_path / "G")},
+            metrics_dir=""
+        )
+    with _watching(make_config({}), QueueBackend()):
+        first = BackupBuilder(make_config({"D:": {"exclude": ["*.log"]}}))
+        first.timestamp = "2024-01-01_09-00-00"
+        first.execute_backup()
+        assert first.executed == True
+        
+        # Nessuna cartella modificata, ma *.log non è più escluso
+        second = BackupBuilder(make_config({}))
+        second.timestamp = "2024-01-01_10-00-00"
+        second.execute_backup()
+    
+    assert second.executed == True
+    assert "change_journal_dirs" not in second.metrics.counters
+    assert "change_journal_fallbacks" in second.metrics.counters
+    snapshot = tmp_path / "G" / "BackupPC" / "2024-01-01_10-00-00" / "Disco_D_Backup_2024-01-01_10-00-00"
+    assert (snapshot / "clean" / "b.log").read_bytes() == b"b"
+
+
+def test_execute_backup_compressed_storage(tmp_path):
+    """In modalità compressa lo snapshot contiene i file compressi e le metriche il rapporto di compressione"""
+    import json
+    source = tmp_path / "D"
+    source.mkdir()
+    (source / "server.log").write_bytes(b"riga di log ripetuta\n" * 5000)
+    (source / "foto.jpg").write_bytes(b"x" * 5000)
+    (tmp_path / "G").mkdir()
+    
+    config = BackupConfig(
+        backup_drive="G:",
+        backup_root="BackupPC",
+        source_drives=["D:"],
+        user_folders=["Documents"],
+        keep_last_n=7,
+        storage_mode="compressed",
+        compression_processes=1,
+        drive_map={"D:": str(source), "G:": str(tmp_path / "G")},
+        metrics_dir=str(tmp_path / "metrics")
+    )
+    
+    builder = BackupBuilder(config)
+    builder.execute_backup()
+    assert builder.executed == True
+    
+    snapshot = tmp_path / "G" / "BackupPC" / builder.timestamp / f"Disco_D_Backup_{builder.timestamp}"
+    assert (snapshot / "server.log.pybckz").exists()
+    assert (snapshot / "foto.jpg").read_bytes() == b"x" * 5000
+    with open(tmp_path / "metrics" / "pybck_runs.jsonl", encoding="utf-8") as file:
+        counters = json.loads(file.readline())["counters"]
+    assert counters["files_compressed"] == 1
+    assert counters["files_incompressible"] == 1
+    assert counters["compression_bytes_in"] == 110000
+    assert counters["compression_bytes_out"] < 15000
+
+def test_execute_backup_dedup_storage(tmp_path):
+    """In modalità dedup lo snapshot contiene solo la ricetta, anche con il motore nativo"""
+    from pybck.ChunkStore import RECIPE_NAME, STORE_NAME, read_recipe
+    source = tmp_path / "D"
+    source.mkdir()
+    (source / "a.txt").write_bytes(b"contenuto deduplicato")
+    (tmp_path / "G").mkdir()
+    
+    config = BackupConfig(
+        backup_drive="G:",
+        backup_root="BackupPC",
+        source_drives=["D:"],
+        user_folders=["Documents"],
+        keep_last_n=7,
+        storage_mode="dedup",
+        copy_engine="native",
+        drive_map={"D:": str(source), "G:": str(tmp_path / "G")},
+        metrics_dir=""
+    )
+    
+    builder = BackupBuilder(config)
+    builder.execute_backup()
+    assert builder.executed == True
+    
+    snapshot = tmp_path / "G" / "BackupPC" / builder.timestamp / f"Disco_D_Backup_{builder.timestamp}"
+    assert not (snapshot / "a.txt").exists()
+    assert [entry["path"] for entry in read_recipe(str(snapshot / RECIPE_NAME))] == ["a.txt"]
+    assert (tmp_path / "G" / "BackupPC" / STORE_NAME).is_dir()
+
+def test_execute_backup_records_unique_bytes_without_walk(tmp_path, monkeypatch):
+    """Alla finalizzazione lo spazio occupato viene dai contatori della copia, non da una visita dello snapshot"""
+    from pybck import BackupCatalog as catalog_module
+    from pybck.BackupCatalog import BackupCatalog
+    source = tmp_path / "D"
+    source.mkdir()
+    (source / "grande.bin").write_bytes(b"g" * 100000)
+    (tmp_path / "G").mkdir()
+    
+    config = BackupConfig(
+        backup_drive="G:",
+        backup_root="BackupPC",
+        source_drives=["D:"],
+        user_folders=["Documents"],
+        keep_last_n=7,
+        copy_engine="native",
+        incremental=True,
+        drive_map={"D:": str(source), "G:": str(tmp_path / "G")},
+        metrics_dir=""
+    )
+    
+    monkeypatch.setattr(catalog_module, "_measure", Mock(side_effect=AssertionError("visita dello snapshot")))
+    for hour in (8, 9):
+        (source / f"nuovo_{hour}.bin").write_bytes(b"n" * 1000)
+        builder = BackupBuilder(config)
+        builder.timestamp = f"2024-01-01_{hour:02d}-00-00"
+        builder.execute_backup()
+        assert builder.executed == True
+    monkeypatch.undo()
+    
+    catalog = BackupCatalog(config.backup_path())
+    recorded = {name: catalog.get(name).unique_bytes for name in catalog.list()}
+    # grande.bin è collegato con hard link: conta nel più recente, come nella misura completa
+    assert recorded["2024-01-01_09-00-00"] >= 102000
+    assert recorded["2024-01-01_08-00-00"] < 2000
+    assert recorded == {name: entry.unique_bytes for name, entry in catalog.rebuild().items()}
+
+def test_execute_backup_robocopy_progress_has_total(tmp_path, monkeypatch):
+    """Con robocopy il totale per l'ETA viene dalla stima delle sorgenti fatta prima della copia"""
+    monkeypatch.chdir(tmp_path)  # Cache della scansione
+    source = tmp_path / "D"
+    source.mkdir()
+    (source / "a.bin").write_bytes(b"a" * 100)
+    (source / "b.bin").write_bytes(b"b" * 200)
+    (tmp_path / "G").mkdir()
+    
+    config = BackupConfig(
+        backup_drive="G:",
+        backup_root="BackupPC",
+        source_drives=["D:"],
+        user_folders=["Documents"],
+        keep_last_n=7,
+        drive_map={"D:": str(source), "G:": str(tmp_path / "G")},
+        metrics_dir=""
+    )
+    
+    events = []
+    builder = BackupBuilder(config, progress_callback=events.append)
+    with patch("pybck.RobocopyRunner.subprocess.Popen") as mock_popen:
+        mock_popen.return_value = _robocopy_process(1, "\t    New File  \t\t     100\ta.bin\n")
+        builder.execute_backup()
+    
+    assert builder.executed == True
+    finished = [event for event in events if event.finished]
+    assert finished[0].bytes_done == 100
+    # 200 byte su 300 ancora da copiare: senza totale l'ETA sarebbe None
+    assert finished[0].eta_s is not None and finished[0].eta_s > 0
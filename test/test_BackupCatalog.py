@@ -0,0 +1,157 @@
+import pytest
+import os
+
+# Importa la tua classe da testare
+from pybck.BackupCatalog import BackupCatalog, CatalogEntry, CATALOG_NAME
+from pybck.BackupManifest import BackupManifest, ManifestEntry, MANIFEST_NAME
+
+
+def test_add_remove_and_reload(tmp_path):
+    catalog = BackupCatalog(str(tmp_path))
+    catalog.add(CatalogEntry("2024-01-20_10-00-00", size=100, files=2, duration=1.5))
+    catalog.add(CatalogEntry("2024-01-22_10-00-00", size=300, files=4))
+    catalog.add(CatalogEntry("2024-01-21_10-00-00", size=200))
+    catalog.remove("2024-01-20_10-00-00")
+
+    reloaded = BackupCatalog(str(tmp_path))
+    assert reloaded.list() == ["2024-01-22_10-00-00", "2024-01-21_10-00-00"]
+    assert reloaded.get("2024-01-22_10-00-00").files == 4
+    assert reloaded.get("2024-01-20_10-00-00") is None
+
+
+def test_last_record_wins(tmp_path):
+    catalog = BackupCatalog(str(tmp_path))
+    entry = CatalogEntry("2024-01-22_10-00-00", size=10)
+    catalog.add(entry)
+    entry.status = "verified"
+    catalog.add(entry)
+
+    assert BackupCatalog(str(tmp_path)).get("2024-01-22_10-00-00").status == "verified"
+
+
+def test_truncated_line_is_ignored_and_compacted(tmp_path):
+    catalog = BackupCatalog(str(tmp_path))
+    catalog.add(CatalogEntry("2024-01-22_10-00-00", size=10))
+    with open(tmp_path / CATALOG_NAME, "a", encoding="utf-8") as file:
+        file.write('{"op": "add", "name": "2024-01-23')  # Scrittura interrotta
+
+    reloaded = BackupCatalog(str(tmp_path))
+    assert reloaded.list() == ["2024-01-22_10-00-00"]
+    # Il file è stato riscritto: un'aggiunta successiva non si unisce alla riga troncata
+    reloaded.add(CatalogEntry("2024-01-24_10-00-00"))
+    assert BackupCatalog(str(tmp_path)).list() == ["2024-01-24_10-00-00", "2024-01-22_10-00-00"]
+
+
+def test_rebuild_from_tree(tmp_path):
+    os.makedirs(tmp_path / "2024-01-22_10-00-00")
+    os.makedirs(tmp_path / "2024-01-23_10-00-00")
+    os.makedirs(tmp_path / ".tmp_backup_2024-01-24_10-00-00")
+    BackupManifest.write(str(tmp_path / "2024-01-22_10-00-00" / MANIFEST_NAME),
+                         [ManifestEntry("a", 5, 0, 0o644), ManifestEntry("b", 7, 0, 0o644)])
+
+    entries = BackupCatalog(str(tmp_path)).rebuild()
+    assert sorted(entries) == ["2024-01-22_10-00-00", "2024-01-23_10-00-00"]
+    assert entries["2024-01-22_10-00-00"].size == 12
+    assert entries["2024-01-22_10-00-00"].files == 2
+    assert entries["2024-01-23_10-00-00"].size == 0
+    assert BackupCatalog(str(tmp_path)).list() == ["2024-01-23_10-00-00", "2024-01-22_10-00-00"]
+
+
+def test_reconcile_with_tree(tmp_path):
+    catalog = BackupCatalog(str(tmp_path))
+    for name in ("2024-01-21_10-00-00", "2024-01-22_10-00-00"):
+        os.makedirs(tmp_path / name)
+        catalog.add(CatalogEntry(name, size=1, unique_bytes=0))
+    # Snapshot finalizzato senza riga nel catalogo e snapshot cancellato a mano
+    os.makedirs(tmp_path / "2024-01-23_10-00-00")
+    (tmp_path / "2024-01-23_10-00-00" / "a.txt").write_bytes(b"a" * 9)
+    os.rmdir(tmp_path / "2024-01-21_10-00-00")
+
+    entries = BackupCatalog(str(tmp_path)).reconcile()
+
+    assert sorted(entries) == ["2024-01-22_10-00-00", "2024-01-23_10-00-00"]
+    # Lo snapshot aggiunto e quelli più vecchi vanno rimisurati
+    assert [entries[name].unique_bytes for name in sorted(entries)] == [None, None]
+    assert BackupCatalog(str(tmp_path)).list() == ["2024-01-23_10-00-00", "2024-01-22_10-00-00"]
+    catalog = BackupCatalog(str(tmp_path))
+    catalog.measure(catalog.list())
+    assert catalog.get("2024-01-23_10-00-00").unique_bytes == 9
+
+
+def test_remove_invalidates_older_snapshots(tmp_path):
+    catalog = BackupCatalog(str(tmp_path))
+    names = ["2024-01-21_10-00-00", "2024-01-22_10-00-00", "2024-01-23_10-00-00"]
+    for name in names:
+        catalog.add(CatalogEntry(name, unique_bytes=5))
+
+    # Il più vecchio non cambia l'attribuzione degli altri
+    catalog.remove(names[0])
+    assert [catalog.get(name).unique_bytes for name in names[1:]] == [5, 5]
+    # Uno intermedio sì: i file condivisi con i più vecchi ora contano in quelli
+    catalog.add(CatalogEntry(names[0], unique_bytes=5))
+    catalog.remove(names[1])
+    reloaded = BackupCatalog(str(tmp_path))
+    assert reloaded.list() == [names[2], names[0]]
+    assert reloaded.get(names[0]).unique_bytes is None
+    assert reloaded.get(names[2]).unique_bytes == 5
+
+
+def test_add_newest_moves_linked_bytes(tmp_path):
+    catalog = BackupCatalog(str(tmp_path))
+    catalog.add(CatalogEntry("2024-01-21_10-00-00", unique_bytes=100))
+    catalog.add(CatalogEntry("2024-01-22_10-00-00", unique_bytes=1000))
+
+    # 700 byte collegati con hard link: ora contano nel nuovo snapshot, che contiene tutti i suoi 1200
+    catalog.add_newest(CatalogEntry("2024-01-23_10-00-00", unique_bytes=1200), 700)
+    reloaded = BackupCatalog(str(tmp_path))
+    assert [reloaded.get(name).unique_bytes for name in reloaded.list()] == [1200, 300, 100]
+
+    # Attribuzione sconosciuta (es. modalità dedup): i precedenti vanno rimisurati
+    catalog.add_newest(CatalogEntry("2024-01-24_10-00-00"), None)
+    assert [catalog.get(name).unique_bytes for name in catalog.list()] == [None, None, None, None]
+
+
+def test_missing_root_is_not_created(tmp_path):
+    catalog = BackupCatalog(str(tmp_path / "assente"))
+    catalog.add(CatalogEntry("2024-01-22_10-00-00"))
+    assert not (tmp_path / "assente").exists()
+
+
+def test_unique_bytes_counts_shared_data_once(tmp_path):
+    old, new = tmp_path / "2024-01-22_10-00-00", tmp_path / "2024-01-23_10-00-00"
+    (old / "D").mkdir(parents=True)
+    (new / "D").mkdir(parents=True)
+    (old / "D" / "condiviso.bin").write_bytes(b"x" * 1000)
+    os.link(old / "D" / "condiviso.bin", new / "D" / "condiviso.bin")  # Hard link dello snapshot incrementale
+    (new / "D" / "nuovo.bin").write_bytes(b"y" * 300)
+
+    catalog = BackupCatalog(str(tmp_path))
+    # Senza gli snapshot più recenti contano solo i file non condivisi
+    assert catalog.entry_from_disk(str(new), new.name).unique_bytes == 300
+    # Ricostruendo dal più recente il file condiviso conta una sola volta, nel più recente
+    entries = catalog.rebuild()
+    assert entries[new.name].unique_bytes == 1300
+    assert entries[old.name].unique_bytes == 0
+    # Tra i soli snapshot indicati: senza il più recente il file conta nel più vecchio
+    assert catalog.occupancy([old.name]) == {old.name: 1000}
+    assert entries[old.name].size == 0  # Nessun manifest: dimensione logica sconosciuta
+
+
+def test_unique_bytes_of_dedup_snapshots(tmp_path):
+    from pybck.ChunkStore import ChunkStore, DedupEngine, STORE_NAME, RECIPE_NAME
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "a.bin").write_bytes(os.urandom(200 * 1024))
+    root = tmp_path / "root"
+    store = ChunkStore(str(root / STORE_NAME))
+    engine = DedupEngine(store)
+    engine.mirror(str(source), str(root / "2024-01-22_10-00-00" / "D"))
+    (source / "b.bin").write_bytes(os.urandom(100 * 1024))
+    engine.mirror(str(source), str(root / "2024-01-23_10-00-00" / "D"), link_dest=str(root / "2024-01-22_10-00-00" / "D"))
+    store.close()
+
+    recipe_bytes = [os.path.getsize(root / name / "D" / RECIPE_NAME) for name in ("2024-01-22_10-00-00", "2024-01-23_10-00-00")]
+    entries = BackupCatalog(str(root)).rebuild()
+    # Il più recente contiene i chunk di entrambi i file; al primo resta solo la sua ricetta
+    assert entries["2024-01-23_10-00-00"].unique_bytes == 300 * 1024 + recipe_bytes[1]
+    assert entries["2024-01-22_10-00-00"].unique_bytes == recipe_bytes[0]
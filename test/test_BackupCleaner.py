@@ -7,6 +7,8 @@ from unittest.mock import Mock
 # Importa la tua classe da testare
 from pybck.BackupCleaner import BackupCleaner
 from pybck.BackupConfig import BackupConfig
+from pybck.BackupManifest import BackupManifest, ManifestEntry, MANIFEST_NAME
+from pybck.BackupJournal import BackupJournal, journal_header
 
 
 def test_getListBackups_old():
@@ -16,6 +18,7 @@ def test_getListBackups_old():
         config = Mock()
         config.backup_drive = tmpdir  # Usa il temp dir
         config.backup_root = ""       # Niente sottocartella
+        config.drive_map = {}
         
         cleaner = BackupCleaner(config)
         
@@ -42,6 +45,7 @@ def test_getListBackups_failed():
         config = Mock()
         config.backup_drive = tmpdir  # Usa il temp dir
         config.backup_root = ""       # Niente sottocartella
+        config.drive_map = {}
         
         cleaner = BackupCleaner(config)
         
@@ -58,4 +62,195 @@ def test_getListBackups_failed():
         assert len(result) == 2
         assert ".tmp_backup_2024-01-22_10-30-45" in result
         assert ".tmp_backup_2025-01-22_10-30-45" in result
-        assert "10-30-45" not in result  # Pattern non matcha
\ No newline at end of file
+        assert "10-30-45" not in result  # Pattern non matcha
+
+def test_get_finalized_backups_sorted():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config = Mock()
+        config.backup_drive = tmpdir
+        config.backup_root = ""
+        config.drive_map = {}
+
+        cleaner = BackupCleaner(config)
+
+        os.makedirs(os.path.join(tmpdir, "2024-01-22_10-30-45"))
+        os.makedirs(os.path.join(tmpdir, "2025-01-22_10-30-45"))
+        os.makedirs(os.path.join(tmpdir, "2024-12-01_08-00-00"))
+        os.makedirs(os.path.join(tmpdir, ".tmp_backup_2026-01-01_00-00-00"))
+
+        # Dal più recente al più vecchio, esclusi i backup temporanei
+        assert cleaner.get_finalized_backups() == ["2025-01-22_10-30-45", "2024-12-01_08-00-00", "2024-01-22_10-30-45"]
+
+def test_get_finalized_backups_reconciles_catalog(tmp_path):
+    config = Mock()
+    config.backup_drive = str(tmp_path)
+    config.backup_root = ""
+    config.drive_map = {}
+    os.makedirs(tmp_path / "2024-01-22_10-30-45")
+    assert BackupCleaner(config).get_finalized_backups() == ["2024-01-22_10-30-45"]
+
+    # Il catalogo esiste ma non conosce lo snapshot finalizzato dopo (aggiornamento fallito)
+    os.makedirs(tmp_path / "2024-01-23_10-30-45")
+    assert BackupCleaner(config).get_finalized_backups() == ["2024-01-23_10-30-45", "2024-01-22_10-30-45"]
+
+    # Snapshot cancellato fuori da pybck: non resta nel catalogo
+    os.rmdir(tmp_path / "2024-01-22_10-30-45")
+    assert BackupCleaner(config).get_finalized_backups() == ["2024-01-23_10-30-45"]
+
+
+def test_clean_old_backups_uses_trash():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config = Mock()
+        config.backup_drive = tmpdir
+        config.backup_root = ""
+        config.drive_map = {}
+        config.keep_last_n = 1
+        config.keep_daily = config.keep_weekly = config.keep_monthly = config.keep_yearly = 0
+        config.max_backup_size_gb = 0
+        config.reclaim_threads = 2
+        config.reclaim_max_ops_per_s = 0
+        config.reclaim_in_background = True
+
+        for name in ("2024-01-22_10-30-45", "2025-01-22_10-30-45"):
+            os.makedirs(os.path.join(tmpdir, name, "Disco_D"))
+            Path(tmpdir, name, "Disco_D", "file.txt").write_text("dati")
+
+        cleaner = BackupCleaner(config)
+        cleaner.clean_old_backups()
+
+        # Il backup più vecchio è subito fuori dall'elenco, il cestino viene svuotato in background
+        assert cleaner.cleanedOld
+        assert cleaner.get_finalized_backups() == ["2025-01-22_10-30-45"]
+        assert cleaner.wait_reclaim(10)
+        assert os.listdir(os.path.join(tmpdir, ".pybck_trash")) == []
+
+
+def test_clean_old_backups_size_budget():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config = Mock()
+        config.backup_drive = tmpdir
+        config.backup_root = ""
+        config.drive_map = {}
+        config.keep_last_n = 0
+        config.keep_daily = config.keep_weekly = config.keep_monthly = config.keep_yearly = 0
+        config.max_backup_size_gb = 2.5
+        config.reclaim_threads = 1
+        config.reclaim_max_ops_per_s = 0
+        config.reclaim_in_background = False
+
+        # Tre snapshot con un file diverso da 1 GB (sparso): ne entrano solo due
+        names = ["2024-01-20_10-00-00", "2024-01-21_10-00-00", "2024-01-22_10-00-00"]
+        for name in names:
+            os.makedirs(os.path.join(tmpdir, name))
+            with open(os.path.join(tmpdir, name, "f.bin"), "wb") as file:
+                file.truncate(1024**3)
+            BackupManifest.write(os.path.join(tmpdir, name, MANIFEST_NAME), [ManifestEntry("f.bin", 1024**3, 0, 0o644)])
+
+        cleaner = BackupCleaner(config)
+        cleaner.clean_old_backups()
+
+        assert cleaner.cleanedOld
+        assert cleaner.get_finalized_backups() == ["2024-01-22_10-00-00", "2024-01-21_10-00-00"]
+
+
+def test_size_budget_counts_hard_links_once(tmp_path):
+    config = Mock()
+    config.backup_drive = str(tmp_path)
+    config.backup_root = ""
+    config.drive_map = {}
+    config.keep_last_n = 0
+    config.keep_daily = config.keep_weekly = config.keep_monthly = config.keep_yearly = 0
+    config.max_backup_size_gb = 2.5
+    config.reclaim_threads = 1
+    config.reclaim_max_ops_per_s = 0
+    config.reclaim_in_background = False
+
+    # Tre snapshot incrementali: lo stesso file da 1 GB collegato con hard link occupa 1 GB, non 3
+    names = ["2024-01-20_10-00-00", "2024-01-21_10-00-00", "2024-01-22_10-00-00"]
+    for name in names:
+        (tmp_path / name).mkdir()
+        if name == names[0]:
+            with open(tmp_path / name / "f.bin", "wb") as file:
+                file.truncate(1024**3)
+        else:
+            os.link(tmp_path / names[0] / "f.bin", tmp_path / name / "f.bin")
+        BackupManifest.write(str(tmp_path / name / MANIFEST_NAME), [ManifestEntry("f.bin", 1024**3, 0, 0o644)])
+
+    cleaner = BackupCleaner(config)
+    sizes = cleaner.snapshot_sizes(names)
+    cleaner.clean_old_backups()
+
+    # Il file condiviso conta nello snapshot più recente che lo contiene
+    assert sizes[names[2]] >= 1024**3 and sizes[names[1]] < 1024 and sizes[names[0]] < 1024
+    assert cleaner.get_finalized_backups() == names[::-1]
+    assert _disk_bytes(tmp_path) <= 2.5 * 1024**3
+
+
+def test_size_budget_holds_on_disk_bytes(tmp_path):
+    config = Mock()
+    config.backup_drive = str(tmp_path)
+    config.backup_root = ""
+    config.drive_map = {}
+    config.keep_last_n = 0
+    config.keep_daily = config.keep_weekly = config.keep_monthly = config.keep_yearly = 0
+    config.max_backup_size_gb = 1.5
+    config.reclaim_threads = 1
+    config.reclaim_max_ops_per_s = 0
+    config.reclaim_in_background = False
+
+    # Ogni snapshot: 1 GB condiviso con hard link più 0,4 GB propri
+    names = ["2024-01-20_10-00-00", "2024-01-21_10-00-00", "2024-01-22_10-00-00"]
+    for name in names:
+        (tmp_path / name).mkdir()
+        if name == names[0]:
+            with open(tmp_path / name / "shared.bin", "wb") as file:
+                file.truncate(1024**3)
+        else:
+            os.link(tmp_path / names[0] / "shared.bin", tmp_path / name / "shared.bin")
+        with open(tmp_path / name / "own.bin", "wb") as file:
+            file.truncate(int(0.4 * 1024**3))
+
+    cleaner = BackupCleaner(config)
+    cleaner.clean_old_backups()
+
+    # Due snapshot occuperebbero 1,8 GB: resta solo il più recente
+    assert cleaner.get_finalized_backups() == [names[2]]
+    assert _disk_bytes(tmp_path) <= 1.5 * 1024**3
+
+
+def _disk_bytes(root):
+    """Byte apparenti occupati sotto root, contando una sola volta ogni inode."""
+    seen = set()
+    total = 0
+    for folder, _, files in os.walk(root):
+        for file in files:
+            info = os.lstat(os.path.join(folder, file))
+            if (info.st_dev, info.st_ino) not in seen:
+                seen.add((info.st_dev, info.st_ino))
+                total += info.st_size
+    return total
+
+
+def test_clean_failed_backups_keeps_resumable(tmp_path):
+    config = BackupConfig(
+        backup_drive="G:",
+        backup_root="BackupPC",
+        source_drives=["D:"],
+        user_folders=["Documents"],
+        keep_last_n=7,
+        reclaim_threads=1
+    )
+    # Radice del backup su una cartella temporanea
+    config.backup_drive = str(tmp_path)
+    config.backup_root = ""
+
+    resumable = tmp_path / ".tmp_backup_2024-01-23_10-30-45"
+    resumable.mkdir()
+    BackupJournal(str(resumable)).start(journal_header(config, "2024-01-23_10-30-45"))
+    (tmp_path / ".tmp_backup_2024-01-22_10-30-45").mkdir()  # Senza journal
+
+    cleaner = BackupCleaner(config)
+    cleaner.clean_failed_backups()
+
+    assert cleaner.cleanedFailed
+    assert cleaner._getListBackups(r"^\.tmp_backup_") == [".tmp_backup_2024-01-23_10-30-45"]
@@ -152,4 +152,41 @@ def test_file_exists_method():
         config.save(config_path)
         
         # Now, the file should exist
-        assert BackupConfig.file_exists(config_path)
\ No newline at end of file
+        assert BackupConfig.file_exists(config_path)
+def test_incremental_requires_native_engine():
+    with pytest.raises(ValueError, match="La modalità incrementale richiede copy_engine 'native'."):
+        BackupConfig(
+            backup_drive="G:",
+            backup_root="BackupPC",
+            source_drives=["C:", "D:"],
+            user_folders=["Documents"],
+            keep_last_n=7,
+            copy_engine="robocopy",
+            incremental=True
+        )
+
+def test_drive_path_windows_and_mapped(tmp_path):
+    config = BackupConfig(
+        backup_drive="G:",
+        backup_root="BackupPC",
+        source_drives=["D:"],
+        user_folders=["Documents"],
+        keep_last_n=7
+    )
+    assert config.drive_path("D:") == "D:\\"
+    assert config.backup_path("snap", "file.txt") == "G:\\BackupPC\\snap\\file.txt"
+
+    config.drive_map = {"G:": str(tmp_path)}
+    assert config.backup_path("snap") == os.path.join(str(tmp_path), "BackupPC", "snap")
+    assert config.join(config.backup_path(), "x") == os.path.join(str(tmp_path), "BackupPC", "x")
+
+def test_invalid_drive_map():
+    with pytest.raises(ValueError, match="Mappatura unità non valida"):
+        BackupConfig(
+            backup_drive="G:",
+            backup_root="BackupPC",
+            source_drives=["D:"],
+            user_folders=["Documents"],
+            keep_last_n=7,
+            drive_map={"Gx": "/tmp"}
+        )
@@ -0,0 +1,74 @@
+import pytest
+import os
+import time
+
+# Importa la tua classe da testare
+from pybck.BackupJournal import BackupJournal, journal_header, resumable_backups, JOURNAL_NAME
+from pybck.BackupConfig import BackupConfig
+
+
+def _config(**kwargs):
+    return BackupConfig(
+        backup_drive="G:",
+        backup_root="BackupPC",
+        source_drives=["C:", "D:"],
+        user_folders=["Documents"],
+        keep_last_n=7,
+        **kwargs
+    )
+
+
+def _start(folder, config, timestamp, done=()):
+    os.makedirs(folder)
+    journal = BackupJournal(str(folder))
+    journal.start(journal_header(config, timestamp))
+    for key in done:
+        journal.mark_done(key)
+    return journal
+
+
+def test_mark_done_and_load(tmp_path):
+    config = _config()
+    _start(tmp_path / "tmp", config, "2024-01-22_10-30-45", ["D:", "C:/Documents"])
+
+    journal = BackupJournal(str(tmp_path / "tmp"))
+    assert journal.load()["timestamp"] == "2024-01-22_10-30-45"
+    assert journal.is_done("D:") and journal.is_done("C:/Documents")
+    assert not journal.is_done("C:")
+
+
+def test_truncated_line_after_resume(tmp_path):
+    config = _config()
+    _start(tmp_path / "tmp", config, "2024-01-22_10-30-45", ["D:"])
+    with open(tmp_path / "tmp" / JOURNAL_NAME, "a", encoding="utf-8") as file:
+        file.write('{"done": "C:/Docu')  # Scrittura interrotta
+
+    journal = BackupJournal(str(tmp_path / "tmp"))
+    journal.load()
+    journal.mark_done("C:/Documents")
+
+    reloaded = BackupJournal(str(tmp_path / "tmp"))
+    reloaded.load()
+    assert reloaded.done == {"D:", "C:/Documents"}
+
+
+def test_resumable_requires_same_config_and_fresh_journal(tmp_path):
+    config = _config()
+    _start(tmp_path / ".tmp_backup_2024-01-22_10-30-45", config, "2024-01-22_10-30-45")
+    _start(tmp_path / ".tmp_backup_2024-01-23_10-30-45", config, "2024-01-23_10-30-45")
+    old = _start(tmp_path / ".tmp_backup_2024-01-01_10-30-45", config, "2024-01-01_10-30-45")
+    os.makedirs(tmp_path / ".tmp_backup_2024-01-24_10-30-45")  # Senza journal: danneggiato
+    stale = time.time() - 100 * 3600
+    os.utime(old.path, (stale, stale))
+
+    assert resumable_backups(str(tmp_path), config) == [".tmp_backup_2024-01-23_10-30-45", ".tmp_backup_2024-01-22_10-30-45"]
+    assert resumable_backups(str(tmp_path), _config(storage_mode="dedup")) == []
+    assert resumable_backups(str(tmp_path), _config(resume_backups=False)) == []
+
+
+def test_start_without_folder(tmp_path):
+    journal = BackupJournal(str(tmp_path / "assente"))
+    journal.start({"version": 1})
+    journal.mark_done("D:")
+    assert journal.is_done("D:")
+    assert not (tmp_path / "assente").exists()
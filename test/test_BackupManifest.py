@@ -0,0 +1,77 @@
+import pytest
+import hashlib
+import os
+
+# Importa la tua classe da testare
+from pybck.BackupManifest import BackupManifest, ManifestEntry, MANIFEST_NAME
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+def test_build_and_lookup(tmp_path):
+    _write(str(tmp_path / "Disco_D_Backup" / "foto" / "mare.jpg"), b"12345")
+    _write(str(tmp_path / "Disco_D_Backup" / "note.txt"), b"ciao")
+    _write(str(tmp_path / "Disco_C_Backup" / "Documents" / "cv.pdf"), b"pdf")
+
+    manifest_path = BackupManifest.build(str(tmp_path))
+
+    assert os.path.basename(manifest_path) == MANIFEST_NAME
+    with BackupManifest(manifest_path) as manifest:
+        assert len(manifest) == 3
+        assert manifest.total_bytes == 12
+        assert manifest.has_hash == False
+
+        entry = manifest.lookup("Disco_D_Backup/foto/mare.jpg")
+        assert entry.size == 5
+        assert entry.mtime_ns == os.stat(tmp_path / "Disco_D_Backup" / "foto" / "mare.jpg").st_mtime_ns
+        assert entry.hash is None
+
+        assert manifest.lookup("Disco_D_Backup/non_esiste.txt") is None
+        # Il manifest non elenca sé stesso
+        assert manifest.lookup(MANIFEST_NAME) is None
+
+        paths = [entry.path for entry in manifest.iter_prefix("Disco_D_Backup/")]
+        assert paths == ["Disco_D_Backup/foto/mare.jpg", "Disco_D_Backup/note.txt"]
+
+
+def test_build_with_hash(tmp_path):
+    _write(str(tmp_path / "a.txt"), b"contenuto")
+
+    with BackupManifest(BackupManifest.build(str(tmp_path), with_hash=True)) as manifest:
+        assert manifest.has_hash == True
+        assert manifest.lookup("a.txt").hash == hashlib.sha256(b"contenuto").digest()
+
+
+def test_write_sorted_many_entries(tmp_path):
+    entries = [ManifestEntry(f"dir{i % 7}/file{i:05d}", i, i * 1000, 0o100644) for i in range(5000)]
+    manifest_path = str(tmp_path / "manifest")
+
+    BackupManifest.write(manifest_path, list(reversed(entries)))
+
+    with BackupManifest(manifest_path) as manifest:
+        paths = [entry.path for entry in manifest]
+        assert paths == sorted(paths)
+        assert manifest.lookup("dir3/file04999") is None
+        assert manifest.lookup("dir0/file04998").size == 4998
+        assert len(list(manifest.iter_prefix("dir6/"))) == len([e for e in entries if e.path.startswith("dir6/")])
+
+
+def test_invalid_manifest(tmp_path):
+    manifest_path = tmp_path / "manifest"
+    manifest_path.write_bytes(b"non un manifest" * 10)
+
+    with pytest.raises(ValueError, match="Manifest non valido"):
+        BackupManifest(str(manifest_path))
+
+
+def test_build_expands_dedup_recipes(tmp_path):
+    recipe = tmp_path / "Disco_D_Backup" / ".pybck_recipe.jsonl"
+    _write(str(recipe), b'{"path": "iso/disco.iso", "size": 700, "mtime_ns": 1, "mode": 33188, "chunks": ["ab"]}\n')
+
+    with BackupManifest(BackupManifest.build(str(tmp_path))) as manifest:
+        assert len(manifest) == 1
+        assert manifest.lookup("Disco_D_Backup/iso/disco.iso").size == 700
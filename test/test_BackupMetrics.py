@@ -0,0 +1,60 @@
+import pytest
+import json
+
+# Importa la tua classe da testare
+from pybck.BackupMetrics import BackupMetrics, RUNS_NAME, PROM_NAME
+from pybck.BackupProgress import ProgressEvent
+from pybck.BackupConfig import BackupConfig
+
+
+def test_span_records_duration_and_error():
+    metrics = BackupMetrics("run")
+    with metrics.span("copy", source="D:"):
+        pass
+    with pytest.raises(RuntimeError):
+        with metrics.span("finalize"):
+            raise RuntimeError("disco scollegato")
+
+    copy, finalize = metrics.spans
+    assert copy.ok and copy.labels == {"source": "D:"} and copy.duration >= 0
+    assert not finalize.ok and finalize.error == "disco scollegato"
+
+
+def test_counters_from_progress():
+    metrics = BackupMetrics("run")
+    event = ProgressEvent("D:\\", 3, 300, 1, 1.0, 3.0, 0.1, None, "", True, retries=2)
+    metrics.add_progress(event)
+    metrics.add_progress(event)
+    assert metrics.counters == {"bytes_copied": 600, "files_copied": 6, "copy_errors": 2, "copy_retries": 4}
+
+
+def test_write_appends_record_and_replaces_textfile(tmp_path):
+    for success in (False, True):
+        metrics = BackupMetrics("run")
+        metrics.success = success
+        metrics.add_span("preflight", 0.25, ok=True, check="sources_exist")
+        metrics.count("bytes_copied", 1024)
+        metrics.write(str(tmp_path))
+
+    lines = (tmp_path / RUNS_NAME).read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["success"] for line in lines] == [False, True]
+
+    prom = (tmp_path / PROM_NAME).read_text(encoding="utf-8")
+    assert "pybck_last_run_success 1" in prom
+    assert 'pybck_phase_duration_seconds{check="sources_exist",phase="preflight"} 0.25' in prom
+    assert "pybck_bytes_copied 1024" in prom
+    assert not (tmp_path / (PROM_NAME + ".tmp")).exists()
+
+
+def test_export_disabled(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config = BackupConfig(
+        backup_drive="G:",
+        backup_root="BackupPC",
+        source_drives=["D:"],
+        user_folders=["Documents"],
+        keep_last_n=7,
+        metrics_dir=""
+    )
+    assert BackupMetrics().export(config) is None
+    assert list(tmp_path.iterdir()) == []
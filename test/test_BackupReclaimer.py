@@ -0,0 +1,96 @@
+import pytest
+import os
+import time
+
+# Importa la tua classe da testare
+from pybck.BackupReclaimer import BackupReclaimer, TRASH_NAME
+
+
+def _make_tree(root, dirs=5, files=4, size=1000):
+    for d in range(dirs):
+        folder = os.path.join(root, f"dir{d}", "sub")
+        os.makedirs(folder)
+        for f in range(files):
+            with open(os.path.join(folder, f"file{f}.bin"), "wb") as file:
+                file.write(b"x" * size)
+
+
+def test_move_and_reclaim(tmp_path):
+    backup = tmp_path / "2024-01-22_10-30-45"
+    _make_tree(str(backup))
+    events = []
+    reclaimer = BackupReclaimer(str(tmp_path / TRASH_NAME), threads=3, progress_callback=events.append)
+
+    moved = reclaimer.move_to_trash(str(backup))
+    # Il backup sparisce subito dalla cartella radice
+    assert not backup.exists()
+    assert os.path.isdir(moved)
+
+    report = reclaimer.reclaim()
+    assert report.files_deleted == 20
+    assert report.dirs_deleted == 11  # 5 dir + 5 sub + cartella del backup
+    assert report.bytes_reclaimed == 20 * 1000
+    assert report.errors == []
+    assert os.listdir(tmp_path / TRASH_NAME) == []
+    assert events[-1].finished and events[-1].bytes_done == 20 * 1000
+
+
+def test_hard_links_are_not_counted(tmp_path):
+    backup = tmp_path / "snap"
+    _make_tree(str(backup), dirs=1, files=1)
+    original = backup / "dir0" / "sub" / "file0.bin"
+    os.link(original, tmp_path / "kept.bin")
+    reclaimer = BackupReclaimer(str(tmp_path / TRASH_NAME))
+
+    reclaimer.move_to_trash(str(backup))
+    report = reclaimer.reclaim()
+    # Il file è ancora referenziato fuori dal cestino: nessuno spazio recuperato
+    assert report.files_deleted == 1
+    assert report.bytes_reclaimed == 0
+    assert (tmp_path / "kept.bin").exists()
+
+
+def test_background_reclaim_and_budget(tmp_path):
+    backup = tmp_path / "snap"
+    _make_tree(str(backup), dirs=2, files=5, size=10)
+    reclaimer = BackupReclaimer(str(tmp_path / TRASH_NAME), threads=2, max_ops_per_s=200)
+
+    reclaimer.move_to_trash(str(backup))
+    start = time.perf_counter()
+    reclaimer.start_background()
+    assert reclaimer.wait(10)
+    elapsed = time.perf_counter() - start
+
+    # 10 file + 5 cartelle a 200 operazioni al secondo
+    assert reclaimer.report.files_deleted == 10
+    assert elapsed >= 14 / 200
+    assert os.listdir(tmp_path / TRASH_NAME) == []
+
+
+def test_reclaim_without_trash(tmp_path):
+    report = BackupReclaimer(str(tmp_path / TRASH_NAME)).reclaim()
+    assert report.files_deleted == 0 and report.errors == []
+
+
+def test_unexpected_error_does_not_hang_reclaim(tmp_path):
+    backup = tmp_path / "snap"
+    _make_tree(str(backup), dirs=3, files=2)
+    reclaimer = BackupReclaimer(str(tmp_path / TRASH_NAME), threads=2)
+    reclaimer.move_to_trash(str(backup))
+    unlink = reclaimer._unlink
+
+    def failing_unlink(entry, report, progress):
+        if "dir1" in entry.path:
+            raise RuntimeError("errore inatteso")
+        unlink(entry, report, progress)
+
+    reclaimer._unlink = failing_unlink
+    reclaimer.start_background()
+    # Prima della correzione il worker moriva e reclaim() restava in attesa per sempre
+    assert reclaimer.wait(10)
+    report = reclaimer.report
+    assert report.files_deleted == 4
+    assert any("errore inatteso" in error for error in report.errors)
+    # Resta solo la cartella con l'errore (e quelle che la contengono)
+    remaining = [os.path.relpath(folder, tmp_path / TRASH_NAME) for folder, _, _ in os.walk(tmp_path / TRASH_NAME)]
+    assert not any("dir0" in folder or "dir2" in folder for folder in remaining)
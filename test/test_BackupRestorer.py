@@ -0,0 +1,173 @@
+import pytest
+import os
+
+from pybck.BackupConfig import BackupConfig
+from pybck.BackupBuilder import BackupBuilder
+from pybck.BackupManifest import MANIFEST_NAME
+from pybck.BackupRestorer import BackupRestorer, manifest_path, source_path
+from pybck.PathIndex import INDEX_NAME
+
+
+def _config(tmp_path, **kwargs):
+    kwargs.setdefault("copy_engine", "native")
+    return BackupConfig(
+        backup_drive="G:",
+        backup_root="BackupPC",
+        source_drives=["D:"],
+        user_folders=["Documents"],
+        keep_last_n=7,
+        drive_map={"D:": str(tmp_path / "D"), "G:": str(tmp_path / "G")},
+        metrics_dir="",
+        **kwargs
+    )
+
+
+def _snapshot(tmp_path, **kwargs):
+    source = tmp_path / "D"
+    (source / "sub" / "profondo").mkdir(parents=True)
+    (source / "grande.bin").write_bytes(os.urandom(2 * 1024 * 1024 + 7))
+    (source / "sub" / "testo.txt").write_bytes(b"riga di testo\n" * 10000)
+    (source / "sub" / "profondo" / "nota.txt").write_bytes(b"nota")
+    (source / "sub" / "vuoto").write_bytes(b"")
+    os.utime(source / "sub" / "testo.txt", (1_600_000_000, 1_600_000_000))
+    (tmp_path / "G").mkdir()
+    config = _config(tmp_path, **kwargs)
+    builder = BackupBuilder(config)
+    builder.execute_backup()
+    assert builder.executed == True
+    return config, builder.timestamp
+
+
+MODES = [{}, {"storage_mode": "compressed", "compression_processes": 1}, {"storage_mode": "dedup"}]
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_restore_whole_snapshot(tmp_path, mode):
+    config, name = _snapshot(tmp_path, **mode)
+    restorer = BackupRestorer(config, threads=3)
+
+    stats = restorer.restore(name, str(tmp_path / "R"))
+    restorer.close()
+
+    restored = tmp_path / "R" / "D"
+    assert (restored / "grande.bin").read_bytes() == (tmp_path / "D" / "grande.bin").read_bytes()
+    assert (restored / "sub" / "testo.txt").read_bytes() == b"riga di testo\n" * 10000
+    assert (restored / "sub" / "profondo" / "nota.txt").read_bytes() == b"nota"
+    assert (restored / "sub" / "vuoto").read_bytes() == b""
+    assert os.stat(restored / "sub" / "testo.txt").st_mtime == pytest.approx(1_600_000_000, abs=2)
+    assert stats.files_copied == 4
+    assert stats.errors == []
+
+
+def test_restore_reports_unexpected_errors(tmp_path, monkeypatch):
+    config, name = _snapshot(tmp_path, storage_mode="dedup")
+    restorer = BackupRestorer(config, threads=2)
+    monkeypatch.setattr(restorer, "_restore_stored", lambda *args: 1 / 0)
+
+    stats = restorer.restore(name, str(tmp_path / "R"))
+    restorer.close()
+
+    assert len(stats.errors) == 4
+    assert "division by zero" in stats.errors[0]
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_restore_single_file_from_manifest(tmp_path, mode):
+    config, name = _snapshot(tmp_path, **mode)
+    restorer = BackupRestorer(config)
+    (tmp_path / "R").mkdir()
+
+    target = restorer.restore_file(name, "D:\\sub\\testo.txt", str(tmp_path / "R"))
+    restorer.close()
+
+    assert target == str(tmp_path / "R" / "testo.txt")
+    assert (tmp_path / "R" / "testo.txt").read_bytes() == b"riga di testo\n" * 10000
+    assert os.listdir(tmp_path / "R") == ["testo.txt"]
+
+
+def test_restore_file_to_new_path_and_missing_file(tmp_path):
+    config, name = _snapshot(tmp_path)
+    restorer = BackupRestorer(config)
+
+    restorer.restore_file(name, "D:/sub/profondo/nota.txt", str(tmp_path / "R" / "copia.txt"))
+
+    assert (tmp_path / "R" / "copia.txt").read_bytes() == b"nota"
+    with pytest.raises(FileNotFoundError):
+        restorer.restore_file(name, "D:/non/esiste.txt", str(tmp_path / "R"))
+    with pytest.raises(FileNotFoundError):
+        restorer.restore_file("2000-01-01_00-00-00", "D:/sub/testo.txt", str(tmp_path / "R"))
+
+
+def test_restore_source_goes_directly_in_destination(tmp_path):
+    config, name = _snapshot(tmp_path)
+
+    stats = BackupRestorer(config).restore(name, str(tmp_path / "R"), source="D:/sub")
+
+    assert sorted(os.listdir(tmp_path / "R")) == ["profondo", "testo.txt", "vuoto"]
+    assert stats.files_copied == 3
+
+
+def test_restore_glob(tmp_path):
+    config, name = _snapshot(tmp_path)
+
+    stats = BackupRestorer(config).restore(name, str(tmp_path / "R"), pattern="D:/sub/*.txt")
+
+    # "*" comprende anche le sottocartelle
+    assert (tmp_path / "R" / "D" / "sub" / "testo.txt").exists()
+    assert (tmp_path / "R" / "D" / "sub" / "profondo" / "nota.txt").exists()
+    assert not (tmp_path / "R" / "D" / "grande.bin").exists()
+    assert stats.files_copied == 2
+
+
+def test_existing_files_are_skipped_or_protected(tmp_path):
+    config, name = _snapshot(tmp_path)
+    BackupRestorer(config).restore(name, str(tmp_path / "R"), source="D:")
+
+    # Stessa dimensione e data: saltato
+    stats = BackupRestorer(config).restore(name, str(tmp_path / "R"), source="D:")
+    assert stats.files_skipped == 4
+    assert stats.files_copied == 0
+
+    # File modificato dopo il ripristino: non sovrascritto senza overwrite
+    (tmp_path / "R" / "sub" / "profondo" / "nota.txt").write_bytes(b"modificata")
+    stats = BackupRestorer(config).restore(name, str(tmp_path / "R"), source="D:")
+    assert len(stats.errors) == 1
+    assert (tmp_path / "R" / "sub" / "profondo" / "nota.txt").read_bytes() == b"modificata"
+
+    stats = BackupRestorer(config, overwrite=True).restore(name, str(tmp_path / "R"), source="D:")
+    assert stats.files_copied == 1
+    assert (tmp_path / "R" / "sub" / "profondo" / "nota.txt").read_bytes() == b"nota"
+
+
+def test_missing_manifest_is_rebuilt(tmp_path):
+    config, name = _snapshot(tmp_path)
+    os.unlink(config.backup_path(name, MANIFEST_NAME))
+
+    BackupRestorer(config).restore_file(name, "D:/grande.bin", str(tmp_path / "grande.bin"))
+
+    assert os.path.isfile(config.backup_path(name, MANIFEST_NAME))
+    assert (tmp_path / "grande.bin").read_bytes() == (tmp_path / "D" / "grande.bin").read_bytes()
+
+
+@pytest.mark.parametrize("path_index", [True, False])
+def test_versions(tmp_path, path_index):
+    config, name = _snapshot(tmp_path, path_index=path_index)
+    restorer = BackupRestorer(config)
+
+    versions = restorer.versions("D:/sub/testo.txt")
+
+    # Con path_index il builder ha creato l'indice, altrimenti la ricerca passa dai manifest
+    assert os.path.isfile(config.backup_path(INDEX_NAME)) == path_index
+    assert [entry.snapshot for entry in versions] == [name]
+    assert versions[0].path == "D:/sub/testo.txt"
+    assert versions[0].size == len(b"riga di testo\n") * 10000
+    assert restorer.versions("D:/non/esiste.txt") == []
+
+
+def test_path_conversion():
+    assert manifest_path("2024-01-22_10-30-45", "d:\\Progetti\\a.txt") == "Disco_D_Backup_2024-01-22_10-30-45/Progetti/a.txt"
+    assert manifest_path("ts", "C:/Documents/") == "Disco_C_Backup_ts/Documents"
+    assert manifest_path("ts", "E:") == "Disco_E_Backup_ts"
+    assert source_path("Disco_D_Backup_ts/Progetti/a.txt") == "D:/Progetti/a.txt"
+    with pytest.raises(ValueError):
+        manifest_path("ts", "Progetti/a.txt")
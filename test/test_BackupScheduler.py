@@ -0,0 +1,77 @@
+import pytest
+import threading
+import time
+
+# Importa la tua classe da testare
+from pybck.BackupScheduler import BackupScheduler, BackupJob, device_id
+
+
+def _tracking_job(name, source, target, counters, lock, delay=0.05):
+    # Job che registra il numero massimo di esecuzioni contemporanee per dispositivo
+    def func():
+        with lock:
+            counters["running"][source] = counters["running"].get(source, 0) + 1
+            counters["running_target"] += 1
+            counters["max"][source] = max(counters["max"].get(source, 0), counters["running"][source])
+            counters["max_target"] = max(counters["max_target"], counters["running_target"])
+        time.sleep(delay)
+        with lock:
+            counters["running"][source] -= 1
+            counters["running_target"] -= 1
+    return BackupJob(name, source, target, func)
+
+
+def test_run_respects_device_limits():
+    counters = {"running": {}, "max": {}, "running_target": 0, "max_target": 0}
+    lock = threading.Lock()
+    jobs = [
+        _tracking_job("D:", "disco1", "usb", counters, lock),
+        _tracking_job("E:", "disco1", "usb", counters, lock),
+        _tracking_job("F:", "disco2", "usb", counters, lock),
+        _tracking_job("H:", "disco3", "usb", counters, lock),
+    ]
+
+    scheduler = BackupScheduler(max_workers=4, max_per_source=1, max_per_target=2)
+    scheduler.run(jobs)
+
+    assert counters["max"]["disco1"] == 1
+    assert counters["max_target"] <= 2
+    assert all(job.wall_time > 0 for job in jobs)
+    assert all(job.error is None for job in jobs)
+
+
+def test_run_overlaps_independent_devices():
+    jobs = [BackupJob(f"J{i}", f"disco{i}", "usb", lambda: time.sleep(0.1)) for i in range(3)]
+
+    start = time.perf_counter()
+    BackupScheduler(max_workers=3, max_per_source=1, max_per_target=3).run(jobs)
+    elapsed = time.perf_counter() - start
+
+    # Tre job da 0.1s su dischi diversi devono sovrapporsi
+    assert elapsed < 0.25
+
+
+def test_run_stops_after_failure():
+    def failing():
+        raise Exception("Robocopy failed")
+
+    jobs = [
+        BackupJob("D:", "disco1", "usb", failing),
+        BackupJob("E:", "disco1", "usb", lambda: None),
+    ]
+
+    BackupScheduler(max_workers=1).run(jobs)
+
+    assert str(jobs[0].error) == "Robocopy failed"
+    # Il secondo job condivide il disco: se parte dopo il fallimento viene annullato
+    assert jobs[1].skipped or jobs[1].started_at <= jobs[0].started_at
+    assert jobs[1].error is None
+
+
+def test_device_id(tmp_path):
+    assert device_id("D:\\", {"D:": "disco1"}) == "disco1"
+    assert device_id("C:\\Users\\Mario", {"C:": "ssd"}) == "ssd"
+    # Due cartelle sullo stesso filesystem appartengono allo stesso dispositivo
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    assert device_id(str(tmp_path / "a")) == device_id(str(tmp_path / "b"))
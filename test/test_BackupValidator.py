@@ -3,10 +3,13 @@ import os
 
 from pathlib import Path
 import psutil
+import threading
+import time
 
 # Importa la tua classe da testare
 from pybck.BackupValidator import BackupValidator
 from pybck.BackupConfig import BackupConfig
+from pybck.SpacePlanner import SpacePlanner, SpacePlan, SAFETY_MARGIN
 
 
 def test_drive_connected(monkeypatch):
@@ -162,6 +165,26 @@ def test_validate_user_folders_not_exist(monkeypatch):
     monkeypatch.setattr("pathlib.Path.exists", lambda self: mock_exists(str(self)))
     assert validator.validate_user_folders_exist() == False
     
+def _mock_space(monkeypatch, free_gb, to_write_gb):
+    # Stima delle sorgenti simulata: il planner scriverebbe to_write_gb sul drive di backup
+    def mock_estimate(self, sources, manifest=None):
+        to_write = int(to_write_gb * 1024**3)
+        return SpacePlan(total_bytes=to_write, bytes_to_write=to_write, required_bytes=int(to_write * SAFETY_MARGIN))
+    
+    def mock_disk_usage(path):
+        normalized = str(path).rstrip("\\")
+        if normalized == "G:":
+            return type('obj', (object,), {
+                'used': 100 * 1024**3,
+                'free': free_gb * 1024**3,
+                'total': 300 * 1024**3
+            })()
+        raise ValueError(f"Path non mockato: {path}")
+    
+    monkeypatch.setattr(SpacePlanner, "estimate", mock_estimate)
+    monkeypatch.setattr(psutil, "disk_usage", mock_disk_usage)
+    monkeypatch.setattr("pathlib.Path.exists", lambda self: True)
+    
 def test_has_sufficient_space_true(monkeypatch):
     config = BackupConfig(
         backup_drive="G:",
@@ -172,42 +195,12 @@ def test_has_sufficient_space_true(monkeypatch):
     )
     
     validator = BackupValidator(config)
+    _mock_space(monkeypatch, free_gb=200, to_write_gb=130)
     
-    def mock_disk_usage(path):
-        # Normalizza: togli backslash finale
-        normalized = str(path).rstrip("\\")
-        
-        if normalized == "C:":
-            return type('obj', (object,), {
-                'used': 100 * 1024**3,
-                'free': 10 * 1024**3,
-                'total': 110 * 1024**3
-            })()
-        elif normalized == "D:":
-            return type('obj', (object,), {
-                'used': 50 * 1024**3,
-                'free': 20 * 1024**3,
-                'total': 70 * 1024**3
-            })()
-        elif normalized == "G:":
-            return type('obj', (object,), {
-                'used': 100 * 1024**3,
-                'free': 200 * 1024**3,
-                'total': 300 * 1024**3
-            })()
-        else:
-            raise ValueError(f"Path non mockato: {path}")
-    
-    def mock_path_exists(self):
-        return True
-    
-    monkeypatch.setattr(psutil, "disk_usage", mock_disk_usage)
-    monkeypatch.setattr("pathlib.Path.exists", mock_path_exists)
-    
-    approx_os_space = 20.0
-    result = validator.has_sufficient_space(approx_os_space)
+    result = validator.has_sufficient_space()
     
     assert result == True, f"Expected True, got {result}"
+    assert validator.space_plan.fits
     
 def test_has_sufficient_space_false(monkeypatch):
     config = BackupConfig(
@@ -219,41 +212,24 @@ def test_has_sufficient_space_false(monkeypatch):
     )
     
     validator = BackupValidator(config)
+    _mock_space(monkeypatch, free_gb=10, to_write_gb=130)
     
-    def mock_disk_usage(path):
-        # Normalizza: togli backslash finale
-        normalized = str(path).rstrip("\\")
-        
-        if normalized == "C:":
-            return type('obj', (object,), {
-                'used': 100 * 1024**3,
-                'free': 10 * 1024**3,
-                'total': 110 * 1024**3
-            })()
-        elif normalized == "D:":
-            return type('obj', (object,), {
-                'used': 50 * 1024**3,
-                'free': 20 * 1024**3,
-                'total': 70 * 1024**3
-            })()
-        elif normalized == "G:":
-            return type('obj', (object,), {
-                'used': 100 * 1024**3,
-                'free': 10 * 1024**3,
-                'total': 300 * 1024**3
-            })()
-        else:
-            raise ValueError(f"Path non mockato: {path}")
-    
-    def mock_path_exists(self):
-        return True
+    assert validator.has_sufficient_space() == False
     
-    monkeypatch.setattr(psutil, "disk_usage", mock_disk_usage)
-    monkeypatch.setattr("pathlib.Path.exists", mock_path_exists)
+def test_has_sufficient_space_backup_drive_missing(monkeypatch):
+    config = BackupConfig(
+        backup_drive="G:",
+        backup_root="BackupPC",
+        source_drives=["D:"],
+        user_folders=["Documents"],
+        keep_last_n=7
+    )
     
-    approx_os_space = 20.0
+    validator = BackupValidator(config)
+    monkeypatch.setattr("pathlib.Path.exists", lambda self: False)
     
-    assert validator.has_sufficient_space(approx_os_space) == False
+    assert validator.has_sufficient_space() == False
+    assert validator.space_plan is None
     
     
 def test_can_perform_backup_all_valid(monkeypatch):
@@ -366,4 +342,75 @@ def test_can_perform_backup_insufficient_space(monkeypatch):
     monkeypatch.setattr(validator, "has_sufficient_space", lambda approx_os_space: False)
     
     approx_os_space = 20.0 
-    assert validator.can_perform_backup(approx_os_space) == False
\ No newline at end of file
+    assert validator.can_perform_backup(approx_os_space) == False    
+def test_disk_partitions_probed_once(monkeypatch):
+    config = BackupConfig(
+        backup_drive="G:",
+        backup_root="BackupPC",
+        source_drives=["C:", "D:"],
+        user_folders=["Documents"],
+        keep_last_n=7
+    )
+    
+    validator = BackupValidator(config)
+    calls = []
+    
+    def mock_disk_partitions():
+        class MockPartition:
+            def __init__(self, device):
+                self.device = device
+        calls.append(1)
+        return [MockPartition("G:"), MockPartition("D:")]
+    
+    monkeypatch.setattr("psutil.disk_partitions", mock_disk_partitions)
+    
+    assert validator.is_drive_connected("G:") == True
+    assert validator.is_drive_connected("D:") == True
+    assert validator.is_drive_connected("E:") == False
+    assert len(calls) == 1
+    
+def test_preflight_hung_source_times_out(monkeypatch):
+    config = BackupConfig(
+        backup_drive="G:",
+        backup_root="BackupPC",
+        source_drives=["C:", "D:"],
+        user_folders=["Documents"],
+        keep_last_n=7,
+        preflight_timeout_s=0.5
+    )
+    
+    validator = BackupValidator(config)
+    release = threading.Event()
+    
+    def mock_exists(self):
+        # D: è un disco che non risponde
+        if str(self).startswith("D:"):
+            release.wait(10)
+        return True
+    
+    def mock_plan(planner):
+        # La stima dello spazio percorrerebbe anche D: e resterebbe bloccata
+        release.wait(10)
+        raise AssertionError("stima dello spazio avviata con una sorgente bloccata")
+    
+    monkeypatch.setattr("pathlib.Path.exists", mock_exists)
+    monkeypatch.setattr("pybck.BackupValidator.SpacePlanner.plan", mock_plan)
+    monkeypatch.setattr(validator, "is_drive_connected", lambda drive: True)
+    
+    start = time.perf_counter()
+    result = validator.can_perform_backup()
+    elapsed = time.perf_counter() - start
+    release.set()
+    
+    # La sonda su D: scade dopo preflight_timeout_s, la validazione termina subito dopo
+    assert result == False
+    assert elapsed < 2 * config.preflight_timeout_s
+    assert validator.error.startswith("Una o più sorgenti non esistono")
+    
+    report = validator.report
+    assert [check.name for check in report.checks] == ["backup_drive_connected", "sources_exist", "user_folders_exist", "sufficient_space"]
+    assert [check.name for check in report.failed] == ["sources_exist"]
+    assert report.checks[-1].skipped
+    hung = [probe for probe in report.probes if probe.name == "source:D:"][0]
+    assert hung.timed_out and hung.latency >= config.preflight_timeout_s
+    assert all(check.latency >= 0 for check in report.checks)
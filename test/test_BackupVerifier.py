@@ -0,0 +1,107 @@
+import pytest
+import json
+import os
+import shutil
+
+# Importa la tua classe da testare
+from pybck.BackupVerifier import BackupVerifier
+from pybck.BackupConfig import BackupConfig
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+def _make_verifier():
+    config = BackupConfig(
+        backup_drive="G:",
+        backup_root="BackupPC",
+        source_drives=["C:", "D:"],
+        user_folders=["Documents"],
+        keep_last_n=7
+    )
+    return BackupVerifier(config, threads=2, buffer_size=4096)
+
+
+def _make_copy(tmp_path):
+    source = tmp_path / "src"
+    _write(str(source / "a.txt"), b"alfa")
+    _write(str(source / "sub" / "b.bin"), os.urandom(20000))
+    shutil.copytree(source, tmp_path / "snap")
+    return str(source), str(tmp_path / "snap")
+
+
+def test_verify_quick_and_full_ok(tmp_path):
+    source, snapshot = _make_copy(tmp_path)
+    verifier = _make_verifier()
+
+    quick = verifier.verify([(source, snapshot)], "quick")
+    full = verifier.verify([(source, snapshot)], "full")
+
+    assert quick.ok and full.ok
+    assert quick.files_checked == 2
+    assert full.bytes_checked == 4 + 20000
+    assert verifier.verified == True
+
+
+def test_verify_full_detects_content_change(tmp_path):
+    source, snapshot = _make_copy(tmp_path)
+    # Stessa dimensione e stessa data: solo il livello "full" se ne accorge
+    target = os.path.join(snapshot, "a.txt")
+    st = os.stat(target)
+    _write(target, b"ALFA")
+    os.utime(target, ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.unlink(os.path.join(snapshot, "sub", "b.bin"))
+
+    verifier = _make_verifier()
+    assert verifier.verify([(source, snapshot)], "quick").mismatch_count == 1
+
+    report = verifier.verify([(source, snapshot)], "full")
+    assert report.mismatch_count == 2
+    assert verifier.verified == False
+    assert "Verifica full fallita" in verifier.error
+
+
+def test_verify_resumes_from_checkpoint(tmp_path):
+    source, snapshot = _make_copy(tmp_path)
+    checkpoint = tmp_path / "checkpoint.jsonl"
+    # Checkpoint di una verifica interrotta, con l'ultima riga troncata
+    checkpoint.write_text(json.dumps({"mode": "full"}) + "\n" + json.dumps("0:a.txt") + "\n\"0:su")
+
+    report = _make_verifier().verify([(source, snapshot)], "full", str(checkpoint))
+
+    assert report.files_resumed == 1
+    assert report.files_checked == 1
+    assert not checkpoint.exists()
+
+
+def test_verify_drops_checkpoint_after_mismatches(tmp_path):
+    source, snapshot = _make_copy(tmp_path)
+    os.unlink(os.path.join(snapshot, "sub", "b.bin"))
+    checkpoint = tmp_path / "cache" / "checkpoint.jsonl"
+
+    report = _make_verifier().verify([(source, snapshot)], "full", str(checkpoint))
+
+    # L'esito è nel report: il checkpoint non resta né nella cache né nello snapshot
+    assert report.mismatch_count == 1
+    assert not checkpoint.exists()
+    assert sorted(os.listdir(snapshot)) == ["a.txt", "sub"]
+
+
+def test_verify_reports_unexpected_errors(tmp_path, monkeypatch):
+    source, snapshot = _make_copy(tmp_path)
+    verifier = _make_verifier()
+    monkeypatch.setattr(verifier, "_hash_file", lambda path: 1 / 0)
+
+    report = verifier.verify([(source, snapshot)], "full")
+
+    assert report.mismatch_count == 2
+    assert "division by zero" in report.mismatches[0]
+    assert verifier.verified == False
+
+
+def test_verify_invalid_mode(tmp_path):
+    with pytest.raises(ValueError, match="Modalità di verifica non valida"):
+        _make_verifier().verify([], "veloce")
@@ -0,0 +1,256 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from pybck.ChangeJournal import ChangeJournal, ChangeSet
+
+
+def _journal(tmp_path, records):
+    journal = ChangeJournal(str(tmp_path / "src"), str(tmp_path / "changes"))
+    journal.append(records)
+    return journal
+
+
+def test_changes_since_mark(tmp_path):
+    now = time.time()
+    journal = _journal(tmp_path, [
+        {"start": "s1", "time": now - 100, "heartbeat": 30},
+        {"dirty": "prima"},
+        {"mark": "P1", "time": now - 90},
+        {"dirty": "Foto/2024"},
+        {"dirty": "Nuova", "tree": True},
+        {"beat": now - 5},
+    ])
+
+    changes = journal.changes_since("P1", now)
+
+    assert changes.dirty == {"Foto/2024"}
+    assert changes.trees == {"Nuova"}
+    assert changes.needs_scan("") and changes.needs_scan("Foto") and changes.needs_scan("Foto/2024")
+    assert not changes.needs_scan("prima") and not changes.needs_scan("Foto/2023")
+    assert changes.is_tree("Nuova")
+
+
+@pytest.mark.parametrize("tail", [
+    [{"overflow": 1.0}],
+    [{"stop": 1.0}],
+    [{"stop": 1.0}, {"start": "s2", "time": None}],
+])
+def test_changes_since_invalid_after_gap(tmp_path, tail):
+    now = time.time()
+    for record in tail:
+        if record.get("time", 0) is None:
+            record["time"] = now
+    journal = _journal(tmp_path, [{"start": "s1", "time": now - 10, "heartbeat": 30},
+                                  {"mark": "P1", "time": now - 5}] + tail)
+
+    # Eventi persi o watcher fermo dopo il mark: scansione completa
+    assert journal.changes_since("P1", now) is None
+
+
+def test_changes_since_requires_mark_and_heartbeat(tmp_path):
+    now = time.time()
+    journal = _journal(tmp_path, [{"mark": "P0", "time": now - 200},
+                                  {"start": "s1", "time": now - 100, "heartbeat": 30},
+                                  {"mark": "P1", "time": now - 90}])
+
+    # Mark scritto prima che il watcher partisse
+    assert journal.changes_since("P0", now) is None
+    # Nessun segnale dal watcher da più di due heartbeat
+    assert journal.changes_since("P1", now) is None
+    assert journal.changes_since("P1", now - 80) is not None
+    assert ChangeJournal(str(tmp_path / "altro"), str(tmp_path / "changes")).changes_since("P1") is None
+
+
+def test_mark_only_when_journal_exists(tmp_path):
+    journal = ChangeJournal(str(tmp_path / "src"), str(tmp_path / "changes"))
+
+    assert not journal.mark("P1")
+    assert not journal.exists()
+
+    journal.append([{"start": "s1", "time": time.time(), "heartbeat": 30}])
+    assert journal.mark("P1")
+    assert journal.changes_since("P1") is not None
+
+
+def test_changes_since_requires_same_filters(tmp_path):
+    journal = ChangeJournal(str(tmp_path / "src"), str(tmp_path / "changes"))
+    journal.append([{"start": "s1", "time": time.time(), "heartbeat": 30}])
+    journal.mark("P1", "impronta-1")
+
+    assert journal.changes_since("P1", filters="impronta-1") is not None
+    assert journal.changes_since("P1") is not None
+    # Filtri cambiati (o tolti) dallo snapshot P1: scansione completa
+    assert journal.changes_since("P1", filters="impronta-2") is None
+    assert journal.changes_since("P1", filters="") is None
+
+
+def test_compact_keeps_session_from_last_mark(tmp_path):
+    now = time.time()
+    journal = _journal(tmp_path, [{"start": "s1", "time": now, "heartbeat": 30}, {"dirty": "a"},
+                                  {"mark": "P1", "time": now}, {"dirty": "b"},
+                                  {"mark": "P2", "time": now}, {"dirty": "c"}, {"beat": now}])
+
+    journal.compact()
+
+    with open(journal.path, encoding="utf-8") as file:
+        records = [json.loads(line) for line in file]
+    assert [list(record)[0] for record in records] == ["start", "mark", "dirty", "beat"]
+    assert journal.changes_since("P1", now) is None
+    assert journal.changes_since("P2", now).dirty == {"c"}
+
+    # Una sessione chiusa non lascia nulla di utilizzabile
+    journal.append([{"overflow": now}])
+    journal.compact()
+    assert os.path.getsize(journal.path) == 0
+
+
+def test_changeset_root_only():
+    changes = ChangeSet({""})
+
+    assert changes.needs_scan("")
+    assert not changes.needs_scan("sub")
+    assert len(changes) == 1
+
+
+class FakeBackend:
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.closed = False
+
+    def add_tree(self, root):
+        return True
+
+    def read(self, timeout):
+        if self.batches:
+            batch = self.batches.pop(0)
+            if isinstance(batch, Exception):
+                raise batch
+            return batch
+        time.sleep(timeout)
+        return []
+
+    def close(self):
+        self.closed = True
+
+
+def _config(tmp_path, source):
+    from pybck.BackupConfig import BackupConfig
+    return BackupConfig(backup_drive="G:", backup_root="BackupPC", source_drives=["D:"], user_folders=["Documents"],
+                        keep_last_n=7, copy_engine="native", incremental=True, change_journal=True,
+                        change_journal_dir=str(tmp_path / "changes"), drive_map={"D:": str(source)})
+
+
+def _run_watcher(watcher, until):
+    stop = threading.Event()
+    thread = threading.Thread(target=watcher.run, args=(stop,))
+    thread.start()
+    deadline = time.time() + 5
+    while not until() and time.time() < deadline:
+        time.sleep(0.01)
+    stop.set()
+    thread.join()
+
+
+def test_watcher_records_relative_dirs(tmp_path):
+    from pybck.ChangeWatcher import ChangeWatcher, WatchOverflow
+    source = tmp_path / "D"
+    (source / "Foto").mkdir(parents=True)
+    config = _config(tmp_path, source)
+    journal = ChangeJournal(str(source), config.change_journal_dir)
+    backend = FakeBackend([[], [(str(source / "Foto"), False), (str(source), False)],
+                           WatchOverflow("coda degli eventi inotify piena"),
+                           [(str(source / "Nuova"), True)]])
+    watcher = ChangeWatcher(config, backend=backend, flush_interval=0.01)
+    watcher.start = lambda: (ChangeWatcher.start(watcher), journal.mark("P1"))
+
+    _run_watcher(watcher, lambda: not backend.batches)
+
+    with open(journal.path, encoding="utf-8") as file:
+        records = [json.loads(line) for line in file]
+    kinds = [list(record)[0] for record in records]
+    assert kinds[:2] == ["start", "mark"]
+    assert {"dirty": "Foto"} in records and {"dirty": ""} in records
+    assert kinds.index("overflow") < kinds.index("start", 1) < records.index({"dirty": "Nuova", "tree": True})
+    assert kinds[-1] == "stop"
+    assert backend.closed
+
+
+def test_mark_waits_for_watcher_ack(tmp_path):
+    from pybck.ChangeWatcher import ChangeWatcher
+    source = tmp_path / "D"
+    source.mkdir()
+    config = _config(tmp_path, source)
+    journal = ChangeJournal(str(source), config.change_journal_dir)
+    journal.append([{"start": "s0", "time": time.time(), "heartbeat": 30}])
+
+    # Nessun watcher: nessuna conferma entro il timeout
+    start = time.monotonic()
+    assert not journal.mark("P0", ack_timeout=0.2)
+    assert time.monotonic() - start < 1
+    assert journal.unacknowledged(0)[0] != []
+
+    # Un evento ancora nella coda del backend al momento del mark viene scritto prima della conferma
+    backend = FakeBackend([])
+    watcher = ChangeWatcher(config, backend=backend, flush_interval=0.5)
+    watcher.start()
+    watcher.start = lambda: None
+    acked = []
+    def mark_with_pending_event():
+        time.sleep(0.1)  # Il watcher è in read(0.5): l'evento resta in coda fino alla conferma
+        backend.batches.append([(str(source / "Foto"), False)])
+        acked.append(journal.mark("P1", ack_timeout=5))
+    threading.Thread(target=mark_with_pending_event).start()
+    _run_watcher(watcher, lambda: acked)
+
+    assert acked == [True]
+    with open(journal.path, encoding="utf-8") as file:
+        records = [json.loads(line) for line in file]
+    mark = next(index for index, record in enumerate(records) if record.get("mark") == "P1")
+    ack = next(index for index, record in enumerate(records) if record.get("ack") == records[mark]["flush"])
+    assert records.index({"dirty": "Foto"}) < ack
+    # Anche il mark di P0, rimasto senza conferma, viene confermato dal watcher
+    assert journal.unacknowledged(0)[0] == []
+
+
+def test_watch_limit_ends_session(tmp_path):
+    from pybck.ChangeWatcher import ChangeWatcher, WatchLimitReached, WatchOverflow
+    source = tmp_path / "D"
+    source.mkdir()
+    config = _config(tmp_path, source)
+    journal = ChangeJournal(str(source), config.change_journal_dir)
+    # Il tipo decide, non il testo: un overflow della coda riapre la sessione, il limite di watch no
+    backend = FakeBackend([WatchOverflow("limite della coda"), WatchLimitReached("limite di watch inotify raggiunto"),
+                           [(str(source), False)]])
+    watcher = ChangeWatcher(config, backend=backend, flush_interval=0.01)
+
+    _run_watcher(watcher, lambda: not backend.batches)
+
+    with open(journal.path, encoding="utf-8") as file:
+        kinds = [list(json.loads(line))[0] for line in file]
+    assert kinds[:5] == ["start", "overflow", "start", "overflow", "dirty"]
+    assert kinds.count("start") == 2
+
+
+@pytest.mark.skipif(not os.sys.platform.startswith("linux"), reason="inotify solo su Linux")
+def test_inotify_backend_reports_changes(tmp_path):
+    from pybck.ChangeWatcher import InotifyBackend
+    (tmp_path / "a" / "b").mkdir(parents=True)
+    backend = InotifyBackend()
+    try:
+        backend.add_tree(str(tmp_path))
+        (tmp_path / "a" / "b" / "file.txt").write_text("x")
+        (tmp_path / "nuova").mkdir()
+        events = backend.read(1.0)
+        # La cartella creata viene osservata subito
+        (tmp_path / "nuova" / "dentro.txt").write_text("y")
+        events += backend.read(1.0)
+    finally:
+        backend.close()
+
+    assert (str(tmp_path / "a" / "b"), False) in events
+    assert (str(tmp_path / "nuova"), True) in events
+    assert (str(tmp_path / "nuova"), False) in events
@@ -0,0 +1,148 @@
+import pytest
+import io
+import os
+import random
+import sys
+
+# Importa la tua classe da testare
+from pybck.ChunkStore import ChunkStore, DedupEngine, chunk_stream, read_recipe, RECIPE_NAME
+
+
+def _random_bytes(size, seed):
+    return random.Random(seed).randbytes(size)
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+def test_chunk_stream_reassembles_and_respects_limits():
+    data = _random_bytes(3 * 1024 * 1024, 1)
+
+    chunks = list(chunk_stream(io.BytesIO(data), min_size=4096, avg_size=16384, max_size=65536))
+
+    assert b"".join(chunks) == data
+    assert all(len(chunk) <= 65536 for chunk in chunks)
+    assert all(len(chunk) >= 4096 for chunk in chunks[:-1])
+
+
+def test_chunk_stream_boundaries_survive_insertion():
+    # Inserire byte all'inizio sposta i dati ma non deve cambiare i chunk successivi
+    data = _random_bytes(1024 * 1024, 2)
+    shifted = b"inserimento" + data
+
+    original = set(chunk_stream(io.BytesIO(data), min_size=2048, avg_size=8192, max_size=32768, chunker="cdc"))
+    modified = set(chunk_stream(io.BytesIO(shifted), min_size=2048, avg_size=8192, max_size=32768, chunker="cdc"))
+
+    assert len(original & modified) >= len(original) - 3
+
+
+@pytest.mark.parametrize("sizes", [(2048, 8192, 32768), (64, 256, 1024)])
+def test_chunk_stream_numpy_matches_pure_python(monkeypatch, sizes):
+    pytest.importorskip("numpy")
+    # Una sequenza di zeri non ha tagli: il chunk arriva fino a max_size
+    data = _random_bytes(5 * 1024 * 1024, 6)
+    data = data[:100000] + bytes(300000) + data[100000:]
+
+    vectorised = [len(chunk) for chunk in chunk_stream(io.BytesIO(data), *sizes, chunker="cdc")]
+    monkeypatch.setitem(sys.modules, "numpy", None)
+    pure = [len(chunk) for chunk in chunk_stream(io.BytesIO(data), *sizes, chunker="cdc")]
+
+    assert vectorised == pure
+
+
+def test_chunk_stream_falls_back_to_fixed_size_without_numpy(monkeypatch):
+    monkeypatch.setitem(sys.modules, "numpy", None)
+    data = _random_bytes(100 * 1024 + 10, 7)
+
+    chunks = list(chunk_stream(io.BytesIO(data), min_size=4096, avg_size=16384, max_size=65536))
+
+    assert b"".join(chunks) == data
+    assert [len(chunk) for chunk in chunks] == [16384] * 6 + [len(data) - 6 * 16384]
+    with pytest.raises(ValueError):
+        list(chunk_stream(io.BytesIO(data), chunker="rabin"))
+
+
+def test_store_put_deduplicates_and_release(tmp_path):
+    store = ChunkStore(str(tmp_path / "store"))
+
+    digest, written = store.put(b"chunk di prova")
+    digest_again, written_again = store.put(b"chunk di prova")
+
+    assert digest == digest_again
+    assert written == True
+    assert written_again == False
+    assert store.read_chunk(digest) == b"chunk di prova"
+
+    assert store.release([digest]) == 0
+    assert os.path.exists(store.chunk_path(digest))
+    assert store.release([digest]) == len(b"chunk di prova")
+    assert not os.path.exists(store.chunk_path(digest))
+    store.close()
+
+
+def test_dedup_engine_mirror_and_restore(tmp_path):
+    source = tmp_path / "src"
+    big = _random_bytes(600 * 1024, 3)
+    _write(str(source / "iso" / "disco.iso"), big)
+    _write(str(source / "copia" / "disco.iso"), big)
+    _write(str(source / "note.txt"), b"ciao")
+
+    store = ChunkStore(str(tmp_path / "store"))
+    engine = DedupEngine(store)
+    stats = engine.mirror(str(source), str(tmp_path / "snap1"))
+
+    # Il secondo file identico non scrive nuovi chunk
+    assert stats.bytes_copied < len(big) + 100
+    recipe = {entry["path"]: entry for entry in read_recipe(str(tmp_path / "snap1" / RECIPE_NAME))}
+    assert set(recipe) == {"iso/disco.iso", "copia/disco.iso", "note.txt"}
+
+    store.restore_file(recipe["iso/disco.iso"]["chunks"], str(tmp_path / "restored.iso"))
+    assert (tmp_path / "restored.iso").read_bytes() == big
+
+    # Secondo snapshot: i file invariati riusano la ricetta senza essere riletti
+    stats = engine.mirror(str(source), str(tmp_path / "snap2"), link_dest=str(tmp_path / "snap1"))
+    assert stats.files_skipped == 3
+    assert stats.bytes_copied == 0
+
+    # Rilasciando il primo snapshot i chunk restano, referenziati dal secondo
+    store.release_recipe(str(tmp_path / "snap1" / RECIPE_NAME))
+    store.restore_file(recipe["copia/disco.iso"]["chunks"], str(tmp_path / "restored2.iso"))
+    assert (tmp_path / "restored2.iso").read_bytes() == big
+    store.close()
+
+
+def test_resumed_mirror_does_not_leak_refs(tmp_path, monkeypatch):
+    source = tmp_path / "src"
+    _write(str(source / "a.bin"), _random_bytes(300 * 1024, 4))
+    _write(str(source / "b.bin"), _random_bytes(300 * 1024, 5))
+    store = ChunkStore(str(tmp_path / "store"))
+    engine = DedupEngine(store)
+
+    # Primo tentativo interrotto dopo il primo file: resta solo la ricetta .tmp
+    original = DedupEngine._store_file
+    calls = []
+    def interrupted(self, *args, **kwargs):
+        calls.append(args)
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        return original(self, *args, **kwargs)
+    monkeypatch.setattr(DedupEngine, "_store_file", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        engine.mirror(str(source), str(tmp_path / "snap"))
+    monkeypatch.setattr(DedupEngine, "_store_file", original)
+    assert (tmp_path / "snap" / (RECIPE_NAME + ".tmp")).exists()
+
+    # Ripresa: la ricetta viene riscritta e ogni chunk ha un solo riferimento
+    engine.mirror(str(source), str(tmp_path / "snap"))
+    assert not (tmp_path / "snap" / (RECIPE_NAME + ".tmp")).exists()
+    assert {refs for (refs,) in store._db.execute("SELECT refs FROM chunks")} == {1}
+
+    # Eliminando lo snapshot non resta nessun chunk
+    store.discard_recipe(str(tmp_path / "snap" / RECIPE_NAME))
+    store.prune_unreferenced()
+    assert store._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0] == 0
+    assert not (tmp_path / "snap" / RECIPE_NAME).exists()
+    store.close()
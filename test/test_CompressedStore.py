@@ -0,0 +1,96 @@
+import pytest
+import hashlib
+import os
+
+from pybck.BackupManifest import BackupManifest
+from pybck.CompressedStore import (CompressEngine, SUFFIX, compress_file, decompress_file, is_compressible,
+                                   read_header, validate_codec, zstandard)
+
+
+TEXT = b"".join(b"2024-01-22 10:30:%02d INFO richiesta servita in %d ms\n" % (i % 60, i) for i in range(20000))
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+@pytest.mark.parametrize("codec", ["zlib", "lzma"] + (["zstd"] if zstandard is not None else []))
+def test_compress_file_roundtrip(tmp_path, codec):
+    _write(str(tmp_path / "server.log"), TEXT)
+
+    compressed, read, written, cpu = compress_file(str(tmp_path / "server.log"), str(tmp_path / "copia.log"), codec)
+
+    assert compressed
+    assert read == len(TEXT)
+    assert written == os.path.getsize(tmp_path / ("copia.log" + SUFFIX)) < len(TEXT) / 5
+    assert cpu >= 0
+    assert read_header(str(tmp_path / ("copia.log" + SUFFIX)))[1] == len(TEXT)
+    decompress_file(str(tmp_path / ("copia.log" + SUFFIX)), str(tmp_path / "ripristino.log"))
+    assert (tmp_path / "ripristino.log").read_bytes() == TEXT
+    assert os.stat(tmp_path / "ripristino.log").st_mtime_ns == os.stat(tmp_path / "server.log").st_mtime_ns
+
+
+def test_incompressible_data_is_copied(tmp_path):
+    data = os.urandom(300 * 1024)
+    _write(str(tmp_path / "dati.bin"), data)
+
+    compressed, read, written, _ = compress_file(str(tmp_path / "dati.bin"), str(tmp_path / "copia.bin"), "zlib")
+
+    assert not compressed
+    assert read == written == len(data)
+    assert (tmp_path / "copia.bin").read_bytes() == data
+    assert not (tmp_path / ("copia.bin" + SUFFIX)).exists()
+
+
+def test_is_compressible():
+    assert is_compressible("relazione.doc", 100000)
+    assert not is_compressible("foto.JPG", 100000)
+    assert not is_compressible("relazione.docx", 100000)
+    assert not is_compressible("nota.txt", 100)
+    # Un file con il suffisso va sempre compresso, altrimenti verrebbe scambiato per un file compresso
+    assert is_compressible("vecchio" + SUFFIX, 10)
+
+
+def test_validate_codec():
+    validate_codec("lzma", 9)
+    with pytest.raises(ValueError, match="Codec di compressione non valido"):
+        validate_codec("brotli")
+
+
+def test_engine_mirror_links_unchanged_and_manifest(tmp_path):
+    source = tmp_path / "src"
+    _write(str(source / "log" / "server.log"), TEXT)
+    _write(str(source / "foto.jpg"), os.urandom(50000))
+    _write(str(source / "nota.txt"), b"breve")
+    _write(str(source / "rumore.dat"), os.urandom(100000))
+
+    engine = CompressEngine("zlib", processes=2)
+    try:
+        stats = engine.mirror(str(source), str(tmp_path / "snap1"))
+        assert stats.files_copied == 4
+        assert stats.files_compressed == 1
+        assert stats.files_incompressible == 3
+        assert stats.bytes_stored < stats.bytes_copied
+        assert (tmp_path / "snap1" / "log" / ("server.log" + SUFFIX)).exists()
+        assert (tmp_path / "snap1" / "foto.jpg").read_bytes() == (source / "foto.jpg").read_bytes()
+
+        _write(str(source / "nota.txt"), b"modificata")
+        stats = engine.mirror(str(source), str(tmp_path / "snap2"), link_dest=str(tmp_path / "snap1"))
+    finally:
+        engine.close()
+
+    assert stats.files_linked == 3
+    assert stats.files_copied == 1
+    compressed = os.path.join("log", "server.log" + SUFFIX)
+    assert os.stat(tmp_path / "snap2" / compressed).st_ino == os.stat(tmp_path / "snap1" / compressed).st_ino
+
+    # Il manifest descrive i file originali
+    with BackupManifest(BackupManifest.build(str(tmp_path / "snap2"), with_hash=True)) as manifest:
+        entry = manifest.lookup("log/server.log")
+        assert entry.size == len(TEXT)
+        assert entry.hash == hashlib.sha256(TEXT).digest()
+        assert entry.mtime_ns == os.stat(source / "log" / "server.log").st_mtime_ns
+        assert manifest.lookup("nota.txt").size == len(b"modificata")
+        assert len(manifest) == 4
@@ -0,0 +1,282 @@
+import pytest
+import errno
+import os
+from types import SimpleNamespace
+
+# Importa la tua classe da testare
+from pybck.CopyEngine import NativeCopyEngine, create_copy_engine, supports_clone, FICLONE
+from pybck.BackupProgress import ProgressTracker
+from pybck.DeltaCopy import DeltaCopier, SignatureCache
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+def test_mirror_copies_tree(tmp_path):
+    source = tmp_path / "src"
+    destination = tmp_path / "dst"
+    _write(str(source / "a.txt"), b"ciao")
+    _write(str(source / "sub" / "deep" / "big.bin"), os.urandom(3 * 1024 * 1024 + 17))
+    _write(str(source / "empty.txt"), b"")
+
+    engine = NativeCopyEngine(threads=4, buffer_size=64 * 1024, retry_wait=0)
+    progress = ProgressTracker(str(source))
+    stats = engine.mirror(str(source), str(destination), progress=progress)
+
+    assert stats.files_copied == 3
+    assert progress.files_done == 3
+    assert progress.total_bytes == stats.bytes_copied
+    assert (destination / "a.txt").read_bytes() == b"ciao"
+    assert (destination / "sub" / "deep" / "big.bin").read_bytes() == (source / "sub" / "deep" / "big.bin").read_bytes()
+    assert (destination / "empty.txt").read_bytes() == b""
+    # I tempi di modifica vengono preservati per i confronti successivi
+    assert os.stat(destination / "a.txt").st_mtime_ns == os.stat(source / "a.txt").st_mtime_ns
+
+
+def test_mirror_skips_unchanged_and_removes_extra(tmp_path):
+    source = tmp_path / "src"
+    destination = tmp_path / "dst"
+    _write(str(source / "keep.txt"), b"uguale")
+    _write(str(source / "change.txt"), b"vecchio")
+
+    engine = NativeCopyEngine(threads=2, retry_wait=0)
+    engine.mirror(str(source), str(destination))
+
+    _write(str(source / "change.txt"), b"contenuto nuovo")
+    _write(str(destination / "extra" / "orfano.txt"), b"x")
+    _write(str(destination / "orfano.txt"), b"x")
+
+    stats = engine.mirror(str(source), str(destination))
+
+    assert stats.files_skipped == 1
+    assert stats.files_copied == 1
+    assert stats.entries_removed == 2
+    assert (destination / "change.txt").read_bytes() == b"contenuto nuovo"
+    assert not (destination / "extra").exists()
+    assert not (destination / "orfano.txt").exists()
+
+
+def test_mirror_buffered_fallback(tmp_path, monkeypatch):
+    # Simula una piattaforma senza copy_file_range/sendfile
+    monkeypatch.setattr("pybck.CopyEngine._HAS_COPY_FILE_RANGE", False)
+    monkeypatch.setattr("pybck.CopyEngine._HAS_SENDFILE", False)
+    source = tmp_path / "src"
+    data = os.urandom(200 * 1024 + 3)
+    _write(str(source / "file.bin"), data)
+
+    engine = NativeCopyEngine(threads=1, buffer_size=4096, retry_wait=0)
+    engine.mirror(str(source), str(tmp_path / "dst"))
+
+    assert (tmp_path / "dst" / "file.bin").read_bytes() == data
+
+
+def test_mirror_keeps_sparse_files_sparse(tmp_path):
+    source = tmp_path / "src"
+    os.makedirs(source)
+    size = 64 * 1024 * 1024
+    with open(source / "disco.img", "wb") as file:
+        file.truncate(size)
+        file.seek(8 * 1024 * 1024)
+        file.write(b"dati" * 1024)
+        file.seek(size - 4096)
+        file.write(b"fine" * 1024)
+    if os.stat(source / "disco.img").st_blocks * 512 >= size:
+        pytest.skip("Il file system non supporta i file sparsi")
+
+    engine = NativeCopyEngine(threads=1, retry_wait=0, reflink=False)
+    stats = engine.mirror(str(source), str(tmp_path / "dst"))
+
+    copy = tmp_path / "dst" / "disco.img"
+    assert stats.files_sparse == 1
+    assert copy.read_bytes() == (source / "disco.img").read_bytes()
+    assert os.stat(copy).st_blocks * 512 < 1024 * 1024
+
+
+def test_mirror_falls_back_when_clone_unsupported(tmp_path, monkeypatch):
+    calls = []
+
+    def ioctl(fd, request, arg):
+        calls.append(request)
+        raise OSError(errno.EOPNOTSUPP, "Operation not supported")
+    monkeypatch.setattr("pybck.CopyEngine._HAS_FICLONE", True)
+    monkeypatch.setattr("pybck.CopyEngine.fcntl", SimpleNamespace(ioctl=ioctl))
+    source = tmp_path / "src"
+    for index in range(3):
+        _write(str(source / f"file{index}.bin"), os.urandom(1000))
+
+    engine = NativeCopyEngine(threads=1, retry_wait=0)
+    stats = engine.mirror(str(source), str(tmp_path / "dst"))
+
+    assert stats.files_copied == 3 and stats.files_cloned == 0
+    assert (tmp_path / "dst" / "file2.bin").read_bytes() == (source / "file2.bin").read_bytes()
+    # Stessa coppia di dispositivi: la clonazione viene tentata una sola volta
+    assert calls == [FICLONE]
+
+
+def test_mirror_counts_cloned_files(tmp_path, monkeypatch):
+    def ioctl(fd, request, arg):
+        # Simula il reflink copiando il contenuto
+        os.write(fd, os.pread(arg, 1 << 20, 0))
+    monkeypatch.setattr("pybck.CopyEngine._HAS_FICLONE", True)
+    monkeypatch.setattr("pybck.CopyEngine.fcntl", SimpleNamespace(ioctl=ioctl))
+    source = tmp_path / "src"
+    _write(str(source / "a.bin"), b"clonato")
+
+    stats = NativeCopyEngine(threads=1, retry_wait=0).mirror(str(source), str(tmp_path / "dst"))
+
+    assert stats.files_cloned == 1 and stats.bytes_cloned == 7
+    assert (tmp_path / "dst" / "a.bin").read_bytes() == b"clonato"
+
+
+def test_mirror_missing_source_raises(tmp_path):
+    engine = NativeCopyEngine(threads=1, retries=0)
+
+    with pytest.raises(Exception, match="Copia nativa fallita"):
+        engine.mirror(str(tmp_path / "non_esiste"), str(tmp_path / "dst"))
+
+
+def test_mirror_reports_unexpected_job_errors(tmp_path, monkeypatch):
+    _write(str(tmp_path / "src" / "a.txt"), b"ciao")
+    engine = NativeCopyEngine(threads=2, retries=0)
+    # Un errore non previsto da _copy_job non deve sparire nel pool di thread
+    monkeypatch.setattr(engine, "_copy_job", lambda *args: 1 / 0)
+
+    with pytest.raises(Exception, match="division by zero"):
+        engine.mirror(str(tmp_path / "src"), str(tmp_path / "dst"))
+
+
+def test_create_copy_engine():
+    assert create_copy_engine("robocopy") is None
+    assert isinstance(create_copy_engine("native", threads=2), NativeCopyEngine)
+
+    with pytest.raises(ValueError, match="Motore di copia non valido"):
+        create_copy_engine("xcopy")
+
+
+def test_mirror_link_dest_hardlinks_unchanged(tmp_path):
+    source = tmp_path / "src"
+    _write(str(source / "statico.bin"), b"dati invariati")
+    _write(str(source / "sub" / "modificato.txt"), b"v1")
+
+    engine = NativeCopyEngine(threads=2, retry_wait=0)
+    engine.mirror(str(source), str(tmp_path / "snap1"))
+
+    _write(str(source / "sub" / "modificato.txt"), b"versione 2")
+    _write(str(source / "nuovo.txt"), b"nuovo")
+
+    stats = engine.mirror(str(source), str(tmp_path / "snap2"), link_dest=str(tmp_path / "snap1"))
+
+    assert stats.files_linked == 1
+    assert stats.files_copied == 2
+    assert os.stat(tmp_path / "snap2" / "statico.bin").st_ino == os.stat(tmp_path / "snap1" / "statico.bin").st_ino
+    assert (tmp_path / "snap2" / "sub" / "modificato.txt").read_bytes() == b"versione 2"
+    # Lo snapshot precedente resta intatto
+    assert (tmp_path / "snap1" / "sub" / "modificato.txt").read_bytes() == b"v1"
+
+
+def test_mirror_delta_copies_large_modified_files(tmp_path, monkeypatch):
+    monkeypatch.setattr("pybck.CopyEngine.supports_clone", lambda directory: True)
+    source = tmp_path / "src"
+    data = bytearray(os.urandom(1024 * 1024))
+    _write(str(source / "posta.pst"), bytes(data))
+    _write(str(source / "piccolo.txt"), b"v1")
+
+    delta = DeltaCopier(min_size=512 * 1024, cache=SignatureCache(str(tmp_path / "firme")))
+    engine = NativeCopyEngine(threads=2, retry_wait=0, delta=delta)
+    engine.mirror(str(source), str(tmp_path / "snap1"))
+
+    data[300000:300010] = b"modificato"
+    _write(str(source / "posta.pst"), bytes(data))
+    os.utime(source / "posta.pst", ns=(os.stat(source / "posta.pst").st_mtime_ns + 10**10,) * 2)
+    _write(str(source / "piccolo.txt"), b"versione 2")
+
+    stats = engine.mirror(str(source), str(tmp_path / "snap2"), link_dest=str(tmp_path / "snap1"))
+
+    assert stats.files_copied == 2
+    assert stats.files_delta == 1
+    assert stats.bytes_reused == len(data) - 16 * 1024
+    assert (tmp_path / "snap2" / "posta.pst").read_bytes() == bytes(data)
+    assert (tmp_path / "snap2" / "piccolo.txt").read_bytes() == b"versione 2"
+    assert os.stat(tmp_path / "snap2" / "posta.pst").st_mtime_ns == os.stat(source / "posta.pst").st_mtime_ns
+    assert (tmp_path / "snap1" / "posta.pst").read_bytes() != bytes(data)
+
+
+def test_mirror_delta_needs_clone_support(tmp_path, monkeypatch):
+    # Senza reflink la copia a delta riscriverebbe tutto il file: copia completa
+    monkeypatch.setattr("pybck.CopyEngine.supports_clone", lambda directory: False)
+    source = tmp_path / "src"
+    _write(str(source / "posta.pst"), os.urandom(1024 * 1024))
+    delta = DeltaCopier(min_size=512 * 1024, cache=SignatureCache(str(tmp_path / "firme")))
+    engine = NativeCopyEngine(threads=2, retry_wait=0, delta=delta)
+    engine.mirror(str(source), str(tmp_path / "snap1"))
+
+    _write(str(source / "posta.pst"), os.urandom(1024 * 1024))
+    os.utime(source / "posta.pst", ns=(os.stat(source / "posta.pst").st_mtime_ns + 10**10,) * 2)
+    stats = engine.mirror(str(source), str(tmp_path / "snap2"), link_dest=str(tmp_path / "snap1"))
+
+    assert stats.files_copied == 1
+    assert stats.files_delta == 0
+    assert stats.bytes_copied == 1024 * 1024
+    assert (tmp_path / "snap2" / "posta.pst").read_bytes() == (source / "posta.pst").read_bytes()
+
+
+def test_supports_clone_leaves_no_probe(tmp_path):
+    assert supports_clone(str(tmp_path)) in (True, False)
+    assert os.listdir(tmp_path) == []
+
+
+def test_mirror_with_changes_scans_only_dirty_dirs(tmp_path):
+    from pybck.BackupManifest import BackupManifest
+    from pybck.ChangeJournal import ChangeSet
+    source = tmp_path / "src"
+    _write(str(source / "clean" / "deep" / "a.txt"), b"invariato")
+    _write(str(source / "dirty" / "b.txt"), b"vecchio")
+    _write(str(source / "root.txt"), b"radice")
+    engine = NativeCopyEngine(threads=2, retry_wait=0)
+    previous = tmp_path / "P1" / "Disco_D_Backup_P1"
+    engine.mirror(str(source), str(previous))
+    BackupManifest.build(str(tmp_path / "P1"))
+
+    _write(str(source / "dirty" / "b.txt"), b"nuovo contenuto")
+    _write(str(source / "dirty" / "c.txt"), b"aggiunto")
+    # Non registrato nel journal: il sottoalbero invariato non viene letto
+    _write(str(source / "clean" / "ignorato.txt"), b"x")
+
+    changes = ChangeSet({"dirty"})
+    changes.manifest = BackupManifest(str(tmp_path / "P1" / ".pybck_manifest"))
+    changes.prefix = "Disco_D_Backup_P1/"
+    destination = tmp_path / "P2"
+    try:
+        stats = engine.mirror(str(source), str(destination), str(previous), changes=changes)
+    finally:
+        changes.manifest.close()
+
+    assert stats.dirs_unscanned == 1
+    assert (destination / "dirty" / "b.txt").read_bytes() == b"nuovo contenuto"
+    assert (destination / "dirty" / "c.txt").read_bytes() == b"aggiunto"
+    assert os.stat(destination / "clean" / "deep" / "a.txt").st_ino == os.stat(previous / "clean" / "deep" / "a.txt").st_ino
+    assert os.stat(destination / "root.txt").st_ino == os.stat(previous / "root.txt").st_ino
+    assert not (destination / "clean" / "ignorato.txt").exists()
+
+
+def test_mirror_applies_path_filter(tmp_path):
+    from pybck.PathFilter import PathFilter
+    source = tmp_path / "src"
+    destination = tmp_path / "dst"
+    _write(str(source / "web" / "index.html"), b"<html>")
+    _write(str(source / "web" / "node_modules" / "react" / "index.js"), b"x" * 100)
+    _write(str(source / "bozza.tmp"), b"temporaneo")
+    # Copia di un backup precedente: gli elementi ora esclusi vanno rimossi come in /MIR
+    _write(str(destination / "bozza.tmp"), b"temporaneo")
+
+    engine = NativeCopyEngine(threads=2, retry_wait=0)
+    stats = engine.mirror(str(source), str(destination), path_filter=PathFilter(exclude=["node_modules/", "*.tmp"]))
+
+    assert stats.files_copied == 1
+    assert stats.entries_filtered == 2
+    assert (destination / "web" / "index.html").exists()
+    assert not (destination / "web" / "node_modules").exists()
+    assert not (destination / "bozza.tmp").exists()
@@ -0,0 +1,98 @@
+import os
+import time
+import zlib
+
+from pybck.DeltaCopy import DeltaCopier, SignatureCache, block_size_for, roll, signature, MIN_BLOCK
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+def test_roll_matches_adler32():
+    data = os.urandom(4096)
+    block = 512
+    weak = zlib.adler32(data[:block])
+    for start in range(1, len(data) - block):
+        weak = roll(weak, data[start - 1], data[start + block - 1], block)
+        assert weak == zlib.adler32(data[start:start + block])
+
+
+def test_block_size_for():
+    assert block_size_for(0) == MIN_BLOCK
+    assert block_size_for(4 * 1024**3) == 65536
+    assert block_size_for(10**15) == 1024 * 1024
+    assert block_size_for(4 * 1024**3, configured=8192) == 8192
+
+
+def test_copy_rebuilds_file_after_edits(tmp_path):
+    base = bytearray(os.urandom(2 * 1024 * 1024 + 123))
+    _write(str(tmp_path / "base.bin"), bytes(base))
+    new = bytearray(base)
+    new[100000:100050] = os.urandom(50)          # Blocco modificato
+    new[900000:900000] = b"inserito" * 5          # Inserimento: i blocchi successivi si spostano
+    del new[1500000:1500011]                      # Rimozione
+    new += os.urandom(3000)                       # Coda aggiunta
+    _write(str(tmp_path / "src.bin"), bytes(new))
+
+    copier = DeltaCopier(min_size=0, cache=SignatureCache(str(tmp_path / "firme")))
+    result = copier.copy(str(tmp_path / "src.bin"), str(tmp_path / "base.bin"), str(tmp_path / "dst.bin"))
+
+    assert (tmp_path / "dst.bin").read_bytes() == bytes(new)
+    assert result.literal_bytes + result.reused_bytes == len(new)
+    assert result.literal_bytes < 6 * MIN_BLOCK
+    assert not result.cached
+    assert (tmp_path / "base.bin").read_bytes() == bytes(base)
+
+
+def test_copy_uses_cached_signature_of_previous_copy(tmp_path):
+    data = bytearray(os.urandom(512 * 1024))
+    _write(str(tmp_path / "src.bin"), bytes(data))
+    _write(str(tmp_path / "snap1.bin"), bytes(data))
+    copier = DeltaCopier(min_size=0, cache=SignatureCache(str(tmp_path / "firme")))
+
+    data[1000] ^= 0xFF
+    _write(str(tmp_path / "src.bin"), bytes(data))
+    assert not copier.copy(str(tmp_path / "src.bin"), str(tmp_path / "snap1.bin"), str(tmp_path / "snap2.bin")).cached
+
+    # La firma di snap2 è stata salvata durante la copia: il backup successivo non rilegge la base
+    data[200000] ^= 0xFF
+    _write(str(tmp_path / "src.bin"), bytes(data))
+    result = copier.copy(str(tmp_path / "src.bin"), str(tmp_path / "snap2.bin"), str(tmp_path / "snap3.bin"))
+
+    assert result.cached
+    assert result.literal_bytes == MIN_BLOCK
+    assert (tmp_path / "snap3.bin").read_bytes() == bytes(data)
+    # Le copie collegate con hard link condividono l'inode e quindi la firma
+    os.link(tmp_path / "snap3.bin", tmp_path / "snap4.bin")
+    cached = copier.cache.load(os.stat(tmp_path / "snap4.bin"), MIN_BLOCK)
+    assert cached == signature(str(tmp_path / "snap3.bin"), MIN_BLOCK)
+
+
+def test_copy_replaces_hard_link_without_touching_previous_snapshot(tmp_path):
+    data = os.urandom(256 * 1024)
+    _write(str(tmp_path / "snap1.bin"), data)
+    os.link(tmp_path / "snap1.bin", tmp_path / "snap2.bin")
+    _write(str(tmp_path / "src.bin"), data[:-10] + b"0123456789")
+
+    DeltaCopier(min_size=0, cache=SignatureCache(str(tmp_path / "firme"))).copy(
+        str(tmp_path / "src.bin"), str(tmp_path / "snap1.bin"), str(tmp_path / "snap2.bin"))
+
+    assert (tmp_path / "snap1.bin").read_bytes() == data
+    assert (tmp_path / "snap2.bin").read_bytes() == data[:-10] + b"0123456789"
+
+
+def test_cache_prune_removes_unused_signatures(tmp_path):
+    cache = SignatureCache(str(tmp_path / "firme"))
+    _write(str(tmp_path / "a.bin"), os.urandom(1000))
+    _write(str(tmp_path / "b.bin"), os.urandom(1000))
+    for name in ("a.bin", "b.bin"):
+        cache.save(os.stat(tmp_path / name), signature(str(tmp_path / name), MIN_BLOCK))
+    old = cache._path(os.stat(tmp_path / "a.bin"))
+    os.utime(old, (time.time() - 40 * 86400,) * 2)
+
+    assert cache.prune() == 1
+    assert not os.path.exists(old)
+    assert cache.load(os.stat(tmp_path / "b.bin"), MIN_BLOCK) is not None
@@ -0,0 +1,52 @@
+import pytest
+import logging
+import os
+import subprocess
+import sys
+
+# Importa la tua classe da testare
+from pybck import logger, setup_logging, shutdown_logging, RateLimitedLog
+
+
+def test_import_has_no_side_effects(tmp_path):
+    # L'import del pacchetto non crea la cartella dei log nella cartella corrente
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    subprocess.run([sys.executable, "-c", "import pybck"], cwd=tmp_path, env=env, check=True)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_setup_logging_writes_through_queue(tmp_path):
+    log_file = tmp_path / "logs" / "backup.log"
+    previous_level = logger.level
+    try:
+        setup_logging(logging.INFO, str(log_file), console=False)
+        logger.debug("non scritto %s", "debug")
+        logger.info("scritto %s", "info")
+    finally:
+        shutdown_logging()
+        logger.setLevel(previous_level)
+
+    text = log_file.read_text(encoding="utf-8")
+    assert "scritto info" in text
+    assert "non scritto" not in text
+    assert logger.propagate
+
+
+def test_rate_limited_log_reports_suppressed(caplog):
+    limited = RateLimitedLog(logger, limit=2, interval=3600)
+    with caplog.at_level(logging.WARNING, logger="PyBck"):
+        for index in range(5):
+            limited.warning("errore sul file %d", index)
+        limited.flush()
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert messages == ["errore sul file 0", "errore sul file 1", "3 messaggi soppressi per limite di frequenza"]
+
+
+def test_rate_limited_log_skips_disabled_levels(caplog):
+    limited = RateLimitedLog(logger, limit=1, interval=3600)
+    with caplog.at_level(logging.INFO, logger="PyBck"):
+        limited.debug("nascosto")
+        limited.info("visibile")
+    assert limited.suppressed == 0
+    assert [record.getMessage() for record in caplog.records] == ["visibile"]
@@ -0,0 +1,92 @@
+import pytest
+
+from pybck.BackupConfig import BackupConfig
+from pybck.PathFilter import PathFilter, drive_filter, validate_filters
+
+
+EXCLUDE = ["node_modules/", "$RECYCLE.BIN/", "*.tmp", "**/build/", "AppData/Local/Temp/", "re:\\.pyc$"]
+
+
+def test_exclude_rules():
+    path_filter = PathFilter(exclude=EXCLUDE)
+
+    assert not path_filter.enter("web/node_modules")
+    assert not path_filter.enter("$Recycle.Bin")
+    assert not path_filter.enter("a/b/build")
+    assert not path_filter.enter("build")
+    assert not path_filter.enter("AppData/Local/Temp")
+    assert path_filter.enter("AppData/Local")
+    assert path_filter.enter("web/src")
+    # Le regole di sole cartelle non valgono per i file
+    assert path_filter.accept("build")
+    assert path_filter.accept("node_modules")
+    assert not path_filter.accept("Documenti/bozza.TMP")
+    assert not path_filter.accept("lib/modulo.pyc")
+    assert path_filter.accept("Documenti/lettera.docx")
+
+
+def test_include_literal_paths_prune_walk():
+    path_filter = PathFilter(include=["/Progetti/", "Foto/2024"], exclude=["node_modules/"])
+
+    assert path_filter.enter("Progetti")
+    assert path_filter.enter("Progetti/web/src")
+    assert path_filter.enter("Foto")
+    assert path_filter.enter("foto/2024")
+    assert not path_filter.enter("Foto/2023")
+    assert not path_filter.enter("Giochi")
+    assert not path_filter.enter("Progetti/web/node_modules")
+    assert path_filter.accept("Progetti/web/index.html")
+    assert not path_filter.accept("Foto/indice.txt")
+    assert not path_filter.accept("note.txt")
+
+
+def test_include_patterns_apply_to_files():
+    path_filter = PathFilter(include=["*.docx", "re:^Fatture/\\d{4}/"])
+
+    # Senza percorsi letterali ogni cartella va percorsa
+    assert path_filter.enter("Qualsiasi/cartella")
+    assert path_filter.accept("a/b/relazione.docx")
+    assert path_filter.accept("Fatture/2024/marzo.pdf")
+    assert not path_filter.accept("Fatture/vecchie/marzo.pdf")
+    assert not path_filter.accept("a/b/relazione.pdf")
+
+
+def test_match_checks_ancestors():
+    path_filter = PathFilter(exclude=["node_modules/", "cache/"])
+
+    assert not path_filter.match("web/node_modules/react/index.js")
+    assert not path_filter.match("cache/dati.bin")
+    assert path_filter.match("web/src/index.js")
+
+
+def test_robocopy_args():
+    path_filter = PathFilter(include=["*.docx"], exclude=["node_modules/", "*.tmp", "AppData/Local/Temp/"])
+
+    files, options = path_filter.robocopy_args("C:\\Users\\me")
+
+    assert files == ["*.docx"]
+    assert options == ["/XD", "node_modules", "*.tmp", "C:\\Users\\me\\AppData\\Local\\Temp", "/XF", "*.tmp"]
+
+
+def test_drive_filter_merges_common_rules():
+    config = BackupConfig(backup_drive="G:", backup_root="BackupPC", source_drives=["D:", "E:"],
+                          user_folders=["Documents"], keep_last_n=7, copy_engine="native",
+                          filters={"*": {"exclude": ["node_modules/"]}, "D:": {"exclude": ["*.iso"]}})
+
+    d_filter = drive_filter(config, "D:")
+    assert d_filter.exclude == ["node_modules/", "*.iso"]
+    assert drive_filter(config, "E:").exclude == ["node_modules/"]
+    config.filters = {}
+    assert drive_filter(config, "D:") is None
+
+
+@pytest.mark.parametrize("filters, engine, message", [
+    ({"X": {"exclude": ["a"]}}, "native", "unità non valida"),
+    ({"D:": {"skip": ["a"]}}, "native", "solo le chiavi"),
+    ({"D:": {"exclude": [""]}}, "native", "regole non vuote"),
+    ({"D:": {"exclude": ["re:(aperta"]}}, "native", "Espressione regolare non valida"),
+    ({"D:": {"exclude": ["src/**/build/"]}}, "robocopy", "non applicabili da robocopy"),
+])
+def test_validate_filters_errors(filters, engine, message):
+    with pytest.raises(ValueError, match=message):
+        validate_filters(filters, engine)
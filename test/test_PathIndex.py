@@ -0,0 +1,171 @@
+import pytest
+import itertools
+import os
+import sqlite3
+from unittest.mock import Mock
+
+from pybck.BackupCleaner import BackupCleaner
+from pybck.BackupManifest import BackupManifest, ManifestEntry, MANIFEST_NAME
+from pybck.PathIndex import PathIndex, INDEX_NAME
+
+NAMES = ["2024-01-20_10-00-00", "2024-01-21_10-00-00", "2024-01-22_10-00-00", "2024-01-23_10-00-00"]
+
+# Contenuto di ogni snapshot: percorso nel manifest → (size, mtime_ns)
+SNAPSHOTS = {
+    NAMES[0]: {"a.txt": (1, 100), "b.txt": (2, 200), "c.txt": (3, 300)},
+    NAMES[1]: {"a.txt": (1, 100), "b.txt": (5, 500), "c.txt": (3, 300)},
+    NAMES[2]: {"a.txt": (1, 100), "b.txt": (5, 500), "sub/d.txt": (4, 400)},
+    NAMES[3]: {"a.txt": (1, 100), "b.txt": (2, 200), "c.txt": (3, 300), "sub/d.txt": (4, 400)},
+}
+
+
+def _write_snapshots(root, snapshots=SNAPSHOTS):
+    for name, files in snapshots.items():
+        os.makedirs(os.path.join(root, name), exist_ok=True)
+        entries = [ManifestEntry(f"Disco_D_Backup_{name}/{path}", size, mtime_ns, 0o644)
+                   for path, (size, mtime_ns) in files.items()]
+        entries.append(ManifestEntry(".pybck_journal.jsonl", 10, 0, 0o644))  # File interno, non indicizzato
+        BackupManifest.write(os.path.join(root, name, MANIFEST_NAME), entries)
+
+
+def _expected(names, path):
+    # Risultato atteso di versions() calcolato direttamente dai manifest
+    relative = path[len("D:/"):]
+    return [(name, *SNAPSHOTS[name][relative]) for name in sorted(names, reverse=True) if relative in SNAPSHOTS[name]]
+
+
+def _versions(index, path):
+    return [(entry.snapshot, entry.size, entry.mtime_ns) for entry in index.versions(path)]
+
+
+def test_versions_across_snapshots(tmp_path):
+    _write_snapshots(str(tmp_path))
+    with PathIndex(str(tmp_path)) as index:
+        written = [index.add_snapshot(name) for name in NAMES]
+
+        for path in ("D:/a.txt", "D:/b.txt", "D:/c.txt", "D:/sub/d.txt"):
+            assert _versions(index, path) == _expected(NAMES, path)
+        assert index.versions("D:/assente.txt") == []
+        assert index.versions("d:\\sub\\d.txt")[0].path == "D:/sub/d.txt"
+        assert index.snapshots() == NAMES[::-1]
+
+    # Solo i file nuovi o modificati vengono scritti: a.txt invariato occupa una sola riga
+    assert written == [3, 1, 1, 2]
+    db = sqlite3.connect(str(tmp_path / INDEX_NAME))
+    assert db.execute("SELECT COUNT(*) FROM versions WHERE path = 'D:/a.txt'").fetchone()[0] == 1
+    assert db.execute("SELECT COUNT(*) FROM versions WHERE path LIKE '%journal%'").fetchone()[0] == 0
+
+
+@pytest.mark.parametrize("batch", [False, True])
+@pytest.mark.parametrize("removed", [names for size in (1, 2, 3) for names in itertools.combinations(NAMES, size)])
+def test_remove_snapshots(tmp_path, removed, batch):
+    _write_snapshots(str(tmp_path))
+    with PathIndex(str(tmp_path)) as index:
+        for name in NAMES:
+            index.add_snapshot(name)
+        if batch:
+            index.remove_snapshots(list(removed))
+        else:
+            for name in removed:
+                index.remove_snapshot(name)
+
+        remaining = [name for name in NAMES if name not in removed]
+        for path in ("D:/a.txt", "D:/b.txt", "D:/c.txt", "D:/sub/d.txt"):
+            assert _versions(index, path) == _expected(remaining, path)
+
+        # Dopo la rimozione l'indice continua ad aggiornarsi in modo incrementale
+        new = "2024-01-24_10-00-00"
+        _write_snapshots(str(tmp_path), {new: {"a.txt": (1, 100), "c.txt": (9, 900)}})
+        index.add_snapshot(new)
+        assert _versions(index, "D:/a.txt")[0] == (new, 1, 100)
+        assert _versions(index, "D:/c.txt")[0] == (new, 9, 900)
+        assert [version[0] for version in _versions(index, "D:/b.txt")] == [name for name, *_ in _expected(remaining, "D:/b.txt")]
+
+
+def test_older_snapshot_rebuilds_index(tmp_path):
+    _write_snapshots(str(tmp_path))
+    with PathIndex(str(tmp_path)) as index:
+        for name in (NAMES[0], NAMES[2], NAMES[3]):
+            index.add_snapshot(name)
+        index.add_snapshot(NAMES[1])
+
+        assert index.snapshots() == NAMES[::-1]
+        assert _versions(index, "D:/b.txt") == _expected(NAMES, "D:/b.txt")
+
+
+def test_search_prefix_and_glob(tmp_path):
+    _write_snapshots(str(tmp_path))
+    with PathIndex(str(tmp_path)) as index:
+        for name in NAMES:
+            index.add_snapshot(name)
+
+        # b.txt ha tre versioni distinte: 200 (solo il primo), 500 (secondo e terzo), 200 (ultimo)
+        found = index.search(pattern="D:/b.*")
+        assert [(v.path, v.first, v.last, v.size) for v in found] == [
+            ("D:/b.txt", NAMES[3], NAMES[3], 2),
+            ("D:/b.txt", NAMES[1], NAMES[2], 5),
+            ("D:/b.txt", NAMES[0], NAMES[0], 2),
+        ]
+        assert [v.path for v in index.search(prefix="D:/sub/")] == ["D:/sub/d.txt"]
+        assert {v.path for v in index.search(pattern="*.txt")} == {"D:/a.txt", "D:/b.txt", "D:/c.txt", "D:/sub/d.txt"}
+        assert len(index.search(prefix="D:/", limit=2)) == 2
+        assert index.search(prefix="E:/") == []
+
+
+def test_cleaner_removes_deleted_snapshots_from_index(tmp_path):
+    _write_snapshots(str(tmp_path))
+    with PathIndex(str(tmp_path)) as index:
+        for name in NAMES:
+            index.add_snapshot(name)
+
+    config = Mock()
+    config.backup_drive = str(tmp_path)
+    config.backup_root = ""
+    config.drive_map = {}
+    config.keep_last_n = 0
+    config.keep_daily = config.keep_weekly = config.keep_monthly = config.keep_yearly = 0
+    config.reclaim_threads = 1
+    config.reclaim_max_ops_per_s = 0
+    config.reclaim_in_background = False
+    cleaner = BackupCleaner(config)
+    # Budget pari allo spazio occupato dagli ultimi tre snapshot
+    sizes = cleaner.snapshot_sizes(NAMES)
+    config.max_backup_size_gb = sum(sizes[name] for name in NAMES[1:]) / 1024**3
+    cleaner.clean_old_backups()
+
+    assert cleaner.cleanedOld
+    assert cleaner.get_finalized_backups() == NAMES[:0:-1]
+    with PathIndex(str(tmp_path)) as index:
+        assert index.snapshots() == cleaner.get_finalized_backups()
+        assert NAMES[0] not in [entry.snapshot for entry in index.versions("D:/a.txt")]
+
+
+def test_cleaner_opens_index_once(tmp_path, monkeypatch):
+    _write_snapshots(str(tmp_path))
+    with PathIndex(str(tmp_path)) as index:
+        for name in NAMES:
+            index.add_snapshot(name)
+
+    config = Mock()
+    config.backup_drive = str(tmp_path)
+    config.backup_root = ""
+    config.drive_map = {}
+    config.keep_last_n = 1
+    config.keep_daily = config.keep_weekly = config.keep_monthly = config.keep_yearly = 0
+    config.max_backup_size_gb = 0
+    config.reclaim_threads = 1
+    config.reclaim_max_ops_per_s = 0
+    config.reclaim_in_background = False
+    opened = []
+    original = PathIndex.__init__
+    monkeypatch.setattr(PathIndex, "__init__", lambda self, root: opened.append(root) or original(self, root))
+    cleaner = BackupCleaner(config)
+    cleaner.clean_old_backups()
+
+    # Tre snapshot eliminati, una sola apertura dell'indice
+    assert cleaner.get_finalized_backups() == NAMES[-1:]
+    assert len(opened) == 1
+    monkeypatch.undo()
+    with PathIndex(str(tmp_path)) as index:
+        assert index.snapshots() == NAMES[-1:]
+        assert _versions(index, "D:/c.txt") == _expected(NAMES[-1:], "D:/c.txt")
@@ -0,0 +1,56 @@
+import pytest
+from datetime import datetime, timedelta
+
+# Importa la tua classe da testare
+from pybck.RetentionPolicy import RetentionPolicy, plan_retention
+
+
+def _daily_names(days, start=datetime(2024, 1, 1, 10, 0, 0)):
+    return [(start + timedelta(days=d)).strftime("%Y-%m-%d_%H-%M-%S") for d in range(days)]
+
+
+def test_keep_last_matches_old_behaviour():
+    names = _daily_names(10)
+    keep, delete = plan_retention(names, RetentionPolicy(keep_last=7))
+    assert keep == sorted(names, reverse=True)[:7]
+    assert delete == sorted(names, reverse=True)[7:]
+
+
+def test_no_rules_deletes_everything():
+    names = _daily_names(3)
+    assert plan_retention(names, RetentionPolicy()) == ([], sorted(names, reverse=True))
+
+
+def test_daily_keeps_last_backup_of_each_day():
+    names = ["2024-01-02_08-00-00", "2024-01-02_20-00-00", "2024-01-01_08-00-00", "2023-12-31_08-00-00"]
+    keep, delete = plan_retention(names, RetentionPolicy(keep_daily=2))
+    assert keep == ["2024-01-02_20-00-00", "2024-01-01_08-00-00"]
+    assert delete == ["2024-01-02_08-00-00", "2023-12-31_08-00-00"]
+
+
+def test_gfs_buckets():
+    names = _daily_names(400)
+    keep, _ = plan_retention(names, RetentionPolicy(keep_daily=7, keep_weekly=4, keep_monthly=12, keep_yearly=2))
+
+    newest = sorted(names, reverse=True)
+    assert set(newest[:7]) <= set(keep)
+    # Ultimo giorno di ciascun mese e di ciascun anno
+    assert "2024-12-31_10-00-00" in keep
+    assert "2024-03-31_10-00-00" in keep
+    # Settimane ISO: la domenica è l'ultimo giorno
+    assert "2025-01-26_10-00-00" in keep
+    assert "2024-01-15_10-00-00" not in keep
+
+
+def test_size_budget_keeps_newest_that_fit():
+    names = _daily_names(5)
+    sizes = {name: 10 for name in names}
+    keep, delete = plan_retention(names, RetentionPolicy(max_total_bytes=35), sizes)
+    assert keep == sorted(names, reverse=True)[:3]
+    assert len(delete) == 2
+
+
+def test_size_budget_always_keeps_newest():
+    names = _daily_names(2)
+    keep, _ = plan_retention(names, RetentionPolicy(keep_last=2, max_total_bytes=5), {name: 100 for name in names})
+    assert keep == [max(names)]
@@ -0,0 +1,60 @@
+import pytest
+import io
+from unittest.mock import Mock, patch
+
+# Importa la tua classe da testare
+from pybck.RobocopyRunner import RobocopyRunner
+from pybck.BackupProgress import ProgressTracker
+
+
+ROBOCOPY_OUTPUT = (
+    "\t                   3\tD:\\Foto\\\n"
+    "\t    New File  \t\t    1048576\tmare.jpg\n"
+    "\t    Newer     \t\t       2048\tnote.txt\n"
+    "2024/01/22 10:30:45 ERROR 5 (0x00000005) Copying File D:\\Foto\\bloccato.jpg\n"
+    "Accesso negato.\n"
+)
+
+
+def _process(returncode, output):
+    process = Mock()
+    process.stdout = io.StringIO(output)
+    process.wait.return_value = returncode
+    return process
+
+
+def test_run_parses_events():
+    events = []
+    tracker = ProgressTracker("D:\\", callback=events.append, interval=0)
+
+    with patch("pybck.RobocopyRunner.subprocess.Popen") as mock_popen:
+        mock_popen.return_value = _process(1, ROBOCOPY_OUTPUT)
+        returncode, output = RobocopyRunner().run("D:\\", "G:\\BackupPC\\tmp", tracker)
+
+    assert returncode == 1
+    assert tracker.files_done == 2
+    assert tracker.bytes_done == 1048576 + 2048
+    assert tracker.errors == 1
+    assert events[-1].last_file == "Copying File D:\\Foto\\bloccato.jpg"
+    assert "Accesso negato." in output
+
+
+def test_run_keeps_bounded_buffer():
+    output = "".join(f"riga {i}\n" for i in range(1000))
+
+    with patch("pybck.RobocopyRunner.subprocess.Popen") as mock_popen:
+        mock_popen.return_value = _process(0, output)
+        _, tail = RobocopyRunner(max_buffer_lines=10).run("D:\\", "G:\\BackupPC\\tmp")
+
+    assert tail.splitlines() == [f"riga {i}" for i in range(990, 1000)]
+
+
+def test_progress_tracker_eta():
+    tracker = ProgressTracker("D:\\", total_bytes=1000)
+    tracker.file_done("a", 500)
+
+    event = tracker.snapshot()
+
+    assert event.files_done == 1
+    assert event.eta_s is not None
+    assert event.mb_per_s > 0
@@ -0,0 +1,109 @@
+import pytest
+import gzip
+import io
+import os
+import tarfile
+
+from pybck.BackupConfig import BackupConfig
+from pybck.BackupBuilder import BackupBuilder
+from pybck.SnapshotExporter import SnapshotExporter, read_index, read_member, INDEX_NAME
+
+
+def _config(tmp_path, **kwargs):
+    kwargs.setdefault("copy_engine", "native")
+    return BackupConfig(
+        backup_drive="G:",
+        backup_root="BackupPC",
+        source_drives=["D:"],
+        user_folders=["Documents"],
+        keep_last_n=7,
+        drive_map={"D:": str(tmp_path / "D"), "G:": str(tmp_path / "G")},
+        metrics_dir="",
+        **kwargs
+    )
+
+
+def _snapshot(tmp_path, **kwargs):
+    # Backup reale di una sorgente con file grandi, piccoli e vuoti
+    source = tmp_path / "D"
+    (source / "sub").mkdir(parents=True)
+    (source / "grande.bin").write_bytes(os.urandom(3 * 1024 * 1024 + 5))
+    (source / "sub" / "testo.txt").write_bytes(b"riga di testo\n" * 10000)
+    (source / "sub" / "vuoto").write_bytes(b"")
+    (tmp_path / "G").mkdir()
+    config = _config(tmp_path, **kwargs)
+    builder = BackupBuilder(config)
+    builder.execute_backup()
+    assert builder.executed == True
+    return config, builder.timestamp
+
+
+@pytest.mark.parametrize("mode", [{}, {"storage_mode": "compressed", "compression_processes": 1},
+                                  {"storage_mode": "dedup"}])
+def test_export_is_a_standard_tar_gz(tmp_path, mode):
+    config, name = _snapshot(tmp_path, **mode)
+
+    stats = SnapshotExporter(config, threads=3, level=1).export(name, str(tmp_path / "export.tar.gz"))
+
+    with tarfile.open(tmp_path / "export.tar.gz", "r:gz") as tar:
+        names = tar.getnames()
+        drive = f"{name}/Disco_D_Backup_{name}"
+        assert tar.extractfile(f"{drive}/grande.bin").read() == (tmp_path / "D" / "grande.bin").read_bytes()
+        assert tar.extractfile(f"{drive}/sub/testo.txt").read() == b"riga di testo\n" * 10000
+        assert tar.getmember(f"{drive}/sub/vuoto").size == 0
+        assert tar.getmember(f"{drive}/sub/testo.txt").mtime == pytest.approx(os.stat(tmp_path / "D" / "sub" / "testo.txt").st_mtime, abs=0.01)
+    # Il manifest non viene esportato, l'indice è l'ultimo membro
+    assert not any(".pybck_manifest" in member or ".pybck_recipe" in member for member in names)
+    assert names[-1] == f"{name}/{INDEX_NAME}"
+    assert stats.bytes_out == os.path.getsize(tmp_path / "export.tar.gz")
+
+
+def test_read_member_uses_index(tmp_path):
+    config, name = _snapshot(tmp_path)
+    path = str(tmp_path / "export.tar.gz")
+    SnapshotExporter(config, threads=2).export(name, path)
+
+    index = read_index(path)
+    drive = f"{name}/Disco_D_Backup_{name}"
+    assert {member["name"] for member in index["members"]} == {f"{drive}/grande.bin", f"{drive}/sub/testo.txt", f"{drive}/sub/vuoto"}
+    assert len(index["blocks"]) > 3
+    assert b"".join(read_member(path, f"{drive}/sub/testo.txt", index)) == b"riga di testo\n" * 10000
+    assert b"".join(read_member(path, f"{drive}/grande.bin")) == (tmp_path / "D" / "grande.bin").read_bytes()
+    with pytest.raises(KeyError):
+        list(read_member(path, f"{drive}/assente", index))
+
+
+def test_export_to_stream(tmp_path):
+    config, name = _snapshot(tmp_path)
+    output = io.BytesIO()
+
+    SnapshotExporter(config, threads=2).export(name, output)
+
+    # Un unico flusso gzip (il footer è un membro vuoto) contenente un tar valido
+    with tarfile.open(fileobj=io.BytesIO(gzip.decompress(output.getvalue()))) as tar:
+        assert f"{name}/Disco_D_Backup_{name}/grande.bin" in tar.getnames()
+
+
+def test_export_missing_snapshot(tmp_path):
+    (tmp_path / "G" / "BackupPC").mkdir(parents=True)
+    with pytest.raises(FileNotFoundError, match="Snapshot non trovato"):
+        SnapshotExporter(_config(tmp_path)).export("2024-01-01_00-00-00", str(tmp_path / "x.tar.gz"))
+
+
+def test_failed_export_leaves_no_archive(tmp_path, monkeypatch):
+    config, name = _snapshot(tmp_path)
+    output = tmp_path / "export.tar.gz"
+    output.write_bytes(b"archivio precedente")
+    exporter = SnapshotExporter(config, threads=2)
+    # Lo snapshot cambia durante l'esportazione: un file risulta più corto del previsto
+    original = exporter._members
+    def truncated(*args):
+        for info, chunks in original(*args):
+            yield info, (list(chunks)[:1] if info.name.endswith("grande.bin") else chunks)
+    monkeypatch.setattr(exporter, "_members", truncated)
+
+    with pytest.raises(OSError, match="grande.bin"):
+        exporter.export(name, str(output))
+
+    assert output.read_bytes() == b"archivio precedente"
+    assert not (tmp_path / "export.tar.gz.tmp").exists()
@@ -0,0 +1,128 @@
+import pytest
+import os
+
+# Importa la tua classe da testare
+from pybck.SpacePlanner import SpacePlanner, CLUSTER_SIZE
+from pybck.BackupConfig import BackupConfig
+from pybck.BackupManifest import BackupManifest, ManifestEntry, MANIFEST_NAME
+from pybck.BackupBuilder import BackupBuilder
+from pybck import SpacePlanner as space_planner
+
+
+def _planner(tmp_path):
+    config = BackupConfig(
+        backup_drive="G:",
+        backup_root="BackupPC",
+        source_drives=["C:", "D:"],
+        user_folders=["Documents"],
+        keep_last_n=7
+    )
+    return SpacePlanner(config, threads=3, cache_path=str(tmp_path / "cache" / "scan.json"))
+
+
+def _write(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(b"x" * size)
+
+
+def _make_source(tmp_path):
+    source = tmp_path / "src"
+    _write(str(source / "a.bin"), 5000)
+    _write(str(source / "sub" / "b.bin"), 100)
+    _write(str(source / "sub" / "deep" / "c.bin"), 8192)
+    return str(source)
+
+
+def test_estimate_full_backup(tmp_path):
+    source = _make_source(tmp_path)
+    plan = _planner(tmp_path).estimate([(source, "")])
+
+    assert plan.files == 3
+    assert plan.total_bytes == 5000 + 100 + 8192
+    # Ogni file arrotondato al cluster
+    assert plan.bytes_to_write == 2 * CLUSTER_SIZE + CLUSTER_SIZE + 2 * CLUSTER_SIZE
+    assert plan.required_bytes > plan.bytes_to_write
+    assert plan.dirs_scanned == 3
+
+
+def test_estimate_delta_against_previous_manifest(tmp_path):
+    source = _make_source(tmp_path)
+    st = os.stat(os.path.join(source, "a.bin"))
+    manifest_path = str(tmp_path / "manifest")
+    BackupManifest.write(manifest_path, [
+        ManifestEntry("Disco_D_Backup_ts/a.bin", st.st_size, st.st_mtime_ns, 0o644),    # Invariato
+        ManifestEntry("Disco_D_Backup_ts/sub/b.bin", 99, st.st_mtime_ns, 0o644),         # Dimensione diversa
+    ])
+
+    with BackupManifest(manifest_path) as manifest:
+        plan = _planner(tmp_path).estimate([(source, "Disco_D_Backup_ts/")], manifest)
+
+    # a.bin è già nello snapshot precedente: restano b.bin e c.bin
+    assert plan.total_bytes == 5000 + 100 + 8192
+    assert plan.bytes_to_write == CLUSTER_SIZE + 2 * CLUSTER_SIZE
+
+
+def test_cache_reused_until_directory_changes(tmp_path):
+    source = _make_source(tmp_path)
+    _planner(tmp_path).estimate([(source, "")])
+
+    cached = _planner(tmp_path).estimate([(source, "")])
+    assert cached.dirs_cached == 3
+    assert cached.total_bytes == 5000 + 100 + 8192
+
+    _write(os.path.join(source, "sub", "new.bin"), 10)
+    changed = _planner(tmp_path).estimate([(source, "")])
+    assert changed.dirs_cached == 2
+    assert changed.files == 4
+
+
+def test_missing_source(tmp_path):
+    plan = _planner(tmp_path).estimate([(str(tmp_path / "assente"), "")])
+    assert plan.missing_sources == [str(tmp_path / "assente")]
+    assert not plan.fits
+
+
+def test_deletions_needed_oldest_first():
+    sizes = {"2024-01-01_10-00-00": 30, "2024-01-02_10-00-00": 50, "2024-01-03_10-00-00": 70}
+    candidates = ["2024-01-01_10-00-00", "2024-01-02_10-00-00", "2024-01-03_10-00-00"]
+
+    assert SpacePlanner.deletions_needed(60, candidates, sizes) == (["2024-01-01_10-00-00", "2024-01-02_10-00-00"], 80)
+    assert SpacePlanner.deletions_needed(0, candidates, sizes) == ([], 0)
+
+
+def test_plan_reclaims_unique_bytes_of_hard_linked_snapshots(tmp_path, monkeypatch):
+    source = tmp_path / "D"
+    _write(str(source / "grande.bin"), 1024 * 1024)
+    (tmp_path / "G").mkdir()
+    config = BackupConfig(
+        backup_drive="G:",
+        backup_root="BackupPC",
+        source_drives=["D:"],
+        user_folders=["Documents"],
+        keep_last_n=7,
+        copy_engine="native",
+        incremental=True,
+        drive_map={"D:": str(source), "G:": str(tmp_path / "G")},
+        metrics_dir=""
+    )
+    for hour in (8, 9, 10):
+        # Ogni file resta solo nello snapshot in cui è stato copiato
+        if hour > 8:
+            os.remove(source / f"nuovo_{hour - 1}.bin")
+        _write(str(source / f"nuovo_{hour}.bin"), 1000)
+        builder = BackupBuilder(config)
+        builder.timestamp = f"2024-01-01_{hour:02d}-00-00"
+        builder.execute_backup()
+        assert builder.executed == True
+    _write(str(source / "prossimo.bin"), 4 * 1024 * 1024)
+    monkeypatch.setattr(space_planner.psutil, "disk_usage", lambda path: type("Usage", (), {"free": 0}))
+
+    plan = SpacePlanner(config, threads=2, cache_path=str(tmp_path / "cache.json")).plan()
+
+    # grande.bin è un hard link nello snapshot più recente e non viene liberato: eliminare i due più
+    # vecchi libera i loro file da 1000 byte e i loro manifest, esattamente i byte che spariscono dal disco
+    backup_path = tmp_path / "G" / "BackupPC"
+    freed = sum(1000 + os.path.getsize(backup_path / name / MANIFEST_NAME) for name in plan.snapshots_to_delete)
+    assert plan.snapshots_to_delete == ["2024-01-01_08-00-00", "2024-01-01_09-00-00"]
+    assert plan.reclaimable_bytes == freed
@@ -0,0 +1,132 @@
+import pytest
+import json
+import os
+import subprocess
+import sys
+
+# Importa la tua classe da testare
+from pybck import shutdown_logging
+from pybck.BackupConfig import BackupConfig
+from pybck.main import main, EXIT_OK, EXIT_CONFIG
+
+
+@pytest.fixture
+def config_path(tmp_path, monkeypatch):
+    # Unità mappate su cartelle temporanee; log e metriche nella cartella di lavoro del test
+    monkeypatch.chdir(tmp_path)
+    source = tmp_path / "D"
+    source.mkdir()
+    (source / "a.txt").write_bytes(b"a" * 100)
+    (tmp_path / "G").mkdir()
+    user_profile = tmp_path / "Users" / "test"
+    (user_profile / "Documents").mkdir(parents=True)
+    monkeypatch.setenv("USERPROFILE", str(user_profile))
+
+    config = BackupConfig(
+        backup_drive="G:",
+        backup_root="BackupPC",
+        source_drives=["D:"],
+        user_folders=["Documents"],
+        keep_last_n=7,
+        copy_engine="native",
+        drive_map={"D:": str(source), "G:": str(tmp_path / "G")},
+    )
+    path = str(tmp_path / "config.json")
+    config.save(path)
+    yield path
+    shutdown_logging()
+
+
+def test_run_then_status(config_path, tmp_path, capsys):
+    assert main(["--config", config_path, "--quiet", "run"]) == EXIT_OK
+    snapshots = [name for name in os.listdir(tmp_path / "G" / "BackupPC") if not name.startswith(".")]
+    assert len(snapshots) == 1
+    assert (tmp_path / "G" / "BackupPC" / snapshots[0] / f"Disco_D_Backup_{snapshots[0]}" / "a.txt").exists()
+
+    with open(tmp_path / "metrics" / "pybck_runs.jsonl", encoding="utf-8") as file:
+        record = json.loads(file.readline())
+    assert record["success"] == True
+    assert {"validate", "clean_failed", "backup", "clean_old"} <= {span["name"] for span in record["spans"]}
+
+    capsys.readouterr()
+    assert main(["--config", config_path, "status"]) == EXIT_OK
+    output = capsys.readouterr().out
+    assert "Snapshot: 1" in output
+    assert snapshots[0] in output
+    assert "riuscita" in output
+
+
+def test_export_latest_snapshot(config_path, tmp_path, capsys):
+    import tarfile
+    assert main(["--config", config_path, "--quiet", "run"]) == EXIT_OK
+    capsys.readouterr()
+
+    assert main(["--config", config_path, "--quiet", "export", "-o", str(tmp_path / "out.tar.gz"), "--threads", "2"]) == EXIT_OK
+    assert "esportato" in capsys.readouterr().out
+    with tarfile.open(tmp_path / "out.tar.gz", "r:gz") as tar:
+        assert any(name.endswith("/a.txt") for name in tar.getnames())
+    assert main(["--config", config_path, "--quiet", "export", "1999-01-01_00-00-00"]) == 1
+
+
+def test_restore_source_and_file(config_path, tmp_path, capsys):
+    assert main(["--config", config_path, "--quiet", "run"]) == EXIT_OK
+    name = os.listdir(tmp_path / "G" / "BackupPC")
+    name = [item for item in name if not item.startswith(".")][0]
+    capsys.readouterr()
+
+    assert main(["--config", config_path, "--quiet", "restore", name, str(tmp_path / "R"), "--source", "D:"]) == EXIT_OK
+    assert "ripristinato: 1 file" in capsys.readouterr().out
+    assert (tmp_path / "R" / "a.txt").read_bytes() == b"a" * 100
+    assert main(["--config", config_path, "--quiet", "restore", name, str(tmp_path / "b.txt"), "--file", "D:/a.txt"]) == EXIT_OK
+    assert (tmp_path / "b.txt").read_bytes() == b"a" * 100
+    assert main(["--config", config_path, "--quiet", "restore", name, str(tmp_path), "--file", "D:/assente.txt"]) == 1
+
+
+def test_find_versions(config_path, tmp_path, capsys):
+    assert main(["--config", config_path, "--quiet", "run"]) == EXIT_OK
+    capsys.readouterr()
+
+    assert main(["--config", config_path, "--quiet", "find", "D:/a.txt"]) == EXIT_OK
+    assert "100 byte" in capsys.readouterr().out
+    assert main(["--config", config_path, "--quiet", "find", "D:/*.txt", "--rebuild"]) == EXIT_OK
+    assert "D:/a.txt" in capsys.readouterr().out
+    assert main(["--config", config_path, "--quiet", "find", "D:/assente.txt"]) == 1
+
+
+def test_verify_resumes_interrupted_verification(config_path, tmp_path, capsys):
+    (tmp_path / "D" / "b.txt").write_bytes(b"b" * 50)
+    assert main(["--config", config_path, "--quiet", "run"]) == EXIT_OK
+    name = [name for name in os.listdir(tmp_path / "G" / "BackupPC") if not name.startswith(".")][0]
+    # Checkpoint lasciato da una verifica full interrotta dopo a.txt
+    checkpoint = tmp_path / "cache" / "verify" / f"{name}.jsonl"
+    checkpoint.parent.mkdir(parents=True)
+    checkpoint.write_text(json.dumps({"mode": "full"}) + "\n" + json.dumps("0:a.txt") + "\n")
+    capsys.readouterr()
+
+    assert main(["--config", config_path, "--quiet", "verify", "--mode", "full"]) == EXIT_OK
+    assert "1 file, 0.0 MB, 1 già verificati, 0 non corrispondenti" in capsys.readouterr().out
+    assert not checkpoint.exists()
+
+    (tmp_path / "G" / "BackupPC" / name / f"Disco_D_Backup_{name}" / "a.txt").write_bytes(b"x")
+    assert main(["--config", config_path, "--quiet", "verify", name]) != EXIT_OK
+    assert "a.txt" in capsys.readouterr().err
+    # Anche con file non corrispondenti nessun checkpoint resta nello snapshot o nella cache
+    assert not checkpoint.exists()
+    assert not any(item.startswith(".pybck_verify") for item in os.listdir(tmp_path / "G" / "BackupPC" / name))
+
+
+def test_missing_config(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    assert main(["--config", "assente.json", "status"]) == EXIT_CONFIG
+    assert "File di configurazione non trovato" in capsys.readouterr().err
+
+
+def test_help_does_not_import_heavy_modules():
+    # --help e status non devono caricare psutil, sqlite o i motori di copia
+    code = ("import sys, pybck.main\n"
+            "from pybck.main import cmd_status\n"
+            "import pybck.BackupCatalog, pybck.BackupJournal\n"
+            "print(','.join(m for m in ('psutil', 'sqlite3', 'pybck.CopyEngine', 'logging.handlers') if m in sys.modules))")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True).stdout
+    assert output.strip() == ""